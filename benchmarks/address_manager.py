@@ -0,0 +1,96 @@
+import asyncio
+import os
+import random
+import sys
+from pathlib import Path
+from time import time
+
+import aiosqlite
+
+from silicoin.server.address_manager import AddressManager
+from silicoin.server.address_manager_store import AddressManagerStore
+from silicoin.types.peer_info import PeerInfo, TimestampedPeerInfo
+
+NUM_PEERS = 20000
+NUM_SELECTS = 10000
+NUM_ITERS = 20
+
+
+def rand_peer() -> TimestampedPeerInfo:
+    host = f"{random.randrange(1, 224)}.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(1, 255)}"
+    return TimestampedPeerInfo(host, 8444, random.randrange(1_600_000_000, 1_650_000_000))
+
+
+def rand_source() -> PeerInfo:
+    return PeerInfo(f"{random.randrange(1, 224)}.{random.randrange(256)}.1.1", 8444)
+
+
+async def setup_store() -> AddressManagerStore:
+    db_filename = Path("address-manager-benchmark.db")
+    try:
+        os.unlink(db_filename)
+    except FileNotFoundError:
+        pass
+    connection = await aiosqlite.connect(db_filename)
+    await connection.execute("pragma journal_mode=wal")
+    await connection.execute("pragma synchronous=FULL")
+    return await AddressManagerStore.create(connection)
+
+
+async def run_address_manager_benchmark():
+    verbose: bool = "--verbose" in sys.argv
+    random.seed(123456789)
+    store = await setup_store()
+    address_manager = AddressManager()
+
+    try:
+        start = time()
+        for i in range(NUM_PEERS):
+            await address_manager.add_to_new_table([rand_peer()], rand_source())
+        print(f"{time() - start:0.4f}s, ADD {NUM_PEERS} peers, {address_manager.new_count} in the new table")
+
+        start = time()
+        for i in range(NUM_PEERS // 50):
+            info = await address_manager.select_peer(True)
+            if info is not None:
+                await address_manager.mark_good(info.peer_info)
+        print(f"{time() - start:0.4f}s, MARK GOOD {NUM_PEERS // 50}, {address_manager.tried_count} in the tried table")
+
+        for new_only in [False, True]:
+            start = time()
+            for i in range(NUM_SELECTS):
+                assert await address_manager.select_peer(new_only) is not None
+            print(f"{time() - start:0.4f}s, SELECT PEER {NUM_SELECTS} times, new_only={new_only}")
+
+        start = time()
+        await store.serialize(address_manager)
+        print(f"{time() - start:0.4f}s, SERIALIZE all {len(address_manager.map_info)} peers")
+
+        if verbose:
+            print("profiling incremental serialize ", end="")
+        total_time = 0.0
+        for i in range(NUM_ITERS):
+            for j in range(50):
+                await address_manager.add_to_new_table([rand_peer()], rand_source())
+            start = time()
+            await store.serialize(address_manager)
+            total_time += time() - start
+            if verbose:
+                print(".", end="")
+                sys.stdout.flush()
+        if verbose:
+            print("")
+        print(f"{total_time:0.4f}s, SERIALIZE {NUM_ITERS} times after adding 50 peers")
+
+        start = time()
+        loaded = await store.deserialize()
+        print(f"{time() - start:0.4f}s, DESERIALIZE {len(loaded.map_info)} peers")
+        assert loaded.new_count == address_manager.new_count
+        assert loaded.tried_count == address_manager.tried_count
+
+    finally:
+        await store.db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_address_manager_benchmark())
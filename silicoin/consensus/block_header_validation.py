@@ -47,11 +47,15 @@ def validate_unfinished_header_block(
     skip_vdf_is_valid: bool = False,
     check_sub_epoch_summary=True,
     height: Optional[uint32] = None,
+    difficulty_coeff: Optional[Decimal] = None,
 ) -> Tuple[Optional[uint64], Optional[Decimal], Optional[ValidationError]]:
     """
     Validates an unfinished header block. This is a block without the infusion VDFs (unfinished)
     and without transactions and transaction info (header). Returns (required_iters, error).
 
+    difficulty_coeff is the farmer's difficulty coefficient at the previous height, if the caller already resolved
+    it. Otherwise it is looked up synchronously through the blockchain.
+
     This method is meant to validate only the unfinished part of the block. However, the finished_sub_slots
     refers to all sub-slots that were finishes from the previous block's infusion point, up to this blocks
     infusion point. Therefore, in the case where this is an overflow block, and the last sub-slot is not yet
@@ -509,9 +513,10 @@ def validate_unfinished_header_block(
             peak_height = height - 1
         else:
             peak_height = 0
-    difficulty_coeff = blocks.get_farmer_difficulty_coeff_sync(
-        header_block.reward_chain_block.proof_of_space.farmer_public_key, peak_height
-    )
+    if difficulty_coeff is None:
+        difficulty_coeff = blocks.get_farmer_difficulty_coeff_sync(
+            header_block.reward_chain_block.proof_of_space.farmer_public_key, peak_height
+        )
     log.info(f"[debug] validate block {difficulty_coeff}")
     required_iters: uint64 = calculate_iterations_quality(
         constants.DIFFICULTY_CONSTANT_FACTOR,
@@ -853,6 +858,7 @@ def validate_finished_header_block(
     expected_difficulty: uint64,
     expected_sub_slot_iters: uint64,
     check_sub_epoch_summary=True,
+    difficulty_coeff: Optional[Decimal] = None,
 ) -> Tuple[Optional[uint64], Optional[Decimal], Optional[ValidationError]]:
     """
     Fully validates the header of a block. A header block is the same  as a full block, but
@@ -878,6 +884,7 @@ def validate_finished_header_block(
         False,
         check_sub_epoch_summary=check_sub_epoch_summary,
         height=header_block.height,
+        difficulty_coeff=difficulty_coeff,
     )
 
     genesis_block = False
@@ -1,10 +1,13 @@
 import asyncio
+import bisect
 import dataclasses
 import logging
 import multiprocessing
+import threading
 from concurrent.futures.process import ProcessPoolExecutor
 from decimal import Decimal
 from enum import Enum
+from pathlib import Path
 from typing import Dict, List, Optional, Set, Tuple, Union
 
 from blspy import G1Element
@@ -24,6 +27,7 @@ from silicoin.consensus.multiprocess_validation import (
     PreValidationResult,
     _run_generator,
     pre_validate_blocks_multiprocessing,
+    pre_validate_blocks_pipelined,
 )
 from silicoin.consensus.pos_quality import UI_ACTUAL_SPACE_CONSTANT_FACTOR
 from silicoin.full_node.block_store import BlockStore
@@ -45,12 +49,41 @@ from silicoin.types.unfinished_header_block import UnfinishedHeaderBlock
 from silicoin.types.weight_proof import SubEpochChallengeSegment
 from silicoin.util.errors import ConsensusError, Err
 from silicoin.util.generator_tools import get_block_header, tx_removals_and_additions
+from silicoin.util.height_map import HeightMap, read_snapshot, write_snapshot
 from silicoin.util.ints import uint16, uint32, uint64, uint128
+from silicoin.util.lru_cache import LRUCache
 from silicoin.util.streamable import recurse_jsonify
 
 log = logging.getLogger(__name__)
 
 
+def calculate_farmer_difficulty_coeff(network_space: uint128, staking: int, blocks: int, block_range: int) -> Decimal:
+    """
+    Difficulty coefficient of a farmer, from the network space, the farmer's staking, and the number of blocks the
+    farmer made in the last block_range blocks.
+    """
+    minimal_staking = Decimal(network_space) / (block_range * 100)
+
+    coeff = Decimal(0)
+    space = 0
+    if minimal_staking == 0 or staking < minimal_staking:
+        coeff = Decimal(20)
+    else:
+        if blocks == 0:
+            coeff = Decimal(1)
+        else:
+            # multiple 1000 to keep same scale as sit
+            space = uint128(int(network_space * blocks / block_range))
+
+            if space == 0:
+                coeff = Decimal(1)
+            elif staking >= space:
+                coeff = Decimal("0.5") + Decimal(1) / (Decimal(staking) / space + 1)
+            else:
+                coeff = Decimal("0.05") + Decimal(1) / (Decimal(staking) / space + Decimal("0.05"))
+    return coeff
+
+
 class ReceiveBlockResult(Enum):
     """
     When Blockchain.receive_block(b) is called, one of these results is returned,
@@ -76,7 +109,7 @@ class Blockchain(BlockchainInterface):
     # all hashes of blocks in block_record by height, used for garbage collection
     __heights_in_cache: Dict[uint32, Set[bytes32]]
     # Defines the path from genesis to the peak, no orphan blocks
-    __height_to_hash: Dict[uint32, bytes32]
+    __height_to_hash: HeightMap
     # All sub-epoch summaries that have been included in the blockchain from the beginning until and including the peak
     # (height_included, SubEpochSummary). Note: ONLY for the blocks in the path to the peak
     __sub_epoch_summaries: Dict[uint32, SubEpochSummary] = {}
@@ -86,6 +119,8 @@ class Blockchain(BlockchainInterface):
     block_store: BlockStore
     # Set holding seen compact proofs, in order to avoid duplicates.
     _seen_compact_proofs: Set[Tuple[VDFInfo, uint32]]
+    # Network space estimates by (newer, older) header hash, asked for every peak, farmer and RPC poll
+    _network_space_cache: LRUCache
 
     # Whether blockchain is shut down or not
     _shut_down: bool
@@ -94,10 +129,20 @@ class Blockchain(BlockchainInterface):
     lock: asyncio.Lock
     compact_proof_lock: asyncio.Lock
     hint_store: HintStore
+    # File with a copy of __height_to_hash and __sub_epoch_summaries, which speeds up loading the chain
+    snapshot_path: Optional[Path]
+    # Peak height of the last snapshot written or read
+    snapshot_height: Optional[uint32]
+    # Serializes the snapshot writes of the executor and of shut_down
+    _snapshot_lock: threading.Lock
 
     @staticmethod
     async def create(
-        coin_store: CoinStore, block_store: BlockStore, consensus_constants: ConsensusConstants, hint_store: HintStore
+        coin_store: CoinStore,
+        block_store: BlockStore,
+        consensus_constants: ConsensusConstants,
+        hint_store: HintStore,
+        snapshot_path: Optional[Path] = None,
     ):
         """
         Initializes a blockchain with the BlockRecords from disk, assuming they have all been
@@ -119,20 +164,71 @@ class Blockchain(BlockchainInterface):
         self.block_store = block_store
         self.constants_json = recurse_jsonify(dataclasses.asdict(self.constants))
         self._shut_down = False
+        self.snapshot_path = snapshot_path
+        self.snapshot_height = None
+        self._snapshot_lock = threading.Lock()
         await self._load_chain_from_store()
         self._seen_compact_proofs = set()
         self.hint_store = hint_store
+        self._network_space_cache = LRUCache(1000)
         return self
 
     def shut_down(self):
         self._shut_down = True
         self.pool.shutdown(wait=True)
+        try:
+            self.write_snapshot()
+        except Exception as e:
+            log.error(f"Failed to write the height to hash snapshot: {e}")
+
+    def _snapshot_data(self) -> Optional[Tuple[HeightMap, Dict[uint32, SubEpochSummary]]]:
+        if self.snapshot_path is None or self._peak_height is None or self._peak_height == self.snapshot_height:
+            return None
+        return HeightMap(self.__height_to_hash.to_bytes()), self.__sub_epoch_summaries.copy()
+
+    def write_snapshot(self) -> None:
+        """
+        Saves the path to the peak, so that the next start does not have to read it from the database.
+        """
+        data = self._snapshot_data()
+        if data is None:
+            return None
+        self._write_snapshot(data[0], data[1])
+        self.snapshot_height = uint32(len(data[0]) - 1)
+
+    def _write_snapshot(self, height_to_hash: HeightMap, sub_epoch_summaries: Dict[uint32, SubEpochSummary]) -> None:
+        assert self.snapshot_path is not None
+        with self._snapshot_lock:
+            write_snapshot(self.snapshot_path, height_to_hash, sub_epoch_summaries)
+
+    async def checkpoint_snapshot(self, interval: int) -> None:
+        """
+        Writes a snapshot if the peak moved by at least interval blocks since the last one, outside of the event loop
+        so that a large chain does not block it. A crash then only loses the blocks after the last checkpoint, which
+        are read from the database on the next start. Doesn't need the blockchain lock, the state is copied up front.
+        """
+        if self._peak_height is None or self._peak_height - (self.snapshot_height or 0) < interval:
+            return None
+        data = self._snapshot_data()
+        if data is None:
+            return None
+        await asyncio.get_running_loop().run_in_executor(None, self._write_snapshot, data[0], data[1])
+        self.snapshot_height = uint32(len(data[0]) - 1)
 
     async def _load_chain_from_store(self) -> None:
         """
         Initializes the state of the Blockchain class from the database.
         """
-        height_to_hash, sub_epoch_summaries = await self.block_store.get_peak_height_dicts()
+        snapshot = None
+        snapshot_height: Optional[uint32] = None
+        if self.snapshot_path is not None:
+            snapshot = read_snapshot(self.snapshot_path)
+            if snapshot is not None:
+                # Before the block store extends it
+                snapshot_height = uint32(len(snapshot[0]) - 1)
+        height_to_hash, sub_epoch_summaries, from_snapshot = await self.block_store.get_peak_height_dicts(snapshot)
+        # A snapshot which doesn't match the chain gets rewritten by the next checkpoint
+        self.snapshot_height = snapshot_height if from_snapshot else None
         self.__height_to_hash = height_to_hash
         self.__sub_epoch_summaries = sub_epoch_summaries
         self.__block_records = {}
@@ -228,6 +324,9 @@ class Blockchain(BlockchainInterface):
                 npc_result = None
                 header_block = get_block_header(block, [], [])
 
+            difficulty_coeff = await self.get_farmer_difficulty_coeff(
+                block.reward_chain_block.proof_of_space.farmer_public_key, uint32(max(block.height - 1, 0))
+            )
             required_iters, _, error = validate_finished_header_block(
                 self.constants,
                 self,
@@ -235,6 +334,7 @@ class Blockchain(BlockchainInterface):
                 False,
                 difficulty,
                 sub_slot_iters,
+                difficulty_coeff=difficulty_coeff,
             )
 
             if error is not None:
@@ -288,6 +388,7 @@ class Blockchain(BlockchainInterface):
                         ] = fetched_block_record.sub_epoch_summary_included
                 if peak_height is not None:
                     self._peak_height = peak_height
+                    self.__height_to_hash.rollback(peak_height)
             except BaseException:
                 self.block_store.rollback_cache_block(header_hash)
                 await self.block_store.db_wrapper.rollback_transaction()
@@ -356,6 +457,7 @@ class Blockchain(BlockchainInterface):
                 else:
                     added, _ = [], []
                 await self.block_store.set_peak(block_record.header_hash)
+                await self.block_store.set_main_chain(-1, [(block_record.height, block_record.header_hash)])
                 return uint32(0), uint32(0), [block_record], (added, {})
             return None, None, [], ([], {})
 
@@ -406,6 +508,10 @@ class Blockchain(BlockchainInterface):
                 curr = fetched_block_record.prev_hash
 
             records_to_add = []
+            # The coin changes of all the blocks are applied to the coin store in one batch
+            coin_store_blocks: List[Tuple[uint32, uint64, Set[Coin], List[Coin], List[bytes32]]] = []
+            all_removals: List[bytes32] = []
+            hint_list: List[Tuple[bytes32, bytes]] = []
             for fetched_full_block, fetched_block_record in reversed(blocks_to_add):
                 records_to_add.append(fetched_block_record)
                 if fetched_full_block.is_transaction_block():
@@ -419,39 +525,49 @@ class Blockchain(BlockchainInterface):
                         )
 
                     assert fetched_full_block.foliage_transaction_block is not None
-                    added_rec = await self.coin_store.new_block(
-                        fetched_full_block.height,
-                        fetched_full_block.foliage_transaction_block.timestamp,
-                        fetched_full_block.get_included_reward_coins(),
-                        tx_additions,
-                        tx_removals,
+                    coin_store_blocks.append(
+                        (
+                            fetched_full_block.height,
+                            fetched_full_block.foliage_transaction_block.timestamp,
+                            fetched_full_block.get_included_reward_coins(),
+                            tx_additions,
+                            tx_removals,
+                        )
                     )
-                    removed_rec: List[Optional[CoinRecord]] = [
-                        await self.coin_store.get_coin_record(name) for name in tx_removals
-                    ]
-
-                    # Set additions first, then removals in order to handle ephemeral coin state
-                    # Add in height order is also required
-                    record: Optional[CoinRecord]
+                    all_removals.extend(tx_removals)
+                    if npc_res is not None:
+                        hint_list.extend(self.get_hint_list(npc_res))
+
+            if len(coin_store_blocks) > 0:
+                added_recs: List[List[CoinRecord]] = await self.coin_store.new_blocks(coin_store_blocks)
+                removed_rec: List[CoinRecord] = []
+                # Stays below the SQLite variable limit
+                for i in range(0, len(all_removals), 500):
+                    removed_rec += await self.coin_store.get_coin_records_by_names(True, all_removals[i : i + 500])
+                assert len(removed_rec) == len(set(all_removals))
+
+                # Set additions first, then removals in order to handle ephemeral coin state
+                # Add in height order is also required
+                record: Optional[CoinRecord]
+                for added_rec in added_recs:
                     for record in added_rec:
                         assert record
                         lastest_coin_state[record.name] = record
-                    for record in removed_rec:
-                        assert record
-                        lastest_coin_state[record.name] = record
-
-                    if npc_res is not None:
-                        hint_list: List[Tuple[bytes32, bytes]] = self.get_hint_list(npc_res)
-                        await self.hint_store.add_hints(hint_list)
-                        # There can be multiple coins for the same hint
-                        for coin_id, hint in hint_list:
-                            key = hint
-                            if key not in hint_coin_state:
-                                hint_coin_state[key] = {}
-                            hint_coin_state[key][coin_id] = lastest_coin_state[coin_id]
+                for record in removed_rec:
+                    lastest_coin_state[record.name] = record
+
+                if len(hint_list) > 0:
+                    await self.hint_store.add_hints(hint_list)
+                    # There can be multiple coins for the same hint
+                    for coin_id, hint in hint_list:
+                        key = hint
+                        if key not in hint_coin_state:
+                            hint_coin_state[key] = {}
+                        hint_coin_state[key][coin_id] = lastest_coin_state[coin_id]
 
             # Changes the peak to be the new peak
             await self.block_store.set_peak(block_record.header_hash)
+            await self.block_store.set_main_chain(fork_height, [(r.height, r.header_hash) for r in records_to_add])
             return (
                 uint32(max(fork_height, 0)),
                 block_record.height,
@@ -603,6 +719,9 @@ class Blockchain(BlockchainInterface):
             sub_slot_iters,
             self.coin_store,
             skip_overflow_ss_validation,
+            difficulty_coeff=await self.get_farmer_difficulty_coeff(
+                unfinished_header_block.reward_chain_block.proof_of_space.farmer_public_key
+            ),
         )
 
         if error is not None:
@@ -650,6 +769,27 @@ class Blockchain(BlockchainInterface):
             self.get_block_generator,
             batch_size,
             wp_summaries,
+            self.pool,
+        )
+
+    async def pre_validate_blocks_pipelined(
+        self,
+        blocks: List[FullBlock],
+        npc_results: Dict[uint32, NPCResult],
+        batch_size: int = 4,
+        wp_summaries: Optional[List[SubEpochSummary]] = None,
+    ) -> Optional[List["asyncio.Future[List[PreValidationResult]]"]]:
+        return await pre_validate_blocks_pipelined(
+            self.constants,
+            self.constants_json,
+            self,
+            blocks,
+            True,
+            npc_results,
+            self.get_block_generator,
+            batch_size,
+            wp_summaries,
+            self.pool,
         )
 
     async def run_generator(self, unfinished_block: bytes, generator: BlockGenerator) -> NPCResult:
@@ -757,6 +897,9 @@ class Blockchain(BlockchainInterface):
     async def get_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
         return await self.block_store.get_block_records_in_range(start, stop)
 
+    async def get_main_chain_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
+        return await self.block_store.get_main_chain_block_records_in_range(start, stop)
+
     async def get_header_blocks_in_range(
         self, start: int, stop: int, tx_filter: bool = True
     ) -> Dict[bytes32, HeaderBlock]:
@@ -858,6 +1001,9 @@ class Blockchain(BlockchainInterface):
             return None
         return segments
 
+    async def get_sub_epoch_challenge_segment_hashes(self) -> Set[bytes32]:
+        return await self.block_store.get_sub_epoch_challenge_segment_hashes()
+
     # Returns 'True' if the info is already in the set, otherwise returns 'False' and stores it.
     def seen_compact_proofs(self, vdf_info: VDFInfo, height: uint32) -> bool:
         pot_tuple = (vdf_info, height)
@@ -946,12 +1092,19 @@ class Blockchain(BlockchainInterface):
         return BlockGenerator(block.transactions_generator, result)
 
     async def get_network_space(self, newer: bytes32, older: bytes32) -> uint128:
-        newer_block = await self.block_store.get_block_record(newer)
+        newer_block = self.try_block_record(newer)
+        if newer_block is None:
+            newer_block = await self.block_store.get_block_record(newer)
         if newer_block is None:
             raise ValueError("Newer block not found")
-        older_block = await self.block_store.get_block_record(older)
+        older_block = self.try_block_record(older)
+        if older_block is None:
+            older_block = await self.block_store.get_block_record(older)
         if older_block is None:
             raise ValueError("Older block not found")
+        return self._network_space_between(newer_block, older_block)
+
+    def _network_space_between(self, newer_block: BlockRecord, older_block: BlockRecord) -> uint128:
         delta_weight = newer_block.weight - older_block.weight
 
         delta_iters = newer_block.total_iters - older_block.total_iters
@@ -971,7 +1124,13 @@ class Blockchain(BlockchainInterface):
             # Average over the last day
             older_header_hash = self.height_to_hash(uint32(max(1, peak.height - block_range)))
             assert older_header_hash is not None
-            return await self.get_network_space(peak.header_hash, older_header_hash)
+            # Keyed by both ends, so a reorg below the peak is not served a stale estimate
+            key = (peak.header_hash, older_header_hash)
+            space: Optional[uint128] = self._network_space_cache.get(key)
+            if space is None:
+                space = await self.get_network_space(peak.header_hash, older_header_hash)
+                self._network_space_cache.put(key, space)
+            return space
         else:
             return uint128(0)
 
@@ -1003,33 +1162,91 @@ class Blockchain(BlockchainInterface):
                 curr = self.try_block_record(curr.prev_hash)
         network_space = await self.get_peak_network_space(block_range, peak)
         staking = await self.get_peak_farmer_staking(farmer_public_key, peak)
-        minimal_staking = Decimal(network_space) / (block_range * 100)
+        return calculate_farmer_difficulty_coeff(network_space, staking, blocks, block_range)
 
-        coeff = Decimal(0)
-        space = 0
-        if minimal_staking == 0 or staking < minimal_staking:
-            coeff = Decimal(20)
-        else:
-            if blocks == 0:
-                coeff = Decimal(1)
+    async def get_farmer_difficulty_coeffs(self, keys: List[Tuple[G1Element, uint32]]) -> List[Decimal]:
+        """
+        Returns the same coefficients as calling get_farmer_difficulty_coeff for each (farmer public key, height)
+        pair, resolved together: the chain is walked once for the whole window, the block records are fetched with
+        one query, and the staking of each farmer with one query for all its heights.
+        """
+        coeffs: Dict[Tuple[bytes, uint32], Decimal] = {}
+        pending: Dict[Tuple[bytes, uint32], G1Element] = {}
+        for farmer_public_key, height in keys:
+            key = (bytes(farmer_public_key), height)
+            if height == 0:
+                coeffs[key] = Decimal(20)
             else:
-                # multiple 1000 to keep same scale as sit
-                space = uint128(int(network_space * blocks / block_range))
-
-                if space == 0:
-                    coeff = Decimal(1)
-                elif staking >= space:
-                    coeff = Decimal("0.5") + Decimal(1) / (Decimal(staking) / space + 1)
-                else:
-                    coeff = Decimal("0.05") + Decimal(1) / (Decimal(staking) / space + Decimal("0.05"))
-
-        # log.info(
-        #     f"minimal_staking : {minimal_staking}, space : {space} "
-        #     f"Difficulty coefficient: {coeff}, staking: {staking}, total space: {network_space}, "
-        #     f"blocks: {blocks}, peak_height: {peak_height}"
-        # )
+                pending[key] = farmer_public_key
+        if len(pending) > 0:
+            coeffs.update(await self._resolve_farmer_difficulty_coeffs(pending))
+        return [coeffs[(bytes(farmer_public_key), height)] for farmer_public_key, height in keys]
+
+    async def _resolve_farmer_difficulty_coeffs(
+        self, pending: Dict[Tuple[bytes, uint32], G1Element]
+    ) -> Dict[Tuple[bytes, uint32], Decimal]:
+        block_range = self.constants.STAKING_ESTIMATE_BLOCK_RANGE
+        heights: List[uint32] = sorted(set(height for _, height in pending.keys()))
+        header_hashes: Dict[uint32, bytes32] = {}
+        for height in heights:
+            header_hashes[height] = self.height_to_hash(height)
+            if height > 1:
+                older_height = uint32(max(1, height - block_range))
+                header_hashes[older_height] = self.height_to_hash(older_height)
+        try:
+            hashes = list(header_hashes.values())
+            records = dict(zip(hashes, await self.block_store.get_block_records_by_hash(hashes)))
+        except ValueError:
+            # A block record is missing, get_farmer_difficulty_coeff handles that case
+            return {
+                key: await self.get_farmer_difficulty_coeff(farmer_public_key, key[1])
+                for key, farmer_public_key in pending.items()
+            }
+
+        # Heights of the blocks of each farmer, from a single walk down from the highest peak
+        heights_by_farmer: Dict[bytes, List[int]] = {}
+        lowest_begin_height = max(heights[0] - block_range, 1)
+        curr: Optional[BlockRecord] = records[header_hashes[heights[-1]]]
+        walk_bottom = heights[-1] + 1
+        while curr is not None and curr.height > lowest_begin_height:
+            heights_by_farmer.setdefault(bytes(curr.farmer_public_key), []).append(curr.height)
+            walk_bottom = curr.height
+            curr = self.try_block_record(curr.prev_hash)
+        for farmer_heights in heights_by_farmer.values():
+            farmer_heights.reverse()
 
-        return coeff
+        network_spaces: Dict[uint32, uint128] = {}
+        for height in heights:
+            if height > 1:
+                older = records[header_hashes[uint32(max(1, height - block_range))]]
+                network_spaces[height] = self._network_space_between(records[header_hashes[height]], older)
+            else:
+                network_spaces[height] = uint128(0)
+
+        staking_heights: Dict[bytes, List[uint32]] = {}
+        for farmer_pk_bytes, height in pending.keys():
+            staking_heights.setdefault(farmer_pk_bytes, []).append(height)
+        stakings: Dict[Tuple[bytes, uint32], uint64] = {}
+        for farmer_pk_bytes, farmer_staking_heights in staking_heights.items():
+            ph = create_puzzlehash_for_pk(pending[(farmer_pk_bytes, farmer_staking_heights[0])])
+            amounts = await self.coin_store.get_unspent_amounts_before_heights(ph, farmer_staking_heights)
+            for height, amount in zip(farmer_staking_heights, amounts):
+                stakings[(farmer_pk_bytes, height)] = amount
+
+        coeffs: Dict[Tuple[bytes, uint32], Decimal] = {}
+        for key, farmer_public_key in pending.items():
+            farmer_pk_bytes, height = key
+            begin_height = max(height - block_range, 1)
+            if height > begin_height and walk_bottom > begin_height + 1:
+                # The walk stopped at a block missing from the cache before covering this window
+                coeffs[key] = await self.get_farmer_difficulty_coeff(farmer_public_key, height)
+                continue
+            farmer_heights = heights_by_farmer.get(farmer_pk_bytes, [])
+            blocks = bisect.bisect_right(farmer_heights, height) - bisect.bisect_right(farmer_heights, begin_height)
+            coeffs[key] = calculate_farmer_difficulty_coeff(
+                network_spaces[height], stakings[key], uint64(blocks), block_range
+            )
+        return coeffs
 
     async def get_peak_farmer_staking(self, farmer_public_key: G1Element, peak: Optional[BlockRecord]) -> uint64:
         ph = create_puzzlehash_for_pk(farmer_public_key)
@@ -1,5 +1,5 @@
 from decimal import Decimal
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from blspy import G1Element
 
@@ -56,6 +56,9 @@ class BlockchainInterface:
     async def get_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
         pass
 
+    async def get_main_chain_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
+        pass
+
     async def get_header_blocks_in_range(
         self, start: int, stop: int, tx_filter: bool = True
     ) -> Dict[bytes32, HeaderBlock]:
@@ -85,6 +88,9 @@ class BlockchainInterface:
     ) -> Optional[List[SubEpochChallengeSegment]]:
         pass
 
+    async def get_sub_epoch_challenge_segment_hashes(self) -> Set[bytes32]:
+        pass
+
     def seen_compact_proofs(self, vdf_info: VDFInfo, height: uint32) -> bool:
         pass
 
@@ -93,6 +99,12 @@ class BlockchainInterface:
     ) -> Decimal:
         raise NotImplementedError("get_farmer_difficulty_coeff not implemented")
 
+    async def get_farmer_difficulty_coeffs(self, keys: List[Tuple[G1Element, uint32]]) -> List[Decimal]:
+        """
+        Returns the difficulty coefficient of each (farmer public key, height) pair, in order.
+        """
+        return [await self.get_farmer_difficulty_coeff(farmer_public_key, height) for farmer_public_key, height in keys]
+
     def get_farmer_difficulty_coeff_sync(
         self, farmer_public_key: G1Element, height: Optional[uint32] = None
     ) -> Decimal:
@@ -1,7 +1,10 @@
+import asyncio
 import logging
 import traceback
+from concurrent.futures import Executor
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from decimal import Decimal
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 from silicoin.consensus.block_header_validation import validate_finished_header_block
 from silicoin.consensus.block_record import BlockRecord
@@ -39,7 +42,7 @@ class PreValidationResult(Streamable):
 
 
 def batch_pre_validate_blocks(
-    blockchain: BlockchainInterface,
+    blockchain: Optional[BlockchainInterface],
     constants_dict: Dict,
     blocks_pickled: Dict[bytes, bytes],
     full_blocks_pickled: Optional[List[bytes]],
@@ -49,6 +52,7 @@ def batch_pre_validate_blocks(
     check_filter: bool,
     expected_difficulty: List[uint64],
     expected_sub_slot_iters: List[uint64],
+    difficulty_coeffs: List[str],
 ) -> List[bytes]:
     blocks = {}
     for k, v in blocks_pickled.items():
@@ -94,6 +98,7 @@ def batch_pre_validate_blocks(
                     check_filter,
                     expected_difficulty[i],
                     expected_sub_slot_iters[i],
+                    difficulty_coeff=Decimal(difficulty_coeffs[i]),
                 )
                 error_int: Optional[uint16] = None
                 if error is not None:
@@ -115,6 +120,7 @@ def batch_pre_validate_blocks(
                     check_filter,
                     expected_difficulty[i],
                     expected_sub_slot_iters[i],
+                    difficulty_coeff=Decimal(difficulty_coeffs[i]),
                 )
                 error_int = None
                 if error is not None:
@@ -137,6 +143,7 @@ async def pre_validate_blocks_multiprocessing(
     get_block_generator: Optional[Callable],
     batch_size: int,
     wp_summaries: Optional[List[SubEpochSummary]] = None,
+    pool: Optional[Executor] = None,
 ) -> Optional[List[PreValidationResult]]:
     """
     This method must be called under the blockchain lock
@@ -151,6 +158,57 @@ async def pre_validate_blocks_multiprocessing(
         blocks: list of full blocks to validate (must be connected to current chain)
         npc_results
         get_block_generator
+        pool: executor which runs the batches, they are validated in this process if None
+    """
+    chunks = await pre_validate_blocks_pipelined(
+        constants,
+        constants_json,
+        block_records,
+        blocks,
+        check_filter,
+        npc_results,
+        get_block_generator,
+        batch_size,
+        wp_summaries,
+        pool,
+    )
+    if chunks is None:
+        return None
+    results: List[PreValidationResult] = []
+    for chunk in chunks:
+        results += await chunk
+    return results
+
+
+def _completed_future(results: List[PreValidationResult]) -> "asyncio.Future[List[PreValidationResult]]":
+    future: "asyncio.Future[List[PreValidationResult]]" = asyncio.get_running_loop().create_future()
+    future.set_result(results)
+    return future
+
+
+async def _deserialize_results(results: Awaitable[List[bytes]]) -> List[PreValidationResult]:
+    return [PreValidationResult.from_bytes(result) for result in await results]
+
+
+async def pre_validate_blocks_pipelined(
+    constants: ConsensusConstants,
+    constants_json: Dict,
+    block_records: BlockchainInterface,
+    blocks: Sequence[Union[FullBlock, HeaderBlock]],
+    check_filter: bool,
+    npc_results: Dict[uint32, NPCResult],
+    get_block_generator: Optional[Callable],
+    batch_size: int,
+    wp_summaries: Optional[List[SubEpochSummary]] = None,
+    pool: Optional[Executor] = None,
+) -> Optional[List["asyncio.Future[List[PreValidationResult]]"]]:
+    """
+    Like pre_validate_blocks_multiprocessing, but returns as soon as the batches of batch_size blocks were handed to
+    the pool, with one future per batch, in block order. This lets the caller add the blocks of the first batches to
+    the chain while the later ones are still being validated. The parts which need the blockchain run before this
+    returns, so the futures do not depend on the chain state anymore.
+
+    Callers which stop early must cancel the remaining futures.
     """
     prev_b: Optional[BlockRecord] = None
     # Collects all the recent blocks (up to the previous sub-epoch)
@@ -160,7 +218,9 @@ async def pre_validate_blocks_multiprocessing(
     num_blocks_seen = 0
     if blocks[0].height > 0:
         if not block_records.contains_block(blocks[0].prev_header_hash):
-            return [PreValidationResult(uint16(Err.INVALID_PREV_BLOCK_HASH.value), None, None, None)]
+            return [
+                _completed_future([PreValidationResult(uint16(Err.INVALID_PREV_BLOCK_HASH.value), None, None, None)])
+            ]
         curr = block_records.block_record(blocks[0].prev_header_hash)
         num_sub_slots_to_look_for = 3 if curr.overflow else 2
         while (
@@ -184,8 +244,23 @@ async def pre_validate_blocks_multiprocessing(
     for block in blocks:
         block_record_was_present.append(block_records.contains_block(block.header_hash))
 
+    # Resolve the farmers' difficulty coefficients for the whole batch up front, so header validation doesn't need to
+    # query the blockchain for each block
+    difficulty_coeffs: Optional[List[Decimal]] = None
+    try:
+        difficulty_coeffs = await block_records.get_farmer_difficulty_coeffs(
+            [
+                (block.reward_chain_block.proof_of_space.farmer_public_key, uint32(max(block.height - 1, 0)))
+                for block in blocks
+            ]
+        )
+    except KeyError:
+        # Some previous height is not in the chain yet, look the coefficients up block by block below
+        pass
+
     diff_ssis: List[Tuple[uint64, uint64]] = []
-    for block in blocks:
+    block_difficulty_coeffs: List[Decimal] = []
+    for block_index, block in enumerate(blocks):
         if block.height != 0:
             assert block_records.contains_block(block.prev_header_hash)
             if prev_b is None:
@@ -212,9 +287,12 @@ async def pre_validate_blocks_multiprocessing(
                     block_records.remove_block_record(block_i.header_hash)
             return None
 
-        difficulty_coeff = await block_records.get_farmer_difficulty_coeff(
-            block.reward_chain_block.proof_of_space.farmer_public_key, block.height - 1 if block.height > 0 else 0
-        )
+        if difficulty_coeffs is not None:
+            difficulty_coeff = difficulty_coeffs[block_index]
+        else:
+            difficulty_coeff = await block_records.get_farmer_difficulty_coeff(
+                block.reward_chain_block.proof_of_space.farmer_public_key, block.height - 1 if block.height > 0 else 0
+            )
         log.info(f"[debug] validating {block.reward_chain_block.height}, {difficulty_coeff}")
         required_iters: uint64 = calculate_iterations_quality(
             constants.DIFFICULTY_CONSTANT_FACTOR,
@@ -249,6 +327,7 @@ async def pre_validate_blocks_multiprocessing(
             recent_blocks_compressed[block_rec.header_hash] = block_records.block_record(block_rec.header_hash)
         prev_b = block_rec
         diff_ssis.append((difficulty, sub_slot_iters))
+        block_difficulty_coeffs.append(difficulty_coeff)
 
     block_dict: Dict[bytes32, Union[FullBlock, HeaderBlock]] = {}
     for i, block in enumerate(blocks):
@@ -260,7 +339,8 @@ async def pre_validate_blocks_multiprocessing(
     npc_results_pickled = {}
     for k, v in npc_results.items():
         npc_results_pickled[k] = bytes(v)
-    results = []
+    loop = asyncio.get_running_loop()
+    chunks: List["asyncio.Future[List[PreValidationResult]]"] = []
     # Pool of workers to validate blocks concurrently
     for i in range(0, len(blocks), batch_size):
         end_i = min(i + batch_size, len(blocks))
@@ -291,6 +371,8 @@ async def pre_validate_blocks_multiprocessing(
                 try:
                     block_generator: Optional[BlockGenerator] = await get_block_generator(block, prev_blocks_dict)
                 except ValueError:
+                    for chunk in chunks:
+                        chunk.cancel()
                     return None
                 if block_generator is not None:
                     previous_generators.append(bytes(block_generator))
@@ -301,8 +383,7 @@ async def pre_validate_blocks_multiprocessing(
                     hb_pickled = []
                 hb_pickled.append(bytes(block))
 
-        results += batch_pre_validate_blocks(
-            block_records,
+        args = (
             constants_json,
             final_pickled,
             b_pickled,
@@ -312,9 +393,19 @@ async def pre_validate_blocks_multiprocessing(
             check_filter,
             [diff_ssis[j][0] for j in range(i, end_i)],
             [diff_ssis[j][1] for j in range(i, end_i)],
+            [str(block_difficulty_coeffs[j]) for j in range(i, end_i)],
         )
-    # Collect all results into one flat list
-    return [PreValidationResult.from_bytes(result) for result in results]
+        if pool is None:
+            results = batch_pre_validate_blocks(block_records, *args)
+            chunks.append(_completed_future([PreValidationResult.from_bytes(result) for result in results]))
+        else:
+            # The difficulty coefficients are resolved above, so the workers don't need the blockchain
+            chunks.append(
+                asyncio.ensure_future(
+                    _deserialize_results(loop.run_in_executor(pool, batch_pre_validate_blocks, None, *args))
+                )
+            )
+    return chunks
 
 
 def _run_generator(
@@ -25,7 +25,7 @@ from silicoin.plotting.util import add_plot_directory
 from silicoin.server.server import ssl_context_for_root, ssl_context_for_server
 from silicoin.ssl.create_ssl import get_mozilla_ca_crt
 from silicoin.util.silicoin_logging import initialize_logging
-from silicoin.util.config import load_config
+from silicoin.util.config import load_config, load_config_view
 from silicoin.util.json_util import dict_to_json_str
 from silicoin.util.keychain import (
     Keychain,
@@ -847,7 +847,7 @@ class WebSocketServer:
 
         if exclude_final_dir is False and len(final_dir) > 0:
             resolved_final_dir: str = str(Path(final_dir).resolve())
-            config = load_config(self.root_path, "config.yaml")
+            config = load_config_view(self.root_path, "config.yaml")
             plot_directories_list: str = config["harvester"]["plot_directories"]
 
             if resolved_final_dir not in plot_directories_list:
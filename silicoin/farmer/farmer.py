@@ -32,6 +32,7 @@ from silicoin.protocols.pool_protocol import (
     AuthenticationPayload,
 )
 from silicoin.protocols.protocol_message_types import ProtocolMessageTypes
+from silicoin.protocols.shared_protocol import Capability
 from silicoin.server.outbound_message import NodeType, make_msg
 from silicoin.server.server import ssl_context_for_root
 from silicoin.server.ws_connection import WSSilicoinConnection
@@ -40,7 +41,7 @@ from silicoin.types.blockchain_format.proof_of_space import ProofOfSpace
 from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.util.bech32m import decode_puzzle_hash
 from silicoin.util.byte_types import hexstr_to_bytes
-from silicoin.util.config import load_config, save_config, config_path_for_filename
+from silicoin.util.config import load_config, load_config_view, save_config, config_path_for_filename
 from silicoin.util.hash import std_hash
 from silicoin.util.ints import uint8, uint16, uint32, uint64
 from silicoin.util.keychain import Keychain
@@ -69,15 +70,69 @@ HARVESTER PROTOCOL (FARMER <-> HARVESTER)
 
 class HarvesterCacheEntry:
     def __init__(self):
-        self.data: Optional[dict] = None
+        # Plots of the harvester in their json form, by filename
+        self.plots: Dict[str, Dict] = {}
+        self.failed_to_open_filenames: List[str] = []
+        self.no_key_filenames: List[str] = []
+        # The harvester's plot list version the cache is at, used for delta requests
+        self.sync_id: bytes32 = bytes32(b"\x00" * 32)
+        self.version: uint64 = uint64(0)
+        self.has_data: bool = False
         self.last_update: float = 0
 
+    @property
+    def data(self) -> Optional[dict]:
+        if not self.has_data:
+            return None
+        return {
+            "plots": list(self.plots.values()),
+            "failed_to_open_filenames": self.failed_to_open_filenames,
+            "no_key_filenames": self.no_key_filenames,
+        }
+
     def bump_last_update(self):
         self.last_update = time.time()
 
-    def set_data(self, data):
-        self.data = data
+    def set_plots(self, response: harvester_protocol.RespondPlots) -> bool:
+        """
+        Replaces the cache with a full plot list, returns True if anything changed.
+        """
+        new_plots: Dict[str, Dict] = {plot.filename: plot.to_json_dict() for plot in response.plots}
+        changed = self._set_filenames(response.failed_to_open_filenames, response.no_key_filenames)
+        if not self.has_data or new_plots != self.plots:
+            changed = True
+        self.plots = new_plots
+        self.sync_id = bytes32(b"\x00" * 32)
+        self.version = uint64(0)
+        self.has_data = True
+        self.bump_last_update()
+        return changed
+
+    def apply_delta(self, delta: harvester_protocol.RespondPlotsDelta) -> bool:
+        """
+        Applies the plots changed since the cached version, returns True if anything changed.
+        """
+        changed = self._set_filenames(delta.failed_to_open_filenames, delta.no_key_filenames)
+        if delta.full_sync:
+            changed = changed or not self.has_data or len(self.plots) > 0 or len(delta.plots) > 0
+            self.plots = {}
+        for filename in delta.removed_filenames:
+            if self.plots.pop(filename, None) is not None:
+                changed = True
+        for plot in delta.plots:
+            self.plots[plot.filename] = plot.to_json_dict()
+            changed = True
+        self.sync_id = delta.sync_id
+        self.version = delta.version
+        self.has_data = True
         self.bump_last_update()
+        return changed
+
+    def _set_filenames(self, failed_to_open_filenames: List[str], no_key_filenames: List[str]) -> bool:
+        changed = failed_to_open_filenames != self.failed_to_open_filenames or no_key_filenames != self.no_key_filenames
+        self.failed_to_open_filenames = failed_to_open_filenames
+        self.no_key_filenames = no_key_filenames
+        return changed
 
     def needs_update(self, update_interval: int):
         return time.time() - self.last_update > update_interval
@@ -366,7 +421,7 @@ class Farmer:
         return None
 
     async def update_pool_state(self):
-        config = load_config(self._root_path, "config.yaml")
+        config = load_config_view(self._root_path, "config.yaml")
         pool_config_list: List[PoolWalletConfig] = load_pool_config(self._root_path)
         for pool_config in pool_config_list:
             p2_singleton_puzzle_hash = pool_config.p2_singleton_puzzle_hash
@@ -607,35 +662,51 @@ class Farmer:
                 remove_hosts.append(host)
         for key in remove_hosts:
             del self.harvester_cache[key]
-        # Now query each harvester and update caches
-        updated = False
+        # Now query the harvesters which need an update, concurrently
+        update_tasks = []
         for connection in self.server.get_connections(NodeType.HARVESTER):
             cache_entry = await self.get_cached_harvesters(connection)
             if cache_entry.needs_update(self.update_harvester_cache_interval):
                 self.log.debug(f"update_cached_harvesters update harvester: {connection.peer_node_id}")
                 cache_entry.bump_last_update()
-                response = await connection.request_plots(
-                    harvester_protocol.RequestPlots(), timeout=self.update_harvester_cache_interval
-                )
-                if response is not None:
-                    if isinstance(response, harvester_protocol.RespondPlots):
-                        new_data: Dict = response.to_json_dict()
-                        if cache_entry.data != new_data:
-                            updated = True
-                            self.log.debug(f"update_cached_harvesters cache updated: {connection.peer_node_id}")
-                        else:
-                            self.log.debug(f"update_cached_harvesters no changes for: {connection.peer_node_id}")
-                        cache_entry.set_data(new_data)
-                    else:
-                        self.log.error(
-                            f"Invalid response from harvester:"
-                            f"peer_host {connection.peer_host}, peer_node_id {connection.peer_node_id}"
-                        )
-                else:
-                    self.log.error(
-                        f"Harvester '{connection.peer_host}/{connection.peer_node_id}' did not respond: "
-                        f"(version mismatch or time out {UPDATE_HARVESTER_CACHE_INTERVAL}s)"
-                    )
+                update_tasks.append(self.update_cached_harvester(connection, cache_entry))
+        results = await asyncio.gather(*update_tasks)
+        return any(results)
+
+    async def update_cached_harvester(self, connection: WSSilicoinConnection, cache_entry: HarvesterCacheEntry) -> bool:
+        """
+        Updates the plots cache of one harvester. Harvesters that support it only send the plots changed since the
+        cached version. Returns True if the cache changed.
+        """
+        if connection.has_capability(Capability.PLOTS_DELTA):
+            response = await connection.request_plots_delta(
+                harvester_protocol.RequestPlotsDelta(cache_entry.sync_id, cache_entry.version),
+                timeout=self.update_harvester_cache_interval,
+            )
+        else:
+            response = await connection.request_plots(
+                harvester_protocol.RequestPlots(), timeout=self.update_harvester_cache_interval
+            )
+        if response is None:
+            self.log.error(
+                f"Harvester '{connection.peer_host}/{connection.peer_node_id}' did not respond: "
+                f"(version mismatch or time out {UPDATE_HARVESTER_CACHE_INTERVAL}s)"
+            )
+            return False
+        if isinstance(response, harvester_protocol.RespondPlotsDelta):
+            updated = cache_entry.apply_delta(response)
+        elif isinstance(response, harvester_protocol.RespondPlots):
+            updated = cache_entry.set_plots(response)
+        else:
+            self.log.error(
+                f"Invalid response from harvester:"
+                f"peer_host {connection.peer_host}, peer_node_id {connection.peer_node_id}"
+            )
+            return False
+        if updated:
+            self.log.debug(f"update_cached_harvesters cache updated: {connection.peer_node_id}")
+        else:
+            self.log.debug(f"update_cached_harvesters no changes for: {connection.peer_node_id}")
         return updated
 
     async def get_cached_harvesters(self, connection: WSSilicoinConnection) -> HarvesterCacheEntry:
@@ -654,8 +725,8 @@ class Farmer:
         for connection in self.server.get_connections(NodeType.HARVESTER):
             self.log.debug(f"get_harvesters host: {connection.peer_host}, node_id: {connection.peer_node_id}")
             cache_entry = await self.get_cached_harvesters(connection)
-            if cache_entry.data is not None:
-                harvester_object: dict = dict(cache_entry.data)
+            harvester_object: Optional[dict] = cache_entry.data
+            if harvester_object is not None:
                 harvester_object["connection"] = {
                     "node_id": connection.peer_node_id.hex(),
                     "host": connection.peer_host,
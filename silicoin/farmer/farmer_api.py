@@ -528,6 +528,11 @@ class FarmerAPI:
     async def respond_plots(self, _: harvester_protocol.RespondPlots, peer: ws.WSSilicoinConnection):
         self.farmer.log.warning(f"Respond plots came too late from: {peer.get_peer_logging()}")
 
+    @api_request
+    @peer_required
+    async def respond_plots_delta(self, _: harvester_protocol.RespondPlotsDelta, peer: ws.WSSilicoinConnection):
+        self.farmer.log.warning(f"Respond plots delta came too late from: {peer.get_peer_logging()}")
+
     @api_request
     async def respond_stakings(self, response: farmer_protocol.FarmerStakings):
         self.farmer.log.warning("Respond stakings came too late")
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import silicoin.server.ws_connection as ws  # lgtm [py/import-and-import-from]
+from silicoin.protocols.full_node_protocol import RequestBlocks, RespondBlocks
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.types.full_block import FullBlock
+from silicoin.util.ints import uint32
+
+log = logging.getLogger(__name__)
+
+# Weight of the newest sample in the per-peer throughput average
+THROUGHPUT_SMOOTHING = 0.3
+
+
+@dataclass
+class PeerDownloadStats:
+    peer: ws.WSSilicoinConnection
+    in_flight: int = 0
+    blocks_received: int = 0
+    failures: int = 0
+    # Exponential moving average of blocks per second, None until the first batch arrives
+    blocks_per_second: Optional[float] = None
+
+    def record_batch(self, block_count: int, duration: float) -> None:
+        self.blocks_received += block_count
+        sample = block_count / max(duration, 0.001)
+        if self.blocks_per_second is None:
+            self.blocks_per_second = sample
+        else:
+            self.blocks_per_second += THROUGHPUT_SMOOTHING * (sample - self.blocks_per_second)
+
+
+class BlockDownloadScheduler:
+    """
+    Downloads the blocks from start_height to end_height (inclusive) from several peers at once, and hands them out
+    in height order. Every peer can have a few batch requests outstanding, and the size of a new batch depends on how
+    fast the peer delivered so far compared to the fastest peer, so slow peers do not hold back the in order hand
+    off with large batches. Batches which fail are requested again from another peer.
+
+    The scheduler never requests blocks further than max_buffered_blocks ahead of the next batch to hand out, which
+    bounds the memory used by batches that arrived out of order.
+    """
+
+    def __init__(
+        self,
+        start_height: int,
+        end_height: int,
+        get_peers: Callable[[], List[ws.WSSilicoinConnection]],
+        max_batch_size: int,
+        min_batch_size: int = 8,
+        max_requests_per_peer: int = 2,
+        max_buffered_blocks: Optional[int] = None,
+        request_timeout: int = 10,
+    ):
+        self.start_height = start_height
+        self.end_height = end_height
+        self.get_peers = get_peers
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = max(1, min(min_batch_size, max_batch_size))
+        self.max_requests_per_peer = max_requests_per_peer
+        if max_buffered_blocks is None:
+            max_buffered_blocks = 8 * max_batch_size
+        self.max_buffered_blocks = max_buffered_blocks
+        self.request_timeout = request_timeout
+
+        self.peers: Dict[bytes32, PeerDownloadStats] = {}
+        # Peers which failed or were removed, they are not used again during this download
+        self.dropped_peers: Set[bytes32] = set()
+        # First height which has not been assigned to any batch yet
+        self.next_unassigned = start_height
+        # Ranges which have to be requested (again), before new ranges are assigned
+        self.retry_ranges: List[Tuple[int, int]] = []
+        # start height -> (peer, blocks), for batches which arrived but can not be handed out yet
+        self.completed: Dict[int, Tuple[ws.WSSilicoinConnection, List[FullBlock]]] = {}
+        # First height which has not been handed out yet
+        self.next_to_deliver = start_height
+        self.requests: Dict[asyncio.Task, Tuple[PeerDownloadStats, int, int, float]] = {}
+
+    def refresh_peers(self) -> None:
+        for peer in self.get_peers():
+            if peer.closed or peer.peer_node_id in self.dropped_peers or peer.peer_node_id in self.peers:
+                continue
+            self.peers[peer.peer_node_id] = PeerDownloadStats(peer)
+
+    def remove_peer(self, peer: ws.WSSilicoinConnection) -> None:
+        self.dropped_peers.add(peer.peer_node_id)
+        self.peers.pop(peer.peer_node_id, None)
+
+    def batch_size_for(self, stats: PeerDownloadStats) -> int:
+        if stats.blocks_per_second is None:
+            # Unknown peers start in the middle, until they have shown how fast they are
+            return max(self.min_batch_size, self.max_batch_size // 2)
+        fastest = max(s.blocks_per_second for s in self.peers.values() if s.blocks_per_second is not None)
+        size = int(self.max_batch_size * stats.blocks_per_second / fastest)
+        return max(self.min_batch_size, min(self.max_batch_size, size))
+
+    def _next_range(self, stats: PeerDownloadStats) -> Optional[Tuple[int, int]]:
+        if len(self.retry_ranges) > 0:
+            self.retry_ranges.sort()
+            return self.retry_ranges.pop(0)
+        if self.next_unassigned > self.end_height:
+            return None
+        if self.next_unassigned >= self.next_to_deliver + self.max_buffered_blocks:
+            return None
+        start = self.next_unassigned
+        end = min(self.end_height, start + self.batch_size_for(stats) - 1)
+        self.next_unassigned = end + 1
+        return start, end
+
+    def _assign_requests(self) -> None:
+        # Least loaded and fastest peers get work first
+        candidates = sorted(self.peers.values(), key=lambda s: (s.in_flight, -(s.blocks_per_second or 0.0), s.failures))
+        for stats in candidates:
+            while stats.in_flight < self.max_requests_per_peer:
+                if stats.peer.closed:
+                    self.remove_peer(stats.peer)
+                    break
+                block_range = self._next_range(stats)
+                if block_range is None:
+                    return
+                start, end = block_range
+                request = RequestBlocks(uint32(start), uint32(end), True)
+                task = asyncio.create_task(stats.peer.request_blocks(request, timeout=self.request_timeout))
+                self.requests[task] = (stats, start, end, time.monotonic())
+                stats.in_flight += 1
+
+    async def _handle_response(self, task: asyncio.Task) -> None:
+        stats, start, end, started = self.requests.pop(task)
+        stats.in_flight -= 1
+        response = None
+        if not task.cancelled() and task.exception() is None:
+            response = task.result()
+        elif not task.cancelled():
+            log.warning(f"Exception requesting blocks {start} to {end} from {stats.peer.peer_host}: {task.exception()}")
+
+        if (
+            isinstance(response, RespondBlocks)
+            and len(response.blocks) == end - start + 1
+            and response.blocks[0].height == start
+            and response.blocks[-1].height == end
+        ):
+            stats.record_batch(len(response.blocks), time.monotonic() - started)
+            self.completed[start] = (stats.peer, response.blocks)
+            return
+
+        self.retry_ranges.append((start, end))
+        stats.failures += 1
+        if stats.peer.peer_node_id in self.dropped_peers:
+            return
+        self.remove_peer(stats.peer)
+        if response is None:
+            # Timed out or disconnected
+            await stats.peer.close()
+        else:
+            log.info(f"Peer {stats.peer.peer_host} did not send blocks {start} to {end}, not using it for sync")
+
+    async def batches(self) -> AsyncIterator[Tuple[ws.WSSilicoinConnection, List[FullBlock]]]:
+        """
+        Yields (peer, blocks) in height order until end_height was handed out. Raises ValueError if no peer is left
+        to fetch the remaining blocks from.
+        """
+        try:
+            while self.next_to_deliver <= self.end_height:
+                while self.next_to_deliver in self.completed:
+                    peer, blocks = self.completed.pop(self.next_to_deliver)
+                    self.next_to_deliver = blocks[-1].height + 1
+                    yield peer, blocks
+                if self.next_to_deliver > self.end_height:
+                    break
+
+                self.refresh_peers()
+                self._assign_requests()
+                if len(self.requests) == 0:
+                    raise ValueError(f"failed fetching {self.next_to_deliver} to {self.end_height} from peers")
+                done, _ = await asyncio.wait(self.requests.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    await self._handle_response(task)
+        finally:
+            for task in self.requests.keys():
+                task.cancel()
+            self.requests.clear()
+            for stats in self.peers.values():
+                if stats.blocks_received > 0:
+                    log.debug(
+                        f"Fetched {stats.blocks_received} blocks from {stats.peer.peer_host} "
+                        f"at {stats.blocks_per_second:.1f} blocks/s, {stats.failures} failures"
+                    )
@@ -1,5 +1,6 @@
 import logging
-from typing import Dict, List, Optional, Tuple
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
 
 import aiosqlite
 
@@ -9,21 +10,44 @@ from silicoin.types.blockchain_format.sub_epoch_summary import SubEpochSummary
 from silicoin.types.full_block import FullBlock
 from silicoin.types.weight_proof import SubEpochChallengeSegment, SubEpochSegments
 from silicoin.util.db_wrapper import DBWrapper
+from silicoin.util.height_map import HeightMap
 from silicoin.util.ints import uint32
 from silicoin.util.lru_cache import LRUCache
 
 log = logging.getLogger(__name__)
 
+# Marks a compressed block blob. A serialized FullBlock starts with the 4 byte length of its finished sub slots, so
+# its first byte is never 0xff, and blocks stored without compression stay readable.
+COMPRESSED_BLOCK_PREFIX = b"\xff"
+BLOCK_COMPRESSION_LEVEL = 3
+
+
+def compress_block_bytes(block_bytes: bytes) -> bytes:
+    return COMPRESSED_BLOCK_PREFIX + zlib.compress(block_bytes, BLOCK_COMPRESSION_LEVEL)
+
+
+def decompress_block_bytes(blob: bytes) -> bytes:
+    if blob[:1] == COMPRESSED_BLOCK_PREFIX:
+        return zlib.decompress(blob[1:])
+    return blob
+
 
 class BlockStore:
     db: aiosqlite.Connection
     block_cache: LRUCache
+    # Serialized blocks, so peers requesting the same recent blocks don't decompress them each time
+    block_bytes_cache: LRUCache
     db_wrapper: DBWrapper
     ses_challenge_cache: LRUCache
+    compress_blocks: bool
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper):
+    async def create(cls, db_wrapper: DBWrapper, compress_blocks: bool = False):
+        """
+        If compress_blocks is set, new blocks are stored compressed. Blocks are readable either way.
+        """
         self = cls()
+        self.compress_blocks = compress_blocks
 
         # All full blocks which have been added to the blockchain. Header_hash -> block
         self.db_wrapper = db_wrapper
@@ -41,6 +65,9 @@ class BlockStore:
             "farmer_public_key BLOB)"
         )
 
+        # Header hashes of the blocks in the path to the peak, clustered by height
+        await self.db.execute("CREATE TABLE IF NOT EXISTS main_chain(height INTEGER PRIMARY KEY, header_hash blob)")
+
         # todo remove in v1.2
         await self.db.execute("DROP TABLE IF EXISTS sub_epoch_segments_v2")
 
@@ -67,11 +94,18 @@ class BlockStore:
 
         await self.db.commit()
         self.block_cache = LRUCache(1000)
+        self.block_bytes_cache = LRUCache(200)
         self.ses_challenge_cache = LRUCache(50)
         return self
 
     async def add_full_block(self, header_hash: bytes32, block: FullBlock, block_record: BlockRecord) -> None:
         self.block_cache.put(header_hash, block)
+        block_bytes = bytes(block)
+        # The block may replace an older version of itself, for example with compact proofs
+        try:
+            self.block_bytes_cache.remove(header_hash)
+        except KeyError:
+            pass
         cursor_1 = await self.db.execute(
             "INSERT OR REPLACE INTO full_blocks VALUES(?, ?, ?, ?, ?)",
             (
@@ -79,7 +113,7 @@ class BlockStore:
                 block.height,
                 int(block.is_transaction_block()),
                 int(block.is_fully_compactified()),
-                bytes(block),
+                compress_block_bytes(block_bytes) if self.compress_blocks else block_bytes,
             ),
         )
 
@@ -131,6 +165,15 @@ class BlockStore:
             return challenge_segments
         return None
 
+    async def get_sub_epoch_challenge_segment_hashes(self) -> Set[bytes32]:
+        """
+        Returns the header hashes of the sub epoch summary blocks with persisted challenge segments.
+        """
+        cursor = await self.db.execute("SELECT ses_block_hash from sub_epoch_segments_v3")
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return {bytes32(bytes.fromhex(row[0])) for row in rows}
+
     def rollback_cache_block(self, header_hash: bytes32):
         try:
             self.block_cache.remove(header_hash)
@@ -138,6 +181,10 @@ class BlockStore:
             # this is best effort. When rolling back, we may not have added the
             # block to the cache yet
             pass
+        try:
+            self.block_bytes_cache.remove(header_hash)
+        except KeyError:
+            pass
 
     async def get_full_block(self, header_hash: bytes32) -> Optional[FullBlock]:
         cached = self.block_cache.get(header_hash)
@@ -149,22 +196,29 @@ class BlockStore:
         row = await cursor.fetchone()
         await cursor.close()
         if row is not None:
-            block = FullBlock.from_bytes(row[0])
+            block = FullBlock.from_bytes(decompress_block_bytes(row[0]))
             self.block_cache.put(header_hash, block)
             return block
         return None
 
     async def get_full_block_bytes(self, header_hash: bytes32) -> Optional[bytes]:
+        cached_bytes = self.block_bytes_cache.get(header_hash)
+        if cached_bytes is not None:
+            return cached_bytes
         cached = self.block_cache.get(header_hash)
         if cached is not None:
             log.debug(f"cache hit for block {header_hash.hex()}")
-            return bytes(cached)
+            block_bytes = bytes(cached)
+            self.block_bytes_cache.put(header_hash, block_bytes)
+            return block_bytes
         log.debug(f"cache miss for block {header_hash.hex()}")
         cursor = await self.db.execute("SELECT block from full_blocks WHERE header_hash=?", (header_hash.hex(),))
         row = await cursor.fetchone()
         await cursor.close()
         if row is not None:
-            return row[0]
+            block_bytes = decompress_block_bytes(row[0])
+            self.block_bytes_cache.put(header_hash, block_bytes)
+            return block_bytes
         return None
 
     async def get_full_blocks_at(self, heights: List[uint32]) -> List[FullBlock]:
@@ -176,7 +230,7 @@ class BlockStore:
         cursor = await self.db.execute(formatted_str, heights_db)
         rows = await cursor.fetchall()
         await cursor.close()
-        return [FullBlock.from_bytes(row[0]) for row in rows]
+        return [FullBlock.from_bytes(decompress_block_bytes(row[0])) for row in rows]
 
     async def get_block_records_by_hash(self, header_hashes: List[bytes32]):
         """
@@ -221,7 +275,7 @@ class BlockStore:
         all_blocks: Dict[bytes32, FullBlock] = {}
         for row in rows:
             header_hash = bytes.fromhex(row[0])
-            full_block: FullBlock = FullBlock.from_bytes(row[1])
+            full_block: FullBlock = FullBlock.from_bytes(decompress_block_bytes(row[1]))
             all_blocks[header_hash] = full_block
             self.block_cache.put(header_hash, full_block)
         ret: List[FullBlock] = []
@@ -264,6 +318,25 @@ class BlockStore:
 
         return ret
 
+    async def get_main_chain_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
+        """
+        Returns a dictionary with the blocks in the path to the peak with heights between start and stop, without
+        the orphan blocks at these heights.
+        """
+        cursor = await self.db.execute(
+            "SELECT block_records.block from main_chain "
+            "JOIN block_records ON block_records.header_hash=lower(hex(main_chain.header_hash)) "
+            "WHERE main_chain.height>=? AND main_chain.height<=?",
+            (start, stop),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        ret: Dict[bytes32, BlockRecord] = {}
+        for row in rows:
+            block_record = BlockRecord.from_bytes(row[0])
+            ret[block_record.header_hash] = block_record
+        return ret
+
     async def get_block_records_close_to_peak(
         self, blocks_n: int
     ) -> Tuple[Dict[bytes32, BlockRecord], Optional[bytes32]]:
@@ -288,46 +361,123 @@ class BlockStore:
             ret[header_hash] = BlockRecord.from_bytes(row[1])
         return ret, bytes.fromhex(peak_row[0])
 
-    async def get_peak_height_dicts(self) -> Tuple[Dict[uint32, bytes32], Dict[uint32, SubEpochSummary]]:
+    async def get_peak_height_dicts(
+        self, snapshot: Optional[Tuple[HeightMap, Dict[uint32, SubEpochSummary]]] = None
+    ) -> Tuple[HeightMap, Dict[uint32, SubEpochSummary], bool]:
         """
-        Returns a dictionary with all blocks, as well as the header hash of the peak,
-        if present.
+        Returns the header hashes of the blocks in the path to the peak by height, the sub epoch summaries included
+        in them, and whether they were extended from the snapshot. A snapshot, if given and still a prefix of the
+        path to the peak, is extended with the blocks after it instead of reading the whole chain.
         """
 
-        res = await self.db.execute("SELECT * from block_records WHERE is_peak = 1")
+        res = await self.db.execute("SELECT header_hash, height from block_records WHERE is_peak = 1")
         row = await res.fetchone()
         await res.close()
         if row is None:
-            return {}, {}
+            return HeightMap(), {}, False
+        peak: bytes32 = bytes32(bytes.fromhex(row[0]))
+        peak_height: int = row[1]
+
+        if snapshot is not None:
+            from_snapshot = await self._extend_snapshot(snapshot[0], snapshot[1], peak, peak_height)
+            if from_snapshot is not None:
+                return from_snapshot[0], from_snapshot[1], True
+            log.info("The height to hash snapshot does not match the peak, reading the main chain")
+
+        cursor = await self.db.execute("SELECT header_hash from main_chain ORDER BY height")
+        height_to_hash = HeightMap.from_hashes(row[0] for row in await cursor.fetchall())
+        await cursor.close()
+        if len(height_to_hash) != peak_height + 1 or height_to_hash.get(uint32(peak_height)) != peak:
+            # Created before the main chain table existed, or not written with the peak
+            log.info("Rebuilding the main chain table from the block records")
+            height_to_hash = await self._walk_main_chain(peak)
+            async with self.db_wrapper.lock:
+                await self.set_main_chain(-1, [(uint32(h), height_to_hash[uint32(h)]) for h in range(peak_height + 1)])
+                await self.db.commit()
 
-        peak: bytes32 = bytes.fromhex(row[0])
-        cursor = await self.db.execute("SELECT header_hash,prev_hash,height,sub_epoch_summary from block_records")
+        sub_epoch_summaries: Dict[uint32, SubEpochSummary] = {}
+        cursor = await self.db.execute(
+            "SELECT header_hash, height, sub_epoch_summary from block_records WHERE sub_epoch_summary IS NOT NULL"
+        )
+        for row in await cursor.fetchall():
+            if height_to_hash.get(row[1]) == bytes.fromhex(row[0]):
+                sub_epoch_summaries[row[1]] = SubEpochSummary.from_bytes(row[2])
+        await cursor.close()
+        return height_to_hash, sub_epoch_summaries, False
+
+    async def _extend_snapshot(
+        self,
+        height_to_hash: HeightMap,
+        sub_epoch_summaries: Dict[uint32, SubEpochSummary],
+        peak: bytes32,
+        peak_height: int,
+    ) -> Optional[Tuple[HeightMap, Dict[uint32, SubEpochSummary]]]:
+        snapshot_height = len(height_to_hash) - 1
+        if snapshot_height < 0 or snapshot_height > peak_height:
+            return None
+        # Each block commits to its parent, so matching at the last height means all the lower ones match as well
+        cursor = await self.db.execute("SELECT header_hash from main_chain WHERE height=?", (snapshot_height,))
+        row = await cursor.fetchone()
+        await cursor.close()
+        if row is None or height_to_hash.get(uint32(snapshot_height)) != row[0]:
+            return None
+
+        cursor = await self.db.execute(
+            "SELECT height, header_hash from main_chain WHERE height>? ORDER BY height", (snapshot_height,)
+        )
+        for row in await cursor.fetchall():
+            height_to_hash[row[0]] = row[1]
+        await cursor.close()
+        if len(height_to_hash) != peak_height + 1 or height_to_hash.get(uint32(peak_height)) != peak:
+            return None
+
+        cursor = await self.db.execute(
+            "SELECT header_hash, height, sub_epoch_summary from block_records "
+            "WHERE sub_epoch_summary IS NOT NULL AND height>?",
+            (snapshot_height,),
+        )
+        for row in await cursor.fetchall():
+            if height_to_hash.get(row[1]) == bytes.fromhex(row[0]):
+                sub_epoch_summaries[row[1]] = SubEpochSummary.from_bytes(row[2])
+        await cursor.close()
+        log.info(f"Loaded the main chain from a snapshot at height {snapshot_height}")
+        return height_to_hash, sub_epoch_summaries
+
+    async def _walk_main_chain(self, peak: bytes32) -> HeightMap:
+        cursor = await self.db.execute("SELECT header_hash,prev_hash,height from block_records")
         rows = await cursor.fetchall()
         await cursor.close()
         hash_to_prev_hash: Dict[bytes32, bytes32] = {}
         hash_to_height: Dict[bytes32, uint32] = {}
-        hash_to_summary: Dict[bytes32, SubEpochSummary] = {}
 
         for row in rows:
             hash_to_prev_hash[bytes.fromhex(row[0])] = bytes.fromhex(row[1])
             hash_to_height[bytes.fromhex(row[0])] = row[2]
-            if row[3] is not None:
-                hash_to_summary[bytes.fromhex(row[0])] = SubEpochSummary.from_bytes(row[3])
-
-        height_to_hash: Dict[uint32, bytes32] = {}
-        sub_epoch_summaries: Dict[uint32, SubEpochSummary] = {}
 
+        height_to_hash = HeightMap()
         curr_header_hash = peak
         curr_height = hash_to_height[curr_header_hash]
         while True:
             height_to_hash[curr_height] = curr_header_hash
-            if curr_header_hash in hash_to_summary:
-                sub_epoch_summaries[curr_height] = hash_to_summary[curr_header_hash]
             if curr_height == 0:
                 break
             curr_header_hash = hash_to_prev_hash[curr_header_hash]
             curr_height = hash_to_height[curr_header_hash]
-        return height_to_hash, sub_epoch_summaries
+        return height_to_hash
+
+    async def set_main_chain(self, fork_height: int, hashes: List[Tuple[uint32, bytes32]]) -> None:
+        """
+        Replaces the main chain above fork_height with the (height, header_hash) pairs, which must cover the
+        heights from fork_height + 1 up to the new peak.
+        Like set_peak, this must be called in a transaction.
+        """
+        cursor_1 = await self.db.execute("DELETE FROM main_chain WHERE height>?", (fork_height,))
+        await cursor_1.close()
+        cursor_2 = await self.db.executemany(
+            "INSERT OR REPLACE INTO main_chain VALUES(?, ?)",
+            [(height, bytes(header_hash)) for height, header_hash in hashes],
+        )
+        await cursor_2.close()
 
     async def set_peak(self, header_hash: bytes32) -> None:
         # We need to be in a sqlite transaction here.
@@ -366,3 +516,16 @@ class BlockStore:
             heights.append(int(row[0]))
 
         return heights
+
+    async def get_not_compactified_heights(self, start_height: int, number: int) -> List[int]:
+        """
+        Like get_random_not_compactified, but returns the lowest heights above start_height in order.
+        """
+        cursor = await self.db.execute(
+            "SELECT height FROM full_blocks WHERE height>? GROUP BY height HAVING sum(is_fully_compactified)=0 "
+            "ORDER BY height LIMIT ?",
+            (start_height, number),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return [int(row[0]) for row in rows]
@@ -1,4 +1,4 @@
-from typing import List, Optional, Set, Dict
+from typing import List, Optional, Set, Dict, Tuple
 import aiosqlite
 from silicoin.protocols.wallet_protocol import CoinState
 from silicoin.types.blockchain_format.coin import Coin
@@ -7,11 +7,22 @@ from silicoin.types.coin_record import CoinRecord
 from silicoin.util.db_wrapper import DBWrapper
 from silicoin.util.ints import uint32, uint64
 from silicoin.util.lru_cache import LRUCache
+from silicoin.util.pagination import PagePosition
 from time import time
 import logging
 
 log = logging.getLogger(__name__)
 
+# Indexes which only serve queries, and are not needed to validate blocks. On a first sync they can be built once at
+# the end, instead of being updated for every coin. The puzzle hash index is always kept, since the farmer
+# difficulty coefficients look up staking coins by puzzle hash while validating.
+DEFERRABLE_INDEXES: Dict[str, str] = {
+    # Useful for reorg lookups
+    "coin_confirmed_index": "CREATE INDEX IF NOT EXISTS coin_confirmed_index on coin_record(confirmed_index)",
+    "coin_spent_index": "CREATE INDEX IF NOT EXISTS coin_spent_index on coin_record(spent_index)",
+    "coin_parent_index": "CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)",
+}
+
 
 class CoinStore:
     """
@@ -23,9 +34,15 @@ class CoinStore:
     coin_record_cache: LRUCache
     cache_size: uint32
     db_wrapper: DBWrapper
+    # True while the DEFERRABLE_INDEXES are not built
+    indexes_deferred: bool
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper, cache_size: uint32 = uint32(60000)):
+    async def create(cls, db_wrapper: DBWrapper, cache_size: uint32 = uint32(60000), defer_indexes: bool = False):
+        """
+        If defer_indexes is set and the coin store is empty, the DEFERRABLE_INDEXES are not created until
+        build_deferred_indexes is called, which speeds up syncing from genesis.
+        """
         self = cls()
 
         self.cache_size = cache_size
@@ -48,12 +65,14 @@ class CoinStore:
             )
         )
 
-        # Useful for reorg lookups
-        await self.coin_record_db.execute(
-            "CREATE INDEX IF NOT EXISTS coin_confirmed_index on coin_record(confirmed_index)"
-        )
-
-        await self.coin_record_db.execute("CREATE INDEX IF NOT EXISTS coin_spent_index on coin_record(spent_index)")
+        self.indexes_deferred = False
+        if defer_indexes:
+            cursor = await self.coin_record_db.execute("SELECT 1 FROM coin_record LIMIT 1")
+            self.indexes_deferred = (await cursor.fetchone()) is None
+            await cursor.close()
+        if not self.indexes_deferred:
+            for index_sql in DEFERRABLE_INDEXES.values():
+                await self.coin_record_db.execute(index_sql)
 
         # earlier versions of silicoin created this index despite no lookups needing
         # it. For now, just don't create it for new installs. In the future we
@@ -62,12 +81,21 @@ class CoinStore:
 
         await self.coin_record_db.execute("CREATE INDEX IF NOT EXISTS coin_puzzle_hash on coin_record(puzzle_hash)")
 
-        await self.coin_record_db.execute("CREATE INDEX IF NOT EXISTS coin_parent_index on coin_record(coin_parent)")
-
         await self.coin_record_db.commit()
         self.coin_record_cache = LRUCache(cache_size)
         return self
 
+    async def build_deferred_indexes(self) -> None:
+        if not self.indexes_deferred:
+            return None
+        start = time()
+        async with self.db_wrapper.lock:
+            for index_sql in DEFERRABLE_INDEXES.values():
+                await self.coin_record_db.execute(index_sql)
+            await self.coin_record_db.commit()
+        self.indexes_deferred = False
+        log.info(f"Built deferred coin store indexes in {time() - start:0.2f}s")
+
     async def new_block(
         self,
         height: uint32,
@@ -80,50 +108,87 @@ class CoinStore:
         Only called for blocks which are blocks (and thus have rewards and transactions)
         Returns a list of the CoinRecords that were added by this block
         """
+        return (await self.new_blocks([(height, timestamp, included_reward_coins, tx_additions, tx_removals)]))[0]
 
-        start = time()
+    async def new_blocks(
+        self, blocks: List[Tuple[uint32, uint64, Set[Coin], List[Coin], List[bytes32]]]
+    ) -> List[List[CoinRecord]]:
+        """
+        Applies the additions and removals of several transaction blocks, in height order, with one insert and one
+        update. Each entry is (height, timestamp, included_reward_coins, tx_additions, tx_removals), as passed to
+        new_block. Coins which are created and spent within the batch are inserted as spent, and the cache is only
+        updated once the batch is written.
+        Returns, for each block, the list of the CoinRecords that were added by it
+        """
 
-        additions = []
+        start = time()
 
-        for coin in tx_additions:
-            record: CoinRecord = CoinRecord(
-                coin,
-                height,
-                uint32(0),
-                False,
-                False,
-                timestamp,
-            )
-            additions.append(record)
+        all_additions: List[List[CoinRecord]] = []
+        # Records to insert, and the index of each coin created in this batch. Duplicates are kept, so the insert
+        # fails like it would for separate blocks
+        new_records: List[CoinRecord] = []
+        new_record_index: Dict[bytes32, int] = {}
+        # coin name -> spent height, for the coins created before this batch
+        spends: Dict[bytes32, uint32] = {}
+        removal_count = 0
+
+        for height, timestamp, included_reward_coins, tx_additions, tx_removals in blocks:
+            additions = []
+
+            for coin in tx_additions:
+                record: CoinRecord = CoinRecord(
+                    coin,
+                    height,
+                    uint32(0),
+                    False,
+                    False,
+                    timestamp,
+                )
+                additions.append(record)
 
-        if height == 0:
-            assert len(included_reward_coins) == 0
-        else:
-            assert len(included_reward_coins) >= 2
-
-        for coin in included_reward_coins:
-            reward_coin_r: CoinRecord = CoinRecord(
-                coin,
-                height,
-                uint32(0),
-                False,
-                True,
-                timestamp,
-            )
-            additions.append(reward_coin_r)
+            if height == 0:
+                assert len(included_reward_coins) == 0
+            else:
+                assert len(included_reward_coins) >= 2
 
-        await self._add_coin_records(additions)
-        await self._set_spent(tx_removals, height)
+            for coin in included_reward_coins:
+                reward_coin_r: CoinRecord = CoinRecord(
+                    coin,
+                    height,
+                    uint32(0),
+                    False,
+                    True,
+                    timestamp,
+                )
+                additions.append(reward_coin_r)
+
+            for record in additions:
+                new_record_index[record.name] = len(new_records)
+                new_records.append(record)
+            for coin_name in tx_removals:
+                index = new_record_index.get(coin_name)
+                if index is not None:
+                    created = new_records[index]
+                    new_records[index] = CoinRecord(
+                        created.coin, created.confirmed_block_index, height, True, created.coinbase, created.timestamp
+                    )
+                else:
+                    spends[coin_name] = height
+            removal_count += len(tx_removals)
+            all_additions.append(additions)
+
+        await self._add_coin_records(new_records)
+        await self._set_spent_at(spends)
 
         end = time()
         log.log(
             logging.WARNING if end - start > 10 else logging.DEBUG,
-            f"It took {end - start:0.2f}s to apply {len(tx_additions)} additions and "
-            + f"{len(tx_removals)} removals to the coin store. Make sure "
+            f"It took {end - start:0.2f}s to apply {len(new_records)} additions and "
+            + f"{removal_count} removals of {len(blocks)} blocks to the coin store. Make sure "
             + "blockchain database is on a fast drive",
         )
 
-        return additions
+        return all_additions
 
     # Checks DB and DiffStores for CoinRecord with coin_name and returns it
     async def get_coin_record(self, coin_name: bytes32) -> Optional[CoinRecord]:
@@ -218,6 +283,46 @@ class CoinStore:
             coins.add(CoinRecord(coin, row[1], row[2], row[3], row[4], row[8]))
         return list(coins)
 
+    async def get_coin_records_by_puzzle_hashes_page(
+        self,
+        include_spent_coins: bool,
+        puzzle_hashes: List[bytes32],
+        after: Optional[PagePosition],
+        limit: int,
+        start_height: uint32 = uint32(0),
+        end_height: uint32 = uint32((2 ** 32) - 1),
+    ) -> List[CoinRecord]:
+        """
+        Returns up to limit coin records ordered by (confirmed_index, coin_name), starting strictly after the
+        position `after`. Used to walk the coins of large puzzle hashes without loading them all at once.
+        """
+        if len(puzzle_hashes) == 0:
+            return []
+
+        puzzle_hashes_db = tuple([ph.hex() for ph in puzzle_hashes])
+        position_filter = ""
+        position_params: Tuple = ()
+        if after is not None:
+            position_filter = "AND (confirmed_index>? OR (confirmed_index=? AND coin_name>?)) "
+            position_params = (after[0], after[0], after[1].hex())
+        cursor = await self.coin_record_db.execute(
+            f"SELECT * from coin_record INDEXED BY coin_puzzle_hash "
+            f'WHERE puzzle_hash in ({"?," * (len(puzzle_hashes) - 1)}?) '
+            f"AND confirmed_index>=? AND confirmed_index<? "
+            f"{'' if include_spent_coins else 'AND spent=0 '}"
+            f"{position_filter}"
+            f"ORDER BY confirmed_index, coin_name LIMIT ?",
+            puzzle_hashes_db + (start_height, end_height) + position_params + (limit,),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+
+        coins: List[CoinRecord] = []
+        for row in rows:
+            coin = self.row_to_coin(row)
+            coins.append(CoinRecord(coin, row[1], row[2], row[3], row[4], row[8]))
+        return coins
+
     async def get_coin_records_by_names(
         self,
         include_spent_coins: bool,
@@ -397,7 +502,6 @@ class CoinStore:
 
         values = []
         for record in records:
-            self.coin_record_cache.put(record.coin.name(), record)
             values.append(
                 (
                     record.coin.name().hex(),
@@ -417,24 +521,30 @@ class CoinStore:
             values,
         )
         await cursor.close()
+        for record in records:
+            self.coin_record_cache.put(record.name, record)
 
     # Update coin_record to be spent in DB
     async def _set_spent(self, coin_names: List[bytes32], index: uint32):
+        await self._set_spent_at({coin_name: index for coin_name in coin_names})
 
-        # if this coin is in the cache, mark it as spent in there
+    async def _set_spent_at(self, spends: Dict[bytes32, uint32]):
         updates = []
-        for coin_name in coin_names:
-            r = self.coin_record_cache.get(coin_name)
-            if r is not None:
-                self.coin_record_cache.put(
-                    r.name, CoinRecord(r.coin, r.confirmed_block_index, index, True, r.coinbase, r.timestamp)
-                )
+        for coin_name, index in spends.items():
             updates.append((index, coin_name.hex()))
 
         await self.coin_record_db.executemany(
             "UPDATE OR FAIL coin_record SET spent=1,spent_index=? WHERE coin_name=?", updates
         )
 
+        # if this coin is in the cache, mark it as spent in there
+        for coin_name, index in spends.items():
+            r = self.coin_record_cache.get(coin_name)
+            if r is not None:
+                self.coin_record_cache.put(
+                    r.name, CoinRecord(r.coin, r.confirmed_block_index, index, True, r.coinbase, r.timestamp)
+                )
+
     async def get_unspent_coins_before_height(self, puzzle_hash: bytes, height: uint32) -> List[CoinRecord]:
         coins = set()
         cursor = await self.coin_record_db.execute(
@@ -450,3 +560,27 @@ class CoinStore:
             coin = Coin(bytes32(bytes.fromhex(row[6])), bytes32(bytes.fromhex(row[5])), uint64.from_bytes(row[7]))
             coins.add(CoinRecord(coin, row[1], row[2], row[3], row[4], row[8]))
         return list(coins)
+
+    async def get_unspent_amounts_before_heights(self, puzzle_hash: bytes32, heights: List[uint32]) -> List[uint64]:
+        """
+        Returns, for each height, the total amount of the coins with this puzzle hash that
+        get_unspent_coins_before_height would return, using a single query for all heights.
+        """
+        if len(heights) == 0:
+            return []
+        cursor = await self.coin_record_db.execute(
+            "SELECT confirmed_index, spent_index, spent, amount from coin_record INDEXED BY coin_puzzle_hash "
+            "WHERE puzzle_hash=? AND confirmed_index<? AND (spent=0 OR spent_index>=?) ",
+            (puzzle_hash.hex(), max(heights), min(heights)),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        coins = [(row[0], row[1], row[2], uint64.from_bytes(row[3])) for row in rows]
+        amounts: List[uint64] = []
+        for height in heights:
+            amount = 0
+            for confirmed_index, spent_index, spent, coin_amount in coins:
+                if confirmed_index < height and (spent == 0 or spent_index >= height):
+                    amount += coin_amount
+            amounts.append(uint64(amount))
+        return amounts
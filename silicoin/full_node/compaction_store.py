@@ -0,0 +1,117 @@
+import logging
+from typing import List, Optional, Tuple
+
+import aiosqlite
+
+from silicoin.protocols.timelord_protocol import RequestCompactProofOfTime
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.types.blockchain_format.vdf import VDFInfo
+from silicoin.util.db_wrapper import DBWrapper
+from silicoin.util.ints import uint8, uint32
+
+log = logging.getLogger(__name__)
+
+
+class CompactionStore:
+    """
+    The queue of uncompact VDFs of the chain which the bluebox timelords should compact, lowest height first. Each
+    VDF is leased to one timelord at a time, and goes back to the queue if no compact proof came back before the lease
+    expired. Entries are removed once the compact proof is in the chain.
+    """
+
+    db: aiosqlite.Connection
+    db_wrapper: DBWrapper
+
+    @classmethod
+    async def create(cls, db_wrapper: DBWrapper):
+        self = cls()
+        self.db_wrapper = db_wrapper
+        self.db = db_wrapper.db
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS compaction_queue(header_hash text, field_vdf tinyint, height bigint,"
+            " vdf_info blob, lessee text, lease_expiry bigint, PRIMARY KEY(header_hash, field_vdf))"
+        )
+        await self.db.execute("CREATE INDEX IF NOT EXISTS compaction_height on compaction_queue(height)")
+        await self.db.commit()
+        return self
+
+    async def add(self, requests: List[RequestCompactProofOfTime]) -> None:
+        """
+        Queues the VDFs, the ones already queued keep their lease.
+        """
+        async with self.db_wrapper.lock:
+            cursor = await self.db.executemany(
+                "INSERT OR IGNORE INTO compaction_queue VALUES(?, ?, ?, ?, NULL, 0)",
+                [
+                    (request.header_hash.hex(), request.field_vdf, request.height, bytes(request.new_proof_of_time))
+                    for request in requests
+                ],
+            )
+            await cursor.close()
+            await self.db_wrapper.commit_transaction()
+
+    async def lease(self, lessee: str, count: int, now: int, lease_time: int) -> List[RequestCompactProofOfTime]:
+        """
+        Leases up to count of the lowest VDFs that are not leased, or whose lease expired, to lessee until
+        now + lease_time.
+        """
+        async with self.db_wrapper.lock:
+            cursor = await self.db.execute(
+                "SELECT header_hash, field_vdf, height, vdf_info FROM compaction_queue WHERE lease_expiry<=? "
+                "ORDER BY height LIMIT ?",
+                (now, count),
+            )
+            rows = await cursor.fetchall()
+            await cursor.close()
+            cursor = await self.db.executemany(
+                "UPDATE compaction_queue SET lessee=?, lease_expiry=? WHERE header_hash=? AND field_vdf=?",
+                [(lessee, now + lease_time, row[0], row[1]) for row in rows],
+            )
+            await cursor.close()
+            await self.db_wrapper.commit_transaction()
+        return [
+            RequestCompactProofOfTime(
+                VDFInfo.from_bytes(row[3]), bytes32.fromhex(row[0]), uint32(row[2]), uint8(row[1])
+            )
+            for row in rows
+        ]
+
+    async def remove(self, header_hash: bytes32, field_vdf: int) -> Optional[str]:
+        """
+        Removes a VDF that got compacted or can't be compacted anymore. Returns the lessee, or an empty string if
+        it was not leased, and None if it was not queued.
+        """
+        async with self.db_wrapper.lock:
+            cursor = await self.db.execute(
+                "SELECT lessee FROM compaction_queue WHERE header_hash=? AND field_vdf=?",
+                (header_hash.hex(), field_vdf),
+            )
+            row = await cursor.fetchone()
+            await cursor.close()
+            if row is None:
+                return None
+            cursor = await self.db.execute(
+                "DELETE FROM compaction_queue WHERE header_hash=? AND field_vdf=?", (header_hash.hex(), field_vdf)
+            )
+            await cursor.close()
+            await self.db_wrapper.commit_transaction()
+        return "" if row[0] is None else row[0]
+
+    async def get_counts(self, now: int) -> Tuple[int, int]:
+        """
+        Returns the number of queued VDFs that are available, and the number that are leased.
+        """
+        cursor = await self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(lease_expiry>?), 0) FROM compaction_queue", (now,)
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row[0] - row[1], row[1]
+
+    async def get_max_height(self) -> Optional[uint32]:
+        cursor = await self.db.execute("SELECT MAX(height) FROM compaction_queue")
+        row = await cursor.fetchone()
+        await cursor.close()
+        if row is None or row[0] is None:
+            return None
+        return uint32(row[0])
@@ -4,9 +4,10 @@ import logging
 import random
 import time
 import traceback
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple, Union
 
 import aiosqlite
 from blspy import AugSchemeMPL
@@ -22,18 +23,21 @@ from silicoin.consensus.difficulty_adjustment import get_next_sub_slot_iters_and
 from silicoin.consensus.make_sub_epoch_summary import next_sub_epoch_summary
 from silicoin.consensus.multiprocess_validation import PreValidationResult
 from silicoin.consensus.pot_iterations import calculate_sp_iters
+from silicoin.full_node.block_download import BlockDownloadScheduler
 from silicoin.full_node.block_store import BlockStore
 from silicoin.full_node.bundle_tools import detect_potential_template_generator
 from silicoin.full_node.coin_store import CoinStore
+from silicoin.full_node.compaction_store import CompactionStore
 from silicoin.full_node.full_node_store import FullNodeStore, FullNodeStorePeakResult
 from silicoin.full_node.hint_store import HintStore
 from silicoin.full_node.lock_queue import LockClient, LockQueue
 from silicoin.full_node.mempool_manager import MempoolManager
+from silicoin.full_node.network_space import DEFAULT_NETWORK_SPACE_WINDOW, NetworkSpaceEstimator
 from silicoin.full_node.signage_point import SignagePoint
 from silicoin.full_node.sync_store import SyncStore
 from silicoin.full_node.weight_proof import WeightProofHandler
 from silicoin.protocols import farmer_protocol, full_node_protocol, timelord_protocol, wallet_protocol
-from silicoin.protocols.full_node_protocol import RequestBlocks, RespondBlock, RespondBlocks, RespondSignagePoint
+from silicoin.protocols.full_node_protocol import RequestBlocks, RespondBlock, RespondSignagePoint
 from silicoin.protocols.protocol_message_types import ProtocolMessageTypes
 from silicoin.protocols.wallet_protocol import CoinState, CoinStateUpdate
 from silicoin.server.node_discovery import FullNodePeers
@@ -53,6 +57,7 @@ from silicoin.types.mempool_inclusion_status import MempoolInclusionStatus
 from silicoin.types.spend_bundle import SpendBundle
 from silicoin.types.transaction_queue_entry import TransactionQueueEntry
 from silicoin.types.unfinished_block import UnfinishedBlock
+from silicoin.types.weight_proof import WeightProof
 from silicoin.util import cached_bls
 from silicoin.util.bech32m import encode_puzzle_hash
 from silicoin.util.check_fork_next_block import check_fork_next_block
@@ -114,6 +119,13 @@ class FullNode:
         self.full_node_store = FullNodeStore(self.constants)
         self.uncompact_task = None
         self.compact_vdf_requests: Set[bytes32] = set()
+        # The queue of VDFs for the bluebox is scanned up to this height, see broadcast_uncompact_blocks
+        self.compaction_scan_height: int = -1
+        self.compactions_completed: Deque[float] = deque(maxlen=100000)
+        self.compactions_total: int = 0
+        self.compactions_per_timelord: Dict[str, int] = {}
+        # Timelords that returned a compact proof. The others may not be blueboxes, their leases expire early.
+        self.compaction_blueboxes: Set[bytes32] = set()
         self.log = logging.getLogger(name if name else __name__)
 
         # Used for metrics
@@ -164,14 +176,27 @@ class FullNode:
 
             await self.connection.set_trace_callback(sql_trace_callback)
         self.db_wrapper = DBWrapper(self.connection)
-        self.block_store = await BlockStore.create(self.db_wrapper)
+        self.block_store = await BlockStore.create(self.db_wrapper, self.config.get("compress_blocks", False))
         self.sync_store = await SyncStore.create()
         self.hint_store = await HintStore.create(self.db_wrapper)
-        self.coin_store = await CoinStore.create(self.db_wrapper)
+        self.compaction_store = await CompactionStore.create(self.db_wrapper)
+        self.coin_store = await CoinStore.create(
+            self.db_wrapper, defer_indexes=self.config.get("defer_coin_indexes_on_first_sync", True)
+        )
         self.log.info("Initializing blockchain from disk")
         start_time = time.time()
-        self.blockchain = await Blockchain.create(self.coin_store, self.block_store, self.constants, self.hint_store)
+        snapshot_path: Optional[Path] = None
+        if self.config.get("height_to_hash_snapshot_interval", 1000) > 0:
+            snapshot_path = self.db_path.with_suffix(".height_to_hash")
+        self.blockchain = await Blockchain.create(
+            self.coin_store, self.block_store, self.constants, self.hint_store, snapshot_path
+        )
         self.mempool_manager = MempoolManager(self.coin_store, self.constants)
+        self.network_space = NetworkSpaceEstimator(
+            self.blockchain,
+            self.config.get("network_space_windows", [DEFAULT_NETWORK_SPACE_WINDOW]),
+            self.config.get("network_space_series_length", 1000),
+        )
 
         # Blocks are validated under high priority, and transactions under low priority. This guarantees blocks will
         # be validated first.
@@ -193,6 +218,8 @@ class FullNode:
 
         self._sync_task = None
         self._segment_task = None
+        self._weight_proof_task: Optional[asyncio.Task] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
         time_taken = time.time() - start_time
         if self.blockchain.get_peak() is None:
             self.log.info(f"Initialized with empty blockchain time taken: {int(time_taken)}s")
@@ -396,6 +423,9 @@ class FullNode:
             self.sync_store.batch_syncing.remove(peer.peer_node_id)
             raise e
         self.sync_store.batch_syncing.remove(peer.peer_node_id)
+        if self.coin_store.indexes_deferred and await self.synced():
+            self.log.info("Building coin store indexes, this can take a while")
+            await self.coin_store.build_deferred_indexes()
         return True
 
     async def short_sync_backtrack(
@@ -699,6 +729,10 @@ class FullNode:
         self._shut_down = True
         if self._init_weight_proof is not None:
             self._init_weight_proof.cancel()
+        if self._weight_proof_task is not None:
+            self._weight_proof_task.cancel()
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
 
         # blockchain is created in _start and in certain cases it may not exist here during _close
         if hasattr(self, "blockchain"):
@@ -721,6 +755,9 @@ class FullNode:
         await self.connection.close()
         if self._init_weight_proof is not None:
             await asyncio.wait([self._init_weight_proof])
+        if self.weight_proof_handler is not None:
+            # After the sync task, which stops its validation jobs when cancelled
+            self.weight_proof_handler.shutdown()
         await self._blockchain_lock_queue.await_closed()
 
     async def _sync(self):
@@ -871,33 +908,21 @@ class FullNode:
         )
         batch_size = self.constants.MAX_BLOCK_COUNT_PER_REQUESTS
 
-        async def fetch_block_batches(batch_queue, peers_with_peak: List[ws.WSSilicoinConnection]):
+        def get_sync_peers() -> List[ws.WSSilicoinConnection]:
+            nonlocal peers_with_peak
+            if self.sync_store.peers_changed.is_set():
+                peers_with_peak = self.get_peers_with_peak(peak_hash)
+                self.sync_store.peers_changed.clear()
+            return peers_with_peak
+
+        scheduler = BlockDownloadScheduler(fork_point_height, target_peak_sb_height, get_sync_peers, batch_size)
+
+        async def fetch_block_batches(batch_queue):
             try:
-                for start_height in range(fork_point_height, target_peak_sb_height, batch_size):
-                    end_height = min(target_peak_sb_height, start_height + batch_size)
-                    request = RequestBlocks(uint32(start_height), uint32(end_height), True)
-                    fetched = False
-                    for peer in random.sample(peers_with_peak, len(peers_with_peak)):
-                        if peer.closed:
-                            peers_with_peak.remove(peer)
-                            continue
-                        response = await peer.request_blocks(request, timeout=10)
-                        if response is None:
-                            await peer.close()
-                            peers_with_peak.remove(peer)
-                        elif isinstance(response, RespondBlocks):
-                            await batch_queue.put((peer, response.blocks))
-                            fetched = True
-                            break
-                    if fetched is False:
-                        self.log.error(f"failed fetching {start_height} to {end_height} from peers")
-                        await batch_queue.put(None)
-                        return
-                    if self.sync_store.peers_changed.is_set():
-                        peers_with_peak = self.get_peers_with_peak(peak_hash)
-                        self.sync_store.peers_changed.clear()
+                async for peer, blocks in scheduler.batches():
+                    await batch_queue.put((peer, blocks))
             except Exception as e:
-                self.log.error(f"Exception fetching {start_height} to {end_height} from peer {e}")
+                self.log.error(f"Exception fetching blocks from peers: {e}")
             finally:
                 # finished signal with None
                 await batch_queue.put(None)
@@ -918,6 +943,7 @@ class FullNode:
                 if success is False:
                     if peer in peers_with_peak:
                         peers_with_peak.remove(peer)
+                    scheduler.remove_peer(peer)
                     await peer.close(600)
                     raise ValueError(f"Failed to validate block batch {start_height} to {end_height}")
                 self.log.info(f"Added blocks {start_height} to {end_height}")
@@ -931,14 +957,16 @@ class FullNode:
         batch_queue: asyncio.Queue[Tuple[ws.WSSilicoinConnection, List[FullBlock]]] = asyncio.Queue(
             loop=loop, maxsize=buffer_size
         )
-        fetch_task = asyncio.Task(fetch_block_batches(batch_queue, peers_with_peak))
+        fetch_task = asyncio.Task(fetch_block_batches(batch_queue))
         validate_task = asyncio.Task(validate_block_batches(batch_queue))
-        try:
-            await asyncio.gather(fetch_task, validate_task)
-        except Exception as e:
-            assert validate_task.done()
-            fetch_task.cancel()  # no need to cancel validate_task, if we end up here validate_task is already done
-            self.log.error(f"sync from fork point failed err: {e}")
+        # The blocks are written to disk in groups instead of one commit per block
+        async with self.db_wrapper.group_commits(self.config.get("sync_blocks_per_commit", 64)):
+            try:
+                await asyncio.gather(fetch_task, validate_task)
+            except Exception as e:
+                assert validate_task.done()
+                fetch_task.cancel()  # no need to cancel validate_task, if we end up here validate_task is already done
+                self.log.error(f"sync from fork point failed err: {e}")
 
     async def send_peak_to_wallets(self):
         peak = self.blockchain.get_peak()
@@ -1022,54 +1050,66 @@ class FullNode:
             return True, False, fork_height, ([], {})
 
         pre_validate_start = time.time()
-        pre_validation_results: Optional[
-            List[PreValidationResult]
-        ] = await self.blockchain.pre_validate_blocks_multiprocessing(blocks_to_validate, {}, wp_summaries=wp_summaries)
-        pre_validate_end = time.time()
-        if pre_validate_end - pre_validate_start > 10:
-            self.log.warning(f"Block pre-validation time: {pre_validate_end - pre_validate_start:0.2f} seconds")
-        else:
-            self.log.debug(f"Block pre-validation time: {pre_validate_end - pre_validate_start:0.2f} seconds")
-        if pre_validation_results is None:
+        # The blocks are validated in batches by the blockchain's process pool. Each block is added to the chain as
+        # soon as its batch is done, while the workers keep validating the following batches.
+        pre_validation_chunks: Optional[
+            List[asyncio.Future]
+        ] = await self.blockchain.pre_validate_blocks_pipelined(blocks_to_validate, {}, wp_summaries=wp_summaries)
+        if pre_validation_chunks is None:
             return False, False, None, ([], {})
-        for i, block in enumerate(blocks_to_validate):
-            if pre_validation_results[i].error is not None:
-                self.log.error(
-                    f"Invalid block from peer: {peer.get_peer_logging()} {Err(pre_validation_results[i].error)}"
-                )
-                return False, advanced_peak, fork_height, ([], {})
 
         # Dicts because deduping
         all_coin_changes: Dict[bytes32, CoinRecord] = {}
         all_hint_changes: Dict[bytes, Dict[bytes32, CoinRecord]] = {}
 
-        for i, block in enumerate(blocks_to_validate):
-            assert pre_validation_results[i].required_iters is not None
-            result, error, fork_height, coin_changes = await self.blockchain.receive_block(
-                block, pre_validation_results[i], None if advanced_peak else fork_point
-            )
-            self.log.info(f"[debug] post receive block {block.height} {fork_height}")
-            coin_record_list, hint_records = coin_changes
-
-            # Update all changes
-            for record in coin_record_list:
-                all_coin_changes[record.name] = record
-            for hint, list_of_records in hint_records.items():
-                if hint not in all_hint_changes:
-                    all_hint_changes[hint] = {}
-                for record in list_of_records.values():
-                    all_hint_changes[hint][record.name] = record
-
-            if result == ReceiveBlockResult.NEW_PEAK:
-                advanced_peak = True
-            elif result == ReceiveBlockResult.INVALID_BLOCK or result == ReceiveBlockResult.DISCONNECTED_BLOCK:
-                if error is not None:
-                    self.log.error(f"Error: {error}, Invalid block from peer: {peer.get_peer_logging()} ")
-                return False, advanced_peak, fork_height, ([], {})
-            block_record = self.blockchain.block_record(block.header_hash)
-            if block_record.sub_epoch_summary_included is not None:
-                if self.weight_proof_handler is not None:
-                    await self.weight_proof_handler.create_prev_sub_epoch_segments()
+        pre_validate_wait = 0.0
+        blocks_iter = iter(blocks_to_validate)
+        try:
+            for chunk in pre_validation_chunks:
+                wait_start = time.time()
+                pre_validation_results: List[PreValidationResult] = await chunk
+                pre_validate_wait += time.time() - wait_start
+                for pre_validation_result in pre_validation_results:
+                    block = next(blocks_iter)
+                    if pre_validation_result.error is not None:
+                        self.log.error(
+                            f"Invalid block from peer: {peer.get_peer_logging()} {Err(pre_validation_result.error)}"
+                        )
+                        return False, advanced_peak, fork_height, ([], {})
+                    assert pre_validation_result.required_iters is not None
+                    result, error, fork_height, coin_changes = await self.blockchain.receive_block(
+                        block, pre_validation_result, None if advanced_peak else fork_point
+                    )
+                    self.log.info(f"[debug] post receive block {block.height} {fork_height}")
+                    coin_record_list, hint_records = coin_changes
+
+                    # Update all changes
+                    for record in coin_record_list:
+                        all_coin_changes[record.name] = record
+                    for hint, list_of_records in hint_records.items():
+                        if hint not in all_hint_changes:
+                            all_hint_changes[hint] = {}
+                        for record in list_of_records.values():
+                            all_hint_changes[hint][record.name] = record
+
+                    if result == ReceiveBlockResult.NEW_PEAK:
+                        advanced_peak = True
+                    elif result == ReceiveBlockResult.INVALID_BLOCK or result == ReceiveBlockResult.DISCONNECTED_BLOCK:
+                        if error is not None:
+                            self.log.error(f"Error: {error}, Invalid block from peer: {peer.get_peer_logging()} ")
+                        return False, advanced_peak, fork_height, ([], {})
+                    block_record = self.blockchain.block_record(block.header_hash)
+                    if block_record.sub_epoch_summary_included is not None:
+                        if self.weight_proof_handler is not None:
+                            await self.weight_proof_handler.create_prev_sub_epoch_segments()
+        finally:
+            # The remaining batches are not needed if a block failed, their results are dropped
+            for chunk in pre_validation_chunks:
+                chunk.cancel()
+        if pre_validate_wait > 10:
+            self.log.warning(f"Block pre-validation wait time: {pre_validate_wait:0.2f} seconds")
+        else:
+            self.log.debug(f"Block pre-validation wait time: {pre_validate_wait:0.2f} seconds")
         if advanced_peak:
             self._state_changed("new_peak")
             self.log.debug(
@@ -1090,6 +1130,10 @@ class FullNode:
         if self.server is None:
             return None
 
+        if self.coin_store.indexes_deferred:
+            self.log.info("Building coin store indexes, this can take a while")
+            await self.coin_store.build_deferred_indexes()
+
         peak: Optional[BlockRecord] = self.blockchain.get_peak()
         async with self._blockchain_lock_high_priority:
             await self.sync_store.clear_sync_info()
@@ -1212,6 +1256,9 @@ class FullNode:
         sub_slots = await self.blockchain.get_sp_and_ip_sub_slots(record.header_hash)
         assert sub_slots is not None
 
+        if not self.sync_store.get_sync_mode():
+            await self.network_space.new_peak(record)
+
         if not self.sync_store.get_sync_mode():
             self.blockchain.clean_block_records()
 
@@ -1351,6 +1398,56 @@ class FullNode:
         await self.server.send_to_all([msg], NodeType.WALLET)
         self._state_changed("new_peak")
 
+        # Light wallets ask for a weight proof of the new peak, so it is ready to send when they do
+        if (
+            self.weight_proof_handler is not None
+            and not self.sync_store.get_sync_mode()
+            and len(self.server.get_connections(NodeType.WALLET)) > 0
+            and (self._weight_proof_task is None or self._weight_proof_task.done())
+        ):
+            self._weight_proof_task = asyncio.create_task(self._prepare_weight_proof(record.header_hash))
+
+        # In a task, since this can run under the blockchain lock and writing the snapshot takes a while
+        snapshot_interval = self.config.get("height_to_hash_snapshot_interval", 1000)
+        if (
+            snapshot_interval > 0
+            and not self.sync_store.get_sync_mode()
+            and (self._snapshot_task is None or self._snapshot_task.done())
+        ):
+            self._snapshot_task = asyncio.create_task(self._checkpoint_snapshot(snapshot_interval))
+
+    async def _checkpoint_snapshot(self, interval: int) -> None:
+        try:
+            await self.blockchain.checkpoint_snapshot(interval)
+        except Exception as e:
+            self.log.error(f"Failed to write the height to hash snapshot: {e}")
+
+    async def _prepare_weight_proof(self, tip: bytes32) -> None:
+        assert self.weight_proof_handler is not None
+        try:
+            wp = await self.weight_proof_handler.get_proof_of_weight(tip)
+            if wp is not None:
+                self.weight_proof_message(tip, wp)
+        except Exception as e:
+            self.log.error(f"Error preparing weight proof for {tip}: {e}")
+
+    def weight_proof_message(self, tip: bytes32, wp: WeightProof) -> Message:
+        """
+        Returns the respond_proof_of_weight message for tip. Serialization of wp is slow, so the message of the last
+        tip is kept.
+        """
+        if (
+            self.full_node_store.serialized_wp_message_tip is not None
+            and self.full_node_store.serialized_wp_message_tip == tip
+        ):
+            return self.full_node_store.serialized_wp_message
+        message = make_msg(
+            ProtocolMessageTypes.respond_proof_of_weight, full_node_protocol.RespondProofOfWeight(wp, tip)
+        )
+        self.full_node_store.serialized_wp_message_tip = tip
+        self.full_node_store.serialized_wp_message = message
+        return message
+
     async def respond_block(
         self,
         respond_block: full_node_protocol.RespondBlock,
@@ -2124,7 +2221,9 @@ class FullNode:
                 replaced = True
         return replaced
 
-    async def respond_compact_proof_of_time(self, request: timelord_protocol.RespondCompactProofOfTime):
+    async def respond_compact_proof_of_time(
+        self, request: timelord_protocol.RespondCompactProofOfTime, peer: Optional[ws.WSSilicoinConnection] = None
+    ):
         field_vdf = CompressibleVDFField(int(request.field_vdf))
         if not await self._can_accept_compact_proof(
             request.vdf_info, request.vdf_proof, request.height, request.header_hash, field_vdf
@@ -2136,6 +2235,9 @@ class FullNode:
             self.log.error(f"Could not replace compact proof: {request.height}")
             return None
         self.log.info(f"Replaced compact proof at height {request.height}")
+        if peer is not None:
+            self.compaction_blueboxes.add(peer.peer_node_id)
+        await self._compaction_done(request.header_hash, field_vdf, True)
         msg = make_msg(
             ProtocolMessageTypes.new_compact_vdf,
             full_node_protocol.NewCompactVDF(request.height, request.header_hash, request.field_vdf, request.vdf_info),
@@ -2218,6 +2320,7 @@ class FullNode:
         if not replaced:
             self.log.error(f"Could not replace compact proof: {request.height}")
             return None
+        await self._compaction_done(request.header_hash, field_vdf, False)
         msg = make_msg(
             ProtocolMessageTypes.new_compact_vdf,
             full_node_protocol.NewCompactVDF(request.height, request.header_hash, request.field_vdf, request.vdf_info),
@@ -2225,104 +2328,208 @@ class FullNode:
         if self.server is not None:
             await self.server.send_to_all_except([msg], NodeType.FULL_NODE, peer.peer_node_id)
 
+    async def _get_uncompact_vdfs(
+        self, heights: List[int], sanitize_weight_proof_only: bool
+    ) -> List[timelord_protocol.RequestCompactProofOfTime]:
+        broadcast_list: List[timelord_protocol.RequestCompactProofOfTime] = []
+        for h in heights:
+            headers = await self.blockchain.get_header_blocks_in_range(h, h, tx_filter=False)
+            records: Dict[bytes32, BlockRecord] = {}
+            if sanitize_weight_proof_only:
+                records = await self.blockchain.get_block_records_in_range(h, h)
+            for header in headers.values():
+                expected_header_hash = self.blockchain.height_to_hash(header.height)
+                if header.header_hash != expected_header_hash:
+                    continue
+                if sanitize_weight_proof_only:
+                    assert header.header_hash in records
+                    record = records[header.header_hash]
+                for sub_slot in header.finished_sub_slots:
+                    if (
+                        sub_slot.proofs.challenge_chain_slot_proof.witness_type > 0
+                        or not sub_slot.proofs.challenge_chain_slot_proof.normalized_to_identity
+                    ):
+                        broadcast_list.append(
+                            timelord_protocol.RequestCompactProofOfTime(
+                                sub_slot.challenge_chain.challenge_chain_end_of_slot_vdf,
+                                header.header_hash,
+                                header.height,
+                                uint8(CompressibleVDFField.CC_EOS_VDF),
+                            )
+                        )
+                    if sub_slot.proofs.infused_challenge_chain_slot_proof is not None and (
+                        sub_slot.proofs.infused_challenge_chain_slot_proof.witness_type > 0
+                        or not sub_slot.proofs.infused_challenge_chain_slot_proof.normalized_to_identity
+                    ):
+                        assert sub_slot.infused_challenge_chain is not None
+                        broadcast_list.append(
+                            timelord_protocol.RequestCompactProofOfTime(
+                                sub_slot.infused_challenge_chain.infused_challenge_chain_end_of_slot_vdf,
+                                header.header_hash,
+                                header.height,
+                                uint8(CompressibleVDFField.ICC_EOS_VDF),
+                            )
+                        )
+                # Running in 'sanitize_weight_proof_only' ignores CC_SP_VDF and CC_IP_VDF
+                # unless this is a challenge block.
+                if sanitize_weight_proof_only:
+                    if not record.is_challenge_block(self.constants):
+                        continue
+                if header.challenge_chain_sp_proof is not None and (
+                    header.challenge_chain_sp_proof.witness_type > 0
+                    or not header.challenge_chain_sp_proof.normalized_to_identity
+                ):
+                    assert header.reward_chain_block.challenge_chain_sp_vdf is not None
+                    broadcast_list.append(
+                        timelord_protocol.RequestCompactProofOfTime(
+                            header.reward_chain_block.challenge_chain_sp_vdf,
+                            header.header_hash,
+                            header.height,
+                            uint8(CompressibleVDFField.CC_SP_VDF),
+                        )
+                    )
+
+                if (
+                    header.challenge_chain_ip_proof.witness_type > 0
+                    or not header.challenge_chain_ip_proof.normalized_to_identity
+                ):
+                    broadcast_list.append(
+                        timelord_protocol.RequestCompactProofOfTime(
+                            header.reward_chain_block.challenge_chain_ip_vdf,
+                            header.header_hash,
+                            header.height,
+                            uint8(CompressibleVDFField.CC_IP_VDF),
+                        )
+                    )
+        return broadcast_list
+
+    async def _fill_compaction_queue(self, number: int, sanitize_weight_proof_only: bool) -> None:
+        """
+        Queues the uncompact VDFs of the next number of heights above the scanned ones. Starts over from the genesis
+        block after reaching the peak, to pick up the blocks that entered the main chain in a reorg.
+        """
+        heights = await self.block_store.get_not_compactified_heights(self.compaction_scan_height, number)
+        if len(heights) == 0:
+            self.compaction_scan_height = -1
+            return None
+        await self.compaction_store.add(await self._get_uncompact_vdfs(heights, sanitize_weight_proof_only))
+        self.compaction_scan_height = heights[-1]
+        self.log.info(f"Queued the uncompact VDFs of heights {heights[0]} to {heights[-1]} for the bluebox")
+
+    async def _lease_compaction_work(
+        self, lessee: str, count: int, now: int, lease_time: int
+    ) -> List[timelord_protocol.RequestCompactProofOfTime]:
+        """
+        Leases queued VDFs to a bluebox timelord, dropping the ones that were compacted in the meantime or are no
+        longer in the main chain.
+        """
+        leased = await self.compaction_store.lease(lessee, count, now, lease_time)
+        header_blocks: Dict[bytes32, Optional[HeaderBlock]] = {}
+        requests: List[timelord_protocol.RequestCompactProofOfTime] = []
+        for request in leased:
+            if request.header_hash not in header_blocks:
+                header_block: Optional[HeaderBlock] = None
+                if (
+                    self.blockchain.contains_height(request.height)
+                    and self.blockchain.height_to_hash(request.height) == request.header_hash
+                ):
+                    try:
+                        header_block = await self.blockchain.get_header_block_by_height(
+                            request.height, request.header_hash, tx_filter=False
+                        )
+                    except ValueError:
+                        # Reorged out while reading it
+                        header_block = None
+                header_blocks[request.header_hash] = header_block
+            header_block = header_blocks[request.header_hash]
+            if header_block is None or not await self._needs_compact_proof(
+                request.new_proof_of_time, header_block, CompressibleVDFField(request.field_vdf)
+            ):
+                await self.compaction_store.remove(request.header_hash, request.field_vdf)
+                continue
+            requests.append(request)
+        return requests
+
+    async def _lease_compaction_round(
+        self, timelords: List[ws.WSSilicoinConnection], count: int, now: int, lease_time: int, probation_time: int
+    ) -> List[Tuple[ws.WSSilicoinConnection, List[timelord_protocol.RequestCompactProofOfTime]]]:
+        """
+        Leases count VDFs to each timelord, the ones which returned compact proofs before go first. A timelord that
+        never returned a compact proof may not be a bluebox, so its lease expires after probation_time and the VDFs
+        go to the next bluebox that asks.
+        """
+        blueboxes = [timelord for timelord in timelords if timelord.peer_node_id in self.compaction_blueboxes]
+        others = [timelord for timelord in timelords if timelord.peer_node_id not in self.compaction_blueboxes]
+        leases = []
+        for timelord in blueboxes + others:
+            requests = await self._lease_compaction_work(
+                timelord.peer_node_id.hex(),
+                count,
+                now,
+                lease_time if timelord.peer_node_id in self.compaction_blueboxes else probation_time,
+            )
+            leases.append((timelord, requests))
+        return leases
+
+    async def get_compaction_progress(self) -> Dict[str, Any]:
+        now = time.time()
+        available, leased = await self.compaction_store.get_counts(int(now))
+        last_hour = [t for t in self.compactions_completed if t > now - 3600]
+        peak = self.blockchain.get_peak()
+        return {
+            "queued": available,
+            "leased": leased,
+            "scan_height": self.compaction_scan_height,
+            "peak_height": peak.height if peak is not None else None,
+            "completed": self.compactions_total,
+            "completed_last_hour": len(last_hour),
+            "completed_per_timelord": dict(self.compactions_per_timelord),
+        }
+
+    async def _compaction_done(self, header_hash: bytes32, field_vdf: CompressibleVDFField, ours: bool) -> None:
+        lessee = await self.compaction_store.remove(header_hash, field_vdf)
+        if lessee is None or not ours:
+            return None
+        self.compactions_completed.append(time.time())
+        self.compactions_total += 1
+        if lessee != "":
+            self.compactions_per_timelord[lessee] = self.compactions_per_timelord.get(lessee, 0) + 1
+
     async def broadcast_uncompact_blocks(
         self, uncompact_interval_scan: int, target_uncompact_proofs: int, sanitize_weight_proof_only: bool
     ):
+        # Work that is not done in time is leased to the next bluebox that asks, by default after two rounds
+        lease_time = self.config.get("compact_proof_lease_time", 2 * uncompact_interval_scan)
+        # Timelords that are not known to be blueboxes hold their work until the next round at most
+        probation_time = min(lease_time, uncompact_interval_scan)
         try:
+            max_height = await self.compaction_store.get_max_height()
+            self.compaction_scan_height = -1 if max_height is None else max_height
             while not self._shut_down:
                 while self.sync_store.get_sync_mode():
                     if self._shut_down:
                         return None
                     await asyncio.sleep(30)
 
-                broadcast_list: List[timelord_protocol.RequestCompactProofOfTime] = []
-
-                self.log.info("Getting random heights for bluebox to compact")
-                heights = await self.block_store.get_random_not_compactified(target_uncompact_proofs)
-                self.log.info("Heights found for bluebox to compact: [%s]" % ", ".join(map(str, heights)))
-
-                for h in heights:
-
-                    headers = await self.blockchain.get_header_blocks_in_range(h, h, tx_filter=False)
-                    records: Dict[bytes32, BlockRecord] = {}
-                    if sanitize_weight_proof_only:
-                        records = await self.blockchain.get_block_records_in_range(h, h)
-                    for header in headers.values():
-                        expected_header_hash = self.blockchain.height_to_hash(header.height)
-                        if header.header_hash != expected_header_hash:
-                            continue
-                        if sanitize_weight_proof_only:
-                            assert header.header_hash in records
-                            record = records[header.header_hash]
-                        for sub_slot in header.finished_sub_slots:
-                            if (
-                                sub_slot.proofs.challenge_chain_slot_proof.witness_type > 0
-                                or not sub_slot.proofs.challenge_chain_slot_proof.normalized_to_identity
-                            ):
-                                broadcast_list.append(
-                                    timelord_protocol.RequestCompactProofOfTime(
-                                        sub_slot.challenge_chain.challenge_chain_end_of_slot_vdf,
-                                        header.header_hash,
-                                        header.height,
-                                        uint8(CompressibleVDFField.CC_EOS_VDF),
-                                    )
-                                )
-                            if sub_slot.proofs.infused_challenge_chain_slot_proof is not None and (
-                                sub_slot.proofs.infused_challenge_chain_slot_proof.witness_type > 0
-                                or not sub_slot.proofs.infused_challenge_chain_slot_proof.normalized_to_identity
-                            ):
-                                assert sub_slot.infused_challenge_chain is not None
-                                broadcast_list.append(
-                                    timelord_protocol.RequestCompactProofOfTime(
-                                        sub_slot.infused_challenge_chain.infused_challenge_chain_end_of_slot_vdf,
-                                        header.header_hash,
-                                        header.height,
-                                        uint8(CompressibleVDFField.ICC_EOS_VDF),
-                                    )
-                                )
-                        # Running in 'sanitize_weight_proof_only' ignores CC_SP_VDF and CC_IP_VDF
-                        # unless this is a challenge block.
-                        if sanitize_weight_proof_only:
-                            if not record.is_challenge_block(self.constants):
-                                continue
-                        if header.challenge_chain_sp_proof is not None and (
-                            header.challenge_chain_sp_proof.witness_type > 0
-                            or not header.challenge_chain_sp_proof.normalized_to_identity
-                        ):
-                            assert header.reward_chain_block.challenge_chain_sp_vdf is not None
-                            broadcast_list.append(
-                                timelord_protocol.RequestCompactProofOfTime(
-                                    header.reward_chain_block.challenge_chain_sp_vdf,
-                                    header.header_hash,
-                                    header.height,
-                                    uint8(CompressibleVDFField.CC_SP_VDF),
-                                )
-                            )
-
-                        if (
-                            header.challenge_chain_ip_proof.witness_type > 0
-                            or not header.challenge_chain_ip_proof.normalized_to_identity
-                        ):
-                            broadcast_list.append(
-                                timelord_protocol.RequestCompactProofOfTime(
-                                    header.reward_chain_block.challenge_chain_ip_vdf,
-                                    header.header_hash,
-                                    header.height,
-                                    uint8(CompressibleVDFField.CC_IP_VDF),
-                                )
-                            )
+                timelords = [] if self.server is None else self.server.get_connections(NodeType.TIMELORD)
+                # Each bluebox gets target_uncompact_proofs VDFs of its own. The timelords which are not known to be
+                # blueboxes are counted too, so that their short leases don't take the work of the blueboxes.
+                wanted = target_uncompact_proofs * max(len(timelords), 1)
+                available, _ = await self.compaction_store.get_counts(int(time.time()))
+                if available < wanted:
+                    await self._fill_compaction_queue(wanted - available, sanitize_weight_proof_only)
 
-                if len(broadcast_list) > target_uncompact_proofs:
-                    broadcast_list = broadcast_list[:target_uncompact_proofs]
                 if self.sync_store.get_sync_mode():
                     continue
-                if self.server is not None:
-                    self.log.info(f"Broadcasting {len(broadcast_list)} items to the bluebox")
-                    msgs = []
-                    for new_pot in broadcast_list:
-                        msg = make_msg(ProtocolMessageTypes.request_compact_proof_of_time, new_pot)
-                        msgs.append(msg)
-                    await self.server.send_to_all(msgs, NodeType.TIMELORD)
+                leases = await self._lease_compaction_round(
+                    timelords, target_uncompact_proofs, int(time.time()), lease_time, probation_time
+                )
+                for timelord, requests in leases:
+                    if len(requests) == 0 or self.server is None:
+                        continue
+                    self.log.info(f"Sending {len(requests)} items to the bluebox {timelord.peer_host}")
+                    msgs = [make_msg(ProtocolMessageTypes.request_compact_proof_of_time, r) for r in requests]
+                    await self.server.send_to_specific(msgs, timelord.peer_node_id)
                 await asyncio.sleep(uncompact_interval_scan)
         except Exception as e:
             error_stack = traceback.format_exc()
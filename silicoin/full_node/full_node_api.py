@@ -284,18 +284,7 @@ class FullNodeAPI:
             self.log.error(f"failed creating weight proof for peak {request.tip}")
             return None
 
-        # Serialization of wp is slow
-        if (
-            self.full_node.full_node_store.serialized_wp_message_tip is not None
-            and self.full_node.full_node_store.serialized_wp_message_tip == request.tip
-        ):
-            return self.full_node.full_node_store.serialized_wp_message
-        message = make_msg(
-            ProtocolMessageTypes.respond_proof_of_weight, full_node_protocol.RespondProofOfWeight(wp, request.tip)
-        )
-        self.full_node.full_node_store.serialized_wp_message_tip = request.tip
-        self.full_node.full_node_store.serialized_wp_message = message
-        return message
+        return self.full_node.weight_proof_message(request.tip, wp)
 
     @api_request
     async def respond_proof_of_weight(self, request: full_node_protocol.RespondProofOfWeight) -> Optional[Message]:
@@ -1333,11 +1322,14 @@ class FullNodeAPI:
         )
         return msg
 
+    @peer_required
     @api_request
-    async def respond_compact_proof_of_time(self, request: timelord_protocol.RespondCompactProofOfTime):
+    async def respond_compact_proof_of_time(
+        self, request: timelord_protocol.RespondCompactProofOfTime, peer: ws.WSSilicoinConnection
+    ):
         if self.full_node.sync_store.get_sync_mode():
             return None
-        await self.full_node.respond_compact_proof_of_time(request)
+        await self.full_node.respond_compact_proof_of_time(request, peer)
 
     @execute_task
     @peer_required
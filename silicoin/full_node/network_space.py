@@ -0,0 +1,70 @@
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+from silicoin.consensus.block_record import BlockRecord
+from silicoin.consensus.blockchain import Blockchain
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.util.ints import uint32, uint64, uint128
+
+log = logging.getLogger(__name__)
+
+# The window of get_blockchain_state, about a day of blocks
+DEFAULT_NETWORK_SPACE_WINDOW = 4608
+
+
+@dataclass(frozen=True)
+class NetworkSpacePoint:
+    height: uint32
+    header_hash: bytes32
+    # Only transaction blocks have a timestamp
+    timestamp: Optional[uint64]
+    space: uint128
+
+
+class NetworkSpaceEstimator:
+    """
+    Estimates the network space over several windows of blocks once per peak, and keeps the recent estimates of each
+    window as a time series. RPC calls and the UI read these instead of loading block records on every poll.
+    """
+
+    windows: List[int]
+    series: Dict[int, Deque[NetworkSpacePoint]]
+
+    def __init__(self, blockchain: Blockchain, windows: List[int], max_points: int = 1000):
+        self.blockchain = blockchain
+        self.windows = sorted(set(windows) | {DEFAULT_NETWORK_SPACE_WINDOW})
+        self.series = {window: deque(maxlen=max_points) for window in self.windows}
+
+    async def new_peak(self, peak: BlockRecord) -> None:
+        """
+        Adds the estimates at peak. After a reorg, drops the estimates at the same or higher heights and the ones of
+        blocks which are not in the main chain anymore, which are all above the fork point.
+        """
+        for window, points in self.series.items():
+            while len(points) > 0 and (
+                points[-1].height >= peak.height
+                or self.blockchain.height_to_hash(points[-1].height) != points[-1].header_hash
+            ):
+                points.pop()
+            try:
+                space = await self.blockchain.get_peak_network_space(window, peak)
+            except ValueError as e:
+                log.warning(f"Could not estimate the network space over {window} blocks at {peak.height}: {e}")
+                continue
+            points.append(NetworkSpacePoint(peak.height, peak.header_hash, peak.timestamp, space))
+
+    def get_space(self, peak: Optional[BlockRecord], window: int = DEFAULT_NETWORK_SPACE_WINDOW) -> Optional[uint128]:
+        """
+        Returns the estimate over window blocks at peak, if it was computed.
+        """
+        points = self.series.get(window)
+        if peak is None or points is None or len(points) == 0 or points[-1].header_hash != peak.header_hash:
+            return None
+        return points[-1].space
+
+    def get_series(self, window: int, start_height: int = 0) -> List[NetworkSpacePoint]:
+        if window not in self.series:
+            raise ValueError(f"No network space estimates over {window} blocks, the windows are {self.windows}")
+        return [point for point in self.series[window] if point.height >= start_height]
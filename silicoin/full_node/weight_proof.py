@@ -2,8 +2,11 @@ import asyncio
 import dataclasses
 import logging
 import math
+import multiprocessing
 import pathlib
 import random
+import tempfile
+from concurrent.futures import Executor
 from concurrent.futures.process import ProcessPoolExecutor
 from typing import Dict, List, Optional, Tuple
 
@@ -42,6 +45,16 @@ from silicoin.util.streamable import dataclass_from_dict, recurse_jsonify
 
 log = logging.getLogger(__name__)
 
+# VDFs of a weight proof validated by one executor job, small so they spread evenly over the workers
+VDF_BATCH_SIZE = 4
+
+
+def weight_proof_process_count() -> int:
+    cpu_count = multiprocessing.cpu_count()
+    if cpu_count > 61:
+        cpu_count = 61  # Windows Server 2016 has an issue https://bugs.python.org/issue26903
+    return max(cpu_count - 1, 1)
+
 
 class WeightProofHandler:
 
@@ -56,10 +69,16 @@ class WeightProofHandler:
     ):
         self.tip: Optional[bytes32] = None
         self.proof: Optional[WeightProof] = None
+        # Recent chain of the last proof, extended instead of read again while the peak advances
+        self._recent_chain: List[HeaderBlock] = []
         self.constants = constants
         self.blockchain = blockchain
         self.lock = asyncio.Lock()
-        self._num_processes = 4
+        self._num_processes = weight_proof_process_count()
+        self._executor: ProcessPoolExecutor = ProcessPoolExecutor(self._num_processes)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
 
     async def get_proof_of_weight(self, tip: bytes32) -> Optional[WeightProof]:
 
@@ -168,7 +187,11 @@ class WeightProofHandler:
         return seed
 
     async def _get_recent_chain(self, tip_height: uint32) -> Optional[List[HeaderBlock]]:
-        recent_chain: List[HeaderBlock] = []
+        """
+        Returns the blocks in the path to the peak from the one before the second to last sub epoch summary up to
+        tip_height. If the recent chain of the previous proof starts at the same height and is still in the path to
+        the peak, only the blocks added after it are read.
+        """
         ses_heights = self.blockchain.get_ses_heights()
         min_height = 0
         count_ses = 0
@@ -179,28 +202,27 @@ class WeightProofHandler:
                 min_height = ses_height - 1
                 break
         log.debug(f"start {min_height} end {tip_height}")
-        headers = await self.blockchain.get_header_blocks_in_range(min_height, tip_height, tx_filter=False)
-        blocks = await self.blockchain.get_block_records_in_range(min_height, tip_height)
-        ses_count = 0
-        curr_height = tip_height
-        blocks_n = 0
-        while ses_count < 2:
-            if curr_height == 0:
-                break
-            # add to needed reward chain recent blocks
-            header_block = headers[self.blockchain.height_to_hash(curr_height)]
-            block_rec = blocks[header_block.header_hash]
-            if header_block is None:
-                log.error("creating recent chain failed")
-                return None
-            recent_chain.insert(0, header_block)
-            if block_rec.sub_epoch_summary_included:
-                ses_count += 1
-            curr_height = uint32(curr_height - 1)  # type: ignore
-            blocks_n += 1
 
-        header_block = headers[self.blockchain.height_to_hash(curr_height)]
-        recent_chain.insert(0, header_block)
+        recent_chain: List[HeaderBlock] = []
+        cached = self._recent_chain
+        if (
+            len(cached) > 0
+            and cached[0].height == min_height
+            and cached[-1].height <= tip_height
+            and self.blockchain.contains_height(cached[-1].height)
+            and self.blockchain.height_to_hash(cached[-1].height) == cached[-1].header_hash
+        ):
+            recent_chain = list(cached)
+        if len(recent_chain) == 0 or recent_chain[-1].height < tip_height:
+            start = min_height if len(recent_chain) == 0 else recent_chain[-1].height + 1
+            headers = await self.blockchain.get_header_blocks_in_range(start, tip_height, tx_filter=False)
+            for height in range(start, tip_height + 1):
+                header_block = headers.get(self.blockchain.height_to_hash(uint32(height)))
+                if header_block is None:
+                    log.error("creating recent chain failed")
+                    return None
+                recent_chain.append(header_block)
+        self._recent_chain = recent_chain
 
         log.info(
             f"recent chain, "
@@ -243,6 +265,8 @@ class WeightProofHandler:
         ses_blocks = await self.blockchain.get_block_records_at(summary_heights)
         if ses_blocks is None:
             return None
+        # Only the sub epochs without persisted segments are built, without reading the others
+        persisted = await self.blockchain.get_sub_epoch_challenge_segment_hashes()
 
         for sub_epoch_n, ses_height in enumerate(summary_heights):
             log.debug(f"check db for sub epoch {sub_epoch_n}")
@@ -252,9 +276,10 @@ class WeightProofHandler:
             if ses_block is None or ses_block.sub_epoch_summary_included is None:
                 log.error("error while building proof")
                 return None
-            await self.__create_persist_segment(prev_ses_block, ses_block, ses_height, sub_epoch_n)
+            if ses_block.header_hash not in persisted:
+                await self.__create_persist_segment(prev_ses_block, ses_block, ses_height, sub_epoch_n)
+                await asyncio.sleep(2)
             prev_ses_block = ses_block
-            await asyncio.sleep(2)
         log.debug("done checking segments")
         return None
 
@@ -273,7 +298,7 @@ class WeightProofHandler:
         segments: List[SubEpochChallengeSegment] = []
         start_height = await self.get_prev_two_slots_height(se_start)
 
-        blocks = await self.blockchain.get_block_records_in_range(
+        blocks = await self.blockchain.get_main_chain_block_records_in_range(
             start_height, ses_block.height + self.constants.MAX_SUB_SLOT_BLOCKS
         )
         header_blocks = await self.blockchain.get_header_blocks_in_range(
@@ -307,13 +332,17 @@ class WeightProofHandler:
         slot = 0
         batch_size = 50
         curr_rec = se_start
-        blocks = await self.blockchain.get_block_records_in_range(curr_rec.height - batch_size, curr_rec.height)
+        blocks = await self.blockchain.get_main_chain_block_records_in_range(
+            curr_rec.height - batch_size, curr_rec.height
+        )
         end = curr_rec.height
         while slot < 2 and curr_rec.height > 0:
             if curr_rec.first_in_sub_slot:
                 slot += 1
             if end - curr_rec.height == batch_size - 1:
-                blocks = await self.blockchain.get_block_records_in_range(curr_rec.height - batch_size, curr_rec.height)
+                blocks = await self.blockchain.get_main_chain_block_records_in_range(
+                    curr_rec.height - batch_size, curr_rec.height
+                )
                 end = curr_rec.height
             curr_rec = blocks[self.blockchain.height_to_hash(uint32(curr_rec.height - 1))]
         return curr_rec.height
@@ -552,7 +581,8 @@ class WeightProofHandler:
             log.error("failed weight proof sub epoch sample validation")
             return False, uint32(0)
 
-        if not _validate_sub_epoch_segments(constants, rng, wp_segment_bytes, summary_bytes):
+        segments_validated, _ = _validate_sub_epoch_segments(constants, rng, wp_segment_bytes, summary_bytes)
+        if not segments_validated:
             return False, uint32(0)
         log.info("validate weight proof recent blocks")
         if not _validate_recent_blocks(constants, wp_recent_chain_bytes, summary_bytes):
@@ -591,40 +621,16 @@ class WeightProofHandler:
             log.error("failed weight proof sub epoch sample validation")
             return False, uint32(0), []
 
-        executor = ProcessPoolExecutor(4)
-        constants, summary_bytes, wp_segment_bytes, wp_recent_chain_bytes = vars_to_bytes(
-            self.constants, summaries, weight_proof
-        )
-
-        recent_blocks_validation_task = asyncio.get_running_loop().run_in_executor(
-            executor, _validate_recent_blocks, constants, wp_recent_chain_bytes, summary_bytes
-        )
-
-        segments_validated, vdfs_to_validate = _validate_sub_epoch_segments(
-            constants, rng, wp_segment_bytes, summary_bytes
-        )
-        if not segments_validated:
-            return False, uint32(0), []
-
-        vdf_chunks = chunks(vdfs_to_validate, self._num_processes)
-        vdf_tasks = []
-        for chunk in vdf_chunks:
-            byte_chunks = []
-            for vdf_proof, classgroup, vdf_info in chunk:
-                byte_chunks.append((bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)))
-
-            vdf_task = asyncio.get_running_loop().run_in_executor(executor, _validate_vdf_batch, constants, byte_chunks)
-            vdf_tasks.append(vdf_task)
-
-        for vdf_task in vdf_tasks:
-            validated = await vdf_task
-            if not validated:
-                return False, uint32(0), []
-
-        valid_recent_blocks_task = recent_blocks_validation_task
-        valid_recent_blocks = await valid_recent_blocks_task
-        if not valid_recent_blocks:
-            log.error("failed validating weight proof recent blocks")
+        shutdown_file = tempfile.NamedTemporaryFile(prefix="silicoin_weight_proof_validation")
+        try:
+            valid, _ = await validate_weight_proof_in_executor(
+                self._executor, self.constants, rng, summaries, weight_proof, True, pathlib.Path(shutdown_file.name)
+            )
+        finally:
+            # Stops the jobs which are still running
+            shutdown_file.close()
+        if not valid:
+            log.error("failed validating weight proof")
             return False, uint32(0), []
 
         return True, self.get_fork_point(summaries), summaries
@@ -946,46 +952,168 @@ def _validate_sub_epoch_segments(
     rng: random.Random,
     weight_proof_bytes: bytes,
     summaries_bytes: List[bytes],
-):
+) -> Tuple[bool, List[Tuple[VDFProof, ClassgroupElement, VDFInfo]]]:
     constants, summaries = bytes_to_vars(constants_dict, summaries_bytes)
     sub_epoch_segments: SubEpochSegments = SubEpochSegments.from_bytes(weight_proof_bytes)
-    rc_sub_slot_hash = constants.GENESIS_CHALLENGE
-    total_blocks, total_ip_iters = 0, 0
-    total_slot_iters, total_slots = 0, 0
-    total_ip_iters = 0
-    prev_ses: Optional[SubEpochSummary] = None
-    segments_by_sub_epoch = map_segments_by_sub_epoch(sub_epoch_segments.challenge_segments)
-    curr_ssi = constants.SUB_SLOT_ITERS_STARTING
     vdfs_to_validate = []
-    for sub_epoch_n, segments in segments_by_sub_epoch.items():
+    for sub_epoch_n, prev_ssi, sampled_seg_index, segments in _sub_epoch_segment_jobs(
+        constants, rng, sub_epoch_segments.challenge_segments, summaries
+    ):
+        valid, vdf_list = _validate_sub_epoch(constants, summaries, sub_epoch_n, prev_ssi, sampled_seg_index, segments)
+        if not valid:
+            return False, []
+        vdfs_to_validate.extend(vdf_list)
+    return True, vdfs_to_validate
+
+
+def _sub_epoch_segment_jobs(
+    constants: ConsensusConstants,
+    rng: random.Random,
+    challenge_segments: List[SubEpochChallengeSegment],
+    summaries: List[SubEpochSummary],
+) -> List[Tuple[int, uint64, int, List[SubEpochChallengeSegment]]]:
+    """
+    Splits the segments by sub epoch, with what is needed to validate each sub epoch on its own: the sub slot iters
+    of the previous sampled sub epoch and the segment to sample. The sampled segments are drawn from rng in the
+    order of the proof, so the result does not depend on how the sub epochs are validated afterwards.
+    """
+    jobs: List[Tuple[int, uint64, int, List[SubEpochChallengeSegment]]] = []
+    curr_ssi = constants.SUB_SLOT_ITERS_STARTING
+    for sub_epoch_n, segments in map_segments_by_sub_epoch(challenge_segments).items():
         prev_ssi = curr_ssi
-        curr_difficulty, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
-        log.debug(f"validate sub epoch {sub_epoch_n}")
-        # recreate RewardChainSubSlot for next ses rc_hash
+        _, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
         sampled_seg_index = rng.choice(range(len(segments)))
-        if sub_epoch_n > 0:
-            rc_sub_slot = __get_rc_sub_slot(constants, segments[0], summaries, curr_ssi)
-            prev_ses = summaries[sub_epoch_n - 1]
-            rc_sub_slot_hash = rc_sub_slot.get_hash()
-        if not summaries[sub_epoch_n].reward_chain_hash == rc_sub_slot_hash:
-            log.error(f"failed reward_chain_hash validation sub_epoch {sub_epoch_n}")
-            return False
-        for idx, segment in enumerate(segments):
-            valid_segment, ip_iters, slot_iters, slots, vdf_list = _validate_segment(
-                constants, segment, curr_ssi, prev_ssi, curr_difficulty, prev_ses, idx == 0, sampled_seg_index == idx
-            )
-            vdfs_to_validate.extend(vdf_list)
-            if not valid_segment:
-                log.error(f"failed to validate sub_epoch {segment.sub_epoch_n} segment {idx} slots")
-                return False
-            prev_ses = None
-            total_blocks += 1
-            total_slot_iters += slot_iters
-            total_slots += slots
-            total_ip_iters += ip_iters
+        jobs.append((sub_epoch_n, prev_ssi, sampled_seg_index, segments))
+    return jobs
+
+
+def _validate_sub_epoch(
+    constants: ConsensusConstants,
+    summaries: List[SubEpochSummary],
+    sub_epoch_n: int,
+    prev_ssi: uint64,
+    sampled_seg_index: int,
+    segments: List[SubEpochChallengeSegment],
+) -> Tuple[bool, List[Tuple[VDFProof, ClassgroupElement, VDFInfo]]]:
+    curr_difficulty, curr_ssi = _get_curr_diff_ssi(constants, sub_epoch_n, summaries)
+    log.debug(f"validate sub epoch {sub_epoch_n}")
+    prev_ses: Optional[SubEpochSummary] = None
+    rc_sub_slot_hash = constants.GENESIS_CHALLENGE
+    # recreate RewardChainSubSlot for next ses rc_hash
+    if sub_epoch_n > 0:
+        rc_sub_slot = __get_rc_sub_slot(constants, segments[0], summaries, curr_ssi)
+        prev_ses = summaries[sub_epoch_n - 1]
+        rc_sub_slot_hash = rc_sub_slot.get_hash()
+    if not summaries[sub_epoch_n].reward_chain_hash == rc_sub_slot_hash:
+        log.error(f"failed reward_chain_hash validation sub_epoch {sub_epoch_n}")
+        return False, []
+    vdfs_to_validate = []
+    for idx, segment in enumerate(segments):
+        valid_segment, ip_iters, slot_iters, slots, vdf_list = _validate_segment(
+            constants, segment, curr_ssi, prev_ssi, curr_difficulty, prev_ses, idx == 0, sampled_seg_index == idx
+        )
+        vdfs_to_validate.extend(vdf_list)
+        if not valid_segment:
+            log.error(f"failed to validate sub_epoch {segment.sub_epoch_n} segment {idx} slots")
+            return False, []
+        prev_ses = None
     return True, vdfs_to_validate
 
 
+def _validate_sub_epoch_batch(
+    constants_dict: Dict,
+    summaries_bytes: List[bytes],
+    jobs: List[Tuple[int, int, int, bytes]],
+    shutdown_file_path: Optional[pathlib.Path] = None,
+) -> Tuple[bool, List[Tuple[bytes, bytes, bytes]]]:
+    """
+    Validates sub epochs from _sub_epoch_segment_jobs in a worker process, with the segments serialized as
+    SubEpochSegments. Returns the VDFs which still have to be checked.
+    """
+    constants, summaries = bytes_to_vars(constants_dict, summaries_bytes)
+    vdfs_to_validate: List[Tuple[bytes, bytes, bytes]] = []
+    for sub_epoch_n, prev_ssi, sampled_seg_index, segments_bytes in jobs:
+        segments = SubEpochSegments.from_bytes(segments_bytes).challenge_segments
+        valid, vdf_list = _validate_sub_epoch(
+            constants, summaries, sub_epoch_n, uint64(prev_ssi), sampled_seg_index, segments
+        )
+        if not valid:
+            return False, []
+        for vdf_proof, classgroup, vdf_info in vdf_list:
+            vdfs_to_validate.append((bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)))
+
+        if shutdown_file_path is not None and not shutdown_file_path.is_file():
+            log.info("cancelling sub epoch validation, shutdown requested")
+            return False, []
+    return True, vdfs_to_validate
+
+
+async def validate_weight_proof_in_executor(
+    executor: Executor,
+    constants: ConsensusConstants,
+    rng: random.Random,
+    summaries: List[SubEpochSummary],
+    weight_proof: WeightProof,
+    validate_segments: bool,
+    shutdown_file_path: Optional[pathlib.Path] = None,
+) -> Tuple[bool, List[bytes]]:
+    """
+    Validates the recent chain and, if validate_segments, the sub epoch segments of a weight proof in the executor.
+    Every sub epoch is a separate job and so are small batches of the VDFs they return, so idle workers keep picking
+    up work until all of it is done, while the recent chain is validated alongside. Stops at the first failure and
+    cancels the remaining jobs, also when cancelled itself; jobs already running stop once shutdown_file_path is
+    removed. Returns whether the proof is valid and the serialized block records of the recent chain.
+    """
+    loop = asyncio.get_running_loop()
+    constants_dict, summary_bytes, _, wp_recent_chain_bytes = vars_to_bytes(constants, summaries, weight_proof)
+    jobs: List[asyncio.Future] = []
+    # TODO: remove hint overrides after https://github.com/python/typeshed/pull/6187
+    recent_blocks_validation_task: asyncio.Future = loop.run_in_executor(
+        executor,
+        _validate_recent_blocks_and_get_records,
+        constants_dict,
+        wp_recent_chain_bytes,
+        summary_bytes,
+        shutdown_file_path,
+    )  # type: ignore[assignment]
+    jobs.append(recent_blocks_validation_task)
+    try:
+        if validate_segments:
+            segment_tasks: List[asyncio.Future] = []
+            for sub_epoch_n, prev_ssi, sampled_seg_index, segments in _sub_epoch_segment_jobs(
+                constants, rng, weight_proof.sub_epoch_segments, summaries
+            ):
+                job = (sub_epoch_n, int(prev_ssi), sampled_seg_index, bytes(SubEpochSegments(segments)))
+                segment_tasks.append(
+                    loop.run_in_executor(
+                        executor, _validate_sub_epoch_batch, constants_dict, summary_bytes, [job], shutdown_file_path
+                    )
+                )
+            jobs.extend(segment_tasks)
+
+            vdf_tasks: List[asyncio.Future] = []
+            for segment_task in asyncio.as_completed(segment_tasks):
+                segments_validated, vdfs_to_validate = await segment_task
+                if not segments_validated:
+                    return False, []
+                for chunk in chunks(vdfs_to_validate, VDF_BATCH_SIZE):
+                    vdf_task = loop.run_in_executor(
+                        executor, _validate_vdf_batch, constants_dict, chunk, shutdown_file_path
+                    )
+                    # Tracked right away, so the batches are cancelled when a later segment fails
+                    jobs.append(vdf_task)
+                    vdf_tasks.append(vdf_task)
+
+            for vdf_task in asyncio.as_completed(vdf_tasks):
+                if not await vdf_task:
+                    return False, []
+
+        return await recent_blocks_validation_task
+    finally:
+        for job in jobs:
+            job.cancel()
+
+
 def _validate_segment(
     constants: ConsensusConstants,
     segment: SubEpochChallengeSegment,
@@ -8,6 +8,8 @@ from typing import Callable, Dict, List, Optional, Tuple
 from silicoin.consensus.coinbase import create_puzzlehash_for_pk
 import silicoin.server.ws_connection as ws  # lgtm [py/import-and-import-from]
 from silicoin.consensus.constants import ConsensusConstants
+from silicoin.harvester.lookup_stats import LookupStats, PlotLookupParameter
+from silicoin.harvester.plot_sync import PlotSyncState
 from silicoin.plotting.manager import PlotManager
 from silicoin.plotting.util import (
     add_plot_directory,
@@ -18,6 +20,8 @@ from silicoin.plotting.util import (
     PlotRefreshResult,
     PlotRefreshEvents,
 )
+from silicoin.protocols.harvester_protocol import RespondPlotsDelta
+from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.util.streamable import dataclass_from_dict
 from silicoin.util.bech32m import encode_puzzle_hash
 
@@ -35,6 +39,10 @@ class Harvester:
     _refresh_lock: asyncio.Lock
     event_loop: asyncio.events.AbstractEventLoop
     config: Dict
+    plot_sync_state: PlotSyncState
+    # Set by the plot manager's refresh thread, the sync state is updated on the next delta request
+    plot_sync_dirty: bool
+    lookup_stats: LookupStats
 
     def __init__(self, root_path: Path, config: Dict, constants: ConsensusConstants):
         self.log = log
@@ -61,6 +69,12 @@ class Harvester:
         self.cached_challenges = []
         self.state_changed_callback: Optional[Callable] = None
         self.parallel_read: bool = config.get("parallel_read", True)
+        self.plot_sync_state = PlotSyncState()
+        self.plot_sync_dirty = True
+        lookup_parameter: PlotLookupParameter = PlotLookupParameter()
+        if "plot_lookup_parameter" in config:
+            lookup_parameter = dataclass_from_dict(PlotLookupParameter, config["plot_lookup_parameter"])
+        self.lookup_stats = LookupStats(lookup_parameter)
 
     async def _start(self):
         self._refresh_lock = asyncio.Lock()
@@ -88,6 +102,16 @@ class Harvester:
             f"remaining {update_result.remaining}, "
             f"duration: {update_result.duration:.2f} seconds"
         )
+        if event == PlotRefreshEvents.done:
+            self.lookup_stats.retain(set(self.plot_manager.plots.keys()))
+            for device, device_result in update_result.devices.items():
+                self.log.info(
+                    f"refresh_batch: device {device} {sorted(device_result.directories)}, "
+                    f"loaded {device_result.loaded}, processed {device_result.processed}, "
+                    f"{device_result.files_per_second():.2f} files per second"
+                )
+        if event != PlotRefreshEvents.started:
+            self.plot_sync_dirty = True
         if update_result.loaded > 0:
             self.event_loop.call_soon_threadsafe(self._state_changed, "plots")
 
@@ -128,6 +152,18 @@ class Harvester:
                 [str(s) for s in self.plot_manager.no_key_filenames],
             )
 
+    def get_plots_delta(self, sync_id: bytes32, since_version: int) -> RespondPlotsDelta:
+        with self.plot_manager:
+            if self.plot_sync_dirty:
+                self.plot_sync_dirty = False
+                self.plot_sync_state.update(self.plot_manager.plots)
+            return self.plot_sync_state.delta(
+                sync_id,
+                since_version,
+                [str(s) for s in self.plot_manager.failed_to_open_filenames.keys()],
+                [str(s) for s in self.plot_manager.no_key_filenames],
+            )
+
     def delete_plot(self, str_path: str):
         remove_plot(Path(str_path))
         self.plot_manager.trigger_refresh()
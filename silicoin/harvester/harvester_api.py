@@ -2,12 +2,13 @@ import asyncio
 import time
 from decimal import Decimal
 from pathlib import Path
-from typing import Callable, List, Tuple
+from typing import Callable, List, Optional, Tuple
 
 from blspy import AugSchemeMPL, G1Element, G2Element
 
 from silicoin.consensus.pot_iterations import calculate_iterations_quality, calculate_sp_interval_iters
 from silicoin.harvester.harvester import Harvester
+from silicoin.harvester.lookup_stats import wait_for_lookup
 from silicoin.plotting.util import PlotInfo, parse_plot_info
 from silicoin.protocols import harvester_protocol
 from silicoin.protocols.farmer_protocol import FarmingInfo
@@ -69,14 +70,17 @@ class HarvesterAPI:
         assert len(new_challenge.challenge_hash) == 32
 
         stakings = {bytes(k): Decimal(v) for k, v in new_challenge.stakings}
+        lookup_parameter = self.harvester.lookup_stats.parameter
 
         loop = asyncio.get_running_loop()
 
         def blocking_lookup(
-            filename: Path, plot_info: PlotInfo, difficulty_coeff: Decimal
+            filename: Path, plot_info: PlotInfo, difficulty_coeff: Decimal, started: Optional[asyncio.Event]
         ) -> List[Tuple[bytes32, ProofOfSpace]]:
             # Uses the DiskProver object to lookup qualities. This is a blocking call,
             # so it should be run in a thread pool.
+            if started is not None:
+                loop.call_soon_threadsafe(started.set)
             try:
                 plot_id = plot_info.prover.get_id()
                 sp_challenge_hash = ProofOfSpace.calculate_pos_challenge(
@@ -84,6 +88,7 @@ class HarvesterAPI:
                     new_challenge.challenge_hash,
                     new_challenge.sp_hash,
                 )
+                lookup_start = time.time()
                 try:
                     quality_strings = plot_info.prover.get_qualities_for_challenge(sp_challenge_hash)
                 except Exception as e:
@@ -93,6 +98,8 @@ class HarvesterAPI:
                         f"challenge: {sp_challenge_hash}, plot_info: {plot_info}"
                     )
                     return []
+                finally:
+                    self.harvester.lookup_stats.add_qualities(filename, time.time() - lookup_start)
 
                 responses: List[Tuple[bytes32, ProofOfSpace]] = []
                 if quality_strings is not None:
@@ -121,6 +128,7 @@ class HarvesterAPI:
                         if required_iters < sp_interval_iters:
                             # Found a very good proof of space! will fetch the whole proof from disk,
                             # then send to farmer
+                            lookup_start = time.time()
                             try:
                                 proof_xs = plot_info.prover.get_full_proof(
                                     sp_challenge_hash, index, self.harvester.parallel_read
@@ -132,6 +140,8 @@ class HarvesterAPI:
                                     f"plot_info: {plot_info}"
                                 )
                                 continue
+                            finally:
+                                self.harvester.lookup_stats.add_full_proof(filename, time.time() - lookup_start)
 
                             # Look up local_sk from plot to save locked memory
                             (
@@ -176,9 +186,25 @@ class HarvesterAPI:
             else:
                 difficulty_coeff = Decimal(1)
 
-            proofs_of_space_and_q: List[Tuple[bytes32, ProofOfSpace]] = await loop.run_in_executor(
-                self.harvester.executor, blocking_lookup, filename, plot_info, difficulty_coeff
-            )
+            timeout_ms = lookup_parameter.slow_plot_timeout_milliseconds
+            if timeout_ms > 0 and self.harvester.lookup_stats.is_slow(filename):
+                # The slow plots queue last, so their timeout starts once their lookup does
+                started = asyncio.Event()
+                lookup = loop.run_in_executor(
+                    self.harvester.executor, blocking_lookup, filename, plot_info, difficulty_coeff, started
+                )
+                try:
+                    proofs_of_space_and_q: List[Tuple[bytes32, ProofOfSpace]] = await wait_for_lookup(
+                        lookup, started, timeout_ms / 1000
+                    )
+                except asyncio.TimeoutError:
+                    self.harvester.lookup_stats.add_timeout(filename)
+                    self.harvester.log.warning(f"Stopped waiting for the slow plot {filename} after {timeout_ms} ms")
+                    return filename, []
+            else:
+                proofs_of_space_and_q = await loop.run_in_executor(
+                    self.harvester.executor, blocking_lookup, filename, plot_info, difficulty_coeff, None
+                )
             for quality_str, proof_of_space in proofs_of_space_and_q:
                 all_responses.append(
                     harvester_protocol.NewProofOfSpace(
@@ -192,7 +218,8 @@ class HarvesterAPI:
                 )
             return filename, all_responses
 
-        awaitables = []
+        lookups: List[Tuple[Path, PlotInfo]] = []
+        slow_lookups: List[Tuple[Path, PlotInfo]] = []
         passed = 0
         total = 0
         with self.harvester.plot_manager:
@@ -209,10 +236,20 @@ class HarvesterAPI:
                             new_challenge.sp_hash,
                         ):
                             passed += 1
-                            awaitables.append(lookup_challenge(try_plot_filename, try_plot_info))
+                            if lookup_parameter.deprioritize_slow_plots and self.harvester.lookup_stats.is_slow(
+                                try_plot_filename
+                            ):
+                                slow_lookups.append((try_plot_filename, try_plot_info))
+                            else:
+                                lookups.append((try_plot_filename, try_plot_info))
                 except Exception as e:
                     self.harvester.log.error(f"Error plot file {try_plot_filename} may no longer exist {e}")
 
+        # The tasks submit their lookups to the executor in the order they are created, so the slow plots queue last
+        awaitables = [
+            asyncio.create_task(lookup_challenge(filename, plot_info)) for filename, plot_info in lookups + slow_lookups
+        ]
+
         # Concurrently executes all lookups on disk, to take advantage of multiple disk parallelism
         total_proofs_found = 0
         for filename_sublist_awaitable in asyncio.as_completed(awaitables):
@@ -319,3 +356,8 @@ class HarvesterAPI:
 
         response = harvester_protocol.RespondPlots(plots_response, failed_to_open_filenames, no_key_filenames)
         return make_msg(ProtocolMessageTypes.respond_plots, response)
+
+    @api_request
+    async def request_plots_delta(self, request: harvester_protocol.RequestPlotsDelta):
+        response = self.harvester.get_plots_delta(request.sync_id, request.since_version)
+        return make_msg(ProtocolMessageTypes.respond_plots_delta, response)
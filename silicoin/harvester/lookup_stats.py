@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+log = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets in milliseconds, the last bucket takes everything above
+BUCKET_BOUNDS_MS: List[int] = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+PERCENTILES: List[int] = [50, 90, 99]
+
+
+@dataclass
+class PlotLookupParameter:
+    # A plot gets flagged as slow once slow_lookups quality lookups in a row took longer than slow_lookup_milliseconds,
+    # the next faster one clears the flag
+    slow_lookup_milliseconds: int = 3000
+    slow_lookups: int = 3
+    # Start the lookups of the slow plots after the others
+    deprioritize_slow_plots: bool = True
+    # Stop waiting for the lookups of the slow plots this many milliseconds after they started, 0 waits for them
+    slow_plot_timeout_milliseconds: int = 0
+
+
+class LatencyHistogram:
+    counts: List[int]
+    max_ms: float
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.max_ms = 0
+
+    def add(self, milliseconds: float) -> None:
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+        self.max_ms = max(self.max_ms, milliseconds)
+
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def percentile(self, percent: int) -> float:
+        """
+        Returns the upper bound of the bucket the percentile falls in, capped at the slowest lookup.
+        """
+        rank = self.count() * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count > 0 and seen >= rank:
+                if index == len(BUCKET_BOUNDS_MS):
+                    break
+                return min(BUCKET_BOUNDS_MS[index], self.max_ms)
+        return self.max_ms
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"count": self.count(), "max": self.max_ms}
+        for percent in PERCENTILES:
+            result[f"p{percent}"] = self.percentile(percent)
+        return result
+
+
+@dataclass
+class DeviceLookupStats:
+    directories: Set[str] = field(default_factory=set)
+    qualities: LatencyHistogram = field(default_factory=LatencyHistogram)
+    full_proof: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+
+@dataclass
+class PlotLookupStats:
+    device: int
+    qualities: LatencyHistogram = field(default_factory=LatencyHistogram)
+    full_proof: LatencyHistogram = field(default_factory=LatencyHistogram)
+    slow_in_a_row: int = 0
+    slow: bool = False
+    timeouts: int = 0
+
+
+class LookupStats:
+    """
+    Latency histograms of `get_qualities_for_challenge` and `get_full_proof` for each plot and each device (st_dev
+    of the plot directory), so that a failing disk or a slow mount shows up before it costs proofs. Plots which are
+    slow in several lookups in a row get flagged, the harvester can look them up last or stop waiting for them, see
+    `PlotLookupParameter`. The lookups report from the harvester's executor threads.
+    """
+
+    parameter: PlotLookupParameter
+    _lock: threading.Lock
+    _plots: Dict[Path, PlotLookupStats]
+    _devices: Dict[int, DeviceLookupStats]
+    _directory_devices: Dict[Path, int]
+
+    def __init__(self, parameter: PlotLookupParameter):
+        self.parameter = parameter
+        self._lock = threading.Lock()
+        self._plots = {}
+        self._devices = {}
+        self._directory_devices = {}
+
+    def _plot_stats(self, path: Path) -> PlotLookupStats:
+        # Requires `_lock`
+        plot_stats = self._plots.get(path)
+        if plot_stats is None:
+            device = self._directory_devices.get(path.parent)
+            if device is None:
+                try:
+                    device = path.parent.stat().st_dev
+                except OSError:
+                    device = -1
+                self._directory_devices[path.parent] = device
+            plot_stats = PlotLookupStats(device)
+            self._plots[path] = plot_stats
+            if device not in self._devices:
+                self._devices[device] = DeviceLookupStats()
+            self._devices[device].directories.add(str(path.parent))
+        return plot_stats
+
+    def add_qualities(self, path: Path, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        with self._lock:
+            plot_stats = self._plot_stats(path)
+            plot_stats.qualities.add(milliseconds)
+            self._devices[plot_stats.device].qualities.add(milliseconds)
+            if milliseconds > self.parameter.slow_lookup_milliseconds:
+                plot_stats.slow_in_a_row += 1
+                if not plot_stats.slow and plot_stats.slow_in_a_row >= self.parameter.slow_lookups:
+                    plot_stats.slow = True
+                    log.warning(
+                        f"Flagged plot {path} as slow, the last {plot_stats.slow_in_a_row} quality lookups took "
+                        f"longer than {self.parameter.slow_lookup_milliseconds} milliseconds"
+                    )
+            else:
+                plot_stats.slow_in_a_row = 0
+                if plot_stats.slow:
+                    plot_stats.slow = False
+                    log.info(f"Plot {path} is not slow anymore, lookup took {milliseconds:.0f} milliseconds")
+
+    def add_full_proof(self, path: Path, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        with self._lock:
+            plot_stats = self._plot_stats(path)
+            plot_stats.full_proof.add(milliseconds)
+            self._devices[plot_stats.device].full_proof.add(milliseconds)
+
+    def add_timeout(self, path: Path) -> None:
+        with self._lock:
+            self._plot_stats(path).timeouts += 1
+
+    def is_slow(self, path: Path) -> bool:
+        plot_stats = self._plots.get(path)
+        return plot_stats is not None and plot_stats.slow
+
+    def retain(self, paths: Set[Path]) -> None:
+        """
+        Drops the plots which are not in `paths` anymore, the devices keep their history.
+        """
+        with self._lock:
+            for path in [path for path in self._plots.keys() if path not in paths]:
+                del self._plots[path]
+
+    def to_json_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "plots": [
+                    {
+                        "filename": str(path),
+                        "device": plot_stats.device,
+                        "qualities": plot_stats.qualities.to_json_dict(),
+                        "full_proof": plot_stats.full_proof.to_json_dict(),
+                        "slow": plot_stats.slow,
+                        "timeouts": plot_stats.timeouts,
+                    }
+                    for path, plot_stats in self._plots.items()
+                ],
+                "devices": [
+                    {
+                        "device": device,
+                        "directories": sorted(device_stats.directories),
+                        "qualities": device_stats.qualities.to_json_dict(),
+                        "full_proof": device_stats.full_proof.to_json_dict(),
+                    }
+                    for device, device_stats in self._devices.items()
+                ],
+            }
+
+
+async def wait_for_lookup(lookup: asyncio.Future, started: asyncio.Event, timeout_seconds: float) -> Any:
+    """
+    Waits for a lookup running in an executor, at most `timeout_seconds` after `started` got set, the time it spent
+    queued behind the other lookups doesn't count. Raises `asyncio.TimeoutError` without cancelling the lookup, so
+    that it still runs and records its latency, which is what clears the slow flag of a plot.
+    """
+    started_task = asyncio.ensure_future(started.wait())
+    try:
+        await asyncio.wait([started_task, lookup], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        started_task.cancel()
+    return await asyncio.wait_for(asyncio.shield(lookup), timeout_seconds)
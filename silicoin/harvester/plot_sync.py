@@ -0,0 +1,112 @@
+import logging
+from pathlib import Path
+from secrets import token_bytes
+from typing import Dict, List, Tuple
+
+from silicoin.plotting.util import PlotInfo
+from silicoin.protocols.harvester_protocol import Plot, RespondPlotsDelta
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.util.ints import uint64
+
+log = logging.getLogger(__name__)
+
+# Number of removed filenames remembered for delta requests. Farmers that are further behind get a full sync.
+MAX_REMOVED_ENTRIES = 100000
+
+
+def plot_from_info(path: Path, plot_info: PlotInfo) -> Plot:
+    prover = plot_info.prover
+    return Plot(
+        str(path),
+        prover.get_size(),
+        prover.get_id(),
+        plot_info.pool_public_key,
+        plot_info.pool_contract_puzzle_hash,
+        plot_info.plot_public_key,
+        plot_info.file_size,
+        plot_info.time_modified,
+        plot_info.farmer_public_key,
+    )
+
+
+class PlotSyncState:
+    """
+    Versioned view of the harvester's plot list, used to answer request_plots_delta. Every change of the plot list
+    gets a new version, and each plot remembers the version it was last added or changed in. A farmer which knows
+    the list up to some version only receives the plots changed and the filenames removed after it.
+
+    The sync_id changes whenever versions are not comparable anymore (on startup), which forces a full sync.
+    """
+
+    sync_id: bytes32
+    version: int
+    # filename -> (version of the last change, PlotInfo it was built from, Plot)
+    plots: Dict[str, Tuple[int, PlotInfo, Plot]]
+    # filename -> version of the removal, in increasing version order
+    removed: Dict[str, int]
+    # Deltas since versions older than this are not available anymore
+    oldest_delta_version: int
+
+    def __init__(self):
+        self.sync_id = bytes32(token_bytes(32))
+        self.version = 0
+        self.plots = {}
+        self.removed = {}
+        self.oldest_delta_version = 0
+
+    def update(self, current_plots: Dict[Path, PlotInfo]) -> bool:
+        """
+        Brings the versioned list in line with the plot manager's plots. Unchanged plots are detected by identity,
+        since the plot manager keeps the PlotInfo of a plot which didn't change. Returns True if anything changed.
+        """
+        next_version = self.version + 1
+        changed = False
+        seen: Dict[str, None] = {}
+        for path, plot_info in current_plots.items():
+            filename = str(path)
+            seen[filename] = None
+            entry = self.plots.get(filename)
+            if entry is not None and entry[1] is plot_info:
+                continue
+            self.plots[filename] = (next_version, plot_info, plot_from_info(path, plot_info))
+            self.removed.pop(filename, None)
+            changed = True
+        if len(seen) != len(self.plots):
+            for filename in [filename for filename in self.plots if filename not in seen]:
+                del self.plots[filename]
+                self.removed[filename] = next_version
+                changed = True
+            while len(self.removed) > MAX_REMOVED_ENTRIES:
+                oldest = next(iter(self.removed))
+                self.oldest_delta_version = self.removed.pop(oldest)
+        if changed:
+            self.version = next_version
+        return changed
+
+    def delta(
+        self,
+        sync_id: bytes32,
+        since_version: int,
+        failed_to_open_filenames: List[str],
+        no_key_filenames: List[str],
+    ) -> RespondPlotsDelta:
+        full_sync = sync_id != self.sync_id or since_version < self.oldest_delta_version or since_version > self.version
+        if full_sync:
+            plots = [plot for _, _, plot in self.plots.values()]
+            removed_filenames: List[str] = []
+        else:
+            plots = [plot for version, _, plot in self.plots.values() if version > since_version]
+            removed_filenames = [filename for filename, version in self.removed.items() if version > since_version]
+        log.debug(
+            f"PlotSyncState.delta: since {since_version}, version {self.version}, full_sync {full_sync}, "
+            f"plots {len(plots)}, removed {len(removed_filenames)}"
+        )
+        return RespondPlotsDelta(
+            self.sync_id,
+            uint64(self.version),
+            full_sync,
+            plots,
+            removed_filenames,
+            failed_to_open_filenames,
+            no_key_filenames,
+        )
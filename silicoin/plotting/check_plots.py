@@ -30,7 +30,9 @@ def plot_refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshR
 
 def check_plots(root_path, num, challenge_start, grep_string, list_duplicates, debug_show_memo):
     config = load_config(root_path, "config.yaml")
-    plot_refresh_parameter: PlotsRefreshParameter = PlotsRefreshParameter(batch_sleep_milliseconds=0)
+    plot_refresh_parameter: PlotsRefreshParameter = PlotsRefreshParameter(
+        batch_sleep_milliseconds=0, watch_directories=False
+    )
     plot_manager: PlotManager = PlotManager(
         root_path,
         match_str=grep_string,
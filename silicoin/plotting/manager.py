@@ -1,11 +1,15 @@
 import logging
+import mmap
+import os
+import struct
 import threading
 import time
 import traceback
+from collections import deque
 from concurrent.futures.thread import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
 
 from blspy import G1Element
 from chiapos import DiskProver
@@ -13,17 +17,21 @@ from chiapos import DiskProver
 from silicoin.consensus.pos_quality import UI_ACTUAL_SPACE_CONSTANT_FACTOR, _expected_plot_size
 from silicoin.plotting.util import (
     PlotInfo,
+    PlotRefreshDeviceResult,
     PlotRefreshEvents,
     PlotRefreshResult,
     PlotsRefreshParameter,
+    get_filenames,
+    get_plot_directories,
     get_plot_filenames,
     parse_plot_info,
     stream_plot_info_ph,
     stream_plot_info_pk,
 )
+from silicoin.plotting.watcher import PlotDirectoryWatcher
 from silicoin.types.blockchain_format.proof_of_space import ProofOfSpace
 from silicoin.types.blockchain_format.sized_bytes import bytes32
-from silicoin.util.ints import uint16
+from silicoin.util.ints import uint16, uint64
 from silicoin.util.path import mkdir
 from silicoin.util.streamable import Streamable, streamable
 from silicoin.wallet.derive_keys import master_sk_to_local_sk
@@ -32,6 +40,15 @@ log = logging.getLogger(__name__)
 
 CURRENT_VERSION: uint16 = uint16(0)
 
+# The plot cache file starts with its version, version 0 was a serialized DiskCache
+CACHE_VERSION: int = 1
+CACHE_HEADER = struct.Struct(">H")
+# plot_id, length of the serialized CacheEntry
+CACHE_RECORD_HEADER = struct.Struct(">32sI")
+# Compact the cache file once it has this many times more records than entries
+CACHE_COMPACTION_FACTOR = 2
+CACHE_COMPACTION_MIN_RECORDS = 1000
+
 
 @dataclass(frozen=True)
 @streamable
@@ -45,74 +62,381 @@ class CacheEntry(Streamable):
 @dataclass(frozen=True)
 @streamable
 class DiskCache(Streamable):
+    """
+    The cache file of version 0, only read to migrate it.
+    """
+
     version: uint16
     data: List[Tuple[bytes32, CacheEntry]]
 
 
 class Cache:
-    _changed: bool
+    """
+    Append-only file of the plot cache entries keyed by plot_id. It starts with CACHE_HEADER followed by records of
+    CACHE_RECORD_HEADER and the serialized CacheEntry, a record without an entry removes the plot_id. Loading
+    memory-maps the file and only reads the record headers, the entries get parsed once they are requested. Saving
+    appends the changes since the last save, and once most of the records are outdated the file gets compacted in a
+    background thread. A cache file of version 0 is migrated by the next save.
+    """
+
+    _lock: threading.Lock
+    # The live plot_ids with the position and length of their entry in the mapped file, None if it's not mapped
+    _index: Dict[bytes32, Optional[Tuple[int, int]]]
+    # The parsed entries, and the ones which are not mapped
     _data: Dict[bytes32, CacheEntry]
+    # The changes since the last save, None removes the plot_id
+    _pending: Dict[bytes32, Optional[CacheEntry]]
+    _mapped: Optional[mmap.mmap]
+    # The number of records in the file
+    _records: int
+    # Inode and size of the file after the last write, to detect changes done by others
+    _file_state: Optional[Tuple[int, int]]
+    _compaction_thread: Optional[threading.Thread]
 
     def __init__(self, path: Path):
-        self._changed = False
+        self._lock = threading.Lock()
+        self._index = {}
         self._data = {}
+        self._pending = {}
+        self._mapped = None
+        self._records = 0
+        self._file_state = None
+        self._compaction_thread = None
         self._path = path
         if not path.parent.exists():
             mkdir(path.parent)
 
     def __len__(self):
-        return len(self._data)
+        return len(self._index)
 
     def update(self, plot_id: bytes32, entry: CacheEntry):
-        self._data[plot_id] = entry
-        self._changed = True
+        with self._lock:
+            self._index[plot_id] = None
+            self._data[plot_id] = entry
+            self._pending[plot_id] = entry
 
     def remove(self, cache_keys: List[bytes32]):
-        for key in cache_keys:
-            if key in self._data:
-                del self._data[key]
+        with self._lock:
+            for key in cache_keys:
+                if key in self._index:
+                    del self._index[key]
+                    self._data.pop(key, None)
+                    self._pending[key] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat_info = self._path.stat()
+            return stat_info.st_ino, stat_info.st_size
+        except FileNotFoundError:
+            return None
+
+    def _close(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+    def _map(self):
+        with open(self._path, "rb") as file:
+            self._mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _snapshot(self) -> List[Tuple[bytes32, bytes]]:
+        # Requires `_lock`
+        records: List[Tuple[bytes32, bytes]] = []
+        for plot_id, position in self._index.items():
+            if position is not None:
+                assert self._mapped is not None
+                offset, length = position
+                records.append((plot_id, self._mapped[offset : offset + length]))
+            else:
+                records.append((plot_id, bytes(self._data[plot_id])))
+        return records
+
+    def _write_file(self, records: List[Tuple[bytes32, bytes]]) -> Tuple[Path, Dict[bytes32, Tuple[int, int]]]:
+        # Writes the records to a temporary file and returns it with the positions of the entries
+        positions: Dict[bytes32, Tuple[int, int]] = {}
+        offset = CACHE_HEADER.size
+        temp_path = self._path.with_suffix(".tmp")
+        with open(temp_path, "wb") as file:
+            file.write(CACHE_HEADER.pack(CACHE_VERSION))
+            for plot_id, serialized in records:
+                file.write(CACHE_RECORD_HEADER.pack(plot_id, len(serialized)))
+                offset += CACHE_RECORD_HEADER.size
+                file.write(serialized)
+                positions[plot_id] = (offset, len(serialized))
+                offset += len(serialized)
+        return temp_path, positions
+
+    def _replace_file(self, temp_path: Path, positions: Dict[bytes32, Tuple[int, int]]):
+        # Requires `_lock`, the file can't be replaced while it's mapped on Windows
+        self._close()
+        os.replace(temp_path, self._path)
+        self._map()
+        for plot_id, position in positions.items():
+            # Skip the ones which changed after the records were taken
+            if plot_id in self._index and plot_id not in self._pending:
+                self._index[plot_id] = position
+        self._records = len(positions)
+        self._file_state = self._stat()
+
+    def _compact(self):
+        try:
+            with self._lock:
+                file_state = self._file_state
+                records = self._snapshot()
+            temp_path, positions = self._write_file(records)
+            with self._lock:
+                if file_state != self._stat():
+                    log.debug("Cache changed during the compaction, retry after the next save")
+                    temp_path.unlink()
+                    return
+                self._replace_file(temp_path, positions)
+            log.info(f"Compacted the cache to {len(positions)} entries")
+        except Exception as e:
+            log.error(f"Failed to compact cache: {e}, {traceback.format_exc()}")
+
+    def save(self):
+        try:
+            with self._lock:
+                if self._mapped is None or self._file_state is None or self._file_state != self._stat():
+                    # No valid file to append to
+                    temp_path, positions = self._write_file(self._snapshot())
+                    self._pending = {}
+                    self._replace_file(temp_path, positions)
+                    log.info(f"Saved {len(positions)} entries of cached data")
+                    return
+                serialized: bytes = b"".join(
+                    CACHE_RECORD_HEADER.pack(plot_id, 0) if entry is None else self._record(plot_id, entry)
+                    for plot_id, entry in self._pending.items()
+                )
+                with open(self._path, "ab") as file:
+                    file.write(serialized)
+                self._records += len(self._pending)
+                self._pending = {}
+                self._file_state = self._stat()
+                log.info(f"Saved {len(serialized)} bytes of cached data")
+                if self._records > CACHE_COMPACTION_FACTOR * len(self._index) + CACHE_COMPACTION_MIN_RECORDS and (
+                    self._compaction_thread is None or not self._compaction_thread.is_alive()
+                ):
+                    self._compaction_thread = threading.Thread(target=self._compact, daemon=True)
+                    self._compaction_thread.start()
+        except Exception as e:
+            log.error(f"Failed to save cache: {e}, {traceback.format_exc()}")
+
+    @staticmethod
+    def _record(plot_id: bytes32, entry: CacheEntry) -> bytes:
+        serialized = bytes(entry)
+        return CACHE_RECORD_HEADER.pack(plot_id, len(serialized)) + serialized
+
+    def load(self):
+        with self._lock:
+            self._close()
+            self._index = {}
+            self._data = {}
+            self._pending = {}
+            self._records = 0
+            self._file_state = None
+            try:
+                self._map()
+                assert self._mapped is not None
+                log.info(f"Loaded {len(self._mapped)} bytes of cached data")
+                version = CACHE_HEADER.unpack_from(self._mapped, 0)[0]
+                if version == 0:
+                    self._load_disk_cache()
+                    return
+                if version != CACHE_VERSION:
+                    raise ValueError(f"Invalid cache version {version}. Expected version {CACHE_VERSION}.")
+                offset = CACHE_HEADER.size
+                while offset < len(self._mapped):
+                    if offset + CACHE_RECORD_HEADER.size > len(self._mapped):
+                        break
+                    plot_id, length = CACHE_RECORD_HEADER.unpack_from(self._mapped, offset)
+                    offset += CACHE_RECORD_HEADER.size
+                    if offset + length > len(self._mapped):
+                        break
+                    if length == 0:
+                        self._index.pop(bytes32(plot_id), None)
+                    else:
+                        self._index[bytes32(plot_id)] = (offset, length)
+                    offset += length
+                    self._records += 1
+                if offset == len(self._mapped):
+                    self._file_state = self._stat()
+                else:
+                    # Leaves `_file_state` unset to rewrite the file with the next save
+                    log.warning(f"Cache {self._path} ends with an incomplete record")
+            except FileNotFoundError:
+                log.debug(f"Cache {self._path} not found")
+            except Exception as e:
+                log.error(f"Failed to load cache: {e}, {traceback.format_exc()}")
+                self._close()
+                self._index = {}
+                self._records = 0
+
+    def _load_disk_cache(self):
+        # Requires `_lock`, keeps the entries as changes so that the next save rewrites the file
+        assert self._mapped is not None
+        stored_cache: DiskCache = DiskCache.from_bytes(self._mapped[:])
+        self._close()
+        for plot_id, entry in stored_cache.data:
+            self._index[plot_id] = None
+            self._data[plot_id] = entry
+            self._pending[plot_id] = entry
+        log.info(f"Migrating {len(self._index)} entries of cached data from version 0")
+
+    def keys(self):
+        return self._index.keys()
+
+    def items(self):
+        return [(plot_id, self.get(plot_id)) for plot_id in list(self._index.keys())]
+
+    def get(self, plot_id) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._data.get(plot_id)
+            if entry is None:
+                position = self._index.get(plot_id)
+                if position is not None:
+                    assert self._mapped is not None
+                    offset, length = position
+                    entry = CacheEntry.from_bytes(self._mapped[offset : offset + length])
+                    self._data[plot_id] = entry
+            return entry
+
+    def changed(self):
+        return len(self._pending) > 0
+
+    def path(self):
+        return self._path
+
+
+@dataclass(frozen=True)
+@streamable
+class PlotIndexEntry(Streamable):
+    path: str
+    file_size: uint64
+    time_modified_ns: uint64
+    loaded: bool
+
+
+@dataclass(frozen=True)
+@streamable
+class DiskPlotIndex(Streamable):
+    version: uint16
+    entries: List[PlotIndexEntry]
+
+
+class PlotIndex:
+    """
+    The size and modification time of the plot files which loaded, or failed to load, in the last refreshes. It's
+    kept on disk so that after a restart the plots which loaded before are loaded first, and the files which failed
+    to load and didn't change since are not opened again before `retry_invalid_seconds`.
+    """
+
+    _changed: bool
+    _data: Dict[str, PlotIndexEntry]
+    # The paths loaded from disk which were not looked at since
+    _restored: Set[str]
+
+    def __init__(self, path: Path):
+        self._changed = False
+        self._data = {}
+        self._restored = set()
+        self._path = path
+        if not path.parent.exists():
+            mkdir(path.parent)
+
+    def __len__(self):
+        return len(self._data)
+
+    def update(self, path: Path, stat_info: os.stat_result, loaded: bool):
+        entry = PlotIndexEntry(str(path), uint64(stat_info.st_size), uint64(stat_info.st_mtime_ns), loaded)
+        if self._data.get(entry.path) != entry:
+            self._data[entry.path] = entry
+            self._changed = True
+
+    def remove(self, paths: List[str]):
+        for path in paths:
+            if path in self._data:
+                del self._data[path]
                 self._changed = True
 
+    def loaded_before(self, path: Path) -> bool:
+        entry = self._data.get(str(path))
+        return entry is not None and entry.loaded
+
+    def restored_failure(self, path: Path, stat_info: os.stat_result) -> bool:
+        """
+        Returns True once for a file which failed to load before the restart and didn't change since.
+        """
+        path_str = str(path)
+        if path_str not in self._restored:
+            return False
+        self._restored.remove(path_str)
+        entry = self._data[path_str]
+        return (
+            not entry.loaded
+            and entry.file_size == stat_info.st_size
+            and entry.time_modified_ns == stat_info.st_mtime_ns
+        )
+
     def save(self):
         try:
-            disk_cache: DiskCache = DiskCache(
-                CURRENT_VERSION, [(plot_id, cache_entry) for plot_id, cache_entry in self.items()]
-            )
-            serialized: bytes = bytes(disk_cache)
+            disk_index: DiskPlotIndex = DiskPlotIndex(CURRENT_VERSION, list(self._data.values()))
+            serialized: bytes = bytes(disk_index)
             self._path.write_bytes(serialized)
             self._changed = False
-            log.info(f"Saved {len(serialized)} bytes of cached data")
+            log.info(f"Saved {len(serialized)} bytes of plot index")
         except Exception as e:
-            log.error(f"Failed to save cache: {e}, {traceback.format_exc()}")
+            log.error(f"Failed to save plot index: {e}, {traceback.format_exc()}")
 
     def load(self):
         try:
             serialized = self._path.read_bytes()
-            log.info(f"Loaded {len(serialized)} bytes of cached data")
-            stored_cache: DiskCache = DiskCache.from_bytes(serialized)
-            if stored_cache.version != CURRENT_VERSION:
-                # TODO, Migrate or drop current cache if the version changes.
-                raise ValueError(f"Invalid cache version {stored_cache.version}. Expected version {CURRENT_VERSION}.")
-            self._data = {plot_id: cache_entry for plot_id, cache_entry in stored_cache.data}
+            log.info(f"Loaded {len(serialized)} bytes of plot index")
+            stored_index: DiskPlotIndex = DiskPlotIndex.from_bytes(serialized)
+            if stored_index.version != CURRENT_VERSION:
+                raise ValueError(f"Invalid index version {stored_index.version}. Expected version {CURRENT_VERSION}.")
+            self._data = {entry.path: entry for entry in stored_index.entries}
+            self._restored = set(self._data.keys())
         except FileNotFoundError:
-            log.debug(f"Cache {self._path} not found")
+            log.debug(f"Plot index {self._path} not found")
         except Exception as e:
-            log.error(f"Failed to load cache: {e}, {traceback.format_exc()}")
+            log.error(f"Failed to load plot index: {e}, {traceback.format_exc()}")
 
     def keys(self):
         return self._data.keys()
 
-    def items(self):
-        return self._data.items()
-
-    def get(self, plot_id):
-        return self._data.get(plot_id)
-
     def changed(self):
         return self._changed
 
-    def path(self):
-        return self._path
+
+def directory_device(directory: Path) -> int:
+    try:
+        return directory.stat().st_dev
+    except OSError:
+        # Let the refresh handle the missing files
+        return -1
+
+
+def interleave_devices(plot_paths: List[Path]) -> List[Path]:
+    """
+    Orders the plot files round-robin by the device of their directory, keeping their order per device. The plot
+    directories are listed one after the other, so without it every batch of a refresh would open the plots of a
+    single disk or two, and `parallel_opens_per_device` would cap the whole harvester.
+    """
+    directory_devices: Dict[Path, int] = {}
+    device_paths: Dict[int, Deque[Path]] = {}
+    for path in plot_paths:
+        device = directory_devices.get(path.parent)
+        if device is None:
+            device = directory_devices[path.parent] = directory_device(path.parent)
+        device_paths.setdefault(device, deque()).append(path)
+    interleaved: List[Path] = []
+    queues: List[Deque[Path]] = list(device_paths.values())
+    while len(queues) > 0:
+        for queue in queues:
+            interleaved.append(queue.popleft())
+        queues = [queue for queue in queues if len(queue) > 0]
+    return interleaved
 
 
 class PlotManager:
@@ -124,10 +448,13 @@ class PlotManager:
     farmer_public_keys: List[G1Element]
     pool_public_keys: List[G1Element]
     cache: Cache
+    index: PlotIndex
+    watcher: Optional[PlotDirectoryWatcher]
     match_str: Optional[str]
     show_memo: bool
     open_no_key_filenames: bool
     last_refresh_time: float
+    last_poll_time: float
     refresh_parameter: PlotsRefreshParameter
     log: Any
     _lock: threading.Lock
@@ -153,10 +480,13 @@ class PlotManager:
         self.farmer_public_keys = []
         self.pool_public_keys = []
         self.cache = Cache(self.root_path.resolve() / "cache" / "plot_manager.dat")
+        self.index = PlotIndex(self.root_path.resolve() / "cache" / "plot_index.dat")
+        self.watcher = None
         self.match_str = match_str
         self.show_memo = show_memo
         self.open_no_key_filenames = open_no_key_filenames
         self.last_refresh_time = 0
+        self.last_poll_time = 0
         self.refresh_parameter = refresh_parameter
         self.log = logging.getLogger(__name__)
         self._lock = threading.Lock()
@@ -193,12 +523,25 @@ class PlotManager:
         return result
 
     def needs_refresh(self) -> bool:
-        return time.time() - self.last_refresh_time > float(self.refresh_parameter.interval_seconds)
+        interval_seconds = self.refresh_parameter.interval_seconds
+        if self.watcher is not None:
+            interval_seconds = self.refresh_parameter.watched_interval_seconds
+        return time.time() - self.last_refresh_time > float(interval_seconds)
+
+    def needs_poll(self) -> bool:
+        """
+        The directories the watcher can't rely on get listed every `interval_seconds` in between the full refreshes.
+        """
+        if self.watcher is None or len(self.watcher.polled_directories()) == 0:
+            return False
+        last_listed = max(self.last_refresh_time, self.last_poll_time)
+        return time.time() - last_listed > float(self.refresh_parameter.interval_seconds)
 
     def start_refreshing(self):
         self._refreshing_enabled = True
         if self._refresh_thread is None or not self._refresh_thread.is_alive():
             self.cache.load()
+            self.index.load()
             self._refresh_thread = threading.Thread(target=self._refresh_task)
             self._refresh_thread.start()
 
@@ -207,6 +550,9 @@ class PlotManager:
         if self._refresh_thread is not None and self._refresh_thread.is_alive():
             self._refresh_thread.join()
             self._refresh_thread = None
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
 
     def trigger_refresh(self):
         log.debug("trigger_refresh")
@@ -216,94 +562,159 @@ class PlotManager:
         while self._refreshing_enabled:
 
             while not self.needs_refresh() and self._refreshing_enabled:
+                if self.watcher is not None:
+                    changed, removed = self.watcher.get_changes(self.refresh_parameter.watch_settle_seconds)
+                    if len(changed) > 0 or len(removed) > 0:
+                        self.log.debug(f"_refresh_task: {len(changed)} changed, {len(removed)} removed plots watched")
+                        # The changed files are worth another try even if they failed to open recently
+                        for path in changed:
+                            self.failed_to_open_filenames.pop(path, None)
+                        self._refresh_plots(
+                            interleave_devices(sorted(changed)),
+                            self.watcher.directories(),
+                            lambda path: path in removed,
+                        )
+                        continue
+                    if self.needs_poll():
+                        self._poll_directories(self.watcher.polled_directories())
+                        continue
                 time.sleep(1)
 
             if not self._refreshing_enabled:
                 return
 
+            if self.refresh_parameter.watch_directories:
+                if self.watcher is None:
+                    self.watcher = PlotDirectoryWatcher()
+                # Start watching before listing the directories to not miss the changes in between
+                self.watcher.watch(set(Path(directory).resolve() for directory in get_plot_directories(self.root_path)))
+
             plot_filenames: Dict[Path, List[Path]] = get_plot_filenames(self.root_path)
             plot_directories: Set[Path] = set(plot_filenames.keys())
             plot_paths: List[Path] = []
             for paths in plot_filenames.values():
                 plot_paths += paths
+            # Load the plots which loaded before the restart first, spread over all the devices
+            loaded_paths: List[Path] = [path for path in plot_paths if self.index.loaded_before(path)]
+            new_paths: List[Path] = [path for path in plot_paths if not self.index.loaded_before(path)]
+            plot_paths = interleave_devices(loaded_paths) + interleave_devices(new_paths)
 
-            total_result: PlotRefreshResult = PlotRefreshResult()
-            total_size = len(plot_paths)
+            # Drop all plots we have in plot_filename_paths but not longer in the filesystem or set in config, the
+            # listing covers both without another stat per plot
+            listed_paths: Set[Path] = set(plot_paths)
+            self._refresh_plots(plot_paths, plot_directories, lambda path: path not in listed_paths)
 
-            self._refresh_callback(PlotRefreshEvents.started, PlotRefreshResult(remaining=total_size))
-
-            # First drop all plots we have in plot_filename_paths but not longer in the filesystem or set in config
-            def plot_removed(test_path: Path):
-                return not test_path.exists() or test_path.parent not in plot_directories
-
-            filenames_to_remove: List[str] = []
-            for plot_filename, paths_entry in self.plot_filename_paths.items():
-                loaded_path, duplicated_paths = paths_entry
-                loaded_plot = Path(loaded_path) / Path(plot_filename)
-                if plot_removed(loaded_plot):
-                    filenames_to_remove.append(plot_filename)
-                    if loaded_plot in self.plots:
-                        del self.plots[loaded_plot]
-                    total_result.removed += 1
-                    # No need to check the duplicates here since we drop the whole entry
-                    continue
-
-                paths_to_remove: List[str] = []
-                for path in duplicated_paths:
-                    if plot_removed(Path(path) / Path(plot_filename)):
-                        paths_to_remove.append(path)
-                        total_result.removed += 1
-                for path in paths_to_remove:
-                    duplicated_paths.remove(path)
-
-            for filename in filenames_to_remove:
-                del self.plot_filename_paths[filename]
-
-            def batches() -> Iterator[Tuple[int, List[Path]]]:
-                if total_size > 0:
-                    for batch_start in range(0, total_size, self.refresh_parameter.batch_size):
-                        batch_end = min(batch_start + self.refresh_parameter.batch_size, total_size)
-                        yield total_size - batch_end, plot_paths[batch_start:batch_end]
-                else:
-                    yield 0, []
+            self.last_refresh_time = time.time()
 
-            for remaining, batch in batches():
-                batch_result: PlotRefreshResult = self.refresh_batch(batch, plot_directories)
-                if not self._refreshing_enabled:
-                    self.log.debug("refresh_plots: Aborted")
-                    break
-                # Set the remaining files since `refresh_batch()` doesn't know them but we want to report it
-                batch_result.remaining = remaining
-                total_result.loaded += batch_result.loaded
-                total_result.processed += batch_result.processed
-                total_result.duration += batch_result.duration
-
-                self._refresh_callback(PlotRefreshEvents.batch_processed, batch_result)
-                if remaining == 0:
-                    break
-                batch_sleep = self.refresh_parameter.batch_sleep_milliseconds
-                self.log.debug(f"refresh_plots: Sleep {batch_sleep} milliseconds")
-                time.sleep(float(batch_sleep) / 1000.0)
+    def _poll_directories(self, directories: Set[Path]):
+        plot_paths: List[Path] = []
+        for directory in directories:
+            plot_paths += get_filenames(directory)
+        self.log.debug(f"_poll_directories: {len(plot_paths)} plots in {len(directories)} polled directories")
+        listed_paths: Set[Path] = set(plot_paths)
+        self._refresh_plots(
+            interleave_devices(plot_paths),
+            directories,
+            lambda path: path.parent in directories and path not in listed_paths,
+        )
+        self.last_poll_time = time.time()
 
-            if self._refreshing_enabled:
-                self._refresh_callback(PlotRefreshEvents.done, total_result)
+    def _refresh_plots(self, plot_paths: List[Path], plot_directories: Set[Path], plot_removed: Callable[[Path], bool]):
+        total_result: PlotRefreshResult = PlotRefreshResult()
+        total_size = len(plot_paths)
 
-            # Cleanup unused cache
-            available_ids = set([plot_info.prover.get_id() for plot_info in self.plots.values()])
-            invalid_cache_keys = [plot_id for plot_id in self.cache.keys() if plot_id not in available_ids]
-            self.cache.remove(invalid_cache_keys)
-            self.log.debug(f"_refresh_task: cached entries removed: {len(invalid_cache_keys)}")
+        self._refresh_callback(PlotRefreshEvents.started, PlotRefreshResult(remaining=total_size))
 
-            if self.cache.changed():
-                self.cache.save()
+        # First drop the removed plots
+        filenames_to_remove: List[str] = []
+        for plot_filename, paths_entry in self.plot_filename_paths.items():
+            loaded_path, duplicated_paths = paths_entry
+            loaded_plot = Path(loaded_path) / Path(plot_filename)
+            if plot_removed(loaded_plot):
+                filenames_to_remove.append(plot_filename)
+                if loaded_plot in self.plots:
+                    del self.plots[loaded_plot]
+                total_result.removed += 1
+                # No need to check the duplicates here since we drop the whole entry
+                continue
+
+            paths_to_remove: List[str] = []
+            for path in duplicated_paths:
+                if plot_removed(Path(path) / Path(plot_filename)):
+                    paths_to_remove.append(path)
+                    total_result.removed += 1
+            for path in paths_to_remove:
+                duplicated_paths.remove(path)
+
+        for filename in filenames_to_remove:
+            del self.plot_filename_paths[filename]
+
+        batch_start = 0
+        batch_size = self.refresh_parameter.batch_size
+        while True:
+            batch_end = min(batch_start + batch_size, total_size)
+            remaining = total_size - batch_end
+            batch_result: PlotRefreshResult = self.refresh_batch(plot_paths[batch_start:batch_end], plot_directories)
+            if not self._refreshing_enabled:
+                self.log.debug("refresh_plots: Aborted")
+                break
+            # Set the remaining files since `refresh_batch()` doesn't know them but we want to report it
+            batch_result.remaining = remaining
+            total_result.loaded += batch_result.loaded
+            total_result.processed += batch_result.processed
+            total_result.duration += batch_result.duration
+            for device, device_result in batch_result.devices.items():
+                total_device_result = total_result.devices.setdefault(device, PlotRefreshDeviceResult())
+                total_device_result.directories.update(device_result.directories)
+                total_device_result.loaded += device_result.loaded
+                total_device_result.processed += device_result.processed
+                total_device_result.duration += device_result.duration
+
+            self._refresh_callback(PlotRefreshEvents.batch_processed, batch_result)
+            if remaining == 0:
+                break
+            batch_start = batch_end
+            batch_size = self.next_batch_size(batch_result)
+            batch_sleep = self.refresh_parameter.batch_sleep_milliseconds
+            self.log.debug(f"refresh_plots: Sleep {batch_sleep} milliseconds")
+            time.sleep(float(batch_sleep) / 1000.0)
+
+        if self._refreshing_enabled:
+            self._refresh_callback(PlotRefreshEvents.done, total_result)
+
+        # Cleanup unused cache
+        available_ids = set([plot_info.prover.get_id() for plot_info in self.plots.values()])
+        invalid_cache_keys = [plot_id for plot_id in self.cache.keys() if plot_id not in available_ids]
+        self.cache.remove(invalid_cache_keys)
+        self.log.debug(f"_refresh_task: cached entries removed: {len(invalid_cache_keys)}")
+
+        if self.cache.changed():
+            self.cache.save()
+
+        # Cleanup the index of files which are neither loaded nor failed anymore
+        indexed_paths = set(str(path) for path in self.plots.keys())
+        indexed_paths.update(str(path) for path in self.failed_to_open_filenames.keys())
+        self.index.remove([path for path in self.index.keys() if path not in indexed_paths])
+
+        if self.index.changed():
+            self.index.save()
 
-            self.last_refresh_time = time.time()
+        self.log.debug(
+            f"_refresh_task: total_result.loaded {total_result.loaded}, "
+            f"total_result.removed {total_result.removed}, "
+            f"total_duration {total_result.duration:.2f} seconds"
+        )
 
-            self.log.debug(
-                f"_refresh_task: total_result.loaded {total_result.loaded}, "
-                f"total_result.removed {total_result.removed}, "
-                f"total_duration {total_result.duration:.2f} seconds"
-            )
+    def next_batch_size(self, batch_result: PlotRefreshResult) -> int:
+        """
+        Sizes the next batch to take about `batch_target_seconds` at the throughput of the last one, which keeps the
+        batches of already loaded plots large and the ones which have to open many plot files short.
+        """
+        if batch_result.processed == 0 or batch_result.duration <= 0:
+            return self.refresh_parameter.batch_size
+        files_per_second = batch_result.processed / batch_result.duration
+        size = int(files_per_second * self.refresh_parameter.batch_target_seconds)
+        return max(1, min(self.refresh_parameter.batch_size, size))
 
     def refresh_batch(self, plot_paths: List[Path], plot_directories: Set[Path]) -> PlotRefreshResult:
         start_time: float = time.time()
@@ -315,7 +726,21 @@ class PlotManager:
         if self.match_str is not None:
             log.info(f'Only loading plots that contain "{self.match_str}" in the file or directory name')
 
-        def process_file(file_path: Path) -> Optional[PlotInfo]:
+        # Group the files by the device of their directory, to limit the parallel opens per physical disk
+        directory_devices: Dict[Path, int] = {}
+        device_paths: Dict[int, Deque[Path]] = {}
+        for file_path in plot_paths:
+            device = directory_devices.get(file_path.parent)
+            if device is None:
+                device = directory_devices[file_path.parent] = directory_device(file_path.parent)
+            if device not in device_paths:
+                device_paths[device] = deque()
+                result.devices[device] = PlotRefreshDeviceResult()
+            device_paths[device].append(file_path)
+            result.devices[device].directories.add(str(file_path.parent))
+            result.devices[device].processed += 1
+
+        def process_file(file_path: Path, device_result: PlotRefreshDeviceResult) -> Optional[PlotInfo]:
             if not self._refreshing_enabled:
                 return None
             filename_str = str(file_path)
@@ -338,8 +763,16 @@ class PlotManager:
                 if str(file_path.parent) in duplicates:
                     log.debug(f"Skip duplicated plot {str(file_path)}")
                     return None
+            stat_info: Optional[os.stat_result] = None
             try:
-                if not file_path.exists():
+                try:
+                    stat_info = file_path.stat()
+                except FileNotFoundError:
+                    return None
+
+                if self.index.restored_failure(file_path, stat_info):
+                    # Failed to open before the restart and unchanged since, retry it with the other failed files
+                    self.failed_to_open_filenames[file_path] = int(time.time())
                     return None
 
                 prover = DiskProver(str(file_path))
@@ -347,7 +780,6 @@ class PlotManager:
                 log.debug(f"process_file {str(file_path)}")
 
                 expected_size = _expected_plot_size(prover.get_size()) * UI_ACTUAL_SPACE_CONSTANT_FACTOR
-                stat_info = file_path.stat()
 
                 # TODO: consider checking if the file was just written to (which would mean that the file is still
                 # being copied). A segfault might happen in this edge case.
@@ -421,14 +853,18 @@ class PlotManager:
 
                 with counter_lock:
                     result.loaded += 1
+                    device_result.loaded += 1
 
                 if file_path in self.failed_to_open_filenames:
                     del self.failed_to_open_filenames[file_path]
+                self.index.update(file_path, stat_info, True)
 
             except Exception as e:
                 tb = traceback.format_exc()
                 log.error(f"Failed to open file {file_path}. {e} {tb}")
                 self.failed_to_open_filenames[file_path] = int(time.time())
+                if stat_info is not None:
+                    self.index.update(file_path, stat_info, False)
                 return None
             log.info(f"Found plot {file_path} of size {new_plot_info.prover.get_size()}")
 
@@ -443,10 +879,32 @@ class PlotManager:
 
             return new_plot_info
 
-        with self, ThreadPoolExecutor() as executor:
-            plots_refreshed: Dict[Path, PlotInfo] = {}
-            for new_plot in executor.map(process_file, plot_paths):
+        def process_device(device: int) -> List[PlotInfo]:
+            # Each device has up to `parallel_opens_per_device` of these taking files from its queue
+            new_plots: List[PlotInfo] = []
+            paths = device_paths[device]
+            device_result = result.devices[device]
+            while True:
+                try:
+                    file_path = paths.popleft()
+                except IndexError:
+                    break
+                new_plot = process_file(file_path, device_result)
                 if new_plot is not None:
+                    new_plots.append(new_plot)
+            with counter_lock:
+                device_result.duration = max(device_result.duration, time.time() - start_time)
+            return new_plots
+
+        # Up to `parallel_opens_per_device` workers per device, but not more than it has files
+        workers: List[int] = []
+        for worker in range(max(1, self.refresh_parameter.parallel_opens_per_device)):
+            workers += [device for device, paths in device_paths.items() if worker < len(paths)]
+
+        with self, ThreadPoolExecutor(max_workers=max(1, len(workers))) as executor:
+            plots_refreshed: Dict[Path, PlotInfo] = {}
+            for new_plots in executor.map(process_device, workers):
+                for new_plot in new_plots:
                     plots_refreshed[Path(new_plot.prover.get_filename())] = new_plot
             self.plots.update(plots_refreshed)
 
@@ -455,7 +913,7 @@ class PlotManager:
         self.log.debug(
             f"refresh_batch: loaded {result.loaded}, "
             f"removed {result.removed}, processed {result.processed}, "
-            f"remaining {result.remaining}, batch_size {self.refresh_parameter.batch_size}, "
+            f"remaining {result.remaining}, devices {len(result.devices)}, "
             f"duration: {result.duration:.2f} seconds"
         )
         return result
@@ -1,14 +1,14 @@
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 from blspy import G1Element, PrivateKey
 from chiapos import DiskProver
 
 from silicoin.types.blockchain_format.sized_bytes import bytes32
-from silicoin.util.config import load_config, save_config
+from silicoin.util.config import load_config_view, update_config
 
 log = logging.getLogger(__name__)
 
@@ -17,8 +17,17 @@ log = logging.getLogger(__name__)
 class PlotsRefreshParameter:
     interval_seconds: int = 120
     retry_invalid_seconds: int = 1200
+    # The batches are sized to take about batch_target_seconds from the throughput of the last batch, up to batch_size
     batch_size: int = 300
+    batch_target_seconds: int = 5
     batch_sleep_milliseconds: int = 1
+    # How many plot files are opened at the same time on each device (st_dev), spinning disks thrash with more
+    parallel_opens_per_device: int = 2
+    # Refresh the plot files reported by filesystem events, and do the full refresh every watched_interval_seconds.
+    # The directories which can't be watched or are on network filesystems are still listed every interval_seconds.
+    watch_directories: bool = True
+    watched_interval_seconds: int = 1800
+    watch_settle_seconds: int = 10
 
 
 @dataclass
@@ -34,7 +43,8 @@ class PlotInfo:
 
 class PlotRefreshEvents(Enum):
     """
-    This are the events the `PlotManager` will trigger with the callback during a full refresh cycle:
+    This are the events the `PlotManager` will trigger with the callback during a refresh cycle, which is either a full
+    refresh or a refresh of the plot files reported by the plot directory watcher:
 
       - started: This event indicates the start of a refresh cycle and contains the total number of files to
                  process in `PlotRefreshResult.remaining`.
@@ -46,6 +56,7 @@ class PlotRefreshEvents(Enum):
               `PlotRefreshResult.{loaded|removed|processed}` are the totals of all batches.
 
       Note: The values of `PlotRefreshResult.{remaining|duration}` have the same meaning for all events.
+            `PlotRefreshResult.devices` breaks down the processed files of batch_processed and done by device.
     """
 
     started = 0
@@ -53,6 +64,18 @@ class PlotRefreshEvents(Enum):
     done = 2
 
 
+@dataclass
+class PlotRefreshDeviceResult:
+    directories: Set[str] = field(default_factory=set)
+    loaded: int = 0
+    processed: int = 0
+    # Time until all files of the device were processed
+    duration: float = 0
+
+    def files_per_second(self) -> float:
+        return self.processed / self.duration if self.duration > 0 else 0
+
+
 @dataclass
 class PlotRefreshResult:
     loaded: int = 0
@@ -60,11 +83,13 @@ class PlotRefreshResult:
     processed: int = 0
     remaining: int = 0
     duration: float = 0
+    # Keyed by the st_dev of the plot directories
+    devices: Dict[int, PlotRefreshDeviceResult] = field(default_factory=dict)
 
 
 def get_plot_directories(root_path: Path, config: Dict = None) -> List[str]:
     if config is None:
-        config = load_config(root_path, "config.yaml")
+        return list(load_config_view(root_path, "config.yaml")["harvester"]["plot_directories"])
     return config["harvester"]["plot_directories"]
 
 
@@ -79,28 +104,31 @@ def get_plot_filenames(root_path: Path) -> Dict[Path, List[Path]]:
 
 def add_plot_directory(root_path: Path, str_path: str) -> Dict:
     log.debug(f"add_plot_directory {str_path}")
-    config = load_config(root_path, "config.yaml")
-    if str(Path(str_path).resolve()) not in get_plot_directories(root_path, config):
-        config["harvester"]["plot_directories"].append(str(Path(str_path).resolve()))
-    save_config(root_path, "config.yaml", config)
-    return config
+
+    def add(config: Dict) -> None:
+        if str(Path(str_path).resolve()) not in get_plot_directories(root_path, config):
+            config["harvester"]["plot_directories"].append(str(Path(str_path).resolve()))
+
+    return update_config(root_path, "config.yaml", add)
 
 
 def remove_plot_directory(root_path: Path, str_path: str) -> None:
     log.debug(f"remove_plot_directory {str_path}")
-    config = load_config(root_path, "config.yaml")
-    str_paths: List[str] = get_plot_directories(root_path, config)
-    # If path str matches exactly, remove
-    if str_path in str_paths:
-        str_paths.remove(str_path)
-
-    # If path matches full path, remove
-    new_paths = [Path(sp).resolve() for sp in str_paths]
-    if Path(str_path).resolve() in new_paths:
-        new_paths.remove(Path(str_path).resolve())
-
-    config["harvester"]["plot_directories"] = [str(np) for np in new_paths]
-    save_config(root_path, "config.yaml", config)
+
+    def remove(config: Dict) -> None:
+        str_paths: List[str] = get_plot_directories(root_path, config)
+        # If path str matches exactly, remove
+        if str_path in str_paths:
+            str_paths.remove(str_path)
+
+        # If path matches full path, remove
+        new_paths = [Path(sp).resolve() for sp in str_paths]
+        if Path(str_path).resolve() in new_paths:
+            new_paths.remove(Path(str_path).resolve())
+
+        config["harvester"]["plot_directories"] = [str(np) for np in new_paths]
+
+    update_config(root_path, "config.yaml", remove)
 
 
 def remove_plot(path: Path):
@@ -0,0 +1,179 @@
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.api import ObservedWatch
+
+log = logging.getLogger(__name__)
+
+MOUNTS_PATH = Path("/proc/self/mounts")
+# Network filesystems only report the changes made through the local mount, not the ones of other hosts
+EVENTLESS_FILESYSTEMS: Set[str] = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "fuse"}
+
+
+def read_mounts() -> List[Tuple[Path, str]]:
+    """
+    Returns the mount points with their filesystem type, empty where `MOUNTS_PATH` doesn't exist (not Linux).
+    """
+    try:
+        lines = MOUNTS_PATH.read_text().splitlines()
+    except OSError:
+        return []
+    mounts: List[Tuple[Path, str]] = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) >= 3:
+            # Spaces and other special characters are octal escaped
+            mount_point = re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), fields[1])
+            mounts.append((Path(mount_point), fields[2]))
+    return mounts
+
+
+def reports_events(directory: Path, mounts: List[Tuple[Path, str]]) -> bool:
+    """
+    Returns False if the directory is on a filesystem known to miss events, the innermost (and last) mount wins.
+    """
+    mount_point: Optional[Path] = None
+    filesystem: Optional[str] = None
+    for path, path_filesystem in mounts:
+        if (path == directory or path in directory.parents) and (
+            mount_point is None or len(path.parts) >= len(mount_point.parts)
+        ):
+            mount_point, filesystem = path, path_filesystem
+    # fuseblk are local block devices, the other FUSE filesystems are mostly remote
+    return filesystem is None or not (filesystem in EVENTLESS_FILESYSTEMS or filesystem.startswith("fuse."))
+
+
+class PlotDirectoryWatcher(FileSystemEventHandler):
+    """
+    Collects the plot files which got created, modified, moved or deleted in the plot directories from filesystem
+    events, so that the `PlotManager` can refresh only those instead of listing all the plot directories. The
+    directories which can't be watched, or are on a filesystem which misses events (network mounts), get polled.
+    """
+
+    _lock: threading.Lock
+    _observer: Optional[Observer]
+    # The watches of the directories which could be scheduled
+    _watches: Dict[Path, ObservedWatch]
+    # The directories which need to be listed periodically
+    _polled: Set[Path]
+    # The changed plot files with the time of their last event
+    _changed: Dict[Path, float]
+    _removed: Set[Path]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._observer = None
+        self._watches = {}
+        self._polled = set()
+        self._changed = {}
+        self._removed = set()
+
+    def directories(self) -> Set[Path]:
+        """
+        The directories which are watched.
+        """
+        return set(self._watches.keys())
+
+    def polled_directories(self) -> Set[Path]:
+        """
+        The directories which could not be watched or are on a filesystem which misses events.
+        """
+        return set(self._polled)
+
+    def watch(self, directories: Set[Path]) -> None:
+        """
+        Watches the given directories, and drops the pending changes since the caller is about to list them. The
+        directories which could not be watched before are tried again.
+        """
+        with self._lock:
+            self._changed = {}
+            self._removed = set()
+        if self._observer is None:
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.start()
+        for directory in self._watches.keys() - directories:
+            self._observer.unschedule(self._watches.pop(directory))
+        for directory in directories - self._watches.keys():
+            try:
+                self._watches[directory] = self._observer.schedule(self, str(directory), recursive=False)
+            except Exception as e:
+                log.warning(f"Unable to watch plot directory {directory}: {e}")
+        mounts = read_mounts()
+        polled: Set[Path] = set()
+        for directory in directories:
+            if directory not in self._watches:
+                polled.add(directory)
+            elif not reports_events(directory, mounts):
+                if directory not in self._polled:
+                    log.info(f"Polling plot directory {directory}, its filesystem doesn't report all the changes")
+                polled.add(directory)
+        self._polled = polled
+
+    def stop(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self._watches = {}
+        self._polled = set()
+
+    def _plot_path(self, path: str) -> Optional[Path]:
+        plot_path = Path(path)
+        if plot_path.parent not in self._watches:
+            return None
+        # Same filter as `get_filenames`, skips the MacOS ._ files
+        if plot_path.suffix != ".plot" or plot_path.name.startswith("._"):
+            return None
+        return plot_path
+
+    def _add_changed(self, path: str) -> None:
+        plot_path = self._plot_path(path)
+        if plot_path is not None:
+            with self._lock:
+                self._removed.discard(plot_path)
+                self._changed[plot_path] = time.monotonic()
+
+    def _add_removed(self, path: str) -> None:
+        plot_path = self._plot_path(path)
+        if plot_path is not None:
+            with self._lock:
+                self._changed.pop(plot_path, None)
+                self._removed.add(plot_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._add_changed(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._add_changed(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._add_removed(event.src_path)
+            self._add_changed(event.dest_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._add_removed(event.src_path)
+
+    def get_changes(self, settle_seconds: float) -> Tuple[Set[Path], Set[Path]]:
+        """
+        Returns the changed plot files without an event for `settle_seconds`, which leaves the files still being
+        copied for later, and the removed plot files.
+        """
+        settled_before = time.monotonic() - settle_seconds
+        with self._lock:
+            changed: Set[Path] = {path for path, last_event in self._changed.items() if last_event <= settled_before}
+            for path in changed:
+                del self._changed[path]
+            removed: Set[Path] = self._removed
+            self._removed = set()
+        return changed, removed
@@ -1,13 +1,13 @@
 import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from blspy import G1Element
 
 from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.util.byte_types import hexstr_to_bytes
-from silicoin.util.config import load_config, save_config
+from silicoin.util.config import load_config_view, update_config
 from silicoin.util.streamable import Streamable, streamable
 
 """
@@ -39,7 +39,7 @@ class PoolWalletConfig(Streamable):
 
 
 def load_pool_config(root_path: Path) -> List[PoolWalletConfig]:
-    config = load_config(root_path, "config.yaml")
+    config = load_config_view(root_path, "config.yaml")
     ret_list: List[PoolWalletConfig] = []
     if "pool_list" in config["pool"]:
         for pool_config_dict in config["pool"]["pool_list"]:
@@ -61,6 +61,7 @@ def load_pool_config(root_path: Path) -> List[PoolWalletConfig]:
 
 
 async def update_pool_config(root_path: Path, pool_config_list: List[PoolWalletConfig]):
-    full_config = load_config(root_path, "config.yaml")
-    full_config["pool"]["pool_list"] = [c.to_json_dict() for c in pool_config_list]
-    save_config(root_path, "config.yaml", full_config)
+    def update(full_config: Dict) -> None:
+        full_config["pool"]["pool_list"] = [c.to_json_dict() for c in pool_config_list]
+
+    update_config(root_path, "config.yaml", update)
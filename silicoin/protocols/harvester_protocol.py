@@ -98,3 +98,25 @@ class RespondPlots(Streamable):
     plots: List[Plot]
     failed_to_open_filenames: List[str]
     no_key_filenames: List[str]
+
+
+@dataclass(frozen=True)
+@streamable
+class RequestPlotsDelta(Streamable):
+    # Identifies the plot list of the harvester that since_version refers to, all zeros on the first request
+    sync_id: bytes32
+    since_version: uint64
+
+
+@dataclass(frozen=True)
+@streamable
+class RespondPlotsDelta(Streamable):
+    sync_id: bytes32
+    version: uint64
+    # If set, plots is the complete plot list and the farmer drops everything it had for this harvester
+    full_sync: bool
+    # Plots added or changed since the requested version
+    plots: List[Plot]
+    removed_filenames: List[str]
+    failed_to_open_filenames: List[str]
+    no_key_filenames: List[str]
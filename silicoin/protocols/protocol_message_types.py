@@ -98,6 +98,10 @@ class ProtocolMessageTypes(Enum):
     request_ses_hashes = 76
     respond_ses_hashes = 77
 
+    # Incremental harvester plot sync
+    request_plots_delta = 78
+    respond_plots_delta = 79
+
     # Stakings
     request_stakings = 100
     respond_stakings = 101
@@ -5,7 +5,7 @@ from typing import List, Tuple
 from silicoin.util.ints import uint8, uint16
 from silicoin.util.streamable import Streamable, streamable
 
-protocol_version = "0.0.33"
+protocol_version = "0.0.34"
 
 """
 Handshake when establishing a connection between two servers.
@@ -17,6 +17,14 @@ Note: When changing this file, also change protocol_message_types.py
 # These are passed in as uint16 into the Handshake
 class Capability(IntEnum):
     BASE = 1  # Base capability just means it supports the silicoin protocol at mainnet
+    PLOTS_DELTA = 2  # Harvester answers request_plots_delta with the plots changed since a version
+
+
+# Capabilities this node sends in its handshake
+capabilities = [
+    (uint16(Capability.BASE.value), "1"),
+    (uint16(Capability.PLOTS_DELTA.value), "1"),
+]
 
 
 @dataclass(frozen=True)
@@ -4,6 +4,7 @@ from silicoin.consensus.block_record import BlockRecord
 from silicoin.consensus.coinbase import create_puzzlehash_for_pk
 from silicoin.full_node.full_node import FullNode
 from silicoin.full_node.mempool_check_conditions import get_puzzle_and_solution_for_coin
+from silicoin.full_node.network_space import DEFAULT_NETWORK_SPACE_WINDOW
 from silicoin.types.blockchain_format.program import Program, SerializedProgram
 from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.types.coin_record import CoinRecord
@@ -16,9 +17,14 @@ from silicoin.types.unfinished_header_block import UnfinishedHeaderBlock
 from silicoin.util.bech32m import encode_puzzle_hash
 from silicoin.util.byte_types import hexstr_to_bytes
 from silicoin.util.ints import uint32, uint64
+from silicoin.util.pagination import PagePosition, decode_cursor, encode_cursor, iterate_pages, page_limit
 from silicoin.util.ws_message import WsRpcMessage, create_payload_dict
 
 
+def _coin_record_page_position(record: CoinRecord) -> PagePosition:
+    return record.confirmed_block_index, record.name
+
+
 class FullNodeRpcApi:
     def __init__(self, service: FullNode):
         self.service = service
@@ -36,6 +42,8 @@ class FullNodeRpcApi:
             "/get_block_records": self.get_block_records,
             "/get_unfinished_block_headers": self.get_unfinished_block_headers,
             "/get_network_space": self.get_network_space,
+            "/get_network_space_series": self.get_network_space_series,
+            "/get_compaction_progress": self.get_compaction_progress,
             "/get_additions_and_removals": self.get_additions_and_removals,
             # this function is just here for backwards-compatibility. It will probably
             # be removed in the future
@@ -138,7 +146,9 @@ class FullNodeRpcApi:
             is_connected = False
         synced = await self.service.synced() and is_connected
 
-        space = await self.service.blockchain.get_peak_network_space(4608, peak)
+        space = self.service.network_space.get_space(peak)
+        if space is None:
+            space = await self.service.blockchain.get_peak_network_space(DEFAULT_NETWORK_SPACE_WINDOW, peak)
         response: Dict = {
             "blockchain_state": {
                 "peak": peak,
@@ -387,6 +397,32 @@ class FullNodeRpcApi:
         space = await self.service.blockchain.get_network_space(newer_block_bytes, older_block_bytes)
         return {"space": space}
 
+    async def get_network_space_series(self, request: Dict) -> Optional[Dict]:
+        """
+        Retrieves the recent estimates of the total space over a window of blocks, one per peak, for charting.
+        """
+        window = int(request.get("window", DEFAULT_NETWORK_SPACE_WINDOW))
+        start_height = int(request.get("start_height", 0))
+        series = self.service.network_space.get_series(window, start_height)
+        return {
+            "window": window,
+            "series": [
+                {
+                    "height": point.height,
+                    "header_hash": point.header_hash,
+                    "timestamp": point.timestamp,
+                    "space": point.space,
+                }
+                for point in series
+            ],
+        }
+
+    async def get_compaction_progress(self, request: Dict) -> Optional[Dict]:
+        """
+        Retrieves the size of the bluebox work queue, and the compact proofs received from our blueboxes.
+        """
+        return {"progress": await self.service.get_compaction_progress()}
+
     async def get_coin_records_by_puzzle_hash(self, request: Dict) -> Optional[Dict]:
         """
         Retrieves the coins for a given puzzlehash, by default returns unspent coins.
@@ -402,6 +438,10 @@ class FullNodeRpcApi:
         if "include_spent_coins" in request:
             kwargs["include_spent_coins"] = request["include_spent_coins"]
 
+        if request.get("stream", False) or "cursor" in request or "limit" in request:
+            kwargs["puzzle_hashes"] = [kwargs.pop("puzzle_hash")]
+            return await self._coin_records_by_puzzle_hashes_paginated(request, kwargs)
+
         coin_records = await self.service.blockchain.coin_store.get_coin_records_by_puzzle_hash(**kwargs)
 
         return {"coin_records": coin_records}
@@ -424,10 +464,35 @@ class FullNodeRpcApi:
         if "include_spent_coins" in request:
             kwargs["include_spent_coins"] = request["include_spent_coins"]
 
+        if request.get("stream", False) or "cursor" in request or "limit" in request:
+            return await self._coin_records_by_puzzle_hashes_paginated(request, kwargs)
+
         coin_records = await self.service.blockchain.coin_store.get_coin_records_by_puzzle_hashes(**kwargs)
 
         return {"coin_records": coin_records}
 
+    async def _coin_records_by_puzzle_hashes_paginated(self, request: Dict, kwargs: Dict[str, Any]) -> Dict:
+        """
+        Cursor based variant of the puzzle hash lookups, ordered by (confirmed_index, coin name). With "stream"
+        set, every matching record is written out incrementally instead of returning a single page.
+        """
+        coin_store = self.service.blockchain.coin_store
+        position = decode_cursor(request.get("cursor"))
+
+        async def fetch_page(after: Optional[PagePosition], limit: int) -> List[CoinRecord]:
+            return await coin_store.get_coin_records_by_puzzle_hashes_page(after=after, limit=limit, **kwargs)
+
+        if request.get("stream", False):
+            return {"coin_records": iterate_pages(fetch_page, _coin_record_page_position, position)}
+
+        limit = page_limit(request.get("limit", 50))
+        page = await fetch_page(position, limit)
+        return {
+            "coin_records": page,
+            # A short page is the last one
+            "next_cursor": encode_cursor(_coin_record_page_position(page[-1])) if len(page) == limit else None,
+        }
+
     async def get_coin_record_by_name(self, request: Dict) -> Optional[Dict]:
         """
         Retrieves a coin record by it's name.
@@ -75,6 +75,14 @@ class FullNodeRpcClient(RpcClient):
             return None
         return network_space_bytes_estimate["space"]
 
+    async def get_network_space_series(self, window: int = 4608, start_height: int = 0) -> List[Dict]:
+        response = await self.fetch("get_network_space_series", {"window": window, "start_height": start_height})
+        return response["series"]
+
+    async def get_compaction_progress(self) -> Dict:
+        response = await self.fetch("get_compaction_progress", {})
+        return response["progress"]
+
     async def get_coin_record_by_name(self, coin_id: bytes32) -> Optional[CoinRecord]:
         try:
             response = await self.fetch("get_coin_record_by_name", {"name": coin_id.hex()})
@@ -17,6 +17,7 @@ class HarvesterRpcApi:
             "/add_plot_directory": self.add_plot_directory,
             "/get_plot_directories": self.get_plot_directories,
             "/remove_plot_directory": self.remove_plot_directory,
+            "/get_lookup_stats": self.get_lookup_stats,
         }
 
     async def _state_changed(self, change: str) -> List[WsRpcMessage]:
@@ -59,3 +60,6 @@ class HarvesterRpcApi:
         if await self.service.remove_plot_directory(directory_name):
             return {}
         raise ValueError(f"Did not remove plot directory {directory_name}")
+
+    async def get_lookup_stats(self, request: Dict) -> Dict:
+        return self.service.lookup_stats.to_json_dict()
@@ -1,6 +1,7 @@
 import asyncio
+import json
 from ssl import SSLContext
-from typing import Dict, List, Optional, Any
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 import aiohttp
 
@@ -49,6 +50,21 @@ class RpcClient:
                 raise ValueError(res_json)
             return res_json
 
+    async def fetch_stream(self, path, request_json) -> AsyncIterator[Dict]:
+        """
+        Requests a streamed (NDJSON) response, and yields the header followed by every record line as it arrives.
+        """
+        request_json = dict(request_json, stream=True)
+        async with self.session.post(self.url + path, json=request_json, ssl_context=self.ssl_context) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                if len(line.strip()) == 0:
+                    continue
+                res_json = json.loads(line)
+                if not res_json.get("success", True):
+                    raise ValueError(res_json)
+                yield res_json
+
     async def get_connections(self, node_type: Optional[NodeType] = None) -> List[Dict]:
         request = {}
         if node_type is not None:
@@ -58,6 +74,15 @@ class RpcClient:
             connection["node_id"] = hexstr_to_bytes(connection["node_id"])
         return response["connections"]
 
+    async def get_rate_limit_metrics(self, node_id: Optional[bytes32] = None) -> List[Dict]:
+        request = {}
+        if node_id is not None:
+            request["node_id"] = node_id.hex()
+        response = await self.fetch("get_rate_limit_metrics", request)
+        for metrics in response["rate_limit_metrics"]:
+            metrics["node_id"] = hexstr_to_bytes(metrics["node_id"])
+        return response["rate_limit_metrics"]
+
     async def open_connection(self, host: str, port: int) -> Dict:
         return await self.fetch("open_connection", {"host": host, "port": int(port)})
 
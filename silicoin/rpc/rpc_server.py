@@ -1,4 +1,5 @@
 import asyncio
+import inspect
 import json
 import logging
 import traceback
@@ -9,6 +10,7 @@ import aiohttp
 
 from silicoin.server.outbound_message import NodeType
 from silicoin.server.server import ssl_context_for_server
+from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.types.peer_info import PeerInfo
 from silicoin.util.byte_types import hexstr_to_bytes
 from silicoin.util.ints import uint16
@@ -17,6 +19,9 @@ from silicoin.util.ws_message import create_payload, create_payload_dict, format
 
 log = logging.getLogger(__name__)
 
+# Number of records that are buffered before being written to a streamed (NDJSON) response
+NDJSON_LINES_PER_WRITE = 100
+
 
 class RpcServer:
     """
@@ -77,7 +82,7 @@ class RpcServer:
         asyncio.create_task(self._state_changed(*args))
 
     def _wrap_http_handler(self, f) -> Callable:
-        async def inner(request) -> aiohttp.web.Response:
+        async def inner(request) -> aiohttp.web.StreamResponse:
             request_data = await request.json()
             try:
                 res_object = await f(request_data)
@@ -93,10 +98,46 @@ class RpcServer:
                 else:
                     res_object = {"success": False, "error": f"{e}"}
 
+            if any(inspect.isasyncgen(value) for value in res_object.values()):
+                return await self._stream_ndjson(request, res_object)
             return obj_to_response(res_object)
 
         return inner
 
+    async def _stream_ndjson(self, request, res_object: Dict) -> aiohttp.web.StreamResponse:
+        """
+        Writes a response whose records are produced lazily by the handler (as async generators) in
+        newline delimited JSON. The first line holds the remaining fields of the response, followed by one
+        line per record of the form {"<field>": record}. Records are serialized as they are produced, so the
+        full listing is never held in memory. If producing records fails, a last line with
+        {"success": false, "error": ...} is written.
+        """
+        streams = {key: value for key, value in res_object.items() if inspect.isasyncgen(value)}
+        header = {key: value for key, value in res_object.items() if key not in streams}
+
+        response = aiohttp.web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        await response.write((dict_to_json_str(header) + "\n").encode())
+        try:
+            for key, records in streams.items():
+                lines: List[str] = []
+                async for record in records:
+                    lines.append(dict_to_json_str({key: record}))
+                    if len(lines) >= NDJSON_LINES_PER_WRITE:
+                        await response.write(("\n".join(lines) + "\n").encode())
+                        lines = []
+                if len(lines) > 0:
+                    await response.write(("\n".join(lines) + "\n").encode())
+        except Exception as e:
+            tb = traceback.format_exc()
+            self.log.warning(f"Error while streaming response: {tb}")
+            await response.write((dict_to_json_str({"success": False, "error": f"{e}"}) + "\n").encode())
+        finally:
+            for records in streams.values():
+                await records.aclose()
+        await response.write_eof()
+        return response
+
     async def get_connections(self, request: Dict) -> Dict:
         request_node_type: Optional[NodeType] = None
         if "node_type" in request:
@@ -153,6 +194,34 @@ class RpcServer:
             ]
         return {"connections": con_info}
 
+    async def get_rate_limit_metrics(self, request: Dict) -> Dict:
+        """
+        Returns the inbound and outbound rate limiter consumption of every connection, or only of the connection
+        with the given node_id.
+        """
+        if self.rpc_api.service.server is None:
+            raise ValueError("Global connections is not set")
+        node_id: Optional[bytes32] = None
+        if request.get("node_id") is not None:
+            node_id = bytes32(hexstr_to_bytes(request["node_id"]))
+        metrics = []
+        for con in self.rpc_api.service.server.get_connections():
+            if node_id is not None and con.peer_node_id != node_id:
+                continue
+            metrics.append(
+                {
+                    "node_id": con.peer_node_id,
+                    "type": con.connection_type,
+                    "peer_host": con.peer_host,
+                    "peer_port": con.peer_port,
+                    "inbound": con.inbound_rate_limiter.get_metrics(),
+                    "outbound": con.outbound_rate_limiter.get_metrics(),
+                }
+            )
+        if node_id is not None and len(metrics) == 0:
+            raise ValueError(f"Connection with node_id {node_id.hex()} does not exist")
+        return {"rate_limit_metrics": metrics}
+
     async def open_connection(self, request: Dict):
         host = request["host"]
         port = request["port"]
@@ -218,6 +287,10 @@ class RpcServer:
 
             # Only respond if we return something from api call
             if response is not None:
+                # Websocket messages are sent in one piece, so lazily produced records are collected first
+                for key, value in response.items():
+                    if inspect.isasyncgen(value):
+                        response[key] = [record async for record in value]
                 log.debug(f"Rpc response -> {message['command']}")
                 # Set success to true automatically (unless it's already set)
                 if "success" not in response:
@@ -313,6 +386,10 @@ async def start_rpc_server(
             "/get_connections",
             rpc_server._wrap_http_handler(rpc_server.get_connections),
         ),
+        aiohttp.web.post(
+            "/get_rate_limit_metrics",
+            rpc_server._wrap_http_handler(rpc_server.get_rate_limit_metrics),
+        ),
         aiohttp.web.post(
             "/open_connection",
             rpc_server._wrap_http_handler(rpc_server.open_connection),
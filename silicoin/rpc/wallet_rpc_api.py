@@ -1,11 +1,10 @@
 import asyncio
 import logging
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Tuple, Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from blspy import PrivateKey, G1Element
 
-from silicoin.consensus.block_rewards import calculate_base_farmer_reward
 from silicoin.pools.pool_wallet import PoolWallet
 from silicoin.pools.pool_wallet_info import create_pool_state, FARMING_TO_POOL, PoolWalletInfo, PoolState
 from silicoin.protocols.protocol_message_types import ProtocolMessageTypes
@@ -17,6 +16,7 @@ from silicoin.util.bech32m import decode_puzzle_hash, encode_puzzle_hash
 from silicoin.util.byte_types import hexstr_to_bytes
 from silicoin.util.ints import uint32, uint64
 from silicoin.util.keychain import KeyringIsLocked, bytes_to_mnemonic, generate_mnemonic
+from silicoin.util.pagination import PagePosition, decode_cursor, encode_cursor, iterate_pages, page_limit
 from silicoin.util.path import path_from_root
 from silicoin.util.ws_message import WsRpcMessage, create_payload_dict
 from silicoin.wallet.cc_wallet.cat_constants import DEFAULT_CATS
@@ -43,6 +43,10 @@ TIMEOUT = 30
 log = logging.getLogger(__name__)
 
 
+def _tx_page_position(tr: TransactionRecord) -> PagePosition:
+    return tr.confirmed_at_height, tr.name
+
+
 class WalletRpcApi:
     def __init__(self, wallet_node: WalletNode):
         assert wallet_node is not None
@@ -584,14 +588,22 @@ class WalletRpcApi:
                 }
         else:
             async with self.service.wallet_state_manager.lock:
-                unspent_records = await self.service.wallet_state_manager.coin_store.get_unspent_coins_for_wallet(
-                    wallet_id
-                )
-                balance = await wallet.get_confirmed_balance(unspent_records)
-                pending_balance = await wallet.get_unconfirmed_balance(unspent_records)
-                spendable_balance = await wallet.get_spendable_balance(unspent_records)
-                pending_change = await wallet.get_pending_change_balance()
-                max_send_amount = await wallet.get_max_send_amount(unspent_records)
+                coin_store = self.service.wallet_state_manager.coin_store
+                if wallet.type() == WalletType.STANDARD_WALLET:
+                    # The standard wallet balances come from the running totals of the coin store,
+                    # only the max send amount needs to look at the individual coins
+                    balance = await wallet.get_confirmed_balance()
+                    pending_balance = await wallet.get_unconfirmed_balance()
+                    spendable_balance = await wallet.get_spendable_balance()
+                    pending_change = await wallet.get_pending_change_balance()
+                    max_send_amount = await wallet.get_max_send_amount()
+                else:
+                    unspent_records = await coin_store.get_unspent_coins_for_wallet(wallet_id)
+                    balance = await wallet.get_confirmed_balance(unspent_records)
+                    pending_balance = await wallet.get_unconfirmed_balance(unspent_records)
+                    spendable_balance = await wallet.get_spendable_balance(unspent_records)
+                    pending_change = await wallet.get_pending_change_balance()
+                    max_send_amount = await wallet.get_max_send_amount(unspent_records)
 
                 unconfirmed_removals: Dict[
                     bytes32, Coin
@@ -603,7 +615,7 @@ class WalletRpcApi:
                     "spendable_balance": spendable_balance,
                     "pending_change": pending_change,
                     "max_send_amount": max_send_amount,
-                    "unspent_coin_count": len(unspent_records),
+                    "unspent_coin_count": coin_store.get_unspent_coin_count_for_wallet(wallet_id),
                     "pending_coin_removal_count": len(unconfirmed_removals),
                 }
                 self.balance_cache[wallet_id] = wallet_balance
@@ -626,6 +638,28 @@ class WalletRpcApi:
         assert self.service.wallet_state_manager is not None
 
         wallet_id = int(request["wallet_id"])
+        tx_store = self.service.wallet_state_manager.tx_store
+
+        if request.get("stream", False) or "cursor" in request or "limit" in request:
+            # Cursor based pagination, ordered by (confirmed_at_height, transaction_id)
+            position = decode_cursor(request.get("cursor"))
+
+            async def fetch_page(after: Optional[PagePosition], limit: int) -> List[TransactionRecord]:
+                return await tx_store.get_transactions_page(wallet_id, after, limit)
+
+            if request.get("stream", False):
+                return {
+                    "transactions": self._stream_transactions(fetch_page, position),
+                    "wallet_id": wallet_id,
+                }
+            limit = page_limit(request.get("limit", 50))
+            page = await fetch_page(position, limit)
+            return {
+                "transactions": [tr.to_json_dict_convenience(self.service.config) for tr in page],
+                "wallet_id": wallet_id,
+                # A short page is the last one
+                "next_cursor": encode_cursor(_tx_page_position(page[-1])) if len(page) == limit else None,
+            }
 
         start = request.get("start", 0)
         end = request.get("end", 50)
@@ -640,6 +674,14 @@ class WalletRpcApi:
             "wallet_id": wallet_id,
         }
 
+    async def _stream_transactions(
+        self,
+        fetch_page: Callable[[Optional[PagePosition], int], Awaitable[List[TransactionRecord]]],
+        start: Optional[PagePosition],
+    ) -> AsyncIterator[Dict]:
+        async for tr in iterate_pages(fetch_page, _tx_page_position, start):
+            yield tr.to_json_dict_convenience(self.service.config)
+
     async def get_transaction_count(self, request: Dict) -> Dict:
         assert self.service.wallet_state_manager is not None
 
@@ -1111,27 +1153,28 @@ class WalletRpcApi:
         return {"status": "SUCCESS"}
 
     async def get_farmed_amount(self, request):
-        tx_records: List[TransactionRecord] = await self.service.wallet_state_manager.tx_store.get_farming_rewards()
+        wallets = self.service.wallet_state_manager.wallets
         amount = 0
         pool_reward_amount = 0
         farmer_reward_amount = 0
         fee_amount = 0
         last_height_farmed = 0
-        for record in tx_records:
-            if record.wallet_id not in self.service.wallet_state_manager.wallets:
+        # The totals are kept up to date by the transaction store, so this does not depend on the number of rewards
+        reward_totals = self.service.wallet_state_manager.tx_store.get_farming_reward_totals()
+        for (wallet_id, tx_type), totals in reward_totals.items():
+            if wallet_id not in wallets:
                 continue
-            if record.type == TransactionType.COINBASE_REWARD:
-                if self.service.wallet_state_manager.wallets[record.wallet_id].type() == WalletType.POOLING_WALLET:
+            if tx_type == TransactionType.COINBASE_REWARD:
+                if wallets[wallet_id].type() == WalletType.POOLING_WALLET:
                     # Don't add pool rewards for pool wallets.
                     continue
-                pool_reward_amount += record.amount
-            height = record.height_farmed(self.service.constants.GENESIS_CHALLENGE)
-            if record.type == TransactionType.FEE_REWARD:
-                fee_amount += record.amount - calculate_base_farmer_reward(height)
-                farmer_reward_amount += calculate_base_farmer_reward(height)
-            if height > last_height_farmed:
-                last_height_farmed = height
-            amount += record.amount
+                pool_reward_amount += totals.amount
+            if tx_type == TransactionType.FEE_REWARD:
+                fee_amount += totals.amount - totals.base_farmer_reward
+                farmer_reward_amount += totals.base_farmer_reward
+            if totals.last_height_farmed > last_height_farmed:
+                last_height_farmed = totals.last_height_farmed
+            amount += totals.amount
 
         assert amount == pool_reward_amount + farmer_reward_amount + fee_amount
         return {
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from silicoin.pools.pool_wallet_info import PoolWalletInfo
 from silicoin.rpc.rpc_client import RpcClient
@@ -130,6 +130,22 @@ class WalletRpcClient(RpcClient):
         )
         return [TransactionRecord.from_json_dict_convenience(tx) for tx in res["transactions"]]
 
+    async def get_transactions_page(
+        self, wallet_id: str, cursor: Optional[str] = None, limit: int = 50
+    ) -> Tuple[List[TransactionRecord], Optional[str]]:
+        """
+        Returns a page of transactions and the cursor of the next page (None when there are no more).
+        """
+        request: Dict[str, Any] = {"wallet_id": wallet_id, "cursor": cursor, "limit": limit}
+        res = await self.fetch("get_transactions", request)
+        txs = [TransactionRecord.from_json_dict_convenience(tx) for tx in res["transactions"]]
+        return txs, res["next_cursor"]
+
+    async def iterate_transactions(self, wallet_id: str) -> AsyncIterator[TransactionRecord]:
+        async for line in self.fetch_stream("get_transactions", {"wallet_id": wallet_id}):
+            if "transactions" in line:
+                yield TransactionRecord.from_json_dict_convenience(line["transactions"])
+
     async def get_transaction_count(
         self,
         wallet_id: str,
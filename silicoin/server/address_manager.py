@@ -1,10 +1,11 @@
 import logging
 import math
 import time
+from array import array
 from asyncio import Lock
 from random import choice, randrange
 from secrets import randbits
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from silicoin.types.peer_info import PeerInfo, TimestampedPeerInfo
 from silicoin.util.hash import std_hash
@@ -156,22 +157,74 @@ class ExtendedPeerInfo:
         return chance
 
 
+class BucketTable:
+    """
+    The node ids in the buckets of the new or the tried table, BUCKET_SIZE positions per bucket, -1 for an empty
+    position. The ids are kept in a flat array instead of a list of lists, together with the list of used positions,
+    so a random entry can be picked without scanning or sampling the table. Changed positions are kept in dirty until
+    the table is saved.
+    """
+
+    def __init__(self, bucket_count: int):
+        size = bucket_count * BUCKET_SIZE
+        self.node_ids = array("q", [-1]) * size
+        # The used positions, and for each position its index in used or -1
+        self.used = array("q")
+        self.used_index = array("q", [-1]) * size
+        self.dirty: Set[int] = set()
+
+    def get(self, bucket: int, pos: int) -> int:
+        return self.node_ids[bucket * BUCKET_SIZE + pos]
+
+    def set(self, bucket: int, pos: int, node_id: int) -> None:
+        position = bucket * BUCKET_SIZE + pos
+        if self.node_ids[position] == node_id:
+            return None
+        self.node_ids[position] = node_id
+        self.dirty.add(position)
+        index = self.used_index[position]
+        if node_id == -1 and index != -1:
+            # Move the last used position to the freed index
+            last = self.used.pop()
+            if last != position:
+                self.used[index] = last
+                self.used_index[last] = index
+            self.used_index[position] = -1
+        elif node_id != -1 and index == -1:
+            self.used_index[position] = len(self.used)
+            self.used.append(position)
+
+    def random_position(self) -> Tuple[int, int]:
+        return divmod(self.used[randrange(len(self.used))], BUCKET_SIZE)
+
+    def positions(self) -> Iterator[Tuple[int, int, int]]:
+        """
+        The bucket, position and node id of the used positions, in no particular order.
+        """
+        for position in list(self.used):
+            bucket, pos = divmod(position, BUCKET_SIZE)
+            yield bucket, pos, self.node_ids[position]
+
+    def __len__(self) -> int:
+        return len(self.used)
+
+
 # This is a Python port from 'CAddrMan' class from Bitcoin core code.
 class AddressManager:
     id_count: int
     key: int
     random_pos: List[int]
-    tried_matrix: List[List[int]]
-    new_matrix: List[List[int]]
+    tried_matrix: BucketTable
+    new_matrix: BucketTable
     tried_count: int
     new_count: int
     map_addr: Dict[str, int]
     map_info: Dict[int, ExtendedPeerInfo]
     last_good: int
     tried_collisions: List[int]
-    used_new_matrix_positions: Set[Tuple[int, int]]
-    used_tried_matrix_positions: Set[Tuple[int, int]]
     allow_private_subnets: bool
+    # Node ids whose stored information changed since the last save
+    dirty_nodes: Set[int]
 
     def __init__(self) -> None:
         self.clear()
@@ -181,52 +234,27 @@ class AddressManager:
         self.id_count = 0
         self.key = randbits(256)
         self.random_pos = []
-        self.tried_matrix = [[-1 for x in range(BUCKET_SIZE)] for y in range(TRIED_BUCKET_COUNT)]
-        self.new_matrix = [[-1 for x in range(BUCKET_SIZE)] for y in range(NEW_BUCKET_COUNT)]
+        self.tried_matrix = BucketTable(TRIED_BUCKET_COUNT)
+        self.new_matrix = BucketTable(NEW_BUCKET_COUNT)
         self.tried_count = 0
         self.new_count = 0
         self.map_addr = {}
         self.map_info = {}
         self.last_good = 1
         self.tried_collisions = []
-        self.used_new_matrix_positions = set()
-        self.used_tried_matrix_positions = set()
         self.allow_private_subnets = False
+        self.dirty_nodes = set()
 
     def make_private_subnets_valid(self) -> None:
         self.allow_private_subnets = True
 
-    # Use only this method for modifying new matrix.
-    def _set_new_matrix(self, row: int, col: int, value: int) -> None:
-        self.new_matrix[row][col] = value
-        if value == -1:
-            if (row, col) in self.used_new_matrix_positions:
-                self.used_new_matrix_positions.remove((row, col))
-        else:
-            if (row, col) not in self.used_new_matrix_positions:
-                self.used_new_matrix_positions.add((row, col))
-
-    # Use only this method for modifying tried matrix.
-    def _set_tried_matrix(self, row: int, col: int, value: int) -> None:
-        self.tried_matrix[row][col] = value
-        if value == -1:
-            if (row, col) in self.used_tried_matrix_positions:
-                self.used_tried_matrix_positions.remove((row, col))
-        else:
-            if (row, col) not in self.used_tried_matrix_positions:
-                self.used_tried_matrix_positions.add((row, col))
-
-    def load_used_table_positions(self) -> None:
-        self.used_new_matrix_positions = set()
-        self.used_tried_matrix_positions = set()
-        for bucket in range(NEW_BUCKET_COUNT):
-            for pos in range(BUCKET_SIZE):
-                if self.new_matrix[bucket][pos] != -1:
-                    self.used_new_matrix_positions.add((bucket, pos))
-        for bucket in range(TRIED_BUCKET_COUNT):
-            for pos in range(BUCKET_SIZE):
-                if self.tried_matrix[bucket][pos] != -1:
-                    self.used_tried_matrix_positions.add((bucket, pos))
+    def mark_clean(self) -> None:
+        """
+        Called once all the changes are saved.
+        """
+        self.dirty_nodes = set()
+        self.new_matrix.dirty = set()
+        self.tried_matrix.dirty = set()
 
     def create_(self, addr: TimestampedPeerInfo, addr_src: Optional[PeerInfo]) -> Tuple[ExtendedPeerInfo, int]:
         self.id_count += 1
@@ -235,6 +263,7 @@ class AddressManager:
         self.map_addr[addr.host] = node_id
         self.map_info[node_id].random_pos = len(self.random_pos)
         self.random_pos.append(node_id)
+        self.dirty_nodes.add(node_id)
         return (self.map_info[node_id], node_id)
 
     def find_(self, addr: PeerInfo) -> Tuple[Optional[ExtendedPeerInfo], Optional[int]]:
@@ -259,39 +288,39 @@ class AddressManager:
     def make_tried_(self, info: ExtendedPeerInfo, node_id: int) -> None:
         for bucket in range(NEW_BUCKET_COUNT):
             pos = info.get_bucket_position(self.key, True, bucket)
-            if self.new_matrix[bucket][pos] == node_id:
-                self._set_new_matrix(bucket, pos, -1)
+            if self.new_matrix.get(bucket, pos) == node_id:
+                self.new_matrix.set(bucket, pos, -1)
                 info.ref_count -= 1
         assert info.ref_count == 0
         self.new_count -= 1
         cur_bucket = info.get_tried_bucket(self.key)
         cur_bucket_pos = info.get_bucket_position(self.key, False, cur_bucket)
-        if self.tried_matrix[cur_bucket][cur_bucket_pos] != -1:
+        if self.tried_matrix.get(cur_bucket, cur_bucket_pos) != -1:
             # Evict the old node from the tried table.
-            node_id_evict = self.tried_matrix[cur_bucket][cur_bucket_pos]
+            node_id_evict = self.tried_matrix.get(cur_bucket, cur_bucket_pos)
             assert node_id_evict in self.map_info
             old_info = self.map_info[node_id_evict]
             old_info.is_tried = False
-            self._set_tried_matrix(cur_bucket, cur_bucket_pos, -1)
+            self.tried_matrix.set(cur_bucket, cur_bucket_pos, -1)
             self.tried_count -= 1
             # Find its position into new table.
             new_bucket = old_info.get_new_bucket(self.key)
             new_bucket_pos = old_info.get_bucket_position(self.key, True, new_bucket)
             self.clear_new_(new_bucket, new_bucket_pos)
             old_info.ref_count = 1
-            self._set_new_matrix(new_bucket, new_bucket_pos, node_id_evict)
+            self.new_matrix.set(new_bucket, new_bucket_pos, node_id_evict)
             self.new_count += 1
-        self._set_tried_matrix(cur_bucket, cur_bucket_pos, node_id)
+        self.tried_matrix.set(cur_bucket, cur_bucket_pos, node_id)
         self.tried_count += 1
         info.is_tried = True
 
     def clear_new_(self, bucket: int, pos: int) -> None:
-        if self.new_matrix[bucket][pos] != -1:
-            delete_id = self.new_matrix[bucket][pos]
+        if self.new_matrix.get(bucket, pos) != -1:
+            delete_id = self.new_matrix.get(bucket, pos)
             delete_info = self.map_info[delete_id]
             assert delete_info.ref_count > 0
             delete_info.ref_count -= 1
-            self._set_new_matrix(bucket, pos, -1)
+            self.new_matrix.set(bucket, pos, -1)
             if delete_info.ref_count == 0:
                 self.delete_new_entry_(delete_id)
 
@@ -325,7 +354,7 @@ class AddressManager:
         for n in range(NEW_BUCKET_COUNT):
             cur_new_bucket = (n + bucket_rand) % NEW_BUCKET_COUNT
             cur_new_bucket_pos = info.get_bucket_position(self.key, True, cur_new_bucket)
-            if self.new_matrix[cur_new_bucket][cur_new_bucket_pos] == node_id:
+            if self.new_matrix.get(cur_new_bucket, cur_new_bucket_pos) == node_id:
                 new_bucket = cur_new_bucket
                 break
 
@@ -340,7 +369,7 @@ class AddressManager:
         tried_bucket_pos = info.get_bucket_position(self.key, False, tried_bucket)
 
         # Will moving this address into tried evict another entry?
-        if test_before_evict and self.tried_matrix[tried_bucket][tried_bucket_pos] != -1:
+        if test_before_evict and self.tried_matrix.get(tried_bucket, tried_bucket_pos) != -1:
             if len(self.tried_collisions) < TRIED_COLLISION_SIZE:
                 if node_id not in self.tried_collisions:
                     self.tried_collisions.append(node_id)
@@ -355,6 +384,7 @@ class AddressManager:
         self.random_pos = self.random_pos[:-1]
         del self.map_addr[info.peer_info.host]
         del self.map_info[node_id]
+        self.dirty_nodes.add(node_id)
         self.new_count -= 1
 
     def add_to_new_table_(self, addr: TimestampedPeerInfo, source: Optional[PeerInfo], penalty: int) -> bool:
@@ -377,6 +407,8 @@ class AddressManager:
                 info.timestamp > 0 or info.timestamp < addr.timestamp - update_interval - penalty
             ):
                 info.timestamp = max(0, addr.timestamp - penalty)
+                if node_id is not None:
+                    self.dirty_nodes.add(node_id)
 
             # do not update if no new information is present
             if addr.timestamp == 0 or (info.timestamp > 0 and addr.timestamp <= info.timestamp):
@@ -402,17 +434,17 @@ class AddressManager:
 
         new_bucket = info.get_new_bucket(self.key, source)
         new_bucket_pos = info.get_bucket_position(self.key, True, new_bucket)
-        if self.new_matrix[new_bucket][new_bucket_pos] != node_id:
-            add_to_new = self.new_matrix[new_bucket][new_bucket_pos] == -1
+        if self.new_matrix.get(new_bucket, new_bucket_pos) != node_id:
+            add_to_new = self.new_matrix.get(new_bucket, new_bucket_pos) == -1
             if not add_to_new:
-                info_existing = self.map_info[self.new_matrix[new_bucket][new_bucket_pos]]
+                info_existing = self.map_info[self.new_matrix.get(new_bucket, new_bucket_pos)]
                 if info_existing.is_terrible() or (info_existing.ref_count > 1 and info.ref_count == 0):
                     add_to_new = True
             if add_to_new:
                 self.clear_new_(new_bucket, new_bucket_pos)
                 info.ref_count += 1
                 if node_id is not None:
-                    self._set_new_matrix(new_bucket, new_bucket_pos, node_id)
+                    self.new_matrix.set(new_bucket, new_bucket_pos, node_id)
             else:
                 if info.ref_count == 0:
                     if node_id is not None:
@@ -441,62 +473,28 @@ class AddressManager:
 
         # Use a 50% chance for choosing between tried and new table entries.
         if not new_only and self.tried_count > 0 and (self.new_count == 0 or randrange(2) == 0):
-            chance = 1.0
-            start = time.time()
-            cached_tried_matrix_positions: List[Tuple[int, int]] = []
-            if len(self.used_tried_matrix_positions) < math.sqrt(TRIED_BUCKET_COUNT * BUCKET_SIZE):
-                cached_tried_matrix_positions = list(self.used_tried_matrix_positions)
-            while True:
-                if len(self.used_tried_matrix_positions) < math.sqrt(TRIED_BUCKET_COUNT * BUCKET_SIZE):
-                    if len(self.used_tried_matrix_positions) == 0:
-                        log.error(f"Empty tried table, but tried_count shows {self.tried_count}.")
-                        return None
-                    # The table is sparse, randomly pick from positions list.
-                    index = randrange(len(cached_tried_matrix_positions))
-                    tried_bucket, tried_bucket_pos = cached_tried_matrix_positions[index]
-                else:
-                    # The table is dense, randomly trying positions is faster than loading positions list.
-                    tried_bucket = randrange(TRIED_BUCKET_COUNT)
-                    tried_bucket_pos = randrange(BUCKET_SIZE)
-                    while self.tried_matrix[tried_bucket][tried_bucket_pos] == -1:
-                        tried_bucket = (tried_bucket + randbits(LOG_TRIED_BUCKET_COUNT)) % TRIED_BUCKET_COUNT
-                        tried_bucket_pos = (tried_bucket_pos + randbits(LOG_BUCKET_SIZE)) % BUCKET_SIZE
-
-                node_id = self.tried_matrix[tried_bucket][tried_bucket_pos]
-                assert node_id != -1
-                info = self.map_info[node_id]
-                if randbits(30) < (chance * info.get_selection_chance() * (1 << 30)):
-                    end = time.time()
-                    log.debug(f"address_manager.select_peer took {(end - start):.2e} seconds in tried table.")
-                    return info
-                chance *= 1.2
+            table = self.tried_matrix
+            table_name = "tried"
         else:
-            chance = 1.0
-            start = time.time()
-            cached_new_matrix_positions: List[Tuple[int, int]] = []
-            if len(self.used_new_matrix_positions) < math.sqrt(NEW_BUCKET_COUNT * BUCKET_SIZE):
-                cached_new_matrix_positions = list(self.used_new_matrix_positions)
-            while True:
-                if len(self.used_new_matrix_positions) < math.sqrt(NEW_BUCKET_COUNT * BUCKET_SIZE):
-                    if len(self.used_new_matrix_positions) == 0:
-                        log.error(f"Empty new table, but new_count shows {self.new_count}.")
-                        return None
-                    index = randrange(len(cached_new_matrix_positions))
-                    new_bucket, new_bucket_pos = cached_new_matrix_positions[index]
-                else:
-                    new_bucket = randrange(NEW_BUCKET_COUNT)
-                    new_bucket_pos = randrange(BUCKET_SIZE)
-                    while self.new_matrix[new_bucket][new_bucket_pos] == -1:
-                        new_bucket = (new_bucket + randbits(LOG_NEW_BUCKET_COUNT)) % NEW_BUCKET_COUNT
-                        new_bucket_pos = (new_bucket_pos + randbits(LOG_BUCKET_SIZE)) % BUCKET_SIZE
-                node_id = self.new_matrix[new_bucket][new_bucket_pos]
-                assert node_id != -1
-                info = self.map_info[node_id]
-                if randbits(30) < chance * info.get_selection_chance() * (1 << 30):
-                    end = time.time()
-                    log.debug(f"address_manager.select_peer took {(end - start):.2e} seconds in new table.")
-                    return info
-                chance *= 1.2
+            table = self.new_matrix
+            table_name = "new"
+        if len(table) == 0:
+            count = self.tried_count if table is self.tried_matrix else self.new_count
+            log.error(f"Empty {table_name} table, but {table_name}_count shows {count}.")
+            return None
+        chance = 1.0
+        start = time.time()
+        while True:
+            # Pick from the used positions only, the tables are mostly empty or mostly full
+            bucket, bucket_pos = table.random_position()
+            node_id = table.get(bucket, bucket_pos)
+            assert node_id != -1
+            info = self.map_info[node_id]
+            if randbits(30) < chance * info.get_selection_chance() * (1 << 30):
+                end = time.time()
+                log.debug(f"address_manager.select_peer took {(end - start):.2e} seconds in {table_name} table.")
+                return info
+            chance *= 1.2
 
     def resolve_tried_collisions_(self) -> None:
         for node_id in self.tried_collisions[:]:
@@ -508,8 +506,8 @@ class AddressManager:
                 peer = info.peer_info
                 tried_bucket = info.get_tried_bucket(self.key)
                 tried_bucket_pos = info.get_bucket_position(self.key, False, tried_bucket)
-                if self.tried_matrix[tried_bucket][tried_bucket_pos] != -1:
-                    old_id = self.tried_matrix[tried_bucket][tried_bucket_pos]
+                if self.tried_matrix.get(tried_bucket, tried_bucket_pos) != -1:
+                    old_id = self.tried_matrix.get(tried_bucket, tried_bucket_pos)
                     old_info = self.map_info[old_id]
                     if time.time() - old_info.last_success < 4 * 60 * 60:
                         resolved = True
@@ -537,7 +535,7 @@ class AddressManager:
         tried_bucket = new_info.get_tried_bucket(self.key)
         tried_bucket_pos = new_info.get_bucket_position(self.key, False, tried_bucket)
 
-        old_id = self.tried_matrix[tried_bucket][tried_bucket_pos]
+        old_id = self.tried_matrix.get(tried_bucket, tried_bucket_pos)
         return self.map_info[old_id]
 
     def get_peers_(self) -> List[TimestampedPeerInfo]:
@@ -566,16 +564,13 @@ class AddressManager:
 
     def cleanup(self, max_timestamp_difference: int, max_consecutive_failures: int):
         now = int(math.floor(time.time()))
-        for bucket in range(NEW_BUCKET_COUNT):
-            for pos in range(BUCKET_SIZE):
-                if self.new_matrix[bucket][pos] != -1:
-                    node_id = self.new_matrix[bucket][pos]
-                    cur_info = self.map_info[node_id]
-                    if (
-                        cur_info.timestamp < now - max_timestamp_difference
-                        and cur_info.num_attempts >= max_consecutive_failures
-                    ):
-                        self.clear_new_(bucket, pos)
+        for bucket, pos, node_id in self.new_matrix.positions():
+            cur_info = self.map_info[node_id]
+            if (
+                cur_info.timestamp < now - max_timestamp_difference
+                and cur_info.num_attempts >= max_consecutive_failures
+            ):
+                self.clear_new_(bucket, pos)
 
     def connect_(self, addr: PeerInfo, timestamp: int):
         info, _ = self.find_(addr)
@@ -589,6 +584,8 @@ class AddressManager:
         update_interval = 20 * 60
         if timestamp - info.timestamp > update_interval:
             info.timestamp = timestamp
+            node_id = self.map_addr[addr.host]
+            self.dirty_nodes.add(node_id)
 
     async def size(self) -> int:
         async with self.lock:
@@ -1,34 +1,42 @@
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 import aiosqlite
 
 from silicoin.server.address_manager import (
     BUCKET_SIZE,
-    NEW_BUCKET_COUNT,
     NEW_BUCKETS_PER_ADDRESS,
     AddressManager,
+    BucketTable,
     ExtendedPeerInfo,
 )
 
 log = logging.getLogger(__name__)
 
+# Written to the metadata, databases without it store the buckets of the new table instead of the positions
+STORE_VERSION = "2"
+
 
 class AddressManagerStore:
     """
     Metadata table:
     - private key
+    - format version
     - new table count
     - tried table count
     Nodes table:
-    * Maps entries from new/tried table to unique node ids.
+    * Maps the node ids of the address manager to their entries.
     - node_id
     - IP, port, together with the IP, port of the source peer.
-    New table:
-    * Stores node_id, bucket for each occurrence in the new table of an entry.
-    * Once we know the buckets, we can also deduce the bucket positions.
-    Every other information, such as tried_matrix, map_addr, map_info, random_pos,
+    New and tried position tables:
+    * Stores the node_id at each used position of the new and the tried table, a position is
+      bucket * BUCKET_SIZE + bucket position.
+    Every other information, such as map_addr, map_info, random_pos, ref counts,
     be deduced and it is not explicitly stored, instead it is recalculated.
+
+    Only the nodes and positions that changed since the last save are written, see AddressManager.dirty_nodes and
+    BucketTable.dirty. Databases written by earlier versions, which stored the buckets of the new table entries
+    instead of their positions, are read once and then rewritten.
     """
 
     db: aiosqlite.Connection
@@ -42,21 +50,29 @@ class AddressManagerStore:
         await self.db.commit()
 
         await self.db.execute("CREATE TABLE IF NOT EXISTS peer_nodes(node_id int,value text)")
+        await self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS peer_node_id on peer_nodes(node_id)")
         await self.db.commit()
 
+        # Only read from databases of the previous format
         await self.db.execute("CREATE TABLE IF NOT EXISTS peer_new_table(node_id int,bucket int)")
         await self.db.commit()
+
+        await self.db.execute("CREATE TABLE IF NOT EXISTS peer_new_positions(position integer PRIMARY KEY,node_id int)")
+        await self.db.execute(
+            "CREATE TABLE IF NOT EXISTS peer_tried_positions(position integer PRIMARY KEY,node_id int)"
+        )
+        await self.db.commit()
         return self
 
     async def clear(self) -> None:
-        cursor = await self.db.execute("DELETE from peer_metadata")
-        await cursor.close()
-        cursor = await self.db.execute("DELETE from peer_nodes")
-        await cursor.close()
-        cursor = await self.db.execute("DELETE from peer_new_table")
-        await cursor.close()
+        await self._delete_all()
         await self.db.commit()
 
+    async def _delete_all(self) -> None:
+        for table in ["peer_metadata", "peer_nodes", "peer_new_table", "peer_new_positions", "peer_tried_positions"]:
+            cursor = await self.db.execute(f"DELETE from {table}")
+            await cursor.close()
+
     async def get_metadata(self) -> Dict[str, str]:
         cursor = await self.db.execute("SELECT key, value from peer_metadata")
         metadata = await cursor.fetchall()
@@ -85,74 +101,114 @@ class AddressManagerStore:
         await cursor.close()
         return [(node_id, bucket) for node_id, bucket in entries]
 
+    async def get_positions(self, tried: bool) -> List[Tuple[int, int]]:
+        table = "peer_tried_positions" if tried else "peer_new_positions"
+        cursor = await self.db.execute(f"SELECT position, node_id from {table}")
+        entries = await cursor.fetchall()
+        await cursor.close()
+        return [(position, node_id) for position, node_id in entries]
+
     async def set_metadata(self, metadata) -> None:
-        for key, value in metadata:
-            cursor = await self.db.execute(
-                "INSERT OR REPLACE INTO peer_metadata VALUES(?, ?)",
-                (key, value),
-            )
-            await cursor.close()
-        await self.db.commit()
+        cursor = await self.db.executemany("INSERT OR REPLACE INTO peer_metadata VALUES(?, ?)", metadata)
+        await cursor.close()
 
     async def set_nodes(self, node_list) -> None:
-        for node_id, peer_info in node_list:
-            cursor = await self.db.execute(
-                "INSERT OR REPLACE INTO peer_nodes VALUES(?, ?)",
-                (node_id, peer_info.to_string()),
-            )
-            await cursor.close()
-        await self.db.commit()
+        cursor = await self.db.executemany(
+            "INSERT OR REPLACE INTO peer_nodes VALUES(?, ?)",
+            [(node_id, peer_info.to_string()) for node_id, peer_info in node_list],
+        )
+        await cursor.close()
 
-    async def set_new_table(self, entries) -> None:
-        for node_id, bucket in entries:
-            cursor = await self.db.execute(
-                "INSERT OR REPLACE INTO peer_new_table VALUES(?, ?)",
-                (node_id, bucket),
-            )
-            await cursor.close()
-        await self.db.commit()
+    async def delete_nodes(self, node_ids: List[int]) -> None:
+        cursor = await self.db.executemany("DELETE FROM peer_nodes WHERE node_id=?", [(i,) for i in node_ids])
+        await cursor.close()
+
+    async def set_positions(self, tried: bool, table: BucketTable, positions: Iterable[int]) -> None:
+        name = "peer_tried_positions" if tried else "peer_new_positions"
+        used = [(position, table.node_ids[position]) for position in positions if table.node_ids[position] != -1]
+        unused = [(position,) for position in positions if table.node_ids[position] == -1]
+        cursor = await self.db.executemany(f"INSERT OR REPLACE INTO {name} VALUES(?, ?)", used)
+        await cursor.close()
+        cursor = await self.db.executemany(f"DELETE FROM {name} WHERE position=?", unused)
+        await cursor.close()
 
     async def serialize(self, address_manager: AddressManager):
-        metadata = []
-        nodes = []
-        new_table_entries = []
-        metadata.append(("key", str(address_manager.key)))
-
-        unique_ids = {}
-        count_ids = 0
-
-        for node_id, info in address_manager.map_info.items():
-            unique_ids[node_id] = count_ids
-            if info.ref_count > 0:
-                assert count_ids != address_manager.new_count
-                nodes.append((count_ids, info))
-                count_ids += 1
-        metadata.append(("new_count", str(count_ids)))
-
-        tried_ids = 0
-        for node_id, info in address_manager.map_info.items():
-            if info.is_tried:
-                assert info is not None
-                assert tried_ids != address_manager.tried_count
-                nodes.append((count_ids, info))
-                count_ids += 1
-                tried_ids += 1
-        metadata.append(("tried_count", str(tried_ids)))
-
-        for bucket in range(NEW_BUCKET_COUNT):
-            for i in range(BUCKET_SIZE):
-                if address_manager.new_matrix[bucket][i] != -1:
-                    index = unique_ids[address_manager.new_matrix[bucket][i]]
-                    new_table_entries.append((index, bucket))
-
-        await self.clear()
+        """
+        Saves the changes since the last save, or everything if the database holds another address manager.
+        """
+        stored_metadata = await self.get_metadata()
+        metadata = [
+            ("key", str(address_manager.key)),
+            ("version", STORE_VERSION),
+            ("new_count", str(address_manager.new_count)),
+            ("tried_count", str(address_manager.tried_count)),
+        ]
+        if stored_metadata.get("key") != str(address_manager.key) or stored_metadata.get("version") != STORE_VERSION:
+            await self._delete_all()
+            await self.set_nodes(list(address_manager.map_info.items()))
+            await self.set_positions(False, address_manager.new_matrix, list(address_manager.new_matrix.used))
+            await self.set_positions(True, address_manager.tried_matrix, list(address_manager.tried_matrix.used))
+        else:
+            dirty_nodes = address_manager.dirty_nodes
+            await self.set_nodes(
+                [
+                    (node_id, address_manager.map_info[node_id])
+                    for node_id in dirty_nodes
+                    if node_id in address_manager.map_info
+                ]
+            )
+            await self.delete_nodes([node_id for node_id in dirty_nodes if node_id not in address_manager.map_info])
+            await self.set_positions(False, address_manager.new_matrix, address_manager.new_matrix.dirty)
+            await self.set_positions(True, address_manager.tried_matrix, address_manager.tried_matrix.dirty)
         await self.set_metadata(metadata)
-        await self.set_nodes(nodes)
-        await self.set_new_table(new_table_entries)
+        await self.db.commit()
+        address_manager.mark_clean()
 
     async def deserialize(self) -> AddressManager:
-        address_manager = AddressManager()
         metadata = await self.get_metadata()
+        if metadata.get("version") != STORE_VERSION:
+            return await self.deserialize_buckets(metadata)
+
+        address_manager = AddressManager()
+        address_manager.clear()
+        address_manager.key = int(metadata["key"])
+        nodes: Dict[int, ExtendedPeerInfo] = dict(await self.get_nodes())
+        for tried, table in [(False, address_manager.new_matrix), (True, address_manager.tried_matrix)]:
+            orphans: List[int] = []
+            for position, node_id in await self.get_positions(tried):
+                info = nodes.get(node_id)
+                if info is None:
+                    orphans.append(position)
+                    continue
+                bucket, pos = divmod(position, BUCKET_SIZE)
+                table.set(bucket, pos, node_id)
+                if tried:
+                    info.is_tried = True
+                else:
+                    info.ref_count += 1
+            # Only the positions of nodes that are gone differ from the database, they are deleted by the next save
+            table.dirty = set(orphans)
+
+        for node_id, info in nodes.items():
+            address_manager.id_count = max(address_manager.id_count, node_id)
+            if not info.is_tried and info.ref_count == 0:
+                address_manager.dirty_nodes.add(node_id)
+                continue
+            address_manager.map_addr[info.peer_info.host] = node_id
+            address_manager.map_info[node_id] = info
+            info.random_pos = len(address_manager.random_pos)
+            address_manager.random_pos.append(node_id)
+            if info.is_tried:
+                address_manager.tried_count += 1
+            else:
+                address_manager.new_count += 1
+        return address_manager
+
+    async def deserialize_buckets(self, metadata: Dict[str, str]) -> AddressManager:
+        """
+        Reads a database of the previous format, which is rewritten by the next serialize.
+        """
+        address_manager = AddressManager()
         nodes = await self.get_nodes()
         new_table_entries = await self.get_new_table()
         address_manager.clear()
@@ -174,14 +230,14 @@ class AddressManagerStore:
         for node_id, info in tried_table_nodes:
             tried_bucket = info.get_tried_bucket(address_manager.key)
             tried_bucket_pos = info.get_bucket_position(address_manager.key, False, tried_bucket)
-            if address_manager.tried_matrix[tried_bucket][tried_bucket_pos] == -1:
+            if address_manager.tried_matrix.get(tried_bucket, tried_bucket_pos) == -1:
                 info.random_pos = len(address_manager.random_pos)
                 info.is_tried = True
                 id_count = address_manager.id_count
                 address_manager.random_pos.append(id_count)
                 address_manager.map_info[id_count] = info
                 address_manager.map_addr[info.peer_info.host] = id_count
-                address_manager.tried_matrix[tried_bucket][tried_bucket_pos] = id_count
+                address_manager.tried_matrix.set(tried_bucket, tried_bucket_pos, id_count)
                 address_manager.id_count += 1
                 address_manager.tried_count += 1
             # else:
@@ -192,12 +248,14 @@ class AddressManagerStore:
             if node_id >= 0 and node_id < address_manager.new_count:
                 info = address_manager.map_info[node_id]
                 bucket_pos = info.get_bucket_position(address_manager.key, True, bucket)
-                if address_manager.new_matrix[bucket][bucket_pos] == -1 and info.ref_count < NEW_BUCKETS_PER_ADDRESS:
+                if (
+                    address_manager.new_matrix.get(bucket, bucket_pos) == -1
+                    and info.ref_count < NEW_BUCKETS_PER_ADDRESS
+                ):
                     info.ref_count += 1
-                    address_manager.new_matrix[bucket][bucket_pos] = node_id
+                    address_manager.new_matrix.set(bucket, bucket_pos, node_id)
 
         for node_id, info in list(address_manager.map_info.items()):
             if not info.is_tried and info.ref_count == 0:
                 address_manager.delete_new_entry_(node_id)
-        address_manager.load_used_table_positions()
         return address_manager
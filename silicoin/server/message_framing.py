@@ -0,0 +1,73 @@
+import struct
+from typing import Optional
+
+from silicoin.server.outbound_message import Message
+from silicoin.util.ints import uint8, uint16
+
+# Wire layout of a Message, identical to its streamable serialization:
+# type (1 byte) | has_id (1 byte) | [id (2 bytes)] | data length (4 bytes) | data
+_HEADER_NO_ID = struct.Struct(">BBI")
+_HEADER_WITH_ID = struct.Struct(">BBHI")
+
+# Name of the attribute used to memoize the encoded frame on a Message instance
+_FRAME_ATTRIBUTE = "_encoded_frame"
+
+
+class FramingError(ValueError):
+    pass
+
+
+def encode_message(message: Message) -> bytes:
+    """
+    Returns the wire frame of a message. Messages are immutable, so the frame is memoized on the message
+    instance: broadcasting one message to many connections encodes it only once.
+    """
+    frame: Optional[bytes] = message.__dict__.get(_FRAME_ATTRIBUTE)
+    if frame is not None:
+        return frame
+    if message.id is None:
+        header = _HEADER_NO_ID.pack(message.type, 0, len(message.data))
+    else:
+        header = _HEADER_WITH_ID.pack(message.type, 1, message.id, len(message.data))
+    frame = header + message.data
+    object.__setattr__(message, _FRAME_ATTRIBUTE, frame)
+    return frame
+
+
+def decode_message(frame: bytes) -> Message:
+    """
+    Parses a wire frame into a Message. The header is read in place from a memoryview, and the payload is
+    sliced out of the frame once, without going through the generic streamable parser.
+    """
+    view = memoryview(frame)
+    if len(view) < 2:
+        raise FramingError(f"Message frame too short: {len(view)} bytes")
+    has_id = view[1]
+    if has_id == 0:
+        header_struct = _HEADER_NO_ID
+    elif has_id == 1:
+        header_struct = _HEADER_WITH_ID
+    else:
+        raise FramingError("Optional must be 0 or 1")
+    if len(view) < header_struct.size:
+        raise FramingError(f"Message frame too short: {len(view)} bytes")
+
+    if has_id == 0:
+        msg_type, _, data_length = header_struct.unpack_from(view)
+        msg_id: Optional[uint16] = None
+    else:
+        msg_type, _, raw_id, data_length = header_struct.unpack_from(view)
+        msg_id = uint16(raw_id)
+    if header_struct.size + data_length != len(view):
+        raise FramingError(
+            f"Message frame has {len(view) - header_struct.size} payload bytes, header specifies {data_length}"
+        )
+
+    # Skip the strictdataclass checks in __init__, every field was already validated by the parsing above
+    message: Message = object.__new__(Message)
+    object.__setattr__(message, "type", uint8(msg_type))
+    object.__setattr__(message, "id", msg_id)
+    object.__setattr__(message, "data", frame[header_struct.size :])
+    # The received frame is also the encoding of the message, in case it gets relayed
+    object.__setattr__(message, _FRAME_ATTRIBUTE, frame)
+    return message
@@ -1,8 +1,7 @@
 import dataclasses
 import logging
 import time
-from collections import Counter
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 from silicoin.protocols.protocol_message_types import ProtocolMessageTypes
 from silicoin.server.outbound_message import Message
@@ -97,6 +96,8 @@ rate_limits_other = {
     ProtocolMessageTypes.farm_new_block: RLSettings(200, 200),
     ProtocolMessageTypes.request_plots: RLSettings(10, 10 * 1024 * 1024),
     ProtocolMessageTypes.respond_plots: RLSettings(10, 100 * 1024 * 1024),
+    ProtocolMessageTypes.request_plots_delta: RLSettings(10, 100),
+    ProtocolMessageTypes.respond_plots_delta: RLSettings(10, 100 * 1024 * 1024),
     ProtocolMessageTypes.request_stakings: RLSettings(100, 2048),
     ProtocolMessageTypes.respond_stakings: RLSettings(100, 2048),
     ProtocolMessageTypes.coin_state_update: RLSettings(1000, 100 * 1024 * 1024),
@@ -111,97 +112,205 @@ rate_limits_other = {
 }
 
 
+# Number of possible values of Message.type, which is a uint8
+NUM_MESSAGE_TYPES = 256
+
+
+@dataclasses.dataclass(frozen=True)
+class TypeLimits:
+    frequency: int
+    max_size: int
+    max_total_size: int
+    counts_towards_non_tx: bool
+    # False for valid message types that have no entry in the tables above, they use DEFAULT_SETTINGS
+    listed: bool
+
+
+def _type_limits(message_type: ProtocolMessageTypes) -> TypeLimits:
+    counts_towards_non_tx = False
+    listed = True
+    if message_type in rate_limits_tx:
+        limits = rate_limits_tx[message_type]
+    elif message_type in rate_limits_other:
+        limits = rate_limits_other[message_type]
+        counts_towards_non_tx = True
+    else:
+        limits = DEFAULT_SETTINGS
+        listed = False
+    max_total_size = limits.max_total_size
+    if max_total_size is None:
+        max_total_size = limits.frequency * limits.max_size
+    return TypeLimits(limits.frequency, limits.max_size, max_total_size, counts_towards_non_tx, listed)
+
+
+# Limits of every message type, indexed by Message.type. None for values that are not a ProtocolMessageTypes.
+limits_by_type: List[Optional[TypeLimits]] = [None] * NUM_MESSAGE_TYPES
+for _message_type in ProtocolMessageTypes:
+    limits_by_type[_message_type.value] = _type_limits(_message_type)
+
+
 # TODO: only full node disconnects based on rate limits
 
 
 class RateLimiter:
+    """
+    Token bucket rate limiter. Every message type has one bucket for its message count and one for its
+    cumulative size, and the non-transaction types share an additional pair of aggregate buckets. A full
+    bucket holds the per-period limit (scaled by percentage_of_limit), and refills continuously at a rate
+    of one full bucket per reset_seconds, so unlike fixed windows, a peer can't send twice its limit
+    around a window boundary.
+
+    Buckets are refilled lazily when a message of that type is processed, and all state is kept in flat
+    lists indexed by message type, so processing a message is O(1) and doesn't allocate.
+    """
+
     incoming: bool
     reset_seconds: int
-    current_minute: int
-    message_counts: Counter
-    message_cumulative_sizes: Counter
     percentage_of_limit: int
-    non_tx_message_counts: int = 0
-    non_tx_cumulative_size: int = 0
+    # Bucket capacities and current levels, indexed by message type
+    count_capacity: List[float]
+    size_capacity: List[float]
+    count_tokens: List[float]
+    size_tokens: List[float]
+    last_refill: List[float]
+    non_tx_count_capacity: float
+    non_tx_size_capacity: float
+    non_tx_count_tokens: float
+    non_tx_size_tokens: float
+    non_tx_last_refill: float
+    # Consumption metrics, indexed by message type
+    message_counts: List[int]
+    message_cumulative_sizes: List[int]
+    rejected_counts: List[int]
 
     def __init__(self, incoming: bool, reset_seconds=60, percentage_of_limit=100):
         """
-        The incoming parameter affects whether counters are incremented
-        unconditionally or not. For incoming messages, the counters are always
-        incremeneted. For outgoing messages, the counters are only incremented
+        The incoming parameter affects whether buckets are drained
+        unconditionally or not. For incoming messages, the tokens are always
+        consumed. For outgoing messages, the tokens are only consumed
         if they are allowed to be sent by the rate limiter, since we won't send
         the messages otherwise.
         """
         self.incoming = incoming
         self.reset_seconds = reset_seconds
-        self.current_minute = time.time() // reset_seconds
-        self.message_counts = Counter()
-        self.message_cumulative_sizes = Counter()
         self.percentage_of_limit = percentage_of_limit
-        self.non_tx_message_counts = 0
-        self.non_tx_cumulative_size = 0
+        proportion_of_limit: float = percentage_of_limit / 100
+        now = time.monotonic()
+
+        self.count_capacity = [0.0] * NUM_MESSAGE_TYPES
+        self.size_capacity = [0.0] * NUM_MESSAGE_TYPES
+        for message_type, limits in enumerate(limits_by_type):
+            if limits is not None:
+                self.count_capacity[message_type] = limits.frequency * proportion_of_limit
+                self.size_capacity[message_type] = limits.max_total_size * proportion_of_limit
+        self.count_tokens = list(self.count_capacity)
+        self.size_tokens = list(self.size_capacity)
+        self.last_refill = [now] * NUM_MESSAGE_TYPES
+
+        self.non_tx_count_capacity = NON_TX_FREQ * proportion_of_limit
+        self.non_tx_size_capacity = NON_TX_MAX_TOTAL_SIZE * proportion_of_limit
+        self.non_tx_count_tokens = self.non_tx_count_capacity
+        self.non_tx_size_tokens = self.non_tx_size_capacity
+        self.non_tx_last_refill = now
+
+        self.message_counts = [0] * NUM_MESSAGE_TYPES
+        self.message_cumulative_sizes = [0] * NUM_MESSAGE_TYPES
+        self.rejected_counts = [0] * NUM_MESSAGE_TYPES
 
     def process_msg_and_check(self, message: Message) -> bool:
         """
         Returns True if message can be processed successfully, false if a rate limit is passed.
         """
 
-        current_minute = int(time.time() // self.reset_seconds)
-        if current_minute != self.current_minute:
-            self.current_minute = current_minute
-            self.message_counts = Counter()
-            self.message_cumulative_sizes = Counter()
-            self.non_tx_message_counts = 0
-            self.non_tx_cumulative_size = 0
-        try:
-            message_type = ProtocolMessageTypes(message.type)
-        except Exception as e:
-            log.warning(f"Invalid message: {message.type}, {e}")
+        message_type: int = message.type
+        limits: Optional[TypeLimits] = limits_by_type[message_type]
+        if limits is None:
+            log.warning(f"Invalid message: {message_type}")
             return True
+        if not limits.listed:
+            log.warning(f"Message type {ProtocolMessageTypes(message_type)} not found in rate limits")
 
-        new_message_counts: int = self.message_counts[message_type] + 1
-        new_cumulative_size: int = self.message_cumulative_sizes[message_type] + len(message.data)
-        new_non_tx_count: int = self.non_tx_message_counts
-        new_non_tx_size: int = self.non_tx_cumulative_size
-        proportion_of_limit: float = self.percentage_of_limit / 100
-
-        ret: bool = False
-        try:
-
-            limits = DEFAULT_SETTINGS
-            if message_type in rate_limits_tx:
-                limits = rate_limits_tx[message_type]
-            elif message_type in rate_limits_other:
-                limits = rate_limits_other[message_type]
-                new_non_tx_count = self.non_tx_message_counts + 1
-                new_non_tx_size = self.non_tx_cumulative_size + len(message.data)
-                if new_non_tx_count > NON_TX_FREQ * proportion_of_limit:
-                    return False
-                if new_non_tx_size > NON_TX_MAX_TOTAL_SIZE * proportion_of_limit:
-                    return False
-            else:
-                log.warning(f"Message type {message_type} not found in rate limits")
-
-            if limits.max_total_size is None:
-                limits = dataclasses.replace(limits, max_total_size=limits.frequency * limits.max_size)
-            assert limits.max_total_size is not None
-
-            if new_message_counts > limits.frequency * proportion_of_limit:
-                return False
-            if len(message.data) > limits.max_size:
-                return False
-            if new_cumulative_size > limits.max_total_size * proportion_of_limit:
-                return False
-
-            ret = True
-            return True
-        finally:
-            if self.incoming or ret:
-                # now that we determined that it's OK to send the message, commit the
-                # updates to the counters. Alternatively, if this was an
-                # incoming message, we already received it and it should
-                # increment the counters unconditionally
-                self.message_counts[message_type] = new_message_counts
-                self.message_cumulative_sizes[message_type] = new_cumulative_size
-                self.non_tx_message_counts = new_non_tx_count
-                self.non_tx_cumulative_size = new_non_tx_size
+        size: int = len(message.data)
+        now = time.monotonic()
+
+        elapsed_fraction = (now - self.last_refill[message_type]) / self.reset_seconds
+        self.last_refill[message_type] = now
+        count_tokens = min(
+            self.count_capacity[message_type],
+            self.count_tokens[message_type] + elapsed_fraction * self.count_capacity[message_type],
+        )
+        size_tokens = min(
+            self.size_capacity[message_type],
+            self.size_tokens[message_type] + elapsed_fraction * self.size_capacity[message_type],
+        )
+        allowed: bool = size <= limits.max_size and count_tokens >= 1 and size_tokens >= size
+
+        if limits.counts_towards_non_tx:
+            non_tx_elapsed_fraction = (now - self.non_tx_last_refill) / self.reset_seconds
+            self.non_tx_last_refill = now
+            non_tx_count_tokens = min(
+                self.non_tx_count_capacity,
+                self.non_tx_count_tokens + non_tx_elapsed_fraction * self.non_tx_count_capacity,
+            )
+            non_tx_size_tokens = min(
+                self.non_tx_size_capacity,
+                self.non_tx_size_tokens + non_tx_elapsed_fraction * self.non_tx_size_capacity,
+            )
+            allowed = allowed and non_tx_count_tokens >= 1 and non_tx_size_tokens >= size
+            if self.incoming or allowed:
+                non_tx_count_tokens = max(0.0, non_tx_count_tokens - 1)
+                non_tx_size_tokens = max(0.0, non_tx_size_tokens - size)
+            self.non_tx_count_tokens = non_tx_count_tokens
+            self.non_tx_size_tokens = non_tx_size_tokens
+
+        if self.incoming or allowed:
+            # Now that we determined that it's OK to send the message, consume the tokens. Alternatively, if this
+            # was an incoming message, we already received it and it should consume tokens unconditionally.
+            # Buckets are floored at zero, so a flood is throttled for at most one period after it stops.
+            count_tokens = max(0.0, count_tokens - 1)
+            size_tokens = max(0.0, size_tokens - size)
+            self.message_counts[message_type] += 1
+            self.message_cumulative_sizes[message_type] += size
+        if not allowed:
+            self.rejected_counts[message_type] += 1
+        self.count_tokens[message_type] = count_tokens
+        self.size_tokens[message_type] = size_tokens
+        return allowed
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Returns the consumption of every message type seen so far: the number of messages and bytes that
+        were counted, the number of rejected messages, and the fraction of the count and size budgets that is
+        currently available.
+        """
+        now = time.monotonic()
+        message_types: Dict[str, Dict[str, Any]] = {}
+        for message_type in range(NUM_MESSAGE_TYPES):
+            if self.message_counts[message_type] == 0 and self.rejected_counts[message_type] == 0:
+                continue
+            elapsed_fraction = (now - self.last_refill[message_type]) / self.reset_seconds
+            message_types[ProtocolMessageTypes(message_type).name] = {
+                "messages": self.message_counts[message_type],
+                "bytes": self.message_cumulative_sizes[message_type],
+                "rejected": self.rejected_counts[message_type],
+                "count_budget_available": min(
+                    1.0, self.count_tokens[message_type] / self.count_capacity[message_type] + elapsed_fraction
+                ),
+                "size_budget_available": min(
+                    1.0, self.size_tokens[message_type] / self.size_capacity[message_type] + elapsed_fraction
+                ),
+            }
+        non_tx_elapsed_fraction = (now - self.non_tx_last_refill) / self.reset_seconds
+        return {
+            "percentage_of_limit": self.percentage_of_limit,
+            "messages": sum(self.message_counts),
+            "bytes": sum(self.message_cumulative_sizes),
+            "rejected": sum(self.rejected_counts),
+            "non_tx_count_budget_available": min(
+                1.0, self.non_tx_count_tokens / self.non_tx_count_capacity + non_tx_elapsed_fraction
+            ),
+            "non_tx_size_budget_available": min(
+                1.0, self.non_tx_size_tokens / self.non_tx_size_capacity + non_tx_elapsed_fraction
+            ),
+            "message_types": message_types,
+        }
@@ -20,6 +20,7 @@ from silicoin.protocols.protocol_state_machine import message_requires_reply
 from silicoin.protocols.protocol_timing import INVALID_PROTOCOL_BAN_SECONDS, API_EXCEPTION_BAN_SECONDS
 from silicoin.protocols.shared_protocol import protocol_version
 from silicoin.server.introducer_peers import IntroducerPeers
+from silicoin.server.message_framing import encode_message
 from silicoin.server.outbound_message import Message, NodeType
 from silicoin.server.ssl_context import private_ssl_paths, public_ssl_paths
 from silicoin.server.ws_connection import WSSilicoinConnection
@@ -609,6 +610,8 @@ class SilicoinServer:
         node_type: NodeType,
         origin_peer: WSSilicoinConnection,
     ):
+        for message in messages:
+            encode_message(message)
         for node_id, connection in self.all_connections.items():
             if node_id == origin_peer.peer_node_id:
                 continue
@@ -632,6 +635,9 @@ class SilicoinServer:
 
     async def send_to_all(self, messages: List[Message], node_type: NodeType):
         await self.validate_broadcast_message_type(messages, node_type)
+        # Encode once, the frame is shared by all the connections the message is queued on
+        for message in messages:
+            encode_message(message)
         for _, connection in self.all_connections.items():
             if connection.connection_type is node_type:
                 for message in messages:
@@ -639,6 +645,8 @@ class SilicoinServer:
 
     async def send_to_all_except(self, messages: List[Message], node_type: NodeType, exclude: bytes32):
         await self.validate_broadcast_message_type(messages, node_type)
+        for message in messages:
+            encode_message(message)
         for _, connection in self.all_connections.items():
             if connection.connection_type is node_type and connection.peer_node_id != exclude:
                 for message in messages:
@@ -2,7 +2,7 @@ import asyncio
 import logging
 import time
 import traceback
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from aiohttp import WSCloseCode, WSMessage, WSMsgType
 
@@ -10,7 +10,8 @@ from silicoin.cmds.init_funcs import silicoin_full_version_str
 from silicoin.protocols.protocol_message_types import ProtocolMessageTypes
 from silicoin.protocols.protocol_state_machine import message_response_ok
 from silicoin.protocols.protocol_timing import INTERNAL_PROTOCOL_ERROR_BAN_SECONDS
-from silicoin.protocols.shared_protocol import Capability, Handshake
+from silicoin.protocols.shared_protocol import Capability, Handshake, capabilities
+from silicoin.server.message_framing import decode_message, encode_message
 from silicoin.server.outbound_message import Message, NodeType, make_msg
 from silicoin.server.rate_limits import RateLimiter
 from silicoin.types.blockchain_format.sized_bytes import bytes32
@@ -25,6 +26,18 @@ from silicoin.util.network import class_for_type, is_localhost
 LENGTH_BYTES: int = 4
 
 
+def known_active_capabilities(values: List[Tuple[uint16, str]]) -> List[Capability]:
+    result: List[Capability] = []
+    for value, setting in values:
+        if setting != "1":
+            continue
+        try:
+            result.append(Capability(value))
+        except ValueError:
+            pass
+    return result
+
+
 class WSSilicoinConnection:
     """
     Represents a connection to another node. Local host and port are ours, while peer host and
@@ -108,6 +121,8 @@ class WSSilicoinConnection:
         # Used by crawler/dns introducer
         self.version = None
         self.protocol_version = ""
+        # Capabilities announced by the peer in its handshake, unknown ones are ignored
+        self.peer_capabilities: List[Capability] = []
 
     async def perform_handshake(self, network_id: str, protocol_version: str, server_port: int, local_type: NodeType):
         if self.is_outbound:
@@ -119,7 +134,7 @@ class WSSilicoinConnection:
                     silicoin_full_version_str(),
                     uint16(server_port),
                     uint8(local_type.value),
-                    [(uint16(Capability.BASE.value), "1")],
+                    capabilities,
                 ),
             )
             assert outbound_handshake is not None
@@ -145,6 +160,7 @@ class WSSilicoinConnection:
             self.protocol_version = inbound_handshake.protocol_version
             self.peer_server_port = inbound_handshake.server_port
             self.connection_type = NodeType(inbound_handshake.node_type)
+            self.peer_capabilities = known_active_capabilities(inbound_handshake.capabilities)
 
         else:
             try:
@@ -175,12 +191,13 @@ class WSSilicoinConnection:
                     silicoin_full_version_str(),
                     uint16(server_port),
                     uint8(local_type.value),
-                    [(uint16(Capability.BASE.value), "1")],
+                    capabilities,
                 ),
             )
             await self._send_message(outbound_handshake)
             self.peer_server_port = inbound_handshake.server_port
             self.connection_type = NodeType(inbound_handshake.node_type)
+            self.peer_capabilities = known_active_capabilities(inbound_handshake.capabilities)
 
         self.outbound_task = asyncio.create_task(self.outbound_handler())
         self.inbound_task = asyncio.create_task(self.inbound_handler())
@@ -382,7 +399,7 @@ class WSSilicoinConnection:
             return None
 
     async def _send_message(self, message: Message):
-        encoded: bytes = bytes(message)
+        encoded: bytes = encode_message(message)
         size = len(encoded)
         assert len(encoded) < (2 ** (LENGTH_BYTES * 8))
         if not self.outbound_rate_limiter.process_msg_and_check(message):
@@ -445,14 +462,14 @@ class WSSilicoinConnection:
                 return None
         elif message.type == WSMsgType.BINARY:
             data = message.data
-            full_message_loaded: Message = Message.from_bytes(data)
+            full_message_loaded: Message = decode_message(data)
             self.bytes_read += len(data)
             self.last_message_time = time.time()
-            try:
-                message_type = ProtocolMessageTypes(full_message_loaded.type).name
-            except Exception:
-                message_type = "Unknown"
             if not self.inbound_rate_limiter.process_msg_and_check(full_message_loaded):
+                try:
+                    message_type = ProtocolMessageTypes(full_message_loaded.type).name
+                except Exception:
+                    message_type = "Unknown"
                 if self.local_type == NodeType.FULL_NODE and not is_localhost(self.peer_host):
                     self.log.error(
                         f"Peer has been rate limited and will be disconnected: {self.peer_host}, "
@@ -487,6 +504,9 @@ class WSSilicoinConnection:
     def get_version(self):
         return self.version
 
+    def has_capability(self, capability: Capability) -> bool:
+        return capability in self.peer_capabilities
+
     def get_peer_info(self) -> Optional[PeerInfo]:
         result = self.ws._writer.transport.get_extra_info("peername")
         if result is None:
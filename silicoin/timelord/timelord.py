@@ -1,12 +1,15 @@
 import asyncio
+import binascii
 import dataclasses
-import io
+import heapq
 import logging
 import random
 import time
 import traceback
+from collections import deque
+from concurrent.futures.process import ProcessPoolExecutor
 from decimal import Decimal
-from typing import Callable, Dict, List, Optional, Tuple, Set
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Set
 
 from chiavdf import create_discriminant
 
@@ -35,6 +38,40 @@ from silicoin.util.ints import uint8, uint32, uint64, uint128
 
 log = logging.getLogger(__name__)
 
+# The scheduler runs when woken up, or after this many seconds to check for stalled chains
+SCHEDULER_TIMEOUT = 1.0
+# Number of recent broadcasts used for the delay statistics
+BROADCAST_DELAY_SAMPLES = 100
+
+
+def parse_vdf_output(data: bytes) -> Tuple[uint64, bytes, uint8, bytes]:
+    """
+    Splits the output of a vdf_client into iterations, the output element, the witness type and the witness. The
+    fields are sliced from a memoryview, only the output element and the witness are copied. Raises ValueError if the
+    output is too short for the sizes it declares.
+    """
+    view = memoryview(data)
+    if len(view) < 17:
+        raise ValueError(f"VDF output of {len(view)} bytes is too short")
+    iterations = uint64(int.from_bytes(view[0:8], "big", signed=True))
+    y_size = int.from_bytes(view[8:16], "big", signed=True)
+    y_end = 16 + y_size
+    if y_size < 0 or y_end + 1 > len(view):
+        raise ValueError(f"Invalid output element size {y_size} in a VDF output of {len(view)} bytes")
+    y_bytes = bytes(view[16:y_end])
+    witness_type = uint8(int.from_bytes(view[y_end : y_end + 1], "big", signed=True))
+    return iterations, y_bytes, witness_type, bytes(view[y_end + 1 :])
+
+
+def verify_vdf_proof(constants: ConsensusConstants, initial_form: bytes, vdf_info: bytes, vdf_proof: bytes) -> bool:
+    """
+    Checks a proof from our own vdf_client. This is meant to be called under a ProcessPoolExecutor, so verification
+    doesn't hold up the event loop.
+    """
+    return VDFProof.from_bytes(vdf_proof).is_valid(
+        constants, ClassgroupElement.from_bytes(initial_form), VDFInfo.from_bytes(vdf_info)
+    )
+
 
 class Timelord:
     def __init__(self, root_path, config: Dict, constants: ConsensusConstants):
@@ -69,10 +106,17 @@ class Timelord:
         self.iters_to_submit: Dict[Chain, List[uint64]] = {}
         self.iters_submitted: Dict[Chain, List[uint64]] = {}
         self.iters_finished: Set = set()
+        # For each chain, the submitted iterations that are not finished yet, as a heap.
+        self.pending_iters: Dict[Chain, List[uint64]] = {}
         # For each iteration submitted, know if it's a signage point, an infusion point or an end of slot.
         self.iteration_to_proof_type: Dict[uint64, IterationType] = {}
         # List of proofs finished.
         self.proofs_finished: List[Tuple[Chain, VDFInfo, VDFProof, int]] = []
+        # When the last proof for each iteration arrived, to measure the delay until the broadcast.
+        self.proof_finished_time: Dict[uint64, float] = {}
+        self.broadcast_delays: Dict[IterationType, Deque[float]] = {
+            iteration_type: deque(maxlen=BROADCAST_DELAY_SAMPLES) for iteration_type in IterationType
+        }
         # Data to send at vdf_client initialization.
         self.overflow_blocks: List[timelord_protocol.NewUnfinishedBlockTimelord] = []
         # Incremented each time `reset_chains` has been called.
@@ -92,9 +136,19 @@ class Timelord:
         self.sanitizer_mode = self.config["sanitizer_mode"]
         self.pending_bluebox_info: List[Tuple[float, timelord_protocol.RequestCompactProofOfTime]] = []
         self.last_active_time = time.time()
+        # Fraction of the proofs from our vdf_clients that are verified, 0 turns off verification.
+        self.vdf_verification_rate: float = self.config.get("vdf_verification_rate", 1.0)
+        self.verification_executor: Optional[ProcessPoolExecutor] = None
+        self.verification_tasks: Set[asyncio.Task] = set()
 
     async def _start(self):
         self.lock: asyncio.Lock = asyncio.Lock()
+        # Set when the scheduler has something to do: a new peak or block, a finished proof or a free vdf_client.
+        self.wakeup_event: asyncio.Event = asyncio.Event()
+        if self.vdf_verification_rate > 0:
+            num_workers = self.config.get("vdf_verification_workers", 1)
+            self.verification_executor = ProcessPoolExecutor(max_workers=num_workers)
+            log.info(f"Started {num_workers} processes for proof of time verification")
         self.vdf_server = await asyncio.start_server(
             self._handle_client,
             self.config["vdf_server"]["host"],
@@ -111,12 +165,71 @@ class Timelord:
         self._shut_down = True
         for task in self.process_communication_tasks:
             task.cancel()
+        for task in self.verification_tasks:
+            task.cancel()
         if self.main_loop is not None:
             self.main_loop.cancel()
+        if self.verification_executor is not None:
+            self.verification_executor.shutdown(wait=False)
 
     async def _await_closed(self):
         pass
 
+    def wake_up(self):
+        self.wakeup_event.set()
+
+    async def _wait_for_wakeup(self):
+        try:
+            await asyncio.wait_for(self.wakeup_event.wait(), timeout=SCHEDULER_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup_event.clear()
+
+    async def _verify_proof(
+        self, initial_form: ClassgroupElement, vdf_info: VDFInfo, vdf_proof: VDFProof
+    ) -> Optional[bool]:
+        """
+        Verifies the proof in the executor, returns None if it was not picked for verification.
+        """
+        if self.verification_executor is None or random.random() >= self.vdf_verification_rate:
+            return None
+        return await asyncio.get_running_loop().run_in_executor(
+            self.verification_executor,
+            verify_vdf_proof,
+            self.constants,
+            bytes(initial_form),
+            bytes(vdf_info),
+            bytes(vdf_proof),
+        )
+
+    async def _check_proof(
+        self, chain: Chain, initial_form: ClassgroupElement, vdf_info: VDFInfo, vdf_proof: VDFProof
+    ) -> None:
+        try:
+            if await self._verify_proof(initial_form, vdf_info, vdf_proof) is False:
+                log.error(f"Invalid proof of time! Chain: {chain} iters: {vdf_info.number_of_iterations}")
+        except Exception as e:
+            log.error(f"Could not verify proof of time: {e}")
+
+    def _record_broadcast_delay(self, iteration: uint64, iteration_type: IterationType):
+        finished_time = self.proof_finished_time.pop(iteration, None)
+        if finished_time is None:
+            return
+        delay = time.monotonic() - finished_time
+        self.broadcast_delays[iteration_type].append(delay)
+        log.debug(f"Broadcast {iteration_type.name} {iteration} {delay * 1000:.1f}ms after its last proof finished")
+
+    def get_broadcast_delays(self) -> Dict[str, Tuple[float, float]]:
+        """
+        The mean and max delay in seconds from the last proof of an iteration to its broadcast, over the recent
+        broadcasts of each type.
+        """
+        return {
+            iteration_type.name: (sum(delays) / len(delays), max(delays))
+            for iteration_type, delays in self.broadcast_delays.items()
+            if len(delays) > 0
+        }
+
     def set_server(self, server: SilicoinServer):
         self.server = server
 
@@ -127,6 +240,7 @@ class Timelord:
             if client_ip in self.ip_whitelist:
                 self.free_clients.append((client_ip, reader, writer))
                 log.debug(f"Added new VDF client {client_ip}.")
+                self.wake_up()
                 for ip, end_time in list(self.potential_free_clients):
                     if ip == client_ip:
                         self.potential_free_clients.remove((ip, end_time))
@@ -232,10 +346,12 @@ class Timelord:
         new_unfinished_blocks = []
         self.iters_finished = set()
         self.proofs_finished = []
+        self.proof_finished_time = {}
         self.num_resets += 1
         for chain in [Chain.CHALLENGE_CHAIN, Chain.REWARD_CHAIN, Chain.INFUSED_CHALLENGE_CHAIN]:
             self.iters_to_submit[chain] = []
             self.iters_submitted[chain] = []
+            self.pending_iters[chain] = []
         self.iteration_to_proof_type = {}
         if not only_eos:
             for block in self.unfinished_blocks + self.overflow_blocks:
@@ -352,7 +468,8 @@ class Timelord:
         for chain in [Chain.CHALLENGE_CHAIN, Chain.REWARD_CHAIN, Chain.INFUSED_CHALLENGE_CHAIN]:
             if chain in self.allows_iters:
                 _, _, writer = self.chain_type_to_stream[chain]
-                for iteration in self.iters_to_submit[chain]:
+                # Lowest first, the vdf_client outputs them in the order they are reached anyway.
+                for iteration in sorted(self.iters_to_submit[chain]):
                     if iteration in self.iters_submitted[chain]:
                         continue
                     log.debug(f"Submitting iterations to {chain}: {iteration}")
@@ -364,6 +481,15 @@ class Timelord:
                     writer.write(iter_str.encode())
                     await writer.drain()
                     self.iters_submitted[chain].append(iteration)
+                    heapq.heappush(self.pending_iters[chain], iteration)
+
+    def _next_pending_iteration(self, chain: Chain) -> Optional[uint64]:
+        pending = self.pending_iters.get(chain, [])
+        while len(pending) > 0 and pending[0] in self.iters_finished:
+            heapq.heappop(pending)
+        if len(pending) == 0:
+            return None
+        return pending[0]
 
     def _clear_proof_list(self, iters: uint64):
         return [
@@ -424,6 +550,7 @@ class Timelord:
                 if self.server is not None:
                     msg = make_msg(ProtocolMessageTypes.new_signage_point_vdf, response)
                     await self.server.send_to_all([msg], NodeType.FULL_NODE)
+                self._record_broadcast_delay(signage_iter, IterationType.SIGNAGE_POINT)
                 # Cleanup the signage point from memory.
                 to_remove.append((signage_iter, signage_point_index))
 
@@ -537,6 +664,7 @@ class Timelord:
                     msg = make_msg(ProtocolMessageTypes.new_infusion_point_vdf, response)
                     if self.server is not None:
                         await self.server.send_to_all([msg], NodeType.FULL_NODE)
+                    self._record_broadcast_delay(iteration, IterationType.INFUSION_POINT)
 
                     self.proofs_finished = self._clear_proof_list(iteration)
 
@@ -748,11 +876,17 @@ class Timelord:
                     timelord_protocol.NewEndOfSubSlotVDF(eos_bundle),
                 )
                 await self.server.send_to_all([msg], NodeType.FULL_NODE)
+            self._record_broadcast_delay(iter_to_look_for, IterationType.END_OF_SUBSLOT)
 
             log.info(
                 f"Built end of subslot bundle. cc hash: {eos_bundle.challenge_chain.get_hash()}. New_difficulty: "
                 f"{eos_bundle.challenge_chain.new_difficulty} New ssi: {eos_bundle.challenge_chain.new_sub_slot_iters}"
             )
+            delays = ", ".join(
+                f"{name}: mean {mean * 1000:.1f}ms max {max_delay * 1000:.1f}ms"
+                for name, (mean, max_delay) in self.get_broadcast_delays().items()
+            )
+            log.info(f"Delays from finished proofs to broadcast: {delays}")
 
             if next_ses is None or next_ses.new_difficulty is None:
                 self.unfinished_blocks = self.overflow_blocks.copy()
@@ -798,9 +932,13 @@ class Timelord:
         async with self.lock:
             await asyncio.sleep(5)
             await self._reset_chains(True)
+        progress = False
         while not self._shut_down:
             try:
-                await asyncio.sleep(0.1)
+                # Keep going while iterations get finished, otherwise sleep until there is something new.
+                if not progress:
+                    await self._wait_for_wakeup()
+                progress = False
                 async with self.lock:
                     await self._handle_failures()
                     # We've got a new peak, process it.
@@ -812,13 +950,10 @@ class Timelord:
                     # Submit pending iterations.
                     await self._submit_iterations()
 
-                    not_finished_iters = [
-                        it for it in self.iters_submitted[Chain.REWARD_CHAIN] if it not in self.iters_finished
-                    ]
-                    if len(not_finished_iters) == 0:
-                        await asyncio.sleep(0.1)
+                    selected_iter = self._next_pending_iteration(Chain.REWARD_CHAIN)
+                    if selected_iter is None:
                         continue
-                    selected_iter = min(not_finished_iters)
+                    num_resets = self.num_resets
 
                     # Check for new infusion point and broadcast it if present.
                     await self._check_for_new_ip(selected_iter)
@@ -826,6 +961,7 @@ class Timelord:
                     await self._check_for_new_sp(selected_iter)
                     # Check for end of subslot, respawn chains and build EndOfSubslotBundle.
                     await self._check_for_end_of_subslot(selected_iter)
+                    progress = selected_iter in self.iters_finished or num_resets != self.num_resets
 
             except Exception:
                 tb = traceback.format_exc()
@@ -884,6 +1020,7 @@ class Timelord:
                 async with self.lock:
                     self.vdf_failures.append((chain, proof_label))
                     self.vdf_failures_count += 1
+                    self.wake_up()
                 return None
 
             if ok.decode() != "OK":
@@ -893,6 +1030,7 @@ class Timelord:
             if not self.sanitizer_mode:
                 async with self.lock:
                     self.allows_iters.append(chain)
+                    self.wake_up()
             else:
                 async with self.lock:
                     assert chain is Chain.BLUEBOX
@@ -917,6 +1055,7 @@ class Timelord:
                     async with self.lock:
                         self.vdf_failures.append((chain, proof_label))
                         self.vdf_failures_count += 1
+                        self.wake_up()
                     break
 
                 msg = ""
@@ -935,7 +1074,9 @@ class Timelord:
                         # This must be a proof, 4 bytes is length prefix
                         length = int.from_bytes(data, "big")
                         proof = await reader.readexactly(length)
-                        stdout_bytes_io: io.BytesIO = io.BytesIO(bytes.fromhex(proof.decode()))
+                        iterations_needed, y_bytes, witness_type, proof_bytes = parse_vdf_output(
+                            binascii.unhexlify(proof)
+                        )
                     except (
                         asyncio.IncompleteReadError,
                         ConnectionResetError,
@@ -945,18 +1086,9 @@ class Timelord:
                         async with self.lock:
                             self.vdf_failures.append((chain, proof_label))
                             self.vdf_failures_count += 1
+                            self.wake_up()
                         break
 
-                    iterations_needed = uint64(int.from_bytes(stdout_bytes_io.read(8), "big", signed=True))
-
-                    y_size_bytes = stdout_bytes_io.read(8)
-                    y_size = uint64(int.from_bytes(y_size_bytes, "big", signed=True))
-
-                    y_bytes = stdout_bytes_io.read(y_size)
-                    witness_type = uint8(int.from_bytes(stdout_bytes_io.read(1), "big", signed=True))
-                    proof_bytes: bytes = stdout_bytes_io.read()
-
-                    # Verifies our own proof just in case
                     form_size = ClassgroupElement.get_size(self.constants)
                     output = ClassgroupElement.from_bytes(y_bytes[:form_size])
                     if not self.sanitizer_mode:
@@ -979,16 +1111,29 @@ class Timelord:
                         self.sanitizer_mode,
                     )
 
-                    if not vdf_proof.is_valid(self.constants, initial_form, vdf_info):
-                        log.error("Invalid proof of time!")
                     if not self.sanitizer_mode:
                         async with self.lock:
                             assert proof_label is not None
                             self.proofs_finished.append((chain, vdf_info, vdf_proof, proof_label))
+                            self.proof_finished_time[vdf_info.number_of_iterations] = time.monotonic()
+                            self.wake_up()
+                        # Verifies our own proof just in case, without holding up the broadcast
+                        task = asyncio.create_task(self._check_proof(chain, initial_form, vdf_info, vdf_proof))
+                        self.verification_tasks.add(task)
+                        task.add_done_callback(self.verification_tasks.discard)
                     else:
                         async with self.lock:
                             writer.write(b"010")
                             await writer.drain()
+                        try:
+                            valid = await self._verify_proof(initial_form, vdf_info, vdf_proof)
+                        except Exception as e:
+                            # Such as a broken executor, treated like an invalid proof to keep serving the client
+                            log.error(f"Could not verify compact proof of time for {header_hash}, not sending it: {e}")
+                            continue
+                        if valid is False:
+                            log.error(f"Invalid compact proof of time for {header_hash}, not sending it")
+                            continue
                         assert header_hash is not None
                         assert field_vdf is not None
                         assert height is not None
@@ -1038,4 +1183,4 @@ class Timelord:
                         self.free_clients = self.free_clients[1:]
                 except Exception as e:
                     log.error(f"Exception manage discriminant queue: {e}")
-            await asyncio.sleep(0.1)
+            await self._wait_for_wakeup()
@@ -34,6 +34,7 @@ class TimelordAPI:
                     f"{new_peak.reward_chain_block.weight} "
                 )
                 self.timelord.new_peak = new_peak
+                self.timelord.wake_up()
             elif (
                 self.timelord.last_state.peak is not None
                 and self.timelord.last_state.peak.reward_chain_block == new_peak.reward_chain_block
@@ -44,6 +45,7 @@ class TimelordAPI:
                 log.warning("block that we don't have, changing to it.")
                 self.timelord.new_peak = new_peak
                 self.timelord.new_subslot_end = None
+                self.timelord.wake_up()
 
     @api_request
     async def new_unfinished_block_timelord(self, new_unfinished_block: timelord_protocol.NewUnfinishedBlockTimelord):
@@ -77,6 +79,7 @@ class TimelordAPI:
                     self.timelord.iteration_to_proof_type[new_block_iters] = IterationType.INFUSION_POINT
                     self.timelord.total_unfinished += 1
                     log.debug(f"Non-overflow unfinished block, total {self.timelord.total_unfinished}")
+                    self.timelord.wake_up()
 
     @api_request
     async def request_compact_proof_of_time(self, vdf_info: timelord_protocol.RequestCompactProofOfTime):
@@ -88,3 +91,4 @@ class TimelordAPI:
             while self.timelord.pending_bluebox_info and (now - self.timelord.pending_bluebox_info[0][0] > 5):
                 del self.timelord.pending_bluebox_info[0]
             self.timelord.pending_bluebox_info.append((now, vdf_info))
+            self.timelord.wake_up()
@@ -1,6 +1,6 @@
 import logging
 from decimal import Decimal
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
 from blspy import G1Element
 
@@ -64,6 +64,9 @@ class BlockCache(BlockchainInterface):
     async def get_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
         return self._block_records
 
+    async def get_main_chain_block_records_in_range(self, start: int, stop: int) -> Dict[bytes32, BlockRecord]:
+        return self._block_records
+
     async def get_block_records_at(self, heights: List[uint32]) -> List[BlockRecord]:
         block_records: List[BlockRecord] = []
         for height in heights:
@@ -98,7 +101,13 @@ class BlockCache(BlockchainInterface):
             return None
         return segments.challenge_segments
 
+    async def get_sub_epoch_challenge_segment_hashes(self) -> Set[bytes32]:
+        return set(self._sub_epoch_segments.keys())  # type: ignore
+
     async def get_farmer_difficulty_coeff(
         self, farmer_public_key: G1Element, height: Optional[uint32] = None
     ) -> Decimal:
         return await self._inner.get_farmer_difficulty_coeff(farmer_public_key, height)
+
+    async def get_farmer_difficulty_coeffs(self, keys: List[Tuple[G1Element, uint32]]) -> List[Decimal]:
+        return await self._inner.get_farmer_difficulty_coeffs(keys)
@@ -1,15 +1,25 @@
 import argparse
+import copy
 import os
 import shutil
 import sys
+import threading
 from pathlib import Path
-from typing import Any, Callable, Dict, Optional, Union
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, Union
 
 import pkg_resources
 import yaml
 
 from silicoin.util.path import mkdir
 
+# The parsed config files by path, together with the file version (mtime, size and inode) they were parsed from,
+# and the read-only view of the parsed config
+_config_cache: Dict[Path, Tuple[Tuple[int, int, int], Dict, Mapping]] = {}
+_config_cache_lock = threading.Lock()
+# Serializes the read-modify-write of update_config within the process
+_config_update_lock = threading.Lock()
+
 
 def initial_config_file(filename: Union[str, Path]) -> str:
     return pkg_resources.resource_string(__name__, f"initial-{filename}").decode()
@@ -36,15 +46,84 @@ def config_path_for_filename(root_path: Path, filename: Union[str, Path]) -> Pat
     return root_path / "config" / filename
 
 
+def freeze_config(value: Any) -> Any:
+    """
+    Returns a read-only copy of the parsed config, with the dicts as mappingproxies and the lists as tuples.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze_config(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze_config(item) for item in value)
+    return value
+
+
+def _config_file_version(path: Path) -> Tuple[int, int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _cache_config(path: Path, version: Tuple[int, int, int], config_data: Any) -> Tuple[Dict, Mapping]:
+    """
+    Caches the config that was just written to path, under the version of the written file.
+    """
+    data = copy.deepcopy(config_data)
+    frozen = freeze_config(data)
+    with _config_cache_lock:
+        _config_cache[path] = (version, data, frozen)
+    return data, frozen
+
+
+def _load_cached_config(root_path: Path, filename: Union[str, Path], exit_on_error: bool) -> Tuple[Dict, Mapping]:
+    """
+    Returns the parsed config and its read-only view, parsing the file only if it changed since the last load.
+    """
+    path = config_path_for_filename(root_path, filename)
+    if not path.is_file():
+        if not exit_on_error:
+            raise ValueError("Config not found")
+        print(f"can't find {path}")
+        print("** please run `silicoin init` to migrate or create new config files **")
+        # TODO: fix this hack
+        sys.exit(-1)
+    version = _config_file_version(path)
+    with _config_cache_lock:
+        cached = _config_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+    with open(path, "r") as f:
+        data = yaml.safe_load(f)
+    frozen = freeze_config(data)
+    with _config_cache_lock:
+        _config_cache[path] = (version, data, frozen)
+    return data, frozen
+
+
 def save_config(root_path: Path, filename: Union[str, Path], config_data: Any):
     path: Path = config_path_for_filename(root_path, filename)
     tmp_path: Path = path.with_suffix("." + str(os.getpid()))
     with open(tmp_path, "w") as f:
         yaml.safe_dump(config_data, f)
+    # Taken before the rename, which keeps the inode and mtime, since another process could replace path right after
+    version = _config_file_version(tmp_path)
     try:
         os.replace(str(tmp_path), path)
     except PermissionError:
+        # The moved file may be a copy, so leave it to the next load
         shutil.move(str(tmp_path), str(path))
+        return
+    _cache_config(path, version, config_data)
+
+
+def update_config(root_path: Path, filename: Union[str, Path], update: Callable[[Dict], Any]) -> Dict:
+    """
+    Loads the config, passes it to update to modify it in place, and saves it. Updates made through this function
+    by the threads of the process don't overwrite each other.
+    """
+    with _config_update_lock:
+        config = load_config(root_path, filename)
+        update(config)
+        save_config(root_path, filename, config)
+    return config
 
 
 def load_config(
@@ -53,15 +132,25 @@ def load_config(
     sub_config: Optional[str] = None,
     exit_on_error=True,
 ) -> Dict:
-    path = config_path_for_filename(root_path, filename)
-    if not path.is_file():
-        if not exit_on_error:
-            raise ValueError("Config not found")
-        print(f"can't find {path}")
-        print("** please run `silicoin init` to migrate or create new config files **")
-        # TODO: fix this hack
-        sys.exit(-1)
-    r = yaml.safe_load(open(path, "r"))
+    """
+    Returns a copy of the config, which the caller is free to modify. The file is only parsed again when it changed.
+    """
+    r, _ = _load_cached_config(root_path, filename, exit_on_error)
+    if sub_config is not None:
+        r = r.get(sub_config)
+    return copy.deepcopy(r)
+
+
+def load_config_view(
+    root_path: Path,
+    filename: Union[str, Path],
+    sub_config: Optional[str] = None,
+    exit_on_error=True,
+) -> Mapping:
+    """
+    Returns the read-only view of the cached config, without copying it. Use load_config for a config to modify.
+    """
+    _, r = _load_cached_config(root_path, filename, exit_on_error)
     if sub_config is not None:
         r = r.get(sub_config)
     return r
@@ -1,4 +1,6 @@
 import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 import aiosqlite
 
@@ -10,20 +12,67 @@ class DBWrapper:
 
     db: aiosqlite.Connection
     lock: asyncio.Lock
+    # While > 0, commit_transaction only writes to disk every this many transactions, see group_commits
+    commit_group_size: int
+    grouped_transactions: int
+    in_savepoint: bool
 
     def __init__(self, connection: aiosqlite.Connection):
         self.db = connection
         self.lock = asyncio.Lock()
+        self.commit_group_size = 0
+        self.grouped_transactions = 0
+        self.in_savepoint = False
 
     async def begin_transaction(self):
-        cursor = await self.db.execute("BEGIN TRANSACTION")
+        if self.commit_group_size > 0 and self.db.in_transaction:
+            # Nested in the transaction of the group, so it can be rolled back on its own
+            cursor = await self.db.execute("SAVEPOINT grouped_transaction")
+            self.in_savepoint = True
+        else:
+            cursor = await self.db.execute("BEGIN TRANSACTION")
         await cursor.close()
 
     async def rollback_transaction(self):
         # Also rolls back the coin store, since both stores must be updated at once
-        if self.db.in_transaction:
+        if self.in_savepoint:
+            self.in_savepoint = False
+            cursor = await self.db.execute("ROLLBACK TO SAVEPOINT grouped_transaction")
+            await cursor.close()
+            cursor = await self.db.execute("RELEASE SAVEPOINT grouped_transaction")
+            await cursor.close()
+        elif self.db.in_transaction:
             cursor = await self.db.execute("ROLLBACK")
             await cursor.close()
+            self.grouped_transactions = 0
 
     async def commit_transaction(self):
-        await self.db.commit()
+        if self.commit_group_size == 0:
+            await self.db.commit()
+            return None
+        if self.in_savepoint:
+            self.in_savepoint = False
+            cursor = await self.db.execute("RELEASE SAVEPOINT grouped_transaction")
+            await cursor.close()
+        self.grouped_transactions += 1
+        if self.grouped_transactions >= self.commit_group_size:
+            await self.db.commit()
+            self.grouped_transactions = 0
+
+    @asynccontextmanager
+    async def group_commits(self, group_size: int) -> AsyncIterator[None]:
+        """
+        Writes the transactions committed inside this context to disk together, group_size at a time, which saves
+        most of the fsyncs while syncing. A transaction which is rolled back only undoes its own changes. The
+        transactions of an unfinished group are lost on a crash, the database stays consistent.
+        """
+        self.commit_group_size = group_size
+        self.grouped_transactions = 0
+        try:
+            yield
+        finally:
+            self.commit_group_size = 0
+            self.grouped_transactions = 0
+            async with self.lock:
+                if self.db.in_transaction:
+                    await self.db.commit()
@@ -121,6 +121,7 @@ class FileKeyring(FileSystemEventHandler):
     keyring_observer: Observer = None
     load_keyring_lock: threading.RLock  # Guards access to needs_load_keyring
     needs_load_keyring: bool = False
+    modification_count: int = 0  # Bumped whenever the keyring contents may have changed
     salt: Optional[bytes] = None  # PBKDF2 param
     payload_cache: dict = {}  # Cache of the decrypted YAML contained in outer_payload_cache['data']
     outer_payload_cache: dict = {}  # Cache of the plaintext YAML "outer" contents (never encrypted)
@@ -189,6 +190,7 @@ class FileKeyring(FileSystemEventHandler):
                     self.keyring_last_mod_time = last_modified
                     with self.load_keyring_lock:
                         self.needs_load_keyring = True
+                        self.modification_count += 1
             except FileNotFoundError:
                 # Shouldn't happen, but if the file doesn't exist there's nothing to do...
                 pass
@@ -242,6 +244,18 @@ class FileKeyring(FileSystemEventHandler):
         with acquire_reader_lock(lock_path=self.keyring_lock_path):
             return self._inner_get_password(service, user)
 
+    @loads_keyring
+    def _inner_get_passwords(self, service: str) -> Dict[str, str]:
+        return dict(self.ensure_cached_keys_dict().get(service, {}))
+
+    def get_passwords(self, service: str) -> Dict[str, str]:
+        """
+        Returns all the passphrases of the service by their 'user' names, from the cached
+        keyring data (does not force a read from disk)
+        """
+        with acquire_reader_lock(lock_path=self.keyring_lock_path):
+            return self._inner_get_passwords(service)
+
     @loads_keyring
     def _inner_set_password(self, service: str, user: str, passphrase: str, *args, **kwargs):
         keys = self.ensure_cached_keys_dict()
@@ -435,6 +449,8 @@ class FileKeyring(FileSystemEventHandler):
         # Update our cached payload
         self.outer_payload_cache = outer_payload
         self.payload_cache = inner_payload
+        with self.load_keyring_lock:
+            self.modification_count += 1
 
     def write_data_to_keyring(self, data):
         os.makedirs(os.path.dirname(self.keyring_path), 0o700, True)
@@ -0,0 +1,142 @@
+import logging
+import os
+import shutil
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.types.blockchain_format.sub_epoch_summary import SubEpochSummary
+from silicoin.util.ints import uint32
+
+log = logging.getLogger(__name__)
+
+HASH_SIZE = 32
+# Marks a height without a header hash, no block hashes to all zeros
+MISSING_HASH = bytes(HASH_SIZE)
+
+SNAPSHOT_MAGIC = b"SITH"
+SNAPSHOT_VERSION = 1
+# magic, version, number of heights, number of sub epoch summaries
+SNAPSHOT_HEADER = struct.Struct(">4sBII")
+# height, length of the serialized summary
+SNAPSHOT_SES_HEADER = struct.Struct(">II")
+
+
+class HeightMap:
+    """
+    Header hashes of the blocks in the path to the peak, indexed by height. The hashes are stored back to back in a
+    single bytearray, 32 bytes per height, instead of a dict with an entry (and two objects) per height, which keeps
+    memory use low for long chains. Behaves like the Dict[uint32, bytes32] it replaces, including raising KeyError
+    for heights without a hash.
+    """
+
+    _hashes: bytearray
+
+    def __init__(self, hashes: bytes = b""):
+        assert len(hashes) % HASH_SIZE == 0
+        self._hashes = bytearray(hashes)
+
+    @classmethod
+    def from_hashes(cls, hashes: Iterable[bytes32]) -> "HeightMap":
+        """
+        Creates the map from the header hashes of heights 0, 1, 2... in order.
+        """
+        return cls(b"".join(hashes))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._hashes)
+
+    def get(self, height: uint32, default: Optional[bytes32] = None) -> Optional[bytes32]:
+        start = height * HASH_SIZE
+        if height < 0 or start >= len(self._hashes):
+            return default
+        header_hash = bytes(self._hashes[start : start + HASH_SIZE])
+        if header_hash == MISSING_HASH:
+            return default
+        return bytes32(header_hash)
+
+    def __getitem__(self, height: uint32) -> bytes32:
+        header_hash = self.get(height)
+        if header_hash is None:
+            raise KeyError(height)
+        return header_hash
+
+    def __contains__(self, height: object) -> bool:
+        return isinstance(height, int) and self.get(uint32(height)) is not None
+
+    def __setitem__(self, height: uint32, header_hash: bytes32) -> None:
+        assert len(header_hash) == HASH_SIZE
+        start = height * HASH_SIZE
+        if start > len(self._hashes):
+            self._hashes.extend(MISSING_HASH * (height - len(self._hashes) // HASH_SIZE))
+        self._hashes[start : start + HASH_SIZE] = header_hash
+
+    def rollback(self, height: int) -> None:
+        """
+        Removes the hashes of the heights above height, after the peak moved to a lower block.
+        """
+        del self._hashes[max(height + 1, 0) * HASH_SIZE :]
+
+    def __len__(self) -> int:
+        """
+        The number of heights up to the highest one stored, the path to the peak has no gaps.
+        """
+        return len(self._hashes) // HASH_SIZE
+
+    def __iter__(self) -> Iterator[uint32]:
+        for height in range(len(self)):
+            if height in self:
+                yield uint32(height)
+
+
+def write_snapshot(path: Path, height_to_hash: HeightMap, sub_epoch_summaries: Dict[uint32, SubEpochSummary]) -> None:
+    """
+    Saves the path to the peak and its sub epoch summaries, so the next start only has to read the blocks added
+    after it from the database. The file is replaced atomically, a crash leaves the previous snapshot.
+    """
+    ses_data = bytearray()
+    for height, ses in sorted(sub_epoch_summaries.items()):
+        ses_bytes = bytes(ses)
+        ses_data += SNAPSHOT_SES_HEADER.pack(height, len(ses_bytes)) + ses_bytes
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(height_to_hash), len(sub_epoch_summaries))
+    tmp_path: Path = path.with_suffix("." + str(os.getpid()))
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(height_to_hash.to_bytes())
+        f.write(ses_data)
+    try:
+        os.replace(str(tmp_path), path)
+    except PermissionError:
+        shutil.move(str(tmp_path), str(path))
+
+
+def read_snapshot(path: Path) -> Optional[Tuple[HeightMap, Dict[uint32, SubEpochSummary]]]:
+    """
+    Returns the contents of a snapshot written by write_snapshot, or None if there is none or it can't be read. The
+    caller must check it against the database before using it.
+    """
+    if not path.exists():
+        return None
+    try:
+        data = path.read_bytes()
+        magic, version, heights, ses_count = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            log.warning(f"Ignoring snapshot {path} with unknown format")
+            return None
+        offset = SNAPSHOT_HEADER.size + heights * HASH_SIZE
+        if len(data) < offset:
+            raise ValueError("truncated")
+        height_to_hash = HeightMap(data[SNAPSHOT_HEADER.size : offset])
+        sub_epoch_summaries: Dict[uint32, SubEpochSummary] = {}
+        for _ in range(ses_count):
+            height, length = SNAPSHOT_SES_HEADER.unpack_from(data, offset)
+            offset += SNAPSHOT_SES_HEADER.size
+            if len(data) < offset + length:
+                raise ValueError("truncated")
+            sub_epoch_summaries[uint32(height)] = SubEpochSummary.from_bytes(data[offset : offset + length])
+            offset += length
+    except Exception as e:
+        log.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+    return height_to_hash, sub_epoch_summaries
@@ -2,10 +2,12 @@ import colorama
 import os
 import pkg_resources
 import sys
+import threading
 import unicodedata
 
 from bitstring import BitArray  # pyright: reportMissingImports=false
 from blspy import AugSchemeMPL, G1Element, PrivateKey  # pyright: reportMissingImports=false
+from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.util.hash import std_hash
 from silicoin.util.keyring_wrapper import KeyringWrapper
 from hashlib import pbkdf2_hmac
@@ -223,6 +225,55 @@ def get_private_key_user(user: str, index: int) -> str:
     return f"wallet-{user}-{index}"
 
 
+def parse_pk_and_entropy(read_str: Optional[str]) -> Optional[Tuple[G1Element, bytes]]:
+    """
+    Parses the keychain contents of a key index, the G1Element followed by the entropy.
+    """
+    if read_str is None or len(read_str) == 0:
+        return None
+    str_bytes = bytes.fromhex(read_str)
+    return (
+        G1Element.from_bytes(str_bytes[: G1Element.SIZE]),
+        str_bytes[G1Element.SIZE :],  # flake8: noqa
+    )
+
+
+class PrivateKeyCache:
+    """
+    The private keys derived from the entropy in the keychain, so that the PBKDF2 in mnemonic_to_seed
+    runs once per key and passphrase instead of on every lookup. Entries are keyed by a hash of the
+    entropy and the passphrase, and are all dropped when the keyring reports a modification (including
+    modifications by other processes, through the FileKeyring file watcher), or when keys are deleted.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.keys: Dict[bytes32, PrivateKey] = {}
+        self.keyring_state: Optional[Tuple[int, Optional[int]]] = None
+
+    def clear(self) -> None:
+        with self.lock:
+            self.keys = {}
+
+    def get(self, ent: bytes, passphrase: str, keyring_state: Tuple[int, Optional[int]]) -> PrivateKey:
+        cache_key = std_hash(bytes([len(ent)]) + ent + passphrase.encode())
+        with self.lock:
+            if keyring_state != self.keyring_state:
+                self.keys = {}
+                self.keyring_state = keyring_state
+            key = self.keys.get(cache_key)
+        if key is None:
+            key = AugSchemeMPL.key_gen(mnemonic_to_seed(bytes_to_mnemonic(ent), passphrase))
+            with self.lock:
+                if keyring_state == self.keyring_state:
+                    self.keys[cache_key] = key
+        return key
+
+
+# Shared by all the Keychain instances of the process
+private_key_cache = PrivateKeyCache()
+
+
 class Keychain:
     """
     The keychain stores two types of keys: private keys, which are PrivateKeys from blspy,
@@ -246,23 +297,46 @@ class Keychain:
         include an G1Element and the entropy required to generate the private key.
         Note that generating the actual private key also requires the passphrase.
         """
-        read_str = self.keyring_wrapper.get_passphrase(self.service, user)
-        if read_str is None or len(read_str) == 0:
-            return None
-        str_bytes = bytes.fromhex(read_str)
-        return (
-            G1Element.from_bytes(str_bytes[: G1Element.SIZE]),
-            str_bytes[G1Element.SIZE :],  # flake8: noqa
-        )
+        return parse_pk_and_entropy(self.keyring_wrapper.get_passphrase(self.service, user))
+
+    @unlocks_keyring(use_passphrase_cache=True)
+    def _get_all_pk_and_entropy(self) -> List[Tuple[int, G1Element, bytes]]:
+        """
+        Returns the key index, G1Element and entropy of all the keys in the keychain, lowest
+        index first. The keyring is read at once if the backend supports it, and otherwise
+        one key index at a time.
+        """
+        passphrases = self.keyring_wrapper.get_passphrases(self.service)
+        all_pkent: List[Tuple[int, G1Element, bytes]] = []
+        for index in range(MAX_KEYS + 1):
+            user = get_private_key_user(self.user, index)
+            if passphrases is None:
+                pkent = self._get_pk_and_entropy(user)
+            else:
+                pkent = parse_pk_and_entropy(passphrases.get(user))
+            if pkent is not None:
+                all_pkent.append((index, pkent[0], pkent[1]))
+        return all_pkent
+
+    def _get_private_key(self, ent: bytes, passphrase: str) -> PrivateKey:
+        """
+        Derives the private key from the entropy and passphrase, or returns it from the cache.
+        """
+        keyring_state = (id(self.keyring_wrapper.get_keyring()), self.keyring_wrapper.get_modification_count())
+        return private_key_cache.get(ent, passphrase, keyring_state)
 
     def _get_free_private_key_index(self) -> int:
         """
         Get the index of the first free spot in the keychain.
         """
+        passphrases = self.keyring_wrapper.get_passphrases(self.service)
         index = 0
         while True:
             pk = get_private_key_user(self.user, index)
-            pkent = self._get_pk_and_entropy(pk)
+            if passphrases is None:
+                pkent = self._get_pk_and_entropy(pk)
+            else:
+                pkent = parse_pk_and_entropy(passphrases.get(pk))
             if pkent is None:
                 return index
             index += 1
@@ -295,19 +369,11 @@ class Keychain:
         """
         Returns the first key in the keychain that has one of the passed in passphrases.
         """
-        index = 0
-        pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        while index <= MAX_KEYS:
-            if pkent is not None:
-                pk, ent = pkent
-                for pp in passphrases:
-                    mnemonic = bytes_to_mnemonic(ent)
-                    seed = mnemonic_to_seed(mnemonic, pp)
-                    key = AugSchemeMPL.key_gen(seed)
-                    if key.get_g1() == pk:
-                        return (key, ent)
-            index += 1
-            pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
+        for _, pk, ent in self._get_all_pk_and_entropy():
+            for pp in passphrases:
+                key = self._get_private_key(ent, pp)
+                if key.get_g1() == pk:
+                    return (key, ent)
         return None
 
     def get_private_key_by_fingerprint(
@@ -316,19 +382,10 @@ class Keychain:
         """
         Return first private key which have the given public key fingerprint.
         """
-        index = 0
-        pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        while index <= MAX_KEYS:
-            if pkent is not None:
-                pk, ent = pkent
+        for _, pk, ent in self._get_all_pk_and_entropy():
+            if pk.get_fingerprint() == fingerprint:
                 for pp in passphrases:
-                    mnemonic = bytes_to_mnemonic(ent)
-                    seed = mnemonic_to_seed(mnemonic, pp)
-                    key = AugSchemeMPL.key_gen(seed)
-                    if pk.get_fingerprint() == fingerprint:
-                        return (key, ent)
-            index += 1
-            pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
+                    return (self._get_private_key(ent, pp), ent)
         return None
 
     def get_all_private_keys(self, passphrases: List[str] = [""]) -> List[Tuple[PrivateKey, bytes]]:
@@ -338,49 +395,25 @@ class Keychain:
         """
         all_keys: List[Tuple[PrivateKey, bytes]] = []
 
-        index = 0
-        pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        while index <= MAX_KEYS:
-            if pkent is not None:
-                pk, ent = pkent
-                for pp in passphrases:
-                    mnemonic = bytes_to_mnemonic(ent)
-                    seed = mnemonic_to_seed(mnemonic, pp)
-                    key = AugSchemeMPL.key_gen(seed)
-                    if key.get_g1() == pk:
-                        all_keys.append((key, ent))
-            index += 1
-            pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
+        for _, pk, ent in self._get_all_pk_and_entropy():
+            for pp in passphrases:
+                key = self._get_private_key(ent, pp)
+                if key.get_g1() == pk:
+                    all_keys.append((key, ent))
         return all_keys
 
     def get_all_public_keys(self) -> List[G1Element]:
         """
         Returns all public keys.
         """
-        all_keys: List[Tuple[G1Element, bytes]] = []
-
-        index = 0
-        pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        while index <= MAX_KEYS:
-            if pkent is not None:
-                pk, ent = pkent
-                all_keys.append(pk)
-            index += 1
-            pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        return all_keys
+        return [pk for _, pk, _ in self._get_all_pk_and_entropy()]
 
     def get_first_public_key(self) -> Optional[G1Element]:
         """
         Returns the first public key.
         """
-        index = 0
-        pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        while index <= MAX_KEYS:
-            if pkent is not None:
-                pk, ent = pkent
-                return pk
-            index += 1
-            pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
+        for _, pk, _ in self._get_all_pk_and_entropy():
+            return pk
         return None
 
     def delete_key_by_fingerprint(self, fingerprint: int):
@@ -388,15 +421,10 @@ class Keychain:
         Deletes all keys which have the given public key fingerprint.
         """
 
-        index = 0
-        pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
-        while index <= MAX_KEYS:
-            if pkent is not None:
-                pk, ent = pkent
-                if pk.get_fingerprint() == fingerprint:
-                    self.keyring_wrapper.delete_passphrase(self.service, get_private_key_user(self.user, index))
-            index += 1
-            pkent = self._get_pk_and_entropy(get_private_key_user(self.user, index))
+        for index, pk, _ in self._get_all_pk_and_entropy():
+            if pk.get_fingerprint() == fingerprint:
+                self.keyring_wrapper.delete_passphrase(self.service, get_private_key_user(self.user, index))
+        private_key_cache.clear()
 
     def delete_all_keys(self):
         """
@@ -436,6 +464,7 @@ class Keychain:
             if (pkent is None or delete_exception) and index > MAX_KEYS:
                 break
             index += 1
+        private_key_cache.clear()
 
     @staticmethod
     def is_keyring_locked() -> bool:
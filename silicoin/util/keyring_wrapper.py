@@ -11,7 +11,7 @@ from keyring.backends.Windows import WinVaultKeyring as WinKeyring
 from keyring.errors import KeyringError, PasswordDeleteError
 from pathlib import Path
 from sys import exit, platform
-from typing import Any, List, Optional, Tuple, Type, Union
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
 
 
 # We want to protect the keyring, even if a user-specified master passphrase isn't provided
@@ -542,6 +542,26 @@ class KeyringWrapper:
 
         return self.get_keyring().get_password(service, user)
 
+    def get_passphrases(self, service: str) -> Optional[Dict[str, str]]:
+        """
+        Returns all the passphrases of the service by their user names in a single read, or None
+        if the keyring backend can only be read one user at a time
+        """
+        keyring = self.get_keyring()
+        if not isinstance(keyring, FileKeyring):
+            return None
+        return keyring.get_passwords(service)
+
+    def get_modification_count(self) -> Optional[int]:
+        """
+        Returns a counter which changes whenever the keyring contents may have changed, including
+        changes made by other processes, or None if the keyring backend doesn't report changes
+        """
+        keyring = self.get_keyring()
+        if not isinstance(keyring, FileKeyring):
+            return None
+        return keyring.modification_count
+
     def set_passphrase(self, service: str, user: str, passphrase: str):
         # On the first write while using the legacy keyring, we'll start migration
         if self.using_legacy_keyring() and self.has_cached_master_passphrase():
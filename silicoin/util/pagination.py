@@ -0,0 +1,70 @@
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.util.byte_types import hexstr_to_bytes
+from silicoin.util.ints import uint32
+
+T = TypeVar("T")
+
+# A position in a listing ordered by (height, unique id). Pages start strictly after it.
+PagePosition = Tuple[uint32, bytes32]
+
+# Number of records fetched per query when an RPC response is streamed
+STREAM_PAGE_SIZE = 1000
+# Upper bound for the page size a client can request
+MAX_PAGE_SIZE = 10000
+
+
+def encode_cursor(position: Optional[PagePosition]) -> Optional[str]:
+    """
+    Encodes a page position as an opaque string that is handed to RPC clients.
+    """
+    if position is None:
+        return None
+    height, key = position
+    return f"{height}:{key.hex()}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[PagePosition]:
+    """
+    Parses a cursor returned by encode_cursor. None (or an empty string) means the first page.
+    """
+    if cursor is None or cursor == "":
+        return None
+    try:
+        height_str, key_str = cursor.split(":", 1)
+        return uint32(int(height_str)), bytes32(hexstr_to_bytes(key_str))
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor}")
+
+
+def page_limit(limit: int) -> int:
+    """
+    Validates the page size requested by a client, which may come as a string from JSON, and caps it.
+    """
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid page limit {limit}")
+    if limit <= 0:
+        raise ValueError(f"Invalid page limit {limit}")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+async def iterate_pages(
+    fetch_page: Callable[[Optional[PagePosition], int], Awaitable[List[T]]],
+    position_of: Callable[[T], PagePosition],
+    start: Optional[PagePosition] = None,
+    page_size: int = STREAM_PAGE_SIZE,
+) -> AsyncIterator[T]:
+    """
+    Yields every record of a keyset-paginated listing, one page in memory at a time.
+    """
+    position = start
+    while True:
+        page = await fetch_page(position, page_size)
+        for record in page:
+            yield record
+        if len(page) < page_size:
+            return
+        position = position_of(page[-1])
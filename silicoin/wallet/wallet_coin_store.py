@@ -7,7 +7,7 @@ from silicoin.types.blockchain_format.coin import Coin
 from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.types.coin_record import CoinRecord
 from silicoin.util.db_wrapper import DBWrapper
-from silicoin.util.ints import uint32, uint64
+from silicoin.util.ints import uint32, uint64, uint128
 from silicoin.wallet.util.wallet_types import WalletType
 from silicoin.wallet.wallet_coin_record import WalletCoinRecord
 
@@ -22,6 +22,8 @@ class WalletCoinStore:
     coin_record_cache: Dict[bytes32, WalletCoinRecord]
     # unspent_coin_wallet_cache keeps ALL unspent coin records for wallet in memory [wallet_id: [record_name: record]]
     unspent_coin_wallet_cache: Dict[int, Dict[bytes32, WalletCoinRecord]]
+    # unspent_balance_cache keeps the sum of the unspent_coin_wallet_cache amounts for each wallet [wallet_id: amount]
+    unspent_balance_cache: Dict[int, int]
     db_wrapper: DBWrapper
 
     @classmethod
@@ -62,6 +64,7 @@ class WalletCoinStore:
         await self.db_connection.commit()
         self.coin_record_cache = {}
         self.unspent_coin_wallet_cache = {}
+        self.unspent_balance_cache = {}
         await self.rebuild_wallet_cache()
         return self
 
@@ -82,11 +85,26 @@ class WalletCoinStore:
                 if coin_record.wallet_id not in self.unspent_coin_wallet_cache:
                     self.unspent_coin_wallet_cache[coin_record.wallet_id] = {}
                 self.unspent_coin_wallet_cache[coin_record.wallet_id][name] = coin_record
+        self._rebuild_unspent_balance_cache()
+
+    def _rebuild_unspent_balance_cache(self) -> None:
+        self.unspent_balance_cache = {}
+        for wallet_id, wallet_coins in self.unspent_coin_wallet_cache.items():
+            self.unspent_balance_cache[wallet_id] = sum(record.coin.amount for record in wallet_coins.values())
+
+    def _update_unspent_balance(
+        self, wallet_id: int, previous: Optional[WalletCoinRecord], current: Optional[WalletCoinRecord]
+    ) -> None:
+        delta = (current.coin.amount if current is not None else 0) - (
+            previous.coin.amount if previous is not None else 0
+        )
+        self.unspent_balance_cache[wallet_id] = self.unspent_balance_cache.get(wallet_id, 0) + delta
 
     # Store CoinRecord in DB and ram cache
     async def add_coin_record(self, record: WalletCoinRecord) -> None:
         # update wallet cache
         name = record.name()
+        previous_unspent = self.unspent_coin_wallet_cache.get(record.wallet_id, {}).get(name)
         self.coin_record_cache[name] = record
         if record.wallet_id in self.unspent_coin_wallet_cache:
             if record.spent and name in self.unspent_coin_wallet_cache[record.wallet_id]:
@@ -97,6 +115,9 @@ class WalletCoinStore:
             if not record.spent:
                 self.unspent_coin_wallet_cache[record.wallet_id] = {}
                 self.unspent_coin_wallet_cache[record.wallet_id][name] = record
+        self._update_unspent_balance(
+            record.wallet_id, previous_unspent, self.unspent_coin_wallet_cache.get(record.wallet_id, {}).get(name)
+        )
 
         cursor = await self.db_connection.execute(
             "INSERT OR REPLACE INTO coin_record VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
@@ -122,7 +143,8 @@ class WalletCoinStore:
             if coin_record.wallet_id in self.unspent_coin_wallet_cache:
                 coin_cache = self.unspent_coin_wallet_cache[coin_record.wallet_id]
                 if coin_name in coin_cache:
-                    coin_cache.pop(coin_record.coin.name())
+                    removed = coin_cache.pop(coin_record.coin.name())
+                    self._update_unspent_balance(coin_record.wallet_id, removed, None)
 
         c = await self.db_connection.execute("DELETE FROM coin_record WHERE coin_name=?", (coin_name.hex(),))
         await c.close()
@@ -211,6 +233,13 @@ class WalletCoinStore:
                     all_unspent.add(coin_record)
             return all_unspent
 
+    def get_unspent_balance_for_wallet(self, wallet_id: int) -> uint128:
+        """Returns the sum of the unspent coins of a wallet, without iterating over them."""
+        return uint128(self.unspent_balance_cache.get(wallet_id, 0))
+
+    def get_unspent_coin_count_for_wallet(self, wallet_id: int) -> int:
+        return len(self.unspent_coin_wallet_cache.get(wallet_id, {}))
+
     async def get_unspent_coins_for_wallet(self, wallet_id: int) -> Set[WalletCoinRecord]:
         """Returns set of CoinRecords that have not been spent yet for a wallet."""
         if wallet_id in self.unspent_coin_wallet_cache:
@@ -292,6 +321,7 @@ class WalletCoinStore:
                 coin_cache = self.unspent_coin_wallet_cache[coin_record.wallet_id]
                 if coin_record.coin.name() in coin_cache:
                     coin_cache.pop(coin_record.coin.name())
+        self._rebuild_unspent_balance_cache()
 
         c1 = await self.db_connection.execute("DELETE FROM coin_record WHERE confirmed_height>?", (height,))
         await c1.close()
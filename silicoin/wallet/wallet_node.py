@@ -745,8 +745,6 @@ class WalletNode:
                             block_records,
                         ) = await self.fetch_and_validate_the_weight_proof(peer, response.header_block)
                         if valid_weight_proof is False:
-                            if syncing:
-                                self.wallet_state_manager.set_sync_mode(False)
                             await peer.close()
                             return
                         assert weight_proof is not None
@@ -767,14 +765,14 @@ class WalletNode:
                         self.wallet_state_manager.state_changed("new_block")
                         await self.update_ui()
                     except Exception:
-                        if syncing:
-                            self.wallet_state_manager.set_sync_mode(False)
                         tb = traceback.format_exc()
                         self.log.error(f"Error syncing to {peer.get_peer_info()} {tb}")
                         await peer.close()
                         return
-                    if syncing:
-                        self.wallet_state_manager.set_sync_mode(False)
+                    finally:
+                        # Also when the sync gets cancelled
+                        if syncing:
+                            self.wallet_state_manager.set_sync_mode(False)
 
                 else:
                     if peer.peer_node_id not in self.synced_peers:
@@ -148,7 +148,7 @@ class WalletStateManager:
 
         self.db_wrapper = DBWrapper(self.db_connection)
         self.coin_store = await WalletCoinStore.create(self.db_wrapper)
-        self.tx_store = await WalletTransactionStore.create(self.db_wrapper)
+        self.tx_store = await WalletTransactionStore.create(self.db_wrapper, self.constants.GENESIS_CHALLENGE)
         self.puzzle_store = await WalletPuzzleStore.create(self.db_wrapper)
         self.user_store = await WalletUserStore.create(self.db_wrapper)
         self.action_store = await WalletActionStore.create(self.db_wrapper)
@@ -461,6 +461,14 @@ class WalletStateManager:
         """
         Returns the balance amount of all coins that are spendable.
         """
+        if unspent_records is None:
+            # Start from the running unspent balance, and only look at the few coins that are not spendable
+            spendable_total: int = self.coin_store.get_unspent_balance_for_wallet(wallet_id)
+            for coin_name in await self._get_unspendable_coin_names(wallet_id):
+                record = await self.coin_store.get_coin_record(coin_name)
+                if record is not None and not record.spent and record.wallet_id == wallet_id:
+                    spendable_total -= record.coin.amount
+            return uint128(spendable_total)
 
         spendable: Set[WalletCoinRecord] = await self.get_spendable_coins_for_wallet(wallet_id, unspent_records)
 
@@ -490,8 +498,7 @@ class WalletStateManager:
         # for example, in the create method of DID wallet
         if self.lock.locked() is False:
             raise AssertionError("expected wallet_state_manager to be locked")
-        unspent_coin_records = await self.coin_store.get_unspent_coins_for_wallet(wallet_id)
-        return get_balance_from_coin_records(unspent_coin_records)
+        return self.coin_store.get_unspent_balance_for_wallet(wallet_id)
 
     async def get_confirmed_balance_for_wallet(
         self,
@@ -503,7 +510,7 @@ class WalletStateManager:
         """
         # lock only if unspent_coin_records is None
         if unspent_coin_records is None:
-            unspent_coin_records = await self.coin_store.get_unspent_coins_for_wallet(wallet_id)
+            return self.coin_store.get_unspent_balance_for_wallet(wallet_id)
         amount: uint128 = uint128(0)
         for record in unspent_coin_records:
             amount = uint128(amount + record.coin.amount)
@@ -1078,27 +1085,33 @@ class WalletStateManager:
             await self.create_more_puzzle_hashes()
         self.state_changed("wallet_created")
 
-    async def get_spendable_coins_for_wallet(self, wallet_id: int, records=None) -> Set[WalletCoinRecord]:
-        if records is None:
-            records = await self.coin_store.get_unspent_coins_for_wallet(wallet_id)
-
+    async def _get_unspendable_coin_names(self, wallet_id: int) -> Set[bytes32]:
+        """
+        Returns the names of the coins which can't be spent because they are part of an unconfirmed transaction
+        of the wallet, or locked in an offer.
+        """
+        unspendable: Set[bytes32] = set()
         # Coins that are currently part of a transaction
         unconfirmed_tx: List[TransactionRecord] = await self.tx_store.get_unconfirmed_for_wallet(wallet_id)
-        removal_dict: Dict[bytes32, Coin] = {}
         for tx in unconfirmed_tx:
             for coin in tx.removals:
                 # TODO, "if" might not be necessary once unconfirmed tx doesn't contain coins for other wallets
                 if await self.does_coin_belong_to_wallet(coin, wallet_id):
-                    removal_dict[coin.name()] = coin
+                    unspendable.add(coin.name())
 
         # Coins that are part of the trade
         offer_locked_coins: Dict[bytes32, WalletCoinRecord] = await self.trade_manager.get_locked_coins()
+        unspendable.update(offer_locked_coins.keys())
+        return unspendable
 
+    async def get_spendable_coins_for_wallet(self, wallet_id: int, records=None) -> Set[WalletCoinRecord]:
+        if records is None:
+            records = await self.coin_store.get_unspent_coins_for_wallet(wallet_id)
+
+        unspendable: Set[bytes32] = await self._get_unspendable_coin_names(wallet_id)
         filtered = set()
         for record in records:
-            if record.coin.name() in offer_locked_coins:
-                continue
-            if record.coin.name() in removal_dict:
+            if record.coin.name() in unspendable:
                 continue
             filtered.add(record)
 
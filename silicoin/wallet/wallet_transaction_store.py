@@ -1,18 +1,37 @@
 import time
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 
 import aiosqlite
+from sortedcontainers import SortedList
 
+from silicoin.consensus.block_rewards import calculate_base_farmer_reward
 from silicoin.types.blockchain_format.sized_bytes import bytes32
 from silicoin.types.mempool_inclusion_status import MempoolInclusionStatus
 from silicoin.util.db_wrapper import DBWrapper
 from silicoin.util.errors import Err
 from silicoin.util.ints import uint8, uint32
+from silicoin.util.pagination import PagePosition
 from silicoin.wallet.transaction_record import TransactionRecord
 from silicoin.wallet.transaction_sorting import SortKey
 from silicoin.wallet.util.transaction_type import TransactionType
 
 
+@dataclass
+class FarmingRewardTotals:
+    """
+    Running totals of the confirmed farming rewards of one type (pool or fee reward) in one wallet.
+    """
+
+    amount: int = 0
+    base_farmer_reward: int = 0
+    heights_farmed: SortedList = field(default_factory=SortedList)
+
+    @property
+    def last_height_farmed(self) -> int:
+        return self.heights_farmed[-1] if len(self.heights_farmed) > 0 else 0
+
+
 class WalletTransactionStore:
     """
     WalletTransactionStore stores transaction history for the wallet.
@@ -23,12 +42,18 @@ class WalletTransactionStore:
     tx_record_cache: Dict[bytes32, TransactionRecord]
     tx_submitted: Dict[bytes32, Tuple[int, int]]  # tx_id: [time submitted: count]
     unconfirmed_for_wallet: Dict[int, Dict[bytes32, TransactionRecord]]
+    genesis_challenge: Optional[bytes32]
+    # Farming reward totals, kept up to date with the records [(wallet_id, type): totals]
+    farming_reward_totals: Dict[Tuple[int, int], FarmingRewardTotals]
+    # What each farming reward record contributes to the totals [tx_id: (amount, base farmer reward, height)]
+    farming_reward_contributions: Dict[bytes32, Tuple[int, int, int]]
 
     @classmethod
-    async def create(cls, db_wrapper: DBWrapper):
+    async def create(cls, db_wrapper: DBWrapper, genesis_challenge: Optional[bytes32] = None):
         self = cls()
 
         self.db_wrapper = db_wrapper
+        self.genesis_challenge = genesis_challenge
         self.db_connection = self.db_wrapper.db
         await self.db_connection.execute(
             (
@@ -77,6 +102,8 @@ class WalletTransactionStore:
         self.tx_record_cache = {}
         self.tx_submitted = {}
         self.unconfirmed_for_wallet = {}
+        self.farming_reward_totals = {}
+        self.farming_reward_contributions = {}
         await self.rebuild_tx_cache()
         return self
 
@@ -85,14 +112,54 @@ class WalletTransactionStore:
         all_records = await self.get_all_transactions()
         self.tx_record_cache = {}
         self.unconfirmed_for_wallet = {}
+        self.farming_reward_totals = {}
+        self.farming_reward_contributions = {}
 
         for record in all_records:
             self.tx_record_cache[record.name] = record
+            self._add_farming_reward(record)
             if record.wallet_id not in self.unconfirmed_for_wallet:
                 self.unconfirmed_for_wallet[record.wallet_id] = {}
             if not record.confirmed:
                 self.unconfirmed_for_wallet[record.wallet_id][record.name] = record
 
+    def _add_farming_reward(self, record: TransactionRecord) -> None:
+        if not record.confirmed or record.type not in (
+            TransactionType.FEE_REWARD.value,
+            TransactionType.COINBASE_REWARD.value,
+        ):
+            return
+        height: Optional[uint32] = None
+        if self.genesis_challenge is not None:
+            height = record.height_farmed(self.genesis_challenge)
+        if height is None:
+            height = record.confirmed_at_height
+        base_farmer_reward = 0
+        if record.type == TransactionType.FEE_REWARD.value:
+            base_farmer_reward = calculate_base_farmer_reward(height)
+
+        totals = self.farming_reward_totals.setdefault((record.wallet_id, record.type), FarmingRewardTotals())
+        totals.amount += record.amount
+        totals.base_farmer_reward += base_farmer_reward
+        totals.heights_farmed.add(height)
+        self.farming_reward_contributions[record.name] = (record.amount, base_farmer_reward, height)
+
+    def _remove_farming_reward(self, record: TransactionRecord) -> None:
+        contribution = self.farming_reward_contributions.pop(record.name, None)
+        if contribution is None:
+            return
+        amount, base_farmer_reward, height = contribution
+        totals = self.farming_reward_totals[(record.wallet_id, record.type)]
+        totals.amount -= amount
+        totals.base_farmer_reward -= base_farmer_reward
+        totals.heights_farmed.remove(height)
+
+    def get_farming_reward_totals(self) -> Dict[Tuple[int, int], FarmingRewardTotals]:
+        """
+        Returns the totals of all confirmed farming rewards, by (wallet_id, transaction type).
+        """
+        return self.farming_reward_totals
+
     async def _clear_database(self):
         cursor = await self.db_connection.execute("DELETE FROM transaction_record")
         await cursor.close()
@@ -102,7 +169,11 @@ class WalletTransactionStore:
         """
         Store TransactionRecord in DB and Cache.
         """
+        previous = self.tx_record_cache.get(record.name)
+        if previous is not None:
+            self._remove_farming_reward(previous)
         self.tx_record_cache[record.name] = record
+        self._add_farming_reward(record)
         if record.wallet_id not in self.unconfirmed_for_wallet:
             self.unconfirmed_for_wallet[record.wallet_id] = {}
         unconfirmed_dict = self.unconfirmed_for_wallet[record.wallet_id]
@@ -145,6 +216,7 @@ class WalletTransactionStore:
     async def delete_transaction_record(self, tx_id: bytes32) -> None:
         if tx_id in self.tx_record_cache:
             tx_record = self.tx_record_cache.pop(tx_id)
+            self._remove_farming_reward(tx_record)
             if tx_record.wallet_id in self.unconfirmed_for_wallet:
                 tx_cache = self.unconfirmed_for_wallet[tx_record.wallet_id]
                 if tx_id in tx_cache:
@@ -380,6 +452,45 @@ class WalletTransactionStore:
 
         return records
 
+    async def get_transactions_page(
+        self,
+        wallet_id: Optional[int],
+        after: Optional[PagePosition],
+        limit: int,
+        types: Optional[List[int]] = None,
+        confirmed: Optional[bool] = None,
+    ) -> List[TransactionRecord]:
+        """
+        Returns up to limit transactions ordered by (confirmed_at_height, bundle_id), starting strictly after the
+        position `after`. Unlike the offset based get_transactions_between, a position stays valid while new
+        transactions are being added, which makes it suitable for walking a large history page by page.
+        """
+        conditions: List[str] = []
+        params: List = []
+        if wallet_id is not None:
+            conditions.append("wallet_id=?")
+            params.append(wallet_id)
+        if types is not None:
+            if len(types) == 0:
+                return []
+            conditions.append(f'type in ({"?," * (len(types) - 1)}?)')
+            params.extend(types)
+        if confirmed is not None:
+            conditions.append("confirmed=?")
+            params.append(int(confirmed))
+        if after is not None:
+            conditions.append("(confirmed_at_height>? OR (confirmed_at_height=? AND bundle_id>?))")
+            params.extend([after[0], after[0], after[1]])
+        where = f" WHERE {' AND '.join(conditions)}" if len(conditions) > 0 else ""
+
+        cursor = await self.db_connection.execute(
+            f"SELECT transaction_record from transaction_record{where} ORDER BY confirmed_at_height, bundle_id LIMIT ?",
+            (*params, limit),
+        )
+        rows = await cursor.fetchall()
+        await cursor.close()
+        return [TransactionRecord.from_bytes(row[0]) for row in rows]
+
     async def get_transaction_count_for_wallet(self, wallet_id) -> int:
         cursor = await self.db_connection.execute(
             "SELECT COUNT(*) FROM transaction_record where wallet_id=?", (wallet_id,)
@@ -471,6 +582,7 @@ class WalletTransactionStore:
                 to_delete.append(tx)
         for tx in to_delete:
             self.tx_record_cache.pop(tx.name)
+            self._remove_farming_reward(tx)
 
         c1 = await self.db_connection.execute("DELETE FROM transaction_record WHERE confirmed_at_height>?", (height,))
         await c1.close()
@@ -4,18 +4,15 @@ import pathlib
 import random
 import tempfile
 from concurrent.futures.process import ProcessPoolExecutor
-from typing import IO, List, Tuple, Optional
+from typing import IO, Dict, List, Set, Tuple, Optional
 
 from silicoin.consensus.block_record import BlockRecord
 from silicoin.consensus.constants import ConsensusConstants
 from silicoin.full_node.weight_proof import (
     _validate_sub_epoch_summaries,
-    vars_to_bytes,
     validate_sub_epoch_sampling,
-    _validate_sub_epoch_segments,
-    _validate_recent_blocks_and_get_records,
-    chunks,
-    _validate_vdf_batch,
+    validate_weight_proof_in_executor,
+    weight_proof_process_count,
 )
 from silicoin.types.blockchain_format.sub_epoch_summary import SubEpochSummary
 
@@ -23,7 +20,7 @@ from silicoin.types.weight_proof import (
     WeightProof,
 )
 
-from silicoin.util.ints import uint32
+from silicoin.util.ints import uint32, uint128
 
 log = logging.getLogger(__name__)
 
@@ -43,32 +40,56 @@ class WalletWeightProofHandler:
         constants: ConsensusConstants,
     ):
         self._constants = constants
-        self._num_processes = 4
-        self._executor_shutdown_tempfile: IO = _create_shutdown_file()
+        self._num_processes = weight_proof_process_count()
         self._executor: ProcessPoolExecutor = ProcessPoolExecutor(self._num_processes)
-        self._weight_proof_tasks: List[asyncio.Task] = []
+        # Validations in progress, with the weight of their peak and the file which keeps their jobs running
+        self._weight_proof_tasks: Dict[asyncio.Task, Tuple[uint128, IO]] = {}
+        # Validations cancelled because a heavier proof arrived
+        self._superseded_tasks: Set[asyncio.Task] = set()
 
     def cancel_weight_proof_tasks(self):
-        for task in self._weight_proof_tasks:
+        for task, (_, shutdown_file) in self._weight_proof_tasks.items():
             if not task.done():
                 task.cancel()
-        self._weight_proof_tasks = []
-        self._executor_shutdown_tempfile.close()
+            shutdown_file.close()
+        self._weight_proof_tasks = {}
         self._executor.shutdown(wait=True)
 
     async def validate_weight_proof(
         self, weight_proof: WeightProof, skip_segment_validation=True
     ) -> Tuple[bool, uint32, List[SubEpochSummary], List[BlockRecord]]:
+        """
+        Validates weight_proof in the process pool. Validations of lighter proofs which are still running are
+        cancelled, since the wallet syncs to the heavier one anyway; they return as invalid.
+        """
+        weight = weight_proof.recent_chain_data[-1].weight
+        for other_task, (other_weight, other_shutdown_file) in self._weight_proof_tasks.items():
+            if other_weight < weight and not other_task.done():
+                log.info(f"Cancelling the validation of a weight proof with weight {other_weight}")
+                other_task.cancel()
+                other_shutdown_file.close()
+                self._superseded_tasks.add(other_task)
+
+        shutdown_file: IO = _create_shutdown_file()
         task: asyncio.Task = asyncio.create_task(
-            self._validate_weight_proof_inner(weight_proof, skip_segment_validation)
+            self._validate_weight_proof_inner(weight_proof, skip_segment_validation, pathlib.Path(shutdown_file.name))
         )
-        self._weight_proof_tasks.append(task)
-        valid, fork_point, summaries, block_records = await task
-        self._weight_proof_tasks.remove(task)
+        self._weight_proof_tasks[task] = (weight, shutdown_file)
+        try:
+            valid, fork_point, summaries, block_records = await task
+        except asyncio.CancelledError:
+            if task not in self._superseded_tasks:
+                # The caller got cancelled
+                raise
+            return False, uint32(0), [], []
+        finally:
+            self._weight_proof_tasks.pop(task, None)
+            self._superseded_tasks.discard(task)
+            shutdown_file.close()
         return valid, fork_point, summaries, block_records
 
     async def _validate_weight_proof_inner(
-        self, weight_proof: WeightProof, skip_segment_validation: bool
+        self, weight_proof: WeightProof, skip_segment_validation: bool, shutdown_file_path: pathlib.Path
     ) -> Tuple[bool, uint32, List[SubEpochSummary], List[BlockRecord]]:
         assert len(weight_proof.sub_epochs) > 0
         if len(weight_proof.sub_epochs) == 0:
@@ -88,58 +109,17 @@ class WalletWeightProofHandler:
             log.error("failed weight proof sub epoch sample validation")
             return False, uint32(0), [], []
 
-        constants, summary_bytes, wp_segment_bytes, wp_recent_chain_bytes = vars_to_bytes(
-            self._constants, summaries, weight_proof
-        )
-
-        vdf_tasks: List[asyncio.Future] = []
-        # TODO: remove hint overrides after https://github.com/python/typeshed/pull/6187
-        recent_blocks_validation_task: asyncio.Future = asyncio.get_running_loop().run_in_executor(
+        valid, records_bytes = await validate_weight_proof_in_executor(
             self._executor,
-            _validate_recent_blocks_and_get_records,
-            constants,
-            wp_recent_chain_bytes,
-            summary_bytes,
-            pathlib.Path(self._executor_shutdown_tempfile.name),
-        )  # type: ignore[assignment]
-        try:
-            if not skip_segment_validation:
-                segments_validated, vdfs_to_validate = _validate_sub_epoch_segments(
-                    constants, rng, wp_segment_bytes, summary_bytes
-                )
-
-                if not segments_validated:
-                    return False, uint32(0), [], []
-
-                vdf_chunks = chunks(vdfs_to_validate, self._num_processes)
-                for chunk in vdf_chunks:
-                    byte_chunks = []
-                    for vdf_proof, classgroup, vdf_info in chunk:
-                        byte_chunks.append((bytes(vdf_proof), bytes(classgroup), bytes(vdf_info)))
-
-                    # TODO: remove hint overrides after https://github.com/python/typeshed/pull/6187
-                    vdf_task: asyncio.Future = asyncio.get_running_loop().run_in_executor(
-                        self._executor,
-                        _validate_vdf_batch,
-                        constants,
-                        byte_chunks,
-                        pathlib.Path(self._executor_shutdown_tempfile.name),
-                    )  # type: ignore[assignment]
-                    vdf_tasks.append(vdf_task)
-
-                for vdf_task in vdf_tasks:
-                    validated = await vdf_task
-                    if not validated:
-                        return False, uint32(0), [], []
-
-            valid_recent_blocks, records_bytes = await recent_blocks_validation_task
-        finally:
-            recent_blocks_validation_task.cancel()
-            for vdf_task in vdf_tasks:
-                vdf_task.cancel()
-
-        if not valid_recent_blocks:
-            log.error("failed validating weight proof recent blocks")
+            self._constants,
+            rng,
+            summaries,
+            weight_proof,
+            not skip_segment_validation,
+            shutdown_file_path,
+        )
+        if not valid:
+            log.error("failed validating weight proof")
             # Verify the data
             return False, uint32(0), [], []
 
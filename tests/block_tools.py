@@ -157,7 +157,7 @@ class BlockTools:
             updated_constants = updated_constants.replace(**const_dict)
         self.constants = updated_constants
 
-        self.refresh_parameter: PlotsRefreshParameter = PlotsRefreshParameter(batch_size=2)
+        self.refresh_parameter: PlotsRefreshParameter = PlotsRefreshParameter(batch_size=2, watch_directories=False)
         self.plot_dir: Path = get_plot_dir()
         self.temp_dir: Path = get_plot_tmp_dir()
         mkdir(self.plot_dir)
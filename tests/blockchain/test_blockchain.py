@@ -1601,6 +1601,26 @@ class TestPreValidation:
         log.info(f"Average pv: {sum(times_pv)/(len(blocks)/n_at_a_time)}")
         log.info(f"Average rb: {sum(times_rb)/(len(blocks))}")
 
+    @pytest.mark.asyncio
+    async def test_pre_validation_pipelined(self, empty_blockchain, default_1000_blocks):
+        blocks = default_1000_blocks[:40]
+        for i in range(0, len(blocks), 20):
+            blocks_to_validate = blocks[i : i + 20]
+            chunks = await empty_blockchain.pre_validate_blocks_pipelined(blocks_to_validate, {}, batch_size=3)
+            assert chunks is not None
+            assert len(chunks) == 7
+            # Blocks of the first batches are added while the later batches may still be validated
+            block_index = 0
+            for chunk in chunks:
+                for res in await chunk:
+                    assert res.error is None
+                    result, err, _, _ = await empty_blockchain.receive_block(blocks_to_validate[block_index], res)
+                    assert err is None
+                    assert result == ReceiveBlockResult.NEW_PEAK
+                    block_index += 1
+            assert block_index == len(blocks_to_validate)
+        assert empty_blockchain.get_peak().height == blocks[-1].height
+
 
 class TestBodyValidation:
     @pytest.mark.asyncio
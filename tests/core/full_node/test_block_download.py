@@ -0,0 +1,65 @@
+import asyncio
+import random
+
+import pytest
+
+from silicoin.full_node.block_download import BlockDownloadScheduler
+from silicoin.protocols.full_node_protocol import RejectBlocks, RespondBlocks
+from silicoin.util.hash import std_hash
+from tests.setup_nodes import bt
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+class FakePeer:
+    def __init__(self, index, blocks, delay, fail=False):
+        self.peer_node_id = std_hash(bytes([index]))
+        self.peer_host = f"peer{index}"
+        self.blocks = blocks
+        self.delay = delay
+        self.fail = fail
+        self.closed = False
+        self.requests = []
+
+    async def request_blocks(self, request, timeout):
+        self.requests.append((request.start_height, request.end_height))
+        await asyncio.sleep(self.delay * random.random())
+        if self.fail:
+            return RejectBlocks(request.start_height, request.end_height)
+        blocks = self.blocks[request.start_height : request.end_height + 1]
+        return RespondBlocks(request.start_height, request.end_height, blocks)
+
+    async def close(self, ban_time=0):
+        self.closed = True
+
+
+class TestBlockDownload:
+    @pytest.mark.asyncio
+    async def test_in_order_from_many_peers(self):
+        blocks = bt.get_consecutive_blocks(60)
+        peers = [FakePeer(0, blocks, 0.01), FakePeer(1, blocks, 0.05), FakePeer(2, blocks, 0.01, fail=True)]
+        scheduler = BlockDownloadScheduler(0, len(blocks) - 1, lambda: peers, 8, min_batch_size=2)
+
+        heights = []
+        async for peer, batch in scheduler.batches():
+            assert not peer.fail
+            heights.extend(block.height for block in batch)
+        assert heights == list(range(len(blocks)))
+
+        # Every peer got more than one request, and the failing peer was dropped after its first requests
+        assert len(peers[0].requests) > 1 and len(peers[1].requests) > 1
+        assert len(peers[2].requests) <= scheduler.max_requests_per_peer
+        assert peers[2].peer_node_id in scheduler.dropped_peers
+
+    @pytest.mark.asyncio
+    async def test_no_peers_left(self):
+        blocks = bt.get_consecutive_blocks(10)
+        peers = [FakePeer(0, blocks, 0.01, fail=True)]
+        scheduler = BlockDownloadScheduler(0, len(blocks) - 1, lambda: peers, 4)
+        with pytest.raises(ValueError):
+            async for _ in scheduler.batches():
+                pass
@@ -8,11 +8,14 @@ import aiosqlite
 import pytest
 
 from silicoin.consensus.blockchain import Blockchain
-from silicoin.full_node.block_store import BlockStore
+from silicoin.full_node.block_store import COMPRESSED_BLOCK_PREFIX, BlockStore, decompress_block_bytes
 from silicoin.full_node.coin_store import CoinStore
 from silicoin.full_node.hint_store import HintStore
 from silicoin.util.db_wrapper import DBWrapper
+from silicoin.util.height_map import HeightMap, read_snapshot, write_snapshot
+from silicoin.util.ints import uint32
 from tests.setup_nodes import bt, test_constants
+from tests.util.db_connection import DBConnection
 
 log = logging.getLogger(__name__)
 
@@ -130,3 +133,92 @@ class TestBlockStore:
         await connection_2.close()
         db_filename.unlink()
         db_filename_2.unlink()
+
+    @pytest.mark.asyncio
+    async def test_compressed_blocks(self):
+        blocks = bt.get_consecutive_blocks(10)
+        async with DBConnection() as db_wrapper, DBConnection() as db_wrapper_2:
+            coin_store_2 = await CoinStore.create(db_wrapper_2)
+            store_2 = await BlockStore.create(db_wrapper_2)
+            hint_store = await HintStore.create(db_wrapper_2)
+            bc = await Blockchain.create(coin_store_2, store_2, test_constants, hint_store)
+
+            plain_store = await BlockStore.create(db_wrapper)
+            compressed_store = await BlockStore.create(db_wrapper, compress_blocks=True)
+            for i, block in enumerate(blocks):
+                await bc.receive_block(block)
+                block_record = bc.block_record(block.header_hash)
+                # Blocks stored with and without compression are both readable
+                store = compressed_store if i % 2 == 0 else plain_store
+                await store.add_full_block(block.header_hash, block, block_record)
+
+            cursor = await db_wrapper.db.execute("SELECT height, block from full_blocks")
+            for height, blob in await cursor.fetchall():
+                assert (blob[:1] == COMPRESSED_BLOCK_PREFIX) == (height % 2 == 0)
+                assert decompress_block_bytes(blob) == bytes(blocks[height])
+            await cursor.close()
+
+            store = await BlockStore.create(db_wrapper)
+            for block in blocks:
+                assert await store.get_full_block_bytes(block.header_hash) == bytes(block)
+                assert await store.get_full_block_bytes(block.header_hash) == bytes(block)
+                assert await store.get_full_block(block.header_hash) == block
+            assert await store.get_full_blocks_at([uint32(2), uint32(3)]) == blocks[2:4]
+            assert await store.get_blocks_by_hash([blocks[5].header_hash]) == [blocks[5]]
+
+    @pytest.mark.asyncio
+    async def test_main_chain(self, tmp_path: Path):
+        blocks = bt.get_consecutive_blocks(10)
+        fork_blocks = bt.get_consecutive_blocks(3, blocks[:6], seed=b"fork")
+        async with DBConnection() as db_wrapper:
+            coin_store = await CoinStore.create(db_wrapper)
+            store = await BlockStore.create(db_wrapper)
+            hint_store = await HintStore.create(db_wrapper)
+            bc = await Blockchain.create(coin_store, store, test_constants, hint_store)
+            for block in blocks:
+                await bc.receive_block(block)
+
+            height_to_hash, _, _ = await store.get_peak_height_dicts()
+            assert [height_to_hash[h] for h in height_to_hash] == [b.header_hash for b in blocks]
+            records = await store.get_main_chain_block_records_in_range(3, 5)
+            assert set(records.keys()) == {b.header_hash for b in blocks[3:6]}
+
+            for block in fork_blocks[6:]:
+                await bc.receive_block(block)
+            assert bc.get_peak_height() == fork_blocks[-1].height
+            height_to_hash, _, _ = await store.get_peak_height_dicts()
+            assert [height_to_hash[h] for h in height_to_hash] == [b.header_hash for b in fork_blocks]
+            records = await store.get_main_chain_block_records_in_range(5, 9)
+            assert set(records.keys()) == {b.header_hash for b in fork_blocks[5:]}
+
+            # Databases created before the main chain table existed are migrated on load
+            await db_wrapper.db.execute("DELETE FROM main_chain")
+            await db_wrapper.db.commit()
+            height_to_hash, _, _ = await store.get_peak_height_dicts()
+            assert [height_to_hash[h] for h in height_to_hash] == [b.header_hash for b in fork_blocks]
+            records = await store.get_main_chain_block_records_in_range(0, 9)
+            assert set(records.keys()) == {b.header_hash for b in fork_blocks}
+
+            # A snapshot of a prefix of the main chain is extended from the database, others are ignored
+            snapshot = HeightMap.from_hashes([b.header_hash for b in fork_blocks[:4]])
+            height_to_hash, _, from_snapshot = await store.get_peak_height_dicts((snapshot, {}))
+            assert [height_to_hash[h] for h in height_to_hash] == [b.header_hash for b in fork_blocks]
+            assert from_snapshot
+            snapshot = HeightMap.from_hashes([b.header_hash for b in blocks])
+            height_to_hash, _, from_snapshot = await store.get_peak_height_dicts((snapshot, {}))
+            assert [height_to_hash[h] for h in height_to_hash] == [b.header_hash for b in fork_blocks]
+            assert not from_snapshot
+
+            # The blockchain only counts the snapshot as written if the block store used it, and replaces it otherwise
+            snapshot_path = tmp_path / "height-to-hash"
+            write_snapshot(snapshot_path, HeightMap.from_hashes([b.header_hash for b in fork_blocks[:4]]), {})
+            bc_snapshot = await Blockchain.create(coin_store, store, test_constants, hint_store, snapshot_path)
+            assert bc_snapshot.snapshot_height == 3
+            bc_snapshot.shut_down()
+            write_snapshot(snapshot_path, HeightMap.from_hashes([b.header_hash for b in blocks]), {})
+            bc_snapshot = await Blockchain.create(coin_store, store, test_constants, hint_store, snapshot_path)
+            assert bc_snapshot.snapshot_height is None
+            bc_snapshot.shut_down()
+            snapshot_data = read_snapshot(snapshot_path)
+            assert snapshot_data is not None
+            assert [snapshot_data[0][h] for h in snapshot_data[0]] == [b.header_hash for b in fork_blocks]
@@ -16,6 +16,7 @@ from silicoin.types.coin_record import CoinRecord
 from silicoin.types.full_block import FullBlock
 from silicoin.types.generator_types import BlockGenerator
 from silicoin.util.generator_tools import tx_removals_and_additions
+from silicoin.util.hash import std_hash
 from silicoin.util.ints import uint64, uint32
 from tests.wallet_tools import WalletTool
 from tests.setup_nodes import bt, test_constants
@@ -330,3 +331,132 @@ class TestCoinStoreWithBlocks:
             assert len(coins_pool) == num_blocks - 2
 
             b.shut_down()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cache_size", [0])
+    async def test_get_puzzle_hashes_page(self, cache_size: uint32):
+        async with DBConnection() as db_wrapper:
+            num_blocks = 20
+            farmer_ph = 32 * b"0"
+            pool_ph = 32 * b"1"
+            blocks = bt.get_consecutive_blocks(
+                num_blocks,
+                farmer_reward_puzzle_hash=farmer_ph,
+                pool_reward_puzzle_hash=pool_ph,
+                guarantee_transaction_block=True,
+            )
+            coin_store = await CoinStore.create(db_wrapper, cache_size=uint32(cache_size))
+            store = await BlockStore.create(db_wrapper)
+            hint_store = await HintStore.create(db_wrapper)
+            b: Blockchain = await Blockchain.create(coin_store, store, test_constants, hint_store)
+            for block in blocks:
+                res, err, _, _ = await b.receive_block(block)
+                assert err is None
+
+            all_coins = await coin_store.get_coin_records_by_puzzle_hashes(True, [farmer_ph, pool_ph])
+            paged: List[CoinRecord] = []
+            position = None
+            while True:
+                page = await coin_store.get_coin_records_by_puzzle_hashes_page(True, [farmer_ph, pool_ph], position, 7)
+                paged.extend(page)
+                if len(page) < 7:
+                    break
+                position = (page[-1].confirmed_block_index, page[-1].name)
+
+            assert len(paged) == len(all_coins)
+            assert set(paged) == set(all_coins)
+            keys = [(c.confirmed_block_index, c.name.hex()) for c in paged]
+            assert keys == sorted(keys)
+
+            b.shut_down()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cache_size", [0])
+    async def test_batched_difficulty_coeffs(self, cache_size: uint32):
+        async with DBConnection() as db_wrapper:
+            num_blocks = 20
+            farmer_ph = 32 * b"0"
+            pool_ph = 32 * b"1"
+            blocks = bt.get_consecutive_blocks(
+                num_blocks,
+                farmer_reward_puzzle_hash=farmer_ph,
+                pool_reward_puzzle_hash=pool_ph,
+                guarantee_transaction_block=True,
+            )
+            coin_store = await CoinStore.create(db_wrapper, cache_size=uint32(cache_size))
+            store = await BlockStore.create(db_wrapper)
+            hint_store = await HintStore.create(db_wrapper)
+            b: Blockchain = await Blockchain.create(coin_store, store, test_constants, hint_store)
+            for block in blocks:
+                res, err, _, _ = await b.receive_block(block)
+                assert err is None
+
+            heights = [uint32(h) for h in range(num_blocks)]
+            for ph in [farmer_ph, pool_ph]:
+                amounts = await coin_store.get_unspent_amounts_before_heights(ph, heights)
+                for height, amount in zip(heights, amounts):
+                    coins = await coin_store.get_unspent_coins_before_height(ph, height)
+                    assert amount == sum(coin.coin.amount for coin in coins)
+
+            farmer_pk = blocks[-1].reward_chain_block.proof_of_space.farmer_public_key
+            keys = [(farmer_pk, height) for height in heights] + [(farmer_pk, uint32(5))]
+            coeffs = await b.get_farmer_difficulty_coeffs(keys)
+            for (pk, height), coeff in zip(keys, coeffs):
+                assert coeff == await b.get_farmer_difficulty_coeff(pk, height)
+
+            b.shut_down()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cache_size", [0, 10])
+    async def test_new_blocks_batch(self, cache_size: uint32):
+        async with DBConnection() as db_wrapper:
+            coin_store = await CoinStore.create(db_wrapper, cache_size=uint32(cache_size), defer_indexes=True)
+            assert coin_store.indexes_deferred
+
+            def coin(i: int) -> Coin:
+                return Coin(std_hash(bytes([i])), std_hash(b"ph"), uint64(i))
+
+            def rewards(height: int) -> Set[Coin]:
+                return {coin(100 + 2 * height), coin(101 + 2 * height)}
+
+            existing = coin(1)
+            await coin_store.new_block(uint32(0), uint64(1000), set(), [existing], [])
+
+            ephemeral, created = coin(2), coin(3)
+            added = await coin_store.new_blocks(
+                [
+                    (uint32(1), uint64(1001), rewards(1), [ephemeral], []),
+                    (uint32(2), uint64(1002), rewards(2), [created], [ephemeral.name()]),
+                    (uint32(3), uint64(1003), rewards(3), [], [existing.name()]),
+                ]
+            )
+            assert [len(additions) for additions in added] == [3, 3, 2]
+            assert all(not record.spent for additions in added for record in additions)
+
+            record = await coin_store.get_coin_record(ephemeral.name())
+            assert record.spent and record.confirmed_block_index == 1 and record.spent_block_index == 2
+            record = await coin_store.get_coin_record(created.name())
+            assert not record.spent and record.confirmed_block_index == 2
+            record = await coin_store.get_coin_record(existing.name())
+            assert record.spent and record.spent_block_index == 3
+            assert len(await coin_store.get_coins_removed_at_height(uint32(2))) == 1
+
+            # Adding a coin twice in a batch fails like adding it again in a later block
+            with pytest.raises(Exception):
+                await coin_store.new_blocks(
+                    [
+                        (uint32(4), uint64(1004), rewards(4), [coin(4)], []),
+                        (uint32(5), uint64(1005), rewards(5), [coin(4)], []),
+                    ]
+                )
+
+            cursor = await db_wrapper.db.execute("SELECT name FROM sqlite_master WHERE type='index'")
+            indexes = {row[0] for row in await cursor.fetchall()}
+            await cursor.close()
+            assert "coin_confirmed_index" not in indexes and "coin_puzzle_hash" in indexes
+            await coin_store.build_deferred_indexes()
+            assert not coin_store.indexes_deferred
+            cursor = await db_wrapper.db.execute("SELECT name FROM sqlite_master WHERE type='index'")
+            indexes = {row[0] for row in await cursor.fetchall()}
+            await cursor.close()
+            assert {"coin_confirmed_index", "coin_spent_index", "coin_parent_index"} <= indexes
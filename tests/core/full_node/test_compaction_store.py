@@ -0,0 +1,107 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from silicoin.consensus.default_constants import DEFAULT_CONSTANTS
+from silicoin.full_node.compaction_store import CompactionStore
+from silicoin.full_node.full_node import FullNode
+from silicoin.protocols.timelord_protocol import RequestCompactProofOfTime
+from silicoin.types.blockchain_format.classgroup import ClassgroupElement
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.types.blockchain_format.vdf import CompressibleVDFField, VDFInfo
+from silicoin.util.ints import uint8, uint32, uint64
+from tests.util.db_connection import DBConnection
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+def make_request(height: int, field_vdf: CompressibleVDFField) -> RequestCompactProofOfTime:
+    vdf_info = VDFInfo(bytes32([height] * 32), uint64(1000 + height), ClassgroupElement.get_default_element())
+    return RequestCompactProofOfTime(vdf_info, bytes32([height + 1] * 32), uint32(height), uint8(field_vdf))
+
+
+class TestCompactionStore:
+    @pytest.mark.asyncio
+    async def test_lease(self):
+        async with DBConnection() as db_wrapper:
+            store = await CompactionStore.create(db_wrapper)
+            assert await store.get_max_height() is None
+            requests = [
+                make_request(height, field) for height in [5, 3, 8] for field in [CompressibleVDFField.CC_IP_VDF]
+            ]
+            requests.append(make_request(3, CompressibleVDFField.CC_SP_VDF))
+            await store.add(requests)
+            # Adding again keeps a single entry
+            await store.add(requests[:1])
+            assert await store.get_counts(100) == (4, 0)
+            assert await store.get_max_height() == 8
+
+            # Lowest heights first, and each VDF to a single timelord
+            leased_a = await store.lease("a", 3, 100, 60)
+            assert [r.height for r in leased_a] == [3, 3, 5]
+            assert leased_a[0] in requests
+            leased_b = await store.lease("b", 3, 100, 60)
+            assert [r.height for r in leased_b] == [8]
+            assert await store.lease("c", 3, 130, 60) == []
+            assert await store.get_counts(130) == (0, 4)
+
+            assert await store.remove(leased_a[0].header_hash, leased_a[0].field_vdf) == "a"
+            assert await store.remove(leased_a[0].header_hash, leased_a[0].field_vdf) is None
+            assert await store.get_counts(130) == (0, 3)
+
+            # Expired leases go to the next timelord
+            leased_c = await store.lease("c", 3, 160, 60)
+            assert leased_c == leased_a[1:] + leased_b
+            assert await store.remove(leased_c[0].header_hash, leased_c[0].field_vdf) == "c"
+
+    @pytest.mark.asyncio
+    async def test_not_leased(self):
+        async with DBConnection() as db_wrapper:
+            store = await CompactionStore.create(db_wrapper)
+            request = make_request(1, CompressibleVDFField.CC_EOS_VDF)
+            await store.add([request])
+            assert await store.remove(request.header_hash, request.field_vdf) == ""
+            assert await store.get_counts(0) == (0, 0)
+
+    @pytest.mark.asyncio
+    async def test_lease_round(self, tmp_path: Path):
+        async with DBConnection() as db_wrapper:
+            config = {"database_path": "db/blockchain_CHALLENGE.sqlite", "selected_network": "testnet0"}
+            full_node = FullNode(config, tmp_path, DEFAULT_CONSTANTS)
+            full_node.compaction_store = await CompactionStore.create(db_wrapper)
+            # The chain checks are not part of this test
+            full_node._lease_compaction_work = full_node.compaction_store.lease
+            await full_node.compaction_store.add(
+                [make_request(height, CompressibleVDFField.CC_IP_VDF) for height in range(4)]
+            )
+            # A timelord which is not a bluebox, and a bluebox which connected after it
+            timelord = SimpleNamespace(peer_node_id=bytes32([100] * 32))
+            bluebox = SimpleNamespace(peer_node_id=bytes32([101] * 32))
+
+            def heights(leases):
+                return {peer.peer_node_id: [r.height for r in requests] for peer, requests in leases}
+
+            # Neither returned a compact proof yet, both are on probation
+            leases = await full_node._lease_compaction_round([timelord, bluebox], 2, 0, 600, 60)
+            assert heights(leases) == {timelord.peer_node_id: [0, 1], bluebox.peer_node_id: [2, 3]}
+
+            # The bluebox returns a compact proof
+            full_node.compaction_blueboxes.add(bluebox.peer_node_id)
+            compacted = leases[1][1][0]
+            assert (
+                await full_node.compaction_store.remove(compacted.header_hash, compacted.field_vdf)
+                == bluebox.peer_node_id.hex()
+            )
+
+            # The work of the timelord goes to the bluebox in the next round, which now leases first and for longer
+            leases = await full_node._lease_compaction_round([timelord, bluebox], 2, 60, 600, 60)
+            assert heights(leases) == {bluebox.peer_node_id: [0, 1], timelord.peer_node_id: [3]}
+            leases = await full_node._lease_compaction_round([timelord, bluebox], 2, 120, 600, 60)
+            assert heights(leases) == {bluebox.peer_node_id: [3], timelord.peer_node_id: []}
+            assert await full_node.compaction_store.get_counts(600) == (0, 3)
@@ -0,0 +1,81 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+import pytest
+
+from silicoin.full_node.network_space import DEFAULT_NETWORK_SPACE_WINDOW, NetworkSpaceEstimator
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.util.ints import uint32, uint64, uint128
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+@dataclass
+class FakeRecord:
+    height: uint32
+    header_hash: bytes32
+    timestamp: Optional[uint64]
+
+
+class FakeBlockchain:
+    def __init__(self):
+        self.calls = 0
+        self.main_chain = {}
+
+    def height_to_hash(self, height):
+        return self.main_chain.get(height)
+
+    async def new_peak(self, estimator, peak):
+        # The peak and its main chain are set before the estimator sees the peak
+        for height in [height for height in self.main_chain.keys() if height > peak.height]:
+            del self.main_chain[height]
+        self.main_chain[peak.height] = peak.header_hash
+        await estimator.new_peak(peak)
+
+    async def get_peak_network_space(self, block_range, peak):
+        self.calls += 1
+        return uint128(peak.height * 1000 + block_range)
+
+
+def record(height: int, fork: int = 0) -> FakeRecord:
+    return FakeRecord(uint32(height), bytes32(bytes([fork, height]) * 16), uint64(height * 20))
+
+
+class TestNetworkSpace:
+    @pytest.mark.asyncio
+    async def test_series(self):
+        blockchain = FakeBlockchain()
+        estimator = NetworkSpaceEstimator(blockchain, [32, 384], max_points=5)
+        assert estimator.windows == [32, 384, DEFAULT_NETWORK_SPACE_WINDOW]
+        assert estimator.get_space(record(1)) is None
+
+        for height in range(1, 9):
+            await blockchain.new_peak(estimator, record(height))
+        assert blockchain.calls == 8 * 3
+        assert estimator.get_space(record(8)) == 8000 + DEFAULT_NETWORK_SPACE_WINDOW
+        assert estimator.get_space(record(8), 32) == 8032
+        # Only for the peak it was computed at
+        assert estimator.get_space(record(7)) is None
+        assert [point.height for point in estimator.get_series(384)] == [4, 5, 6, 7, 8]
+        assert [point.space for point in estimator.get_series(384, 7)] == [7384, 8384]
+
+        # A reorg replaces the estimates above the fork
+        await blockchain.new_peak(estimator, record(6, fork=1))
+        assert [point.height for point in estimator.get_series(32)] == [4, 5, 6]
+        assert estimator.get_series(32)[-1].header_hash == record(6, fork=1).header_hash
+        assert estimator.get_space(record(6, fork=1), 32) == 6032
+
+        # A reorg to a taller fork drops the estimates of the orphaned blocks below the new peak too
+        for height in range(5, 8):
+            blockchain.main_chain[height] = record(height, fork=2).header_hash
+        await blockchain.new_peak(estimator, record(8, fork=2))
+        assert [point.height for point in estimator.get_series(32)] == [4, 8]
+        assert estimator.get_series(32)[-1].header_hash == record(8, fork=2).header_hash
+
+        with pytest.raises(ValueError):
+            estimator.get_series(100)
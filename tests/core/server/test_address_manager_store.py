@@ -0,0 +1,166 @@
+import asyncio
+import time
+from pathlib import Path
+
+import aiosqlite
+import pytest
+
+from silicoin.server.address_manager import BUCKET_SIZE, AddressManager, ExtendedPeerInfo
+from silicoin.server.address_manager_store import STORE_VERSION, AddressManagerStore
+from silicoin.types.peer_info import PeerInfo, TimestampedPeerInfo
+from silicoin.util.ints import uint16, uint64
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+def make_peers(prefix: str, count: int, timestamp: int):
+    return [
+        TimestampedPeerInfo(f"{prefix}.{i // 250}.{i % 250}.1", uint16(8444), uint64(timestamp)) for i in range(count)
+    ]
+
+
+def make_address_manager() -> AddressManager:
+    address_manager = AddressManager()
+    # The test addresses are in a reserved range
+    address_manager.make_private_subnets_valid()
+    return address_manager
+
+
+def state(address_manager: AddressManager):
+    return (
+        sorted(address_manager.new_matrix.positions()),
+        sorted(address_manager.tried_matrix.positions()),
+        sorted(
+            (node_id, info.peer_info.host, int(info.timestamp), info.ref_count, info.is_tried)
+            for node_id, info in address_manager.map_info.items()
+        ),
+        address_manager.new_count,
+        address_manager.tried_count,
+    )
+
+
+async def count_rows(connection: aiosqlite.Connection, table: str) -> int:
+    cursor = await connection.execute(f"SELECT COUNT(*) from {table}")
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row[0]
+
+
+class TestAddressManagerStore:
+    @pytest.mark.asyncio
+    async def test_round_trip(self, tmp_path: Path):
+        now = int(time.time())
+        connection = await aiosqlite.connect(tmp_path / "peers.sqlite")
+        try:
+            store = await AddressManagerStore.create(connection)
+            assert await store.is_empty()
+            address_manager = make_address_manager()
+            await address_manager.add_to_new_table(make_peers("250", 600, now - 100), PeerInfo("252.5.1.1", 8444))
+            for peer in make_peers("250", 100, now - 100):
+                await address_manager.mark_good(PeerInfo(peer.host, peer.port))
+            await store.serialize(address_manager)
+            assert not await store.is_empty()
+            assert len(address_manager.dirty_nodes) == 0
+            assert (await store.get_metadata())["version"] == STORE_VERSION
+            assert state(await store.deserialize()) == state(address_manager)
+
+            # Only the changes are written by the next save
+            for peer in make_peers("250", 200, now - 100)[100:]:
+                await address_manager.mark_good(PeerInfo(peer.host, peer.port))
+            await address_manager.add_to_new_table(make_peers("251", 300, now - 50), PeerInfo("252.6.1.1", 8444))
+            stale = make_peers("250", 600, now - 100)[-1]
+            for _ in range(5):
+                await address_manager.attempt(PeerInfo(stale.host, stale.port), True, now - 61)
+            address_manager.cleanup(0, 5)
+            assert address_manager.find_(PeerInfo(stale.host, stale.port))[0] is None
+            assert len(address_manager.dirty_nodes) > 0
+            await store.serialize(address_manager)
+            reloaded = await store.deserialize()
+            assert state(reloaded) == state(address_manager)
+            assert len(reloaded.dirty_nodes) == 0
+            assert await count_rows(connection, "peer_nodes") == len(address_manager.map_info)
+
+            # A reloaded address manager keeps saving incrementally
+            reloaded.make_private_subnets_valid()
+            await reloaded.add_to_new_table(make_peers("249", 10, now), PeerInfo("252.7.1.1", 8444))
+            await store.serialize(reloaded)
+            assert state(await store.deserialize()) == state(reloaded)
+
+            # Another address manager replaces the stored one
+            other = make_address_manager()
+            await other.add_to_new_table(make_peers("248", 5, now), PeerInfo("252.8.1.1", 8444))
+            await store.serialize(other)
+            assert state(await store.deserialize()) == state(other)
+            assert await count_rows(connection, "peer_nodes") == len(other.map_info) > 0
+        finally:
+            await connection.close()
+
+    @pytest.mark.asyncio
+    async def test_orphan_positions(self, tmp_path: Path):
+        connection = await aiosqlite.connect(tmp_path / "peers.sqlite")
+        try:
+            store = await AddressManagerStore.create(connection)
+            address_manager = make_address_manager()
+            await address_manager.add_to_new_table(make_peers("250", 20, int(time.time())), None)
+            assert len(address_manager.new_matrix) > 0
+            await store.serialize(address_manager)
+            # Positions of nodes that are not stored, left behind by an interrupted save
+            await connection.executemany(
+                "INSERT INTO peer_new_positions VALUES(?, ?)", [(5 * BUCKET_SIZE + 7, 1000), (9 * BUCKET_SIZE, 1001)]
+            )
+            await connection.execute("INSERT INTO peer_tried_positions VALUES(?, ?)", (3 * BUCKET_SIZE + 1, 1002))
+            await connection.commit()
+
+            reloaded = await store.deserialize()
+            assert state(reloaded) == state(address_manager)
+            assert reloaded.new_matrix.dirty == {5 * BUCKET_SIZE + 7, 9 * BUCKET_SIZE}
+            assert reloaded.tried_matrix.dirty == {3 * BUCKET_SIZE + 1}
+            await store.serialize(reloaded)
+            positions = [position for position, _ in await store.get_positions(False)]
+            assert sorted(positions) == sorted(position for position in address_manager.new_matrix.used)
+            assert await store.get_positions(True) == []
+        finally:
+            await connection.close()
+
+    @pytest.mark.asyncio
+    async def test_migration(self, tmp_path: Path):
+        now = int(time.time())
+        key = 2**256 - 1
+        source = PeerInfo("252.5.1.1", uint16(8444))
+        new_infos = [ExtendedPeerInfo(peer, source) for peer in make_peers("250", 3, now)]
+        tried_info = ExtendedPeerInfo(make_peers("251", 1, now)[0], source)
+        connection = await aiosqlite.connect(tmp_path / "peers.sqlite")
+        try:
+            # The previous format numbers the new table nodes from 0, followed by the tried ones, and stores the
+            # buckets of the new table nodes
+            store = await AddressManagerStore.create(connection)
+            await store.set_metadata([("key", str(key)), ("new_count", "3"), ("tried_count", "1")])
+            await store.set_nodes(list(enumerate(new_infos + [tried_info])))
+            await connection.executemany(
+                "INSERT INTO peer_new_table VALUES(?, ?)",
+                [(node_id, info.get_new_bucket(key)) for node_id, info in enumerate(new_infos)],
+            )
+            await connection.commit()
+
+            address_manager = await store.deserialize()
+            assert address_manager.key == key
+            assert address_manager.new_count == 3
+            assert address_manager.tried_count == 1
+            assert sorted(info.peer_info.host for info in address_manager.map_info.values() if not info.is_tried) == [
+                info.peer_info.host for info in new_infos
+            ]
+            assert [info.peer_info.host for info in address_manager.map_info.values() if info.is_tried] == [
+                tried_info.peer_info.host
+            ]
+
+            # The next save rewrites the database in the current format
+            await store.serialize(address_manager)
+            assert (await store.get_metadata())["version"] == STORE_VERSION
+            assert await store.get_new_table() == []
+            assert state(await store.deserialize()) == state(address_manager)
+        finally:
+            await connection.close()
@@ -0,0 +1,37 @@
+import pytest
+
+from silicoin.protocols.protocol_message_types import ProtocolMessageTypes
+from silicoin.server.message_framing import FramingError, decode_message, encode_message
+from silicoin.server.outbound_message import Message, make_msg
+from silicoin.util.ints import uint8, uint16
+
+
+class TestMessageFraming:
+    def test_encode_matches_streamable(self):
+        no_id = make_msg(ProtocolMessageTypes.new_peak, bytes([1] * 40))
+        with_id = Message(uint8(ProtocolMessageTypes.request_block.value), uint16(513), bytes([2] * 10))
+        empty = Message(uint8(ProtocolMessageTypes.request_peers.value), None, b"")
+        for message in [no_id, with_id, empty]:
+            assert encode_message(message) == bytes(message)
+
+    def test_round_trip(self):
+        for msg_id in [None, uint16(0), uint16(65535)]:
+            message = Message(uint8(ProtocolMessageTypes.new_transaction.value), msg_id, bytes(range(200)))
+            decoded = decode_message(bytes(message))
+            assert decoded == message
+            assert decoded == Message.from_bytes(bytes(message))
+
+    def test_broadcast_encodes_once(self):
+        message = make_msg(ProtocolMessageTypes.new_peak, bytes([1] * 40))
+        assert encode_message(message) is encode_message(message)
+
+    def test_invalid_frames(self):
+        frame = bytes(make_msg(ProtocolMessageTypes.new_peak, bytes([1] * 40)))
+        with pytest.raises(FramingError):
+            decode_message(frame[:-1])
+        with pytest.raises(FramingError):
+            decode_message(frame + b"\x00")
+        with pytest.raises(FramingError):
+            decode_message(frame[:3])
+        with pytest.raises(FramingError):
+            decode_message(frame[:1] + b"\x02" + frame[2:])
@@ -261,3 +261,38 @@ class TestRateLimits:
 
         new_signatures_message = make_msg(ProtocolMessageTypes.respond_signatures, bytes([1]))
         assert not r.process_msg_and_check(new_signatures_message)
+
+    @pytest.mark.asyncio
+    async def test_gradual_refill(self):
+        # Tokens come back gradually, so there is no burst of twice the limit around a period boundary
+        r = RateLimiter(True, 4)
+        new_tx_message = make_msg(ProtocolMessageTypes.new_transaction, bytes([1] * 40))
+        for i in range(4000):
+            assert r.process_msg_and_check(new_tx_message)
+        while r.process_msg_and_check(new_tx_message):
+            pass
+
+        await asyncio.sleep(1)
+        passed = 0
+        for i in range(5000):
+            if r.process_msg_and_check(new_tx_message):
+                passed += 1
+        assert 1000 < passed < 2500
+
+    @pytest.mark.asyncio
+    async def test_metrics(self):
+        r = RateLimiter(incoming=False)
+        new_peers_message = make_msg(ProtocolMessageTypes.respond_peers, bytes([1] * 10))
+        for i in range(15):
+            r.process_msg_and_check(new_peers_message)
+
+        metrics = r.get_metrics()
+        assert metrics["messages"] == 10
+        assert metrics["bytes"] == 100
+        assert metrics["rejected"] == 5
+        peers_metrics = metrics["message_types"]["respond_peers"]
+        assert peers_metrics["messages"] == 10
+        assert peers_metrics["rejected"] == 5
+        assert peers_metrics["count_budget_available"] < 0.01
+        assert 0.98 < metrics["non_tx_count_budget_available"] <= 1
+        assert list(metrics["message_types"].keys()) == ["respond_peers"]
@@ -109,6 +109,10 @@ class TestRpc:
             res = await client_2.get_plots()
             num_plots = len(res["plots"])
             assert num_plots > 0
+            lookup_stats = await client_2.get_lookup_stats()
+            assert {plot["filename"] for plot in lookup_stats["plots"]} <= {plot["filename"] for plot in res["plots"]}
+            for device in lookup_stats["devices"]:
+                assert device["qualities"]["p50"] <= device["qualities"]["max"]
             plot_dir = get_plot_dir() / "subdir"
             plot_dir.mkdir(parents=True, exist_ok=True)
 
@@ -189,6 +193,13 @@ class TestRpc:
 
             await time_out_assert_custom_interval(30, 1, test_get_harvesters)
 
+            # The harvester supports plot deltas, so the farmer's cache tracks its plot list version
+            for host_cache in farmer_api.farmer.harvester_cache.values():
+                for cache_entry in host_cache.values():
+                    assert cache_entry.sync_id == harvester.plot_sync_state.sync_id
+                    assert cache_entry.version == harvester.plot_sync_state.version
+                    assert len(cache_entry.plots) == num_plots
+
             # Reset cache and reset update interval to avoid hitting the rate limit
             farmer_api.farmer.update_harvester_cache_interval = update_interval_before
             farmer_api.farmer.harvester_cache = {}
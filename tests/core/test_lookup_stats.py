@@ -0,0 +1,103 @@
+import asyncio
+import threading
+import time
+from concurrent.futures.thread import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from silicoin.harvester.lookup_stats import LatencyHistogram, LookupStats, PlotLookupParameter, wait_for_lookup
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+class TestLookupStats:
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(50) == 0
+        for _ in range(90):
+            histogram.add(3)
+        for _ in range(9):
+            histogram.add(150)
+        histogram.add(45000)
+        assert histogram.count() == 100
+        assert histogram.percentile(50) == 5
+        assert histogram.percentile(90) == 5
+        assert histogram.percentile(99) == 200
+        assert histogram.percentile(100) == 45000
+        assert histogram.to_json_dict() == {"count": 100, "max": 45000, "p50": 5, "p90": 5, "p99": 200}
+
+    def test_slow_plots(self, tmp_path: Path):
+        stats = LookupStats(PlotLookupParameter(slow_lookup_milliseconds=1000, slow_lookups=2))
+        fast_plot = tmp_path / "fast.plot"
+        slow_plot = tmp_path / "slow.plot"
+        for _ in range(3):
+            stats.add_qualities(fast_plot, 0.01)
+        stats.add_qualities(slow_plot, 2)
+        assert not stats.is_slow(slow_plot)
+        stats.add_qualities(slow_plot, 2)
+        assert stats.is_slow(slow_plot)
+        assert not stats.is_slow(fast_plot)
+        stats.add_full_proof(slow_plot, 4)
+        stats.add_timeout(slow_plot)
+
+        result = stats.to_json_dict()
+        assert len(result["devices"]) == 1
+        device = result["devices"][0]
+        assert device["directories"] == [str(tmp_path)]
+        assert device["qualities"]["count"] == 5
+        assert device["full_proof"]["count"] == 1
+        plots = {plot["filename"]: plot for plot in result["plots"]}
+        assert plots[str(slow_plot)]["slow"]
+        assert plots[str(slow_plot)]["timeouts"] == 1
+        assert plots[str(slow_plot)]["full_proof"]["max"] == 4000
+
+        # A fast lookup clears the flag
+        stats.add_qualities(slow_plot, 0.5)
+        assert not stats.is_slow(slow_plot)
+
+        stats.retain({fast_plot})
+        assert [plot["filename"] for plot in stats.to_json_dict()["plots"]] == [str(fast_plot)]
+
+    @pytest.mark.asyncio
+    async def test_lookup_timeout(self, tmp_path: Path):
+        stats = LookupStats(PlotLookupParameter(slow_lookup_milliseconds=1000, slow_lookups=1))
+        plot = tmp_path / "slow.plot"
+        stats.add_qualities(plot, 2)
+        assert stats.is_slow(plot)
+        loop = asyncio.get_running_loop()
+
+        def blocking_lookup(started: asyncio.Event, seconds: float):
+            loop.call_soon_threadsafe(started.set)
+            time.sleep(seconds)
+            stats.add_qualities(plot, seconds)
+            return seconds
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # The time queued behind the other lookups doesn't count
+            gate = threading.Event()
+            blocker = loop.run_in_executor(executor, gate.wait)
+            started = asyncio.Event()
+            lookup = loop.run_in_executor(executor, blocking_lookup, started, 0.2)
+            waiting = asyncio.create_task(wait_for_lookup(lookup, started, 0.05))
+            await asyncio.sleep(0.2)
+            assert not waiting.done()
+            gate.set()
+            await blocker
+            with pytest.raises(asyncio.TimeoutError):
+                await waiting
+
+            # The lookup still finishes and its latency gets recorded
+            assert not lookup.cancelled()
+            assert await lookup == 0.2
+            assert stats.to_json_dict()["plots"][0]["qualities"]["count"] == 2
+
+            # A fast lookup clears the flag
+            started = asyncio.Event()
+            lookup = loop.run_in_executor(executor, blocking_lookup, started, 0.01)
+            assert await wait_for_lookup(lookup, started, 1) == 0.01
+            assert not stats.is_slow(plot)
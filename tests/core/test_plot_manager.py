@@ -0,0 +1,391 @@
+import asyncio
+import time
+from pathlib import Path
+from shutil import copy, move
+from types import SimpleNamespace
+from typing import List, Set, Tuple
+
+import pytest
+from blspy import AugSchemeMPL
+
+from silicoin.plotting import manager
+from silicoin.plotting.manager import CACHE_HEADER, CACHE_VERSION, Cache, CacheEntry, DiskCache, PlotManager
+from silicoin.plotting.util import PlotRefreshEvents, PlotRefreshResult, PlotsRefreshParameter
+from silicoin.plotting.watcher import PlotDirectoryWatcher, read_mounts, reports_events
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.util.ints import uint16
+from tests.block_tools import get_plot_dir
+from tests.setup_nodes import bt
+from tests.time_out_assert import time_out_assert
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+def make_cache_entry(seed: int) -> CacheEntry:
+    public_key = AugSchemeMPL.key_gen(bytes([seed]) * 32).get_g1()
+    if seed % 2 == 0:
+        return CacheEntry(public_key, None, public_key, public_key)
+    return CacheEntry(None, bytes32([seed] * 32), public_key, public_key)
+
+
+def load_cache(path: Path) -> Cache:
+    cache = Cache(path)
+    cache.load()
+    return cache
+
+
+async def wait_for_changes(watcher: PlotDirectoryWatcher, changed_count: int, removed_count: int):
+    changed: Set[Path] = set()
+    removed: Set[Path] = set()
+
+    def collect() -> Tuple[int, int]:
+        new_changed, new_removed = watcher.get_changes(0)
+        changed.difference_update(new_removed)
+        changed.update(new_changed)
+        removed.difference_update(new_changed)
+        removed.update(new_removed)
+        return len(changed), len(removed)
+
+    await time_out_assert(10, collect, (changed_count, removed_count))
+    return changed, removed
+
+
+class TestPlotManager:
+    @pytest.mark.asyncio
+    async def test_watched_refresh(self, tmp_path: Path):
+        plot_dir = tmp_path / "plots"
+        plot_dir.mkdir()
+        late_dir = tmp_path / "late"
+        unwatched_dir = tmp_path / "unwatched"
+        unwatched_dir.mkdir()
+        source_plots = sorted(get_plot_dir().glob("*.plot"))[:2]
+        assert len(source_plots) == 2
+        results: List[Tuple[PlotRefreshEvents, PlotRefreshResult]] = []
+
+        def refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshResult):
+            results.append((event, refresh_result))
+
+        plot_manager = PlotManager(tmp_path / "root", refresh_callback=refresh_callback)
+        plot_manager.set_public_keys(bt.farmer_pubkeys, bt.pool_pubkeys)
+        # Refresh from the test instead of the refresh thread
+        plot_manager._refreshing_enabled = True
+        watcher = PlotDirectoryWatcher()
+
+        def refresh(changed: Set[Path], removed: Set[Path]) -> PlotRefreshResult:
+            results.clear()
+            plot_manager._refresh_plots(sorted(changed), watcher.directories(), lambda path: path in removed)
+            assert results[-1][0] == PlotRefreshEvents.done
+            return results[-1][1]
+
+        try:
+            # A directory which doesn't exist yet can't be watched, the next watch tries it again
+            watcher.watch({plot_dir, late_dir})
+            observer = watcher._observer
+            assert watcher.directories() == {plot_dir}
+            assert watcher.polled_directories() == {late_dir}
+            late_dir.mkdir()
+            watcher.watch({plot_dir, late_dir})
+            assert watcher._observer is observer
+            assert watcher.directories() == {plot_dir, late_dir}
+            assert watcher.polled_directories() == set()
+
+            # New plot files
+            plot_a = plot_dir / source_plots[0].name
+            plot_b = late_dir / source_plots[1].name
+            copy(source_plots[0], plot_a)
+            copy(source_plots[1], plot_b)
+            (plot_dir / "notes.txt").write_text("not a plot")
+            changed, removed = await wait_for_changes(watcher, 2, 0)
+            assert changed == {plot_a, plot_b}
+            result = refresh(changed, removed)
+            assert (result.loaded, result.removed, result.processed) == (2, 0, 2)
+            assert set(plot_manager.plots.keys()) == {plot_a, plot_b}
+            assert plot_manager.index.loaded_before(plot_a)
+            assert plot_manager.index.loaded_before(plot_b)
+
+            # A plot file moved within the watched directories
+            moved_a = plot_dir / f"moved-{plot_a.name}"
+            move(plot_a, moved_a)
+            changed, removed = await wait_for_changes(watcher, 1, 1)
+            assert (changed, removed) == ({moved_a}, {plot_a})
+            result = refresh(changed, removed)
+            assert (result.loaded, result.removed) == (1, 1)
+            assert set(plot_manager.plots.keys()) == {moved_a, plot_b}
+            assert not plot_manager.index.loaded_before(plot_a)
+            assert plot_manager.index.loaded_before(moved_a)
+
+            # A removed plot file, and one moved out of the watched directories
+            plot_b.unlink()
+            move(moved_a, unwatched_dir / moved_a.name)
+            changed, removed = await wait_for_changes(watcher, 0, 2)
+            assert removed == {moved_a, plot_b}
+            result = refresh(changed, removed)
+            assert (result.loaded, result.removed) == (0, 2)
+            assert len(plot_manager.plots) == 0
+            assert len(plot_manager.index) == 0
+
+            # Removing a plot directory stops watching it, without a new observer
+            watcher.watch({plot_dir})
+            assert watcher._observer is observer
+            assert watcher.directories() == {plot_dir}
+            copy(source_plots[1], late_dir / source_plots[1].name)
+            copy(source_plots[1], plot_dir / source_plots[1].name)
+            changed, removed = await wait_for_changes(watcher, 1, 0)
+            assert changed == {plot_dir / source_plots[1].name}
+        finally:
+            watcher.stop()
+            plot_manager._refreshing_enabled = False
+
+    def test_filesystem_events(self, tmp_path: Path, monkeypatch):
+        mounts_path = tmp_path / "mounts"
+        mounts_path.write_text(
+            "/dev/sda1 / ext4 rw 0 0\n"
+            "server:/export /mnt/nfs nfs4 rw 0 0\n"
+            "/dev/sdb1 /mnt/nfs/local ext4 rw 0 0\n"
+            "remote: /mnt/remote\\040plots fuse.sshfs rw 0 0\n"
+            "/dev/sdc1 /mnt/ntfs fuseblk rw 0 0\n"
+        )
+        monkeypatch.setattr("silicoin.plotting.watcher.MOUNTS_PATH", mounts_path)
+        mounts = read_mounts()
+        assert len(mounts) == 5
+        assert (Path("/mnt/remote plots"), "fuse.sshfs") in mounts
+        assert reports_events(Path("/mnt/disk-1/plots"), mounts)
+        assert reports_events(Path("/mnt/ntfs/plots"), mounts)
+        assert reports_events(Path("/mnt/nfs/local"), mounts)
+        assert not reports_events(Path("/mnt/nfs"), mounts)
+        assert not reports_events(Path("/mnt/nfs/plots"), mounts)
+        assert not reports_events(Path("/mnt/remote plots/plots"), mounts)
+        # Unknown without a mount table
+        monkeypatch.setattr("silicoin.plotting.watcher.MOUNTS_PATH", tmp_path / "missing")
+        assert read_mounts() == []
+        assert reports_events(Path("/mnt/nfs/plots"), [])
+
+    def test_poll_directories(self, tmp_path: Path):
+        polled_dir = tmp_path / "polled"
+        watched_dir = tmp_path / "watched"
+        for directory in [polled_dir, watched_dir]:
+            directory.mkdir()
+            # Not valid plots, they fail to open but count as processed
+            for i in range(2):
+                (directory / f"plot-{i}.plot").write_bytes(b"\x00" * 100)
+        results: List[Tuple[PlotRefreshEvents, PlotRefreshResult]] = []
+
+        def refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshResult):
+            results.append((event, refresh_result))
+
+        refresh_parameter = PlotsRefreshParameter(interval_seconds=120, watched_interval_seconds=1800)
+        plot_manager = PlotManager(tmp_path / "root", refresh_callback, refresh_parameter=refresh_parameter)
+        plot_manager._refreshing_enabled = True
+        assert not plot_manager.needs_poll()
+
+        # Only the polled directories are listed in between the full refreshes
+        plot_manager.watcher = SimpleNamespace(polled_directories=lambda: {polled_dir})
+        plot_manager.last_refresh_time = time.time() - 60
+        assert not plot_manager.needs_poll()
+        plot_manager.last_refresh_time = time.time() - 600
+        assert plot_manager.needs_poll()
+        assert not plot_manager.needs_refresh()
+        plot_manager.plot_filename_paths = {
+            "gone.plot": (str(polled_dir), set()),
+            "kept.plot": (str(watched_dir), set()),
+        }
+        plot_manager._poll_directories({polled_dir})
+        assert results[-1][0] == PlotRefreshEvents.done
+        assert (results[-1][1].processed, results[-1][1].removed) == (2, 1)
+        assert set(plot_manager.failed_to_open_filenames.keys()) == set(polled_dir.glob("*.plot"))
+        assert plot_manager.plot_filename_paths.keys() == {"kept.plot"}
+        assert not plot_manager.needs_poll()
+
+        # Nothing to poll
+        plot_manager.watcher = SimpleNamespace(polled_directories=lambda: set())
+        plot_manager.last_poll_time = 0
+        assert not plot_manager.needs_poll()
+        plot_manager._refreshing_enabled = False
+
+    def test_cache(self, tmp_path: Path, monkeypatch):
+        path = tmp_path / "cache" / "plot_manager.dat"
+        entries = {bytes32([i] * 32): make_cache_entry(i) for i in range(6)}
+        plot_ids = list(entries.keys())
+        cache = load_cache(path)
+        assert len(cache) == 0
+        for plot_id in plot_ids[:4]:
+            cache.update(plot_id, entries[plot_id])
+        assert cache.changed()
+        cache.save()
+        assert not cache.changed()
+        assert path.read_bytes()[: CACHE_HEADER.size] == CACHE_HEADER.pack(CACHE_VERSION)
+
+        # Saving appends the changes
+        saved = path.read_bytes()
+        cache.update(plot_ids[4], entries[plot_ids[4]])
+        cache.remove([plot_ids[0], bytes32([100] * 32)])
+        cache.save()
+        assert path.read_bytes()[: len(saved)] == saved
+        assert len(path.read_bytes()) > len(saved)
+        cache.update(plot_ids[5], entries[plot_ids[5]])
+        cache.remove([plot_ids[5]])
+        cache.save()
+
+        reloaded = load_cache(path)
+        assert set(reloaded.keys()) == set(plot_ids[1:5])
+        assert reloaded.items() == [(plot_id, entries[plot_id]) for plot_id in plot_ids[1:5]]
+        assert reloaded.get(plot_ids[0]) is None
+        # A reloaded cache keeps appending
+        saved = path.read_bytes()
+        reloaded.update(plot_ids[0], entries[plot_ids[0]])
+        reloaded.save()
+        assert path.read_bytes()[: len(saved)] == saved
+        assert set(load_cache(path).keys()) == set(plot_ids[:5])
+
+        # The file gets compacted once most of its records are outdated
+        for _ in range(10):
+            reloaded.update(plot_ids[1], entries[plot_ids[1]])
+            reloaded.save()
+        assert reloaded._compaction_thread is None
+        monkeypatch.setattr(manager, "CACHE_COMPACTION_MIN_RECORDS", 0)
+        reloaded.update(plot_ids[1], entries[plot_ids[1]])
+        reloaded.save()
+        assert reloaded._compaction_thread is not None
+        reloaded._compaction_thread.join()
+        compacted = load_cache(path)
+        assert compacted._records == 5
+        assert set(compacted.keys()) == set(plot_ids[:5])
+        assert compacted.items() == reloaded.items()
+
+    def test_cache_damaged(self, tmp_path: Path):
+        path = tmp_path / "cache" / "plot_manager.dat"
+        entries = {bytes32([i] * 32): make_cache_entry(i) for i in range(3)}
+        cache = load_cache(path)
+        for plot_id, entry in entries.items():
+            cache.update(plot_id, entry)
+        cache.save()
+        saved = path.read_bytes()
+
+        # A truncated last record is dropped, and the next save rewrites the file
+        path.write_bytes(saved[:-5])
+        truncated = load_cache(path)
+        assert set(truncated.keys()) == set(list(entries.keys())[:2])
+        truncated.update(*list(entries.items())[2])
+        truncated.save()
+        assert path.read_bytes() == saved
+
+        # A file which is not a cache is dropped
+        path.write_bytes(b"\xff" * 100)
+        assert len(load_cache(path)) == 0
+        path.write_bytes(b"\x00")
+        assert len(load_cache(path)) == 0
+
+    def test_cache_migration(self, tmp_path: Path):
+        path = tmp_path / "cache" / "plot_manager.dat"
+        entries = [(bytes32([i] * 32), make_cache_entry(i)) for i in range(3)]
+        path.parent.mkdir()
+        path.write_bytes(bytes(DiskCache(uint16(0), entries)))
+        cache = load_cache(path)
+        assert cache.items() == entries
+        # The next save rewrites the file in the current format
+        assert cache.changed()
+        cache.save()
+        assert path.read_bytes()[: CACHE_HEADER.size] == CACHE_HEADER.pack(CACHE_VERSION)
+        assert load_cache(path).items() == entries
+
+    def test_next_batch_size(self, tmp_path: Path):
+        refresh_parameter = PlotsRefreshParameter(batch_size=300, batch_target_seconds=5)
+        plot_manager = PlotManager(
+            tmp_path, refresh_callback=lambda event, result: None, refresh_parameter=refresh_parameter
+        )
+        # Nothing to measure
+        assert plot_manager.next_batch_size(PlotRefreshResult()) == 300
+        assert plot_manager.next_batch_size(PlotRefreshResult(processed=10)) == 300
+        # A fast batch is capped at batch_size
+        assert plot_manager.next_batch_size(PlotRefreshResult(processed=300, duration=0.1)) == 300
+        # A slow batch shrinks the next one to about batch_target_seconds
+        assert plot_manager.next_batch_size(PlotRefreshResult(processed=100, duration=10)) == 50
+        assert plot_manager.next_batch_size(PlotRefreshResult(processed=10, duration=10)) == 5
+        # But never to 0
+        assert plot_manager.next_batch_size(PlotRefreshResult(processed=1, duration=100)) == 1
+
+    def test_refresh_devices(self, tmp_path: Path):
+        directories = [tmp_path / "plots-1", tmp_path / "plots-2"]
+        plot_paths: List[Path] = []
+        for directory in directories:
+            directory.mkdir()
+            for i in range(2):
+                # Not valid plots, they fail to open but count as processed
+                plot_path = directory / f"plot-{i}.plot"
+                plot_path.write_bytes(b"\x00" * 100)
+                plot_paths.append(plot_path)
+        missing_path = tmp_path / "missing" / "plot-0.plot"
+        device = tmp_path.stat().st_dev
+        results: List[Tuple[PlotRefreshEvents, PlotRefreshResult]] = []
+
+        def refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshResult):
+            results.append((event, refresh_result))
+
+        refresh_parameter = PlotsRefreshParameter(batch_size=3, batch_sleep_milliseconds=0)
+        plot_manager = PlotManager(tmp_path / "root", refresh_callback, refresh_parameter=refresh_parameter)
+        # Refresh from the test instead of the refresh thread
+        plot_manager._refreshing_enabled = True
+
+        batch_result = plot_manager.refresh_batch(plot_paths + [missing_path], set(directories))
+        assert batch_result.processed == 5
+        assert batch_result.devices.keys() == {device, -1}
+        assert batch_result.devices[device].directories == {str(directory) for directory in directories}
+        assert batch_result.devices[device].processed == 4
+        assert batch_result.devices[device].loaded == 0
+        assert batch_result.devices[-1].directories == {str(missing_path.parent)}
+        assert batch_result.devices[-1].processed == 1
+        assert set(plot_manager.failed_to_open_filenames.keys()) == set(plot_paths)
+
+        # The totals add up the devices of all the batches
+        plot_manager.failed_to_open_filenames = {}
+        plot_manager._refresh_plots(plot_paths, set(directories), lambda path: False)
+        assert [event for event, _ in results] == [
+            PlotRefreshEvents.started,
+            PlotRefreshEvents.batch_processed,
+            PlotRefreshEvents.batch_processed,
+            PlotRefreshEvents.done,
+        ]
+        total_result = results[-1][1]
+        assert total_result.processed == 4
+        assert total_result.devices.keys() == {device}
+        assert total_result.devices[device].directories == {str(directory) for directory in directories}
+        assert total_result.devices[device].processed == 4
+        assert total_result.devices[device].files_per_second() > 0
+        plot_manager._refreshing_enabled = False
+
+    def test_interleave_devices(self, tmp_path: Path, monkeypatch):
+        # Two directories on the first device and one on the second
+        directories = [tmp_path / "plots-1", tmp_path / "plots-2", tmp_path / "plots-3"]
+        devices = {directories[0]: 1, directories[1]: 1, directories[2]: 2}
+        monkeypatch.setattr(manager, "directory_device", lambda directory: devices[directory])
+        plot_paths: List[Path] = []
+        for directory, count in zip(directories, [2, 1, 3]):
+            directory.mkdir()
+            for i in range(count):
+                plot_path = directory / f"plot-{i}.plot"
+                plot_path.write_bytes(b"\x00" * 100)
+                plot_paths.append(plot_path)
+        a0, a1, b0, c0, c1, c2 = plot_paths
+        assert manager.interleave_devices(plot_paths) == [a0, c0, a1, c1, b0, c2]
+        assert manager.interleave_devices([]) == []
+
+        # Every batch keeps both devices busy
+        results: List[Tuple[PlotRefreshEvents, PlotRefreshResult]] = []
+
+        def refresh_callback(event: PlotRefreshEvents, refresh_result: PlotRefreshResult):
+            results.append((event, refresh_result))
+
+        refresh_parameter = PlotsRefreshParameter(batch_size=2, batch_sleep_milliseconds=0)
+        plot_manager = PlotManager(tmp_path / "root", refresh_callback, refresh_parameter=refresh_parameter)
+        plot_manager._refreshing_enabled = True
+        plot_manager._refresh_plots(manager.interleave_devices(plot_paths), set(directories), lambda path: False)
+        batch_results = [result for event, result in results if event == PlotRefreshEvents.batch_processed]
+        assert len(batch_results) == 3
+        for batch_result in batch_results:
+            assert batch_result.devices.keys() == {1, 2}
+            assert all(device_result.processed == 1 for device_result in batch_result.devices.values())
+        plot_manager._refreshing_enabled = False
@@ -0,0 +1,113 @@
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+from blspy import AugSchemeMPL
+
+from silicoin.harvester import plot_sync
+from silicoin.harvester.plot_sync import PlotSyncState
+from silicoin.plotting.util import PlotInfo
+from silicoin.protocols.harvester_protocol import RespondPlotsDelta
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.util.ints import uint8, uint64
+
+
+def make_plot_info(seed: int) -> PlotInfo:
+    public_key = AugSchemeMPL.key_gen(bytes([seed]) * 32).get_g1()
+    prover = SimpleNamespace(get_size=lambda: uint8(32), get_id=lambda: bytes32(bytes([seed]) * 32))
+    return PlotInfo(prover, public_key, None, public_key, 100 + seed, 1000 + seed, public_key)
+
+
+def filenames(delta: RespondPlotsDelta) -> List[str]:
+    return sorted(plot.filename for plot in delta.plots)
+
+
+class TestPlotSyncState:
+    def test_added(self, tmp_path: Path):
+        state = PlotSyncState()
+        plots: Dict[Path, PlotInfo] = {}
+        assert not state.update(plots)
+        assert state.version == 0
+
+        plots[tmp_path / "a.plot"] = make_plot_info(1)
+        plots[tmp_path / "b.plot"] = make_plot_info(2)
+        assert state.update(plots)
+        assert state.version == 1
+        delta = state.delta(state.sync_id, 0, [], [])
+        assert not delta.full_sync
+        assert delta.version == 1
+        assert filenames(delta) == [str(tmp_path / "a.plot"), str(tmp_path / "b.plot")]
+        assert delta.removed_filenames == []
+        plot = next(plot for plot in delta.plots if plot.filename == str(tmp_path / "b.plot"))
+        assert (plot.size, plot.file_size, plot.time_modified) == (32, 102, 1002)
+
+        # The same PlotInfo objects are no change
+        assert not state.update(dict(plots))
+        assert state.version == 1
+        delta = state.delta(state.sync_id, 1, [], [])
+        assert (delta.full_sync, delta.plots, delta.removed_filenames) == (False, [], [])
+
+        # Only the plots added or changed after the requested version are sent
+        plots[tmp_path / "c.plot"] = make_plot_info(3)
+        assert state.update(plots)
+        plots[tmp_path / "a.plot"] = make_plot_info(1)
+        assert state.update(plots)
+        assert state.version == 3
+        assert filenames(state.delta(state.sync_id, 1, [], [])) == [str(tmp_path / "a.plot"), str(tmp_path / "c.plot")]
+        assert filenames(state.delta(state.sync_id, 2, [], [])) == [str(tmp_path / "a.plot")]
+
+    def test_removed(self, tmp_path: Path, monkeypatch):
+        state = PlotSyncState()
+        plots: Dict[Path, PlotInfo] = {tmp_path / f"{i}.plot": make_plot_info(i) for i in range(4)}
+        state.update(plots)
+
+        del plots[tmp_path / "0.plot"]
+        assert state.update(plots)
+        assert state.version == 2
+        delta = state.delta(state.sync_id, 1, [], [])
+        assert (delta.full_sync, delta.plots) == (False, [])
+        assert delta.removed_filenames == [str(tmp_path / "0.plot")]
+        # A farmer which never saw the plot gets the removal as well, it ignores unknown filenames
+        assert state.delta(state.sync_id, 0, [], []).removed_filenames == [str(tmp_path / "0.plot")]
+        assert state.delta(state.sync_id, 2, [], []).removed_filenames == []
+
+        # A plot added back is not removed anymore
+        plots[tmp_path / "0.plot"] = make_plot_info(0)
+        assert state.update(plots)
+        delta = state.delta(state.sync_id, 1, [], [])
+        assert filenames(delta) == [str(tmp_path / "0.plot")]
+        assert delta.removed_filenames == []
+
+        # Only the most recent removals are kept, older versions get a full sync
+        monkeypatch.setattr(plot_sync, "MAX_REMOVED_ENTRIES", 2)
+        removal_versions: List[int] = []
+        for i in range(3):
+            del plots[tmp_path / f"{i}.plot"]
+            assert state.update(plots)
+            removal_versions.append(state.version)
+        assert len(state.removed) == 2
+        assert state.oldest_delta_version == removal_versions[0]
+        assert state.delta(state.sync_id, removal_versions[0] - 1, [], []).full_sync
+        delta = state.delta(state.sync_id, removal_versions[0], [], [])
+        assert not delta.full_sync
+        assert delta.removed_filenames == [str(tmp_path / "1.plot"), str(tmp_path / "2.plot")]
+
+    def test_resync(self, tmp_path: Path):
+        state = PlotSyncState()
+        plots: Dict[Path, PlotInfo] = {tmp_path / f"{i}.plot": make_plot_info(i) for i in range(3)}
+        state.update(plots)
+        del plots[tmp_path / "0.plot"]
+        state.update(plots)
+
+        # Another sync_id, from before a restart, gets the complete list without removals
+        restarted = PlotSyncState()
+        assert restarted.sync_id != state.sync_id
+        for sync_id, since_version in [(restarted.sync_id, 1), (state.sync_id, state.version + 1)]:
+            delta = state.delta(sync_id, since_version, ["failed.plot"], ["no_key.plot"])
+            assert delta.full_sync
+            assert delta.sync_id == state.sync_id
+            assert delta.version == uint64(state.version)
+            assert filenames(delta) == [str(tmp_path / "1.plot"), str(tmp_path / "2.plot")]
+            assert delta.removed_filenames == []
+            assert delta.failed_to_open_filenames == ["failed.plot"]
+            assert delta.no_key_filenames == ["no_key.plot"]
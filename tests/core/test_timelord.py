@@ -0,0 +1,177 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from silicoin.consensus.default_constants import DEFAULT_CONSTANTS
+from silicoin.timelord import timelord, timelord_api
+from silicoin.timelord.timelord import BROADCAST_DELAY_SAMPLES, Timelord, parse_vdf_output
+from silicoin.timelord.timelord_api import TimelordAPI
+from silicoin.timelord.types import Chain, IterationType
+from silicoin.util.ints import uint64
+
+CHAINS = [Chain.CHALLENGE_CHAIN, Chain.REWARD_CHAIN, Chain.INFUSED_CHALLENGE_CHAIN]
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+def make_timelord() -> Timelord:
+    tl = Timelord(None, {"vdf_clients": {"ip": []}, "sanitizer_mode": False}, DEFAULT_CONSTANTS)
+    # Set up by `_start`
+    tl.lock = asyncio.Lock()
+    tl.wakeup_event = asyncio.Event()
+    return tl
+
+
+def vdf_output(iterations: int, y_bytes: bytes, witness_type: int, witness: bytes) -> bytes:
+    return (
+        iterations.to_bytes(8, "big", signed=True)
+        + len(y_bytes).to_bytes(8, "big", signed=True)
+        + y_bytes
+        + witness_type.to_bytes(1, "big", signed=True)
+        + witness
+    )
+
+
+class TestTimelord:
+    def test_parse_vdf_output(self):
+        y_bytes = bytes(range(100))
+        witness = bytes(range(200, 250))
+        assert parse_vdf_output(vdf_output(12345, y_bytes, 2, witness)) == (12345, y_bytes, 2, witness)
+        assert parse_vdf_output(vdf_output(1, b"\x01", 0, b"")) == (1, b"\x01", 0, b"")
+
+        # Short outputs
+        data = vdf_output(12345, y_bytes, 2, witness)
+        for length in [0, 8, 16, 16 + len(y_bytes)]:
+            with pytest.raises(ValueError):
+                parse_vdf_output(data[:length])
+
+        # Malformed outputs
+        for data in [
+            vdf_output(-1, y_bytes, 2, witness),
+            vdf_output(12345, y_bytes, 2, witness)[:8] + (-5).to_bytes(8, "big", signed=True) + b"\x00" * 20,
+            vdf_output(12345, y_bytes, 2, witness)[:8] + (1000).to_bytes(8, "big", signed=True) + y_bytes,
+            vdf_output(12345, y_bytes, -1, witness),
+        ]:
+            with pytest.raises(ValueError):
+                parse_vdf_output(data)
+
+    def test_broadcast_delays(self, monkeypatch):
+        tl = make_timelord()
+        now = 100.0
+        monkeypatch.setattr(timelord.time, "monotonic", lambda: now)
+        assert tl.get_broadcast_delays() == {}
+
+        # Iterations without a finished proof are not counted
+        tl._record_broadcast_delay(uint64(10), IterationType.SIGNAGE_POINT)
+        assert tl.get_broadcast_delays() == {}
+
+        tl.proof_finished_time[uint64(10)] = now - 0.1
+        tl.proof_finished_time[uint64(20)] = now - 0.3
+        tl.proof_finished_time[uint64(30)] = now - 2
+        tl._record_broadcast_delay(uint64(10), IterationType.SIGNAGE_POINT)
+        tl._record_broadcast_delay(uint64(20), IterationType.SIGNAGE_POINT)
+        tl._record_broadcast_delay(uint64(30), IterationType.END_OF_SUBSLOT)
+        assert tl.proof_finished_time == {}
+        delays = tl.get_broadcast_delays()
+        assert delays.keys() == {"SIGNAGE_POINT", "END_OF_SUBSLOT"}
+        assert delays["SIGNAGE_POINT"] == pytest.approx((0.2, 0.3))
+        assert delays["END_OF_SUBSLOT"] == pytest.approx((2, 2))
+
+        # Each iteration is counted once
+        tl._record_broadcast_delay(uint64(30), IterationType.END_OF_SUBSLOT)
+        assert len(tl.broadcast_delays[IterationType.END_OF_SUBSLOT]) == 1
+
+        # Only the recent broadcasts are kept
+        for iteration in range(BROADCAST_DELAY_SAMPLES):
+            tl.proof_finished_time[uint64(1000 + iteration)] = now - 1
+            tl._record_broadcast_delay(uint64(1000 + iteration), IterationType.SIGNAGE_POINT)
+        assert len(tl.broadcast_delays[IterationType.SIGNAGE_POINT]) == BROADCAST_DELAY_SAMPLES
+        assert tl.get_broadcast_delays()["SIGNAGE_POINT"] == pytest.approx((1, 1))
+
+    @pytest.mark.asyncio
+    async def test_wake_up(self, monkeypatch):
+        monkeypatch.setattr(timelord, "SCHEDULER_TIMEOUT", 0.5)
+        tl = make_timelord()
+        api = TimelordAPI(tl)
+        tl.last_state = SimpleNamespace(
+            peak=None,
+            get_weight=lambda: 5,
+            get_sub_slot_iters=lambda: uint64(1000),
+            get_difficulty=lambda: uint64(1),
+            get_last_ip=lambda: uint64(0),
+            get_deficit=lambda: DEFAULT_CONSTANTS.MIN_BLOCKS_PER_CHALLENGE_BLOCK,
+        )
+        tl.iters_to_submit = {chain: [] for chain in CHAINS}
+
+        # Without anything new the scheduler sleeps until the timeout
+        waiting = asyncio.create_task(tl._wait_for_wakeup())
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        await asyncio.wait_for(waiting, 1)
+
+        # A new peak wakes it right away
+        waiting = asyncio.create_task(tl._wait_for_wakeup())
+        await asyncio.sleep(0)
+        new_peak = SimpleNamespace(reward_chain_block=SimpleNamespace(weight=10, height=3))
+        await api.new_peak_timelord(new_peak)
+        await asyncio.wait_for(waiting, 0.1)
+        assert tl.new_peak is new_peak
+        assert not tl.wakeup_event.is_set()
+
+        # And so do new iterations to submit
+        monkeypatch.setattr(timelord_api, "iters_from_block", lambda *args: (uint64(100), uint64(200)))
+        monkeypatch.setattr(tl, "_can_infuse_unfinished_block", lambda block: uint64(200))
+        waiting = asyncio.create_task(tl._wait_for_wakeup())
+        await asyncio.sleep(0)
+        await api.new_unfinished_block_timelord(SimpleNamespace(reward_chain_block=None, difficulty_coeff="1"))
+        await asyncio.wait_for(waiting, 0.1)
+        assert tl.iters_to_submit[Chain.REWARD_CHAIN] == [200]
+        assert tl.iters_to_submit[Chain.CHALLENGE_CHAIN] == [200]
+
+        # A wake up before the scheduler waits is not lost
+        tl.wake_up()
+        await asyncio.wait_for(tl._wait_for_wakeup(), 0.1)
+
+    @pytest.mark.asyncio
+    async def test_pending_iters(self):
+        tl = make_timelord()
+        written = []
+
+        async def drain():
+            pass
+
+        writer = SimpleNamespace(write=written.append, drain=drain)
+        tl.allows_iters = [Chain.REWARD_CHAIN]
+        tl.chain_type_to_stream[Chain.REWARD_CHAIN] = ("127.0.0.1", None, writer)
+        for chain in CHAINS:
+            tl.iters_to_submit[chain] = []
+            tl.iters_submitted[chain] = []
+            tl.pending_iters[chain] = []
+        tl.iters_to_submit[Chain.REWARD_CHAIN] = [uint64(300), uint64(100), uint64(200)]
+        tl.iters_to_submit[Chain.CHALLENGE_CHAIN] = [uint64(100)]
+
+        # Only the chains with a vdf_client get their iterations, lowest first
+        await tl._submit_iterations()
+        assert written == [b"03100", b"03200", b"03300"]
+        assert tl._next_pending_iteration(Chain.REWARD_CHAIN) == 100
+        assert tl._next_pending_iteration(Chain.CHALLENGE_CHAIN) is None
+
+        # The finished iterations are skipped, in any order
+        tl.iters_finished.add(uint64(100))
+        assert tl._next_pending_iteration(Chain.REWARD_CHAIN) == 200
+        tl.iters_finished.add(uint64(300))
+        assert tl._next_pending_iteration(Chain.REWARD_CHAIN) == 200
+
+        # Submitted iterations are not submitted again
+        tl.iters_to_submit[Chain.REWARD_CHAIN].append(uint64(150))
+        await tl._submit_iterations()
+        assert written[3:] == [b"03150"]
+        assert tl._next_pending_iteration(Chain.REWARD_CHAIN) == 150
+        tl.iters_finished.update([uint64(150), uint64(200)])
+        assert tl._next_pending_iteration(Chain.REWARD_CHAIN) is None
+        assert tl.pending_iters[Chain.REWARD_CHAIN] == []
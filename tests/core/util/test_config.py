@@ -1,10 +1,18 @@
 import asyncio
 import copy
+import os
 import pytest
 import random
 import yaml
 
-from silicoin.util.config import create_default_silicoin_config, initial_config_file, load_config, save_config
+from silicoin.util.config import (
+    create_default_silicoin_config,
+    initial_config_file,
+    load_config,
+    load_config_view,
+    save_config,
+    update_config,
+)
 from silicoin.util.path import mkdir
 from multiprocessing import Pool
 from pathlib import Path
@@ -191,6 +199,64 @@ class TestConfig:
         loaded: Dict = load_config(root_path=root_path, filename="config.yaml")
         assert loaded["harvester"]["farmer_peer"]["host"] == "oldmacdonald.eie.io"
 
+    def test_load_config_cached(self, root_path_populated_with_config, default_config_dict, monkeypatch):
+        """
+        The config is parsed once, and again only after the file changed. load_config returns copies
+        that can be modified, and load_config_view a read-only view.
+        """
+        root_path: Path = root_path_populated_with_config
+        config: Dict = load_config(root_path=root_path, filename="config.yaml")
+        view = load_config_view(root_path=root_path, filename="config.yaml")
+        assert config == default_config_dict
+        assert view["harvester"]["farmer_peer"]["host"] == default_config_dict["harvester"]["farmer_peer"]["host"]
+        assert view["harvester"]["plot_directories"] == tuple(default_config_dict["harvester"]["plot_directories"])
+        assert load_config_view(root_path=root_path, filename="config.yaml") is view
+        with pytest.raises(TypeError):
+            view["harvester"]["farmer_peer"]["host"] = "oldmacdonald.eie.io"
+
+        # When: modifying a loaded config without saving it
+        config["harvester"]["farmer_peer"]["host"] = "oldmacdonald.eie.io"
+        # Expect: the cached config is unchanged
+        assert load_config(root_path=root_path, filename="config.yaml") == default_config_dict
+
+        # When: the file is written by another process
+        config_file_path: Path = root_path / "config" / "config.yaml"
+        with open(config_file_path, "w") as f:
+            yaml.safe_dump(config, f)
+        # Expect: the config is parsed again
+        harvester_view = load_config_view(root_path=root_path, filename="config.yaml", sub_config="harvester")
+        assert harvester_view["farmer_peer"]["host"] == "oldmacdonald.eie.io"
+
+        # When: updating the config
+        def update(config: Dict) -> None:
+            config["harvester"]["farmer_peer"]["host"] = "localhost"
+
+        update_config(root_path=root_path, filename="config.yaml", update=update)
+        # Expect: the update is in the file and in the cache
+        with open(config_file_path, "r") as f:
+            assert yaml.safe_load(f)["harvester"]["farmer_peer"]["host"] == "localhost"
+        view = load_config_view(root_path=root_path, filename="config.yaml")
+        assert view["harvester"]["farmer_peer"]["host"] == "localhost"
+
+        # When: another process replaces the file right after this one saved it
+        replace = os.replace
+
+        def replace_then_other_writer(src, dst):
+            replace(src, dst)
+            other_path = config_file_path.with_suffix(".other")
+            other_config = copy.deepcopy(default_config_dict)
+            other_config["harvester"]["farmer_peer"]["host"] = "otherwriter"
+            with open(other_path, "w") as f:
+                yaml.safe_dump(other_config, f)
+            replace(other_path, dst)
+
+        monkeypatch.setattr(os, "replace", replace_then_other_writer)
+        save_config(root_path=root_path, filename="config.yaml", config_data=default_config_dict)
+        monkeypatch.undo()
+        # Expect: the file of the other process is loaded, not the config this process saved
+        view = load_config_view(root_path=root_path, filename="config.yaml")
+        assert view["harvester"]["farmer_peer"]["host"] == "otherwriter"
+
     def test_multiple_writers(self, root_path_populated_with_config, default_config_dict):
         """
         Test whether multiple readers/writers encounter data corruption. When using non-atomic operations
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from tests.util.db_connection import DBConnection
+
+
+@pytest.fixture(scope="module")
+def event_loop():
+    loop = asyncio.get_event_loop()
+    yield loop
+
+
+async def count_rows(db_wrapper) -> int:
+    cursor = await db_wrapper.db.execute("SELECT COUNT(*) FROM t")
+    row = await cursor.fetchone()
+    await cursor.close()
+    return row[0]
+
+
+async def insert(db_wrapper, value: int, fail: bool = False) -> None:
+    await db_wrapper.begin_transaction()
+    try:
+        await db_wrapper.db.execute("INSERT INTO t VALUES(?)", (value,))
+        if fail:
+            raise ValueError("failed transaction")
+        await db_wrapper.commit_transaction()
+    except ValueError:
+        await db_wrapper.rollback_transaction()
+
+
+class TestDBWrapper:
+    @pytest.mark.asyncio
+    async def test_group_commits(self):
+        async with DBConnection() as db_wrapper:
+            await db_wrapper.db.execute("CREATE TABLE t(value int)")
+            await db_wrapper.db.commit()
+
+            async with db_wrapper.group_commits(3):
+                await insert(db_wrapper, 1)
+                await insert(db_wrapper, 2)
+                # Nothing is written to disk before the group is full
+                assert db_wrapper.db.in_transaction
+                # A failing transaction only undoes its own changes
+                await insert(db_wrapper, 3, fail=True)
+                assert await count_rows(db_wrapper) == 2
+                await insert(db_wrapper, 4)
+                assert not db_wrapper.db.in_transaction
+                await insert(db_wrapper, 5)
+                assert db_wrapper.db.in_transaction
+            # Leaving the context writes the unfinished group
+            assert not db_wrapper.db.in_transaction
+            assert await count_rows(db_wrapper) == 4
+
+            # The first transaction of a group is rolled back on its own as well
+            async with db_wrapper.group_commits(3):
+                await insert(db_wrapper, 6, fail=True)
+                await insert(db_wrapper, 7)
+            assert await count_rows(db_wrapper) == 5
+
+            # Without a group every transaction is committed
+            await insert(db_wrapper, 8)
+            assert not db_wrapper.db.in_transaction
+            assert await count_rows(db_wrapper) == 6
@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pytest
+
+from silicoin.types.blockchain_format.sized_bytes import bytes32
+from silicoin.types.blockchain_format.sub_epoch_summary import SubEpochSummary
+from silicoin.util.height_map import HeightMap, read_snapshot, write_snapshot
+from silicoin.util.ints import uint8, uint32, uint64
+
+
+class TestHeightMap(unittest.TestCase):
+    def test_height_map(self):
+        height_map = HeightMap()
+        assert len(height_map) == 0
+        assert height_map.get(uint32(0)) is None
+        with pytest.raises(KeyError):
+            height_map[uint32(0)]
+
+        hashes = [bytes([i + 1]) * 32 for i in range(5)]
+        for height, header_hash in enumerate(hashes):
+            height_map[uint32(height)] = header_hash
+        assert len(height_map) == 5
+        assert [height_map[h] for h in height_map] == hashes
+        assert 4 in height_map
+        assert 5 not in height_map
+
+        # Heights in between are missing until they are set
+        height_map[uint32(7)] = bytes([7]) * 32
+        assert len(height_map) == 8
+        assert 6 not in height_map
+        assert height_map.get(uint32(6), bytes(32)) == bytes(32)
+        assert list(height_map) == [0, 1, 2, 3, 4, 7]
+
+        height_map[uint32(2)] = bytes([9]) * 32
+        assert height_map[uint32(2)] == bytes([9]) * 32
+
+        height_map.rollback(3)
+        assert len(height_map) == 4
+        assert 7 not in height_map
+
+        copy = HeightMap(height_map.to_bytes())
+        assert [copy[h] for h in copy] == [height_map[h] for h in height_map]
+        assert HeightMap.from_hashes(hashes).to_bytes() == b"".join(hashes)
+
+    def test_snapshot(self):
+        path = Path(tempfile.mkdtemp()) / "blockchain.height_to_hash"
+        assert read_snapshot(path) is None
+
+        height_map = HeightMap.from_hashes([bytes([i + 1]) * 32 for i in range(10)])
+        ses = SubEpochSummary(bytes32([1] * 32), bytes32([2] * 32), uint8(3), uint64(4), None)
+        write_snapshot(path, height_map, {uint32(5): ses})
+        snapshot = read_snapshot(path)
+        assert snapshot is not None
+        assert snapshot[0].to_bytes() == height_map.to_bytes()
+        assert snapshot[1] == {uint32(5): ses}
+
+        # Truncated or foreign files are ignored
+        path.write_bytes(path.read_bytes()[:-1])
+        assert read_snapshot(path) is None
+        path.write_bytes(b"not a snapshot")
+        assert read_snapshot(path) is None
@@ -1,6 +1,7 @@
 import json
 import unittest
 from secrets import token_bytes
+from unittest.mock import patch
 
 from blspy import AugSchemeMPL, PrivateKey
 
@@ -94,6 +95,33 @@ class TestKeychain(unittest.TestCase):
         child_sk = AugSchemeMPL.derive_child_sk(master_sk, 0)
         assert child_sk == PrivateKey.from_bytes(tv_child_int.to_bytes(32, "big"))
 
+    @using_temp_file_keyring()
+    def test_private_key_cache(self):
+        kc: Keychain = Keychain(user="testing-1.8.0", service="silicoin-testing-1.8.0")
+        kc.delete_all_keys()
+
+        mnemonic = generate_mnemonic()
+        key = kc.add_private_key(mnemonic, "")
+        with patch("silicoin.util.keychain.mnemonic_to_seed", wraps=mnemonic_to_seed) as mock_to_seed:
+            assert kc.get_all_private_keys() == [(key, bytes_from_mnemonic(mnemonic))]
+            assert kc.get_first_private_key() == (key, bytes_from_mnemonic(mnemonic))
+            assert mock_to_seed.call_count == 1
+
+            # Another passphrase is derived once too
+            assert len(kc.get_all_private_keys(["", "other passphrase"])) == 1
+            assert len(kc.get_all_private_keys(["", "other passphrase"])) == 1
+            assert mock_to_seed.call_count == 2
+
+            # Modifying the keyring drops the cached keys
+            kc.add_private_key(generate_mnemonic(), "")
+            assert mock_to_seed.call_count == 3
+            assert len(kc.get_all_private_keys()) == 2
+            assert mock_to_seed.call_count == 5
+
+            kc.delete_key_by_fingerprint(key.get_g1().get_fingerprint())
+            assert len(kc.get_all_private_keys()) == 1
+            assert mock_to_seed.call_count == 6
+
     def test_bip39_test_vectors_trezor(self):
         with open("tests/util/bip39_test_vectors.json") as f:
             all_vectors = json.loads(f.read())
@@ -0,0 +1,13 @@
+import pytest
+
+from silicoin.util.pagination import MAX_PAGE_SIZE, page_limit
+
+
+class TestPagination:
+    def test_page_limit(self):
+        assert page_limit(5) == 5
+        assert page_limit("5") == 5
+        assert page_limit(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
+        for invalid in [0, -1, "0", "abc", None]:
+            with pytest.raises(ValueError):
+                page_limit(invalid)
@@ -1,6 +1,10 @@
 # flake8: noqa: F811, F401
 import asyncio
+import pathlib
+import random
 import sys
+import tempfile
+from concurrent.futures.process import ProcessPoolExecutor
 from typing import Dict, List, Optional, Tuple
 
 import aiosqlite
@@ -35,11 +39,14 @@ from silicoin.full_node.weight_proof import (  # type: ignore
     WeightProofHandler,
     _map_sub_epoch_summaries,
     _validate_sub_epoch_segments,
+    _validate_sub_epoch_summaries,
     _validate_summaries_weight,
+    validate_weight_proof_in_executor,
 )
 from silicoin.types.full_block import FullBlock
 from silicoin.types.header_block import HeaderBlock
 from silicoin.util.ints import uint32, uint64
+from silicoin.wallet.wallet_weight_proof_handler import WalletWeightProofHandler
 
 
 @pytest.fixture(scope="session")
@@ -436,6 +443,20 @@ class TestWeightProof:
         assert valid
         assert fork_point == 0
 
+    @pytest.mark.asyncio
+    async def test_weight_proof_recent_chain_extended(self, default_1000_blocks):
+        blocks = default_1000_blocks
+        header_cache, height_to_hash, sub_blocks, summaries = await load_blocks_dont_validate(blocks)
+        wpf = WeightProofHandler(test_constants, BlockCache(sub_blocks, header_cache, height_to_hash, summaries))
+        wp = await wpf.get_proof_of_weight(blocks[-10].header_hash)
+        assert wp is not None
+        # The recent chain of the previous proof is extended with the new blocks only
+        wp = await wpf.get_proof_of_weight(blocks[-1].header_hash)
+        assert wp is not None
+        wpf_new = WeightProofHandler(test_constants, BlockCache(sub_blocks, header_cache, height_to_hash, summaries))
+        assert wp == await wpf_new.get_proof_of_weight(blocks[-1].header_hash)
+        assert wp.recent_chain_data[-1].header_hash == blocks[-1].header_hash
+
     @pytest.mark.asyncio
     async def test_weight_proof_extend_new_ses(self, default_1000_blocks):
         blocks = default_1000_blocks
@@ -493,6 +514,79 @@ class TestWeightProof:
         assert valid
         assert fork_point != 0
 
+    @pytest.mark.asyncio
+    async def test_weight_proof_validation_in_executor(self, default_1000_blocks):
+        blocks = default_1000_blocks
+        header_cache, height_to_hash, sub_blocks, summaries = await load_blocks_dont_validate(blocks)
+        wpf = WeightProofHandler(test_constants, BlockCache(sub_blocks, header_cache, height_to_hash, summaries))
+        wp = await wpf.get_proof_of_weight(blocks[-1].header_hash)
+        assert wp is not None
+        ses_list, _ = _validate_sub_epoch_summaries(test_constants, wp)
+        assert ses_list is not None
+
+        executor = ProcessPoolExecutor(2)
+        shutdown_file = tempfile.NamedTemporaryFile(prefix="silicoin_weight_proof_test")
+        try:
+            rng = random.Random(ses_list[-2].get_hash())
+            valid, records = await validate_weight_proof_in_executor(
+                executor, test_constants, rng, ses_list, wp, True, pathlib.Path(shutdown_file.name)
+            )
+            assert valid
+            assert len(records) > 0
+
+            # Removing the file cancels the running jobs
+            shutdown_file.close()
+            rng = random.Random(ses_list[-2].get_hash())
+            valid, records = await validate_weight_proof_in_executor(
+                executor, test_constants, rng, ses_list, wp, True, pathlib.Path(shutdown_file.name)
+            )
+            assert not valid
+        finally:
+            shutdown_file.close()
+            executor.shutdown(wait=True)
+
+    @pytest.mark.asyncio
+    async def test_wallet_weight_proof_superseded(self, default_1000_blocks):
+        blocks = default_1000_blocks
+        header_cache, height_to_hash, sub_blocks, summaries = await load_blocks_dont_validate(blocks)
+        wpf = WeightProofHandler(test_constants, BlockCache(sub_blocks, header_cache, height_to_hash, summaries))
+        lighter_wp = await wpf.get_proof_of_weight(blocks[-100].header_hash)
+        heavier_wp = await wpf.get_proof_of_weight(blocks[-1].header_hash)
+        assert lighter_wp is not None and heavier_wp is not None
+
+        wallet_wpf = WalletWeightProofHandler(test_constants)
+        lighter_started = asyncio.Event()
+
+        async def validate_inner(weight_proof, skip_segment_validation, shutdown_file_path):
+            if weight_proof is lighter_wp:
+                lighter_started.set()
+                # Only ends by getting cancelled
+                await asyncio.sleep(3600)
+            return True, uint32(0), [], []
+
+        wallet_wpf._validate_weight_proof_inner = validate_inner
+        try:
+            lighter = asyncio.create_task(wallet_wpf.validate_weight_proof(lighter_wp))
+            await lighter_started.wait()
+            valid, _, _, _ = await wallet_wpf.validate_weight_proof(heavier_wp)
+            assert valid
+            # The superseded validation returns as invalid instead of raising CancelledError, so the wallet node
+            # takes its invalid proof path which leaves the sync mode
+            valid, fork_point, _, _ = await lighter
+            assert not valid
+            assert fork_point == 0
+            assert len(wallet_wpf._weight_proof_tasks) == 0
+
+            # Cancelling the caller still cancels the validation
+            lighter_started.clear()
+            lighter = asyncio.create_task(wallet_wpf.validate_weight_proof(lighter_wp))
+            await lighter_started.wait()
+            lighter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await lighter
+        finally:
+            wallet_wpf.cancel_weight_proof_tasks()
+
     @pytest.mark.skip("used for debugging")
     @pytest.mark.asyncio
     async def test_weight_proof_from_database(self):